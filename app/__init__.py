@@ -1,11 +1,16 @@
 # app/__init__.py
 
 import os
+import sys
+import time
+
+_INICIO_IMPORTACOES = time.perf_counter()
 
 from sqlalchemy import func, inspect, or_, text
 
 from flask import (
     Flask,
+    current_app,
     redirect,
     url_for,
     has_request_context,
@@ -14,15 +19,28 @@ from flask import (
     request,
     flash,
 )
-from flask_migrate import Migrate
 from flask_login import current_user, logout_user
 from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from .extensions import db, login_manager, mail
-from app.models import RequisicaoTecnico, Tecnico, Usuario
+from app.models import Tecnico, Usuario
 from app.routes.ferramentas_epis import bp_ferramentas_epis
 from app.routes.frota_vistoria import bp_frota_vistoria
+from app.utils.assinaturas import (
+    assinaturas_inline_pendentes,
+    migrar_assinaturas,
+    url_assinatura,
+)
+from app.utils.busca_itens import criar_indice
+from app.utils.contadores import obter_contador
+from app.utils.email_fila import iniciar_worker_emails
+from app.utils.estaticos import iniciar_estaticos, url_webp
+from app.utils.fotos import url_foto
+from app.utils.inicializacao import TemposInicializacao, esquema_atualizado
+from app.utils.razao_estoque import abrir_razao, razao_pendente
+from app.utils.resumo_estoque import reconstruir_resumo, resumo_pendente
+from app.utils.sqlite_perfil import configurar_sqlite, iniciar_manutencao_sqlite
 
 # Comandos CLI
 from app.cli import (
@@ -38,8 +56,28 @@ from app.cli import (
     backup_drive,
     auditar_limpeza_operacional,
     limpar_dados_operacionais,
+    auditar_indices,
+    processar_emails,
+    estresse_saldos,
+    resumo_estoque,
+    razao_snapshot,
+    razao_verificar,
+    tempos_inicializacao,
+    auditar_consultas_listagens,
+    gerar_pdfs_lote,
+    otimizar_fotos,
+    gerar_estaticos,
+    gerar_backup_banco,
+    listar_backups_banco,
+    verificar_backups,
+    retencao_backups,
+    restaurar_backup_banco,
+    manutencao_sqlite_banco,
+    benchmark_sqlite,
 )
 
+_TEMPO_IMPORTACOES = (time.perf_counter() - _INICIO_IMPORTACOES) * 1000
+
 
 def _bootstrap_admin_user():
     admin_email = os.getenv("LOGISTOCK_ADMIN_EMAIL")
@@ -73,9 +111,11 @@ def _ensure_runtime_schema_columns():
         "estoque": {
             "valor_unitario": "FLOAT",
             "condicao_material": "VARCHAR(30)",
+            "versao": "INTEGER NOT NULL DEFAULT 0",
         },
         "saldo_tecnico": {
             "valor_unitario": "FLOAT",
+            "versao": "INTEGER NOT NULL DEFAULT 0",
         },
         "inventario_estoque": {
             "tipo_estoque": "VARCHAR(20)",
@@ -113,6 +153,78 @@ def _ensure_runtime_schema_columns():
     db.session.commit()
 
 
+def _ensure_runtime_indexes():
+    inspector = inspect(db.engine)
+
+    for table in db.metadata.sorted_tables:
+        if not table.indexes or not inspector.has_table(table.name):
+            continue
+
+        existing_indexes = {
+            index["name"]
+            for index in inspector.get_indexes(table.name)
+        }
+
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                continue
+
+            index.create(bind=db.engine)
+
+
+def _ensure_schema(app):
+    """
+    Banco já na head das migrações e com todas as tabelas: pula o
+    create_all e a inspeção de colunas/índices. Mudança de esquema nova
+    precisa vir com migração (que muda a head) para voltar a ser aplicada
+    aqui; VERIFICAR_ESQUEMA_SEMPRE força a verificação completa.
+    """
+    if not app.config.get("VERIFICAR_ESQUEMA_SEMPRE"):
+        with db.engine.connect() as conexao:
+            if esquema_atualizado(conexao, db.metadata):
+                return False
+
+    db.create_all()
+    _ensure_runtime_schema_columns()
+    _ensure_runtime_indexes()
+    _ensure_assinaturas_no_repositorio()
+
+    return True
+
+
+def _ensure_assinaturas_no_repositorio():
+    # Banco sem a migração (só create_all): tira do banco os PNGs em
+    # base64 que ainda estiverem inline.
+    with db.engine.begin() as conexao:
+        if assinaturas_inline_pendentes(conexao):
+            migrar_assinaturas(conexao)
+
+
+def _ensure_resumo_estoque():
+    # Tabela criada agora pelo create_all (sem migração): preenche a
+    # partir do Estoque para a tela de saldo não abrir vazia.
+    with db.engine.begin() as conexao:
+        if resumo_pendente(conexao):
+            reconstruir_resumo(conexao)
+
+
+def _ensure_razao_estoque():
+    # Primeira subida com o razão: os saldos atuais entram como abertura.
+    with db.engine.begin() as conexao:
+        if razao_pendente(conexao):
+            abrir_razao(conexao)
+
+
+def _ensure_busca_itens():
+    # Banco sem a migração do índice de busca: cria e indexa os itens. Sem
+    # FTS5 no SQLite a busca segue no ilike.
+    try:
+        with db.engine.begin() as conexao:
+            criar_indice(conexao)
+    except Exception:
+        current_app.logger.exception("Índice de busca de itens indisponível.")
+
+
 def _import_bp(
     module_path,
     candidates=("bp", "bp_estoque", "estoque_bp", "bp_routes", "blueprint"),
@@ -129,7 +241,16 @@ def _import_bp(
     )
 
 
-def create_app():
+def create_app(configuracao=None):
+    """
+    configuracao: valores que substituem os do config.py antes de ligar as
+    extensões (ex.: banco temporário dos comandos de auditoria).
+    """
+    tempos = TemposInicializacao()
+    tempos.incluir("importacoes", _TEMPO_IMPORTACOES)
+
+    inicio = time.perf_counter()
+
     app = Flask(__name__, instance_relative_config=True)
 
     if os.getenv("RENDER"):
@@ -148,17 +269,37 @@ def create_app():
 
     app.config.from_pyfile(config_path)
 
+    if configuracao:
+        app.config.update(configuracao)
+
     db.init_app(app)
     mail.init_app(app)
 
     from app import models  # noqa: F401
 
+    tempos.registrar("configuracao", inicio)
+
     with app.app_context():
-        db.create_all()
-        _ensure_runtime_schema_columns()
-        _bootstrap_admin_user()
+        configurar_sqlite(app)
 
-    Migrate(app, db)
+        inicio = time.perf_counter()
+        verificado = _ensure_schema(app)
+        tempos.registrar("esquema" if verificado else "esquema_na_head", inicio)
+
+        with tempos.fase("dados_iniciais"):
+            _ensure_resumo_estoque()
+            _ensure_razao_estoque()
+            _ensure_busca_itens()
+            _bootstrap_admin_user()
+
+    inicio = time.perf_counter()
+
+    # Flask-Migrate (Alembic) só serve aos comandos `flask db ...`; nos
+    # workers web a importação custaria ~0,25s por processo.
+    if os.getenv("FLASK_RUN_FROM_CLI") == "true":
+        from flask_migrate import Migrate
+
+        Migrate(app, db)
 
     login_manager.init_app(app)
     login_manager.login_view = "auth.login"
@@ -172,6 +313,14 @@ def create_app():
         except Exception:
             return None
 
+    @app.before_request
+    def iniciar_fila_emails():
+        iniciar_worker_emails(app)
+
+    @app.before_request
+    def iniciar_manutencao_banco():
+        iniciar_manutencao_sqlite(app)
+
     @app.before_request
     def bloquear_tecnico_para_admin():
         if not current_user.is_authenticated:
@@ -186,6 +335,13 @@ def create_app():
             "tecnico_mobile.logout",
             "tecnico_mobile.home",
             "tecnico_mobile.alterar_senha",
+            "tecnico_mobile.service_worker",
+            "tecnico_mobile.api_pacote_offline",
+            "tecnico_mobile.api_envios",
+            "requisicao_mobile.nova",
+            "requisicao_mobile.api_itens_empresa_padrao",
+            "requisicao_mobile.api_itens_por_estoque",
+            "busca_itens.catalogo",
             "baixa_tecnico.formulario_baixa",
             "baixa_tecnico.formulario_mobile_dedicado",
             "baixa_tecnico.api_os_por_cliente",
@@ -215,6 +371,10 @@ def create_app():
 
         return redirect(url_for("tecnico_mobile.home"))
 
+    tempos.registrar("extensoes", inicio)
+
+    inicio = time.perf_counter()
+
     estoque_bp = _import_bp("app.routes.estoque")
     nota_fiscal_bp = _import_bp("app.routes.nota_fiscal")
 
@@ -313,6 +473,36 @@ def create_app():
         candidates=("frota_bp", "bp"),
     )
 
+    bp_email_fila = _import_bp(
+        "app.routes.email_fila",
+        candidates=("bp_email_fila", "bp"),
+    )
+
+    bp_contadores = _import_bp(
+        "app.routes.contadores",
+        candidates=("bp_contadores", "bp"),
+    )
+
+    bp_razao_estoque = _import_bp(
+        "app.routes.razao_estoque",
+        candidates=("bp_razao_estoque", "bp"),
+    )
+
+    bp_assinaturas = _import_bp(
+        "app.routes.assinaturas",
+        candidates=("bp_assinaturas", "bp"),
+    )
+
+    bp_documentos_lote = _import_bp(
+        "app.routes.documentos_lote",
+        candidates=("bp_documentos_lote", "bp"),
+    )
+
+    bp_busca_itens = _import_bp(
+        "app.routes.busca_itens",
+        candidates=("bp_busca_itens", "bp"),
+    )
+
     app.register_blueprint(estoque_bp)
     app.register_blueprint(nota_fiscal_bp)
     app.register_blueprint(bp_frota)
@@ -368,7 +558,14 @@ def create_app():
     app.register_blueprint(bp_tecnico_mobile)
     app.register_blueprint(bp_movimentacao)
     app.register_blueprint(bp_backup)
-    
+    app.register_blueprint(bp_email_fila)
+    app.register_blueprint(bp_contadores)
+    app.register_blueprint(bp_razao_estoque)
+    app.register_blueprint(bp_assinaturas)
+    app.register_blueprint(bp_documentos_lote)
+    app.register_blueprint(bp_busca_itens)
+
+    tempos.registrar("blueprints", inicio)
 
     app.cli.add_command(init_db)
     app.cli.add_command(seed_dados)
@@ -382,6 +579,24 @@ def create_app():
     app.cli.add_command(backup_drive)
     app.cli.add_command(auditar_limpeza_operacional)
     app.cli.add_command(limpar_dados_operacionais)
+    app.cli.add_command(auditar_indices)
+    app.cli.add_command(processar_emails)
+    app.cli.add_command(estresse_saldos)
+    app.cli.add_command(resumo_estoque)
+    app.cli.add_command(razao_snapshot)
+    app.cli.add_command(razao_verificar)
+    app.cli.add_command(tempos_inicializacao)
+    app.cli.add_command(auditar_consultas_listagens)
+    app.cli.add_command(gerar_pdfs_lote)
+    app.cli.add_command(otimizar_fotos)
+    app.cli.add_command(gerar_estaticos)
+    app.cli.add_command(gerar_backup_banco)
+    app.cli.add_command(listar_backups_banco)
+    app.cli.add_command(verificar_backups)
+    app.cli.add_command(retencao_backups)
+    app.cli.add_command(restaurar_backup_banco)
+    app.cli.add_command(manutencao_sqlite_banco)
+    app.cli.add_command(benchmark_sqlite)
 
     @app.context_processor
     def inject_requisicoes_tecnicos_pendentes():
@@ -391,9 +606,7 @@ def create_app():
                     hasattr(current_user, "perfil")
                     and current_user.perfil in ["estoque", "admin"]
                 ):
-                    count = RequisicaoTecnico.query.filter_by(
-                        status="pendente"
-                    ).count()
+                    count = obter_contador("requisicoes_pendentes")
 
                     return dict(
                         requisicoes_tecnicos_pendentes=count
@@ -520,6 +733,18 @@ def create_app():
         except (ValueError, TypeError):
             return "R$ 0,00"
 
+    @app.template_filter("assinatura_url")
+    def assinatura_url(value):
+        return url_assinatura(value)
+
+    @app.template_filter("foto_url")
+    def foto_url(value, rendicao="tela"):
+        return url_foto(value, rendicao)
+
+    # url_for("static") aponta para static/dist (flask gerar-estaticos).
+    iniciar_estaticos(app)
+    app.add_template_global(url_webp, "url_webp")
+
     @app.after_request
     def add_security_headers(response):
         response.headers.setdefault("X-Content-Type-Options", "nosniff")
@@ -527,4 +752,11 @@ def create_app():
         response.headers.setdefault("Referrer-Policy", "strict-origin-when-cross-origin")
         return response
 
+    tempos.concluir()
+    app.extensions["tempos_inicializacao"] = tempos
+    app.logger.info("Inicialização em %s", tempos.resumo())
+
+    if app.config.get("LOG_TEMPOS_INICIALIZACAO"):
+        print(f"[logstock] inicialização em {tempos.resumo()}", file=sys.stderr)
+
     return app
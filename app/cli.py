@@ -1,12 +1,25 @@
 import click
 import os
 import shutil
-import sqlite3
 from datetime import datetime
+from flask import current_app
 from flask.cli import with_appcontext
-from sqlalchemy import inspect, text
+from sqlalchemy import func, inspect, or_, select, text
 from app.extensions import db
-from app.utils.backup_drive import enviar_backup_google_drive
+from app.utils.backups import (
+    aplicar_retencao,
+    concluir_backup,
+    copiar_sqlite,
+    enviar_backup,
+    escolher_backup,
+    gerar_backup,
+    ler_manifesto,
+    listar_backups,
+    restaurar_backup,
+    verificar_backup,
+)
+from app.utils.busca_itens import TABELAS_INDICE, consultas_auditoria
+from app.utils.email_fila import INTERVALO_WORKER_SEGUNDOS, processar_fila_emails
 from app.models import (
     AbastecimentoVeiculo,
     BaixaTecnica,
@@ -183,7 +196,7 @@ def _backup_sqlite_database():
         backup_dir,
         os.path.basename(database_path),
     )
-    shutil.copy2(database_path, backup_path)
+    copiar_sqlite(database_path, backup_path)
 
     return backup_path
 
@@ -236,11 +249,209 @@ def backup_drive():
             f"Banco não encontrado: {status['database_path']}"
         )
 
-    arquivo_id = enviar_backup_google_drive(status["database_path"])
+    manifesto = gerar_backup()
+    enviados = enviar_backup(manifesto, "drive")
 
     click.echo("Backup enviado para o Google Drive.")
     click.echo(f"Banco: {status['database_path']}")
-    click.echo(f"Arquivo ID: {arquivo_id}")
+    click.echo(f"Backup: {manifesto['arquivo']} ({manifesto['tipo']})")
+    click.echo(f"Arquivos enviados: {', '.join(enviados) or 'nenhum (já estavam no Drive)'}")
+
+    _echo_verificacao(concluir_backup(manifesto["nome"]))
+
+
+def _echo_verificacao(manifesto):
+    verificacao = manifesto.get("verificacao") or {}
+
+    if verificacao.get("status") == "ok":
+        click.echo(f"Verificação: ok ({verificacao['duracao_s']} s)")
+    elif verificacao.get("status") == "falhou":
+        click.echo("Verificação: FALHOU")
+        for problema in verificacao.get("problemas", []):
+            click.echo(f"  {problema}")
+    else:
+        click.echo("Verificação: pendente")
+
+
+@click.command("gerar-backup")
+@click.option(
+    "--tipo",
+    type=click.Choice(["auto", "completo", "incremental"]),
+    default="auto",
+    show_default=True,
+    help="auto: incremental sobre o último backup, completo quando a cadeia fecha.",
+)
+@click.option(
+    "--destino",
+    default=None,
+    help='"drive" ou uma pasta; padrão BACKUP_DESTINO (vazio: só local).',
+)
+@click.option(
+    "--sem-verificar",
+    is_flag=True,
+    help="Não verifica o backup nem aplica a retenção (fica para verificar-backups).",
+)
+@with_appcontext
+def gerar_backup_banco(tipo, destino, sem_verificar):
+    """
+    Backup do banco em uso, sem parar a aplicação: instantâneo online do
+    SQLite comprimido (ou pg_dump no PostgreSQL), em BACKUP_DIR. Depois,
+    verificação numa cópia restaurada e retenção.
+    """
+    try:
+        manifesto = gerar_backup(tipo)
+    except RuntimeError as erro:
+        raise click.ClickException(str(erro))
+
+    click.echo(f"Backup: {manifesto['arquivo']} ({manifesto['tipo']})")
+    click.echo(f"Tamanho: {manifesto['tamanho'] / 1024:.1f} KB em {manifesto['duracao_s']} s")
+
+    if manifesto["tipo"] == "incremental":
+        click.echo(
+            f"Páginas alteradas: {manifesto['paginas_gravadas']} de {manifesto['paginas']}"
+            f" (sequência {manifesto['sequencia']} sobre {manifesto['anterior']})"
+        )
+
+    destino = destino or current_app.config.get("BACKUP_DESTINO")
+
+    if destino:
+        enviados = enviar_backup(manifesto, destino)
+        click.echo(f"Enviado para {destino}: {', '.join(enviados) or 'nada novo'}")
+
+    if not sem_verificar:
+        _echo_verificacao(concluir_backup(manifesto["nome"]))
+
+
+@click.command("listar-backups")
+@click.option("--detalhes", "nome", default=None, help="Mostra o manifesto de um backup.")
+@with_appcontext
+def listar_backups_banco(nome):
+    """Catálogo dos backups: tipo, tamanho, linhas e verificação."""
+    if nome:
+        try:
+            manifesto = ler_manifesto(nome)
+        except FileNotFoundError:
+            raise click.ClickException(f"Backup não encontrado: {nome}")
+
+        click.echo(f"Backup: {manifesto['nome']} ({manifesto['tipo']})")
+        click.echo(f"Criado em: {manifesto['criado_em']}")
+        click.echo(f"Arquivo: {manifesto['arquivo']} ({manifesto['tamanho'] / 1024:.1f} KB)")
+        click.echo(f"SHA-256 do arquivo: {manifesto['sha256_arquivo']}")
+
+        if manifesto.get("sha256"):
+            click.echo(f"SHA-256 do banco: {manifesto['sha256']}")
+        if manifesto.get("anterior"):
+            click.echo(f"Sobre: {manifesto['anterior']} (sequência {manifesto['sequencia']})")
+        if manifesto.get("enviado_para"):
+            click.echo(f"Enviado para: {', '.join(manifesto['enviado_para'])}")
+
+        _echo_verificacao(manifesto)
+
+        for tabela, total in (manifesto.get("linhas") or {}).items():
+            click.echo(f"  {tabela:<40} {total:>10}")
+        return
+
+    manifestos = listar_backups()
+
+    if not manifestos:
+        click.echo("Nenhum backup encontrado.")
+        return
+
+    for manifesto in manifestos:
+        verificacao = (manifesto.get("verificacao") or {}).get("status") or "pendente"
+        linhas = sum((manifesto.get("linhas") or {}).values())
+        click.echo(
+            f"{manifesto['nome']:<48} {manifesto['tipo']:<12}"
+            f" {manifesto['tamanho'] / 1024:>10.1f} KB {linhas:>10} linhas  {verificacao}"
+        )
+
+
+@click.command("verificar-backups")
+@click.option("--todos", is_flag=True, help="Verifica de novo os que já passaram.")
+@with_appcontext
+def verificar_backups(todos):
+    """Restaura cada backup numa cópia temporária e roda integrity_check."""
+    falhas = 0
+
+    for manifesto in listar_backups():
+        if not todos and manifesto.get("verificacao"):
+            continue
+
+        manifesto = verificar_backup(manifesto["nome"])
+        status = manifesto["verificacao"]["status"]
+        falhas += status == "falhou"
+        click.echo(f"{manifesto['nome']}: {status}")
+
+        for problema in manifesto["verificacao"]["problemas"]:
+            click.echo(f"  {problema}")
+
+    if falhas:
+        raise click.ClickException(f"{falhas} backup(s) reprovado(s).")
+
+
+@click.command("retencao-backups")
+@click.option("--simular", is_flag=True, help="Só lista o que seria apagado.")
+@with_appcontext
+def retencao_backups(simular):
+    """Apaga os backups fora da retenção avô-pai-filho (BACKUP_RETER_*)."""
+    try:
+        apagados = aplicar_retencao(simular=simular)
+    except RuntimeError as erro:
+        raise click.ClickException(str(erro))
+
+    for manifesto in apagados:
+        click.echo(f"{'Seria apagado' if simular else 'Apagado'}: {manifesto['nome']}")
+
+    click.echo(f"{len(apagados)} backup(s) fora da retenção.")
+
+
+@click.command("restaurar-backup")
+@click.argument("nome", required=False)
+@click.option(
+    "--em",
+    default=None,
+    help='Estado do banco em "AAAA-MM-DD HH:MM": usa o último backup até esse momento.',
+)
+@click.option("--confirm", default="")
+@with_appcontext
+def restaurar_backup_banco(nome, em, confirm):
+    """
+    Troca o banco SQLite por um backup verificado. Parar a aplicação antes
+    e subir de novo depois.
+    """
+    if not nome:
+        try:
+            ate = datetime.fromisoformat(em) if em else None
+        except ValueError:
+            raise click.ClickException(f"Data inválida: {em}")
+
+        manifesto = escolher_backup(ate)
+
+        if not manifesto:
+            raise click.ClickException("Nenhum backup SQLite até esse momento.")
+
+        nome = manifesto["nome"]
+
+    if confirm != "RESTAURAR":
+        click.echo(f"Seria restaurado: {nome}")
+        click.echo("Nada executado. Repita com --confirm RESTAURAR (aplicação parada).")
+        return
+
+    try:
+        resultado = restaurar_backup(nome)
+    except FileNotFoundError:
+        raise click.ClickException(f"Backup não encontrado: {nome}")
+    except (RuntimeError, ValueError) as erro:
+        raise click.ClickException(str(erro))
+
+    click.echo(f"Banco restaurado de {resultado['backup']} em {resultado['duracao_s']} s.")
+    click.echo(f"Banco: {resultado['banco']}")
+
+    if resultado["anterior"]:
+        click.echo(f"Banco anterior salvo em: {resultado['anterior']}")
+
+    if resultado["assinaturas"]:
+        click.echo(f"Assinaturas recuperadas do backup: {resultado['assinaturas']}")
 
 
 def _is_tecnico_preservado(tecnico):
@@ -276,6 +487,7 @@ OPERATIONAL_TABLES = [
     "inventarios_tecnicos",
     "notas_fiscais_itens",
     "notas_fiscais_entrada",
+    "envios_offline",
     "requisicoes_tecnicos_itens",
     "requisicoes_tecnicos",
     "baixas_tecnicas_fotos",
@@ -286,7 +498,11 @@ OPERATIONAL_TABLES = [
     "historico_equipamento_itens",
     "historico_equipamentos",
     "equipamentos_tecnicos",
+    "razao_snapshot_saldos",
+    "razao_snapshots",
+    "razao_estoque",
     "saldo_tecnico",
+    "estoque_resumo",
     "estoque",
     "ordens_servico",
     "cliente",
@@ -301,6 +517,8 @@ PRESERVED_TABLES = {
     "tipo_servico",
     "token_acesso_tecnico",
     "usuarios",
+    # Índice de busca dos itens (acompanha o cadastro de itens).
+    *TABELAS_INDICE,
 }
 
 
@@ -331,7 +549,11 @@ OPERATIONAL_DATA_TABLES = [
     "historico_equipamento_itens",
     "historico_equipamentos",
     "equipamentos_tecnicos",
+    "razao_snapshot_saldos",
+    "razao_snapshots",
+    "razao_estoque",
     "saldo_tecnico",
+    "estoque_resumo",
     "estoque",
     "ordens_servico",
 ]
@@ -363,13 +585,7 @@ def _backup_operational_cleanup():
     os.makedirs(backup_dir, exist_ok=True)
     backup_path = os.path.join(backup_dir, os.path.basename(database_path))
 
-    source = sqlite3.connect(database_path)
-    destination = sqlite3.connect(backup_path)
-    try:
-        source.backup(destination)
-    finally:
-        destination.close()
-        source.close()
+    copiar_sqlite(database_path, backup_path)
     return backup_path
 
 
@@ -637,3 +853,837 @@ def preparar_empresa(confirm):
     click.echo("Removidos:")
     for table_name, count in deleted_counts.items():
         click.echo(f"{table_name}: {count}")
+
+
+def _consultas_criticas():
+    """
+    Consultas quentes com os mesmos predicados usados nas rotas,
+    junto do índice que cada uma deve usar.
+    """
+    return [
+        (
+            "saldos.carregar_estoques",
+            "ix_estoque_busca_saldo",
+            select(Estoque)
+            .where(
+                Estoque.item_id.in_([1, 2, 3]),
+                Estoque.quantidade > 0,
+                Estoque.tipo_servico_id == 1,
+                Estoque.tipo_estoque == "empresa",
+                or_(
+                    Estoque.condicao_material.is_(None),
+                    Estoque.condicao_material == "",
+                ),
+            )
+            .order_by(Estoque.id.asc()),
+        ),
+        (
+            "saldos.carregar_saldos_tecnico",
+            "ix_saldo_tecnico_busca_saldo",
+            select(SaldoTecnico)
+            .where(
+                SaldoTecnico.item_id.in_([1, 2, 3]),
+                SaldoTecnico.quantidade > 0,
+                SaldoTecnico.tecnico_id == 1,
+                SaldoTecnico.tipo_servico_id == 1,
+                SaldoTecnico.tipo_estoque == "empresa",
+                SaldoTecnico.cliente_id.is_(None),
+                SaldoTecnico.ordem_servico_id.is_(None),
+            )
+            .order_by(SaldoTecnico.id.asc()),
+        ),
+        (
+            "buscar_saldo_tecnico",
+            "ix_saldo_tecnico_busca_saldo",
+            select(SaldoTecnico)
+            .where(
+                SaldoTecnico.tecnico_id == 1,
+                SaldoTecnico.item_id == 1,
+                SaldoTecnico.tipo_servico_id == 1,
+                SaldoTecnico.tipo_estoque == "cliente",
+                SaldoTecnico.quantidade > 0,
+                SaldoTecnico.cliente_id == 1,
+                SaldoTecnico.ordem_servico_id == 1,
+            )
+            .order_by(SaldoTecnico.id.asc()),
+        ),
+        (
+            "historico_movimentacoes",
+            "ix_movimentacoes_estoque_data_hora",
+            select(MovimentacaoEstoque)
+            .order_by(
+                MovimentacaoEstoque.data_hora.desc().nulls_last(),
+                MovimentacaoEstoque.id.desc(),
+            )
+            .limit(50),
+        ),
+        (
+            "itens_movimentacao",
+            "ix_movimentacoes_estoque_itens_movimentacao",
+            select(MovimentacaoEstoqueItem)
+            .where(MovimentacaoEstoqueItem.movimentacao_id.in_([1, 2, 3])),
+        ),
+        (
+            "historico_baixas",
+            "ix_baixas_tecnicas_data_hora",
+            select(BaixaTecnica)
+            .order_by(BaixaTecnica.data_hora.desc())
+            .limit(50),
+        ),
+        (
+            "baixas_pendentes",
+            "ix_baixas_tecnicas_status",
+            select(func.count(BaixaTecnica.id))
+            .where(BaixaTecnica.status == "pendente"),
+        ),
+        (
+            "historico_notas_fiscais",
+            "ix_notas_fiscais_entrada_data_hora",
+            select(NotaFiscalEntrada)
+            .order_by(NotaFiscalEntrada.data_hora.desc())
+            .limit(50),
+        ),
+    ]
+
+
+def _plano_consulta(statement):
+    dialeto = db.engine.dialect
+    sql = str(
+        statement.compile(
+            dialect=dialeto,
+            compile_kwargs={"literal_binds": True},
+        )
+    )
+
+    if dialeto.name == "sqlite":
+        linhas = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return "\n".join(str(linha[-1]) for linha in linhas)
+
+    if dialeto.name == "postgresql":
+        # Tabelas pequenas levam o planner ao seq scan; desliga para
+        # verificar se existe um índice utilizável para o predicado.
+        db.session.execute(text("SET LOCAL enable_seqscan = off"))
+        linhas = db.session.execute(text(f"EXPLAIN {sql}")).all()
+        return "\n".join(str(linha[0]) for linha in linhas)
+
+    raise click.ClickException(
+        f"Banco {dialeto.name} não suportado pela auditoria de índices."
+    )
+
+
+@click.command("auditar-indices")
+@click.option("--detalhes", is_flag=True, help="Exibe o plano completo de cada consulta.")
+@with_appcontext
+def auditar_indices(detalhes):
+    falhas = []
+
+    try:
+        consultas = _consultas_criticas() + consultas_auditoria(db.session.connection())
+
+        for nome, indice, statement in consultas:
+            plano = _plano_consulta(statement)
+            usa_indice = indice in plano
+
+            click.echo(f"{'OK' if usa_indice else 'FALHA'} {nome}: {indice}")
+
+            if detalhes or not usa_indice:
+                for linha in plano.splitlines():
+                    click.echo(f"    {linha}")
+
+            if not usa_indice:
+                falhas.append(nome)
+    finally:
+        db.session.rollback()
+
+    if falhas:
+        raise click.ClickException(
+            "Consultas sem índice: " + ", ".join(falhas)
+        )
+
+    click.echo("Todas as consultas críticas usam índice.")
+
+
+@click.command("processar-emails")
+@click.option("--loop", is_flag=True, help="Continua consumindo a fila até ser interrompido.")
+@with_appcontext
+def processar_emails(loop):
+    import time
+
+    while True:
+        total = 0
+
+        while True:
+            processados = processar_fila_emails()
+            total += processados
+
+            if not processados:
+                break
+
+        if not loop:
+            click.echo(f"E-mails processados: {total}")
+            return
+
+        time.sleep(INTERVALO_WORKER_SEGUNDOS)
+
+
+@click.command("estresse-saldos")
+@click.option("--threads", default=8, show_default=True, help="Requisições simultâneas.")
+@click.option("--operacoes", default=40, show_default=True, help="Operações por thread.")
+@click.option(
+    "--database-url",
+    default="",
+    help="Banco descartável para o teste (padrão: SQLite temporário). Nunca use o banco de produção.",
+)
+def estresse_saldos(threads, operacoes, database_url):
+    """
+    Teste de concorrência do saldo técnico: várias threads debitam (FIFO,
+    via app.utils.saldos) e creditam o mesmo saldo ao mesmo tempo, cada uma
+    com a sua sessão. Confere no final que nenhum saldo ficou negativo e
+    que nenhuma atualização se perdeu.
+
+    Sem --database-url roda num SQLite temporário, que serializa as
+    escritas; para exercitar o PostgreSQL (MVCC, conflito de versão de
+    verdade) passe a URL de um banco descartável: as tabelas são criadas.
+    """
+    import random
+    import tempfile
+    import threading
+    import time
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import Session
+    from sqlalchemy.orm.exc import StaleDataError
+    from sqlalchemy.exc import OperationalError
+
+    from app.utils.saldos import TENTATIVAS_CONFLITO, alocar_fifo, debitar
+
+    pasta_temporaria = None
+
+    if not database_url:
+        pasta_temporaria = tempfile.mkdtemp(prefix="logistock_estresse_")
+        database_url = f"sqlite:///{os.path.join(pasta_temporaria, 'estresse.db')}"
+
+    connect_args = (
+        {"check_same_thread": False, "timeout": 30}
+        if database_url.startswith("sqlite")
+        else {}
+    )
+
+    engine = create_engine(database_url, connect_args=connect_args)
+    db.metadata.create_all(engine)
+
+    quantidade_por_saldo = threads * operacoes
+
+    with Session(engine) as session:
+        tipo_servico = TipoServico(nome="Instalação (estresse)")
+        tecnico = Tecnico(nome="Técnico estresse", matricula="estresse", cpf="estresse")
+        item = Item(codigo=f"ESTRESSE-{datetime.utcnow():%Y%m%d%H%M%S%f}", descricao="Item estresse", unidade="un", valor=0)
+        session.add_all([tipo_servico, tecnico, item])
+        session.flush()
+
+        for _ in range(2):
+            session.add(
+                SaldoTecnico(
+                    tecnico_id=tecnico.id,
+                    item_id=item.id,
+                    tipo_servico_id=tipo_servico.id,
+                    tipo_estoque="empresa",
+                    quantidade=quantidade_por_saldo,
+                )
+            )
+
+        session.commit()
+
+        filtros = (
+            SaldoTecnico.tecnico_id == tecnico.id,
+            SaldoTecnico.item_id == item.id,
+        )
+
+    saldo_inicial = quantidade_por_saldo * 2
+    lock = threading.Lock()
+    resultado = {"debitado": 0, "creditado": 0, "conflitos": 0, "desistencias": 0, "recusas": 0}
+
+    def operar(semente):
+        aleatorio = random.Random(semente)
+
+        with Session(engine) as session:
+            for _ in range(operacoes):
+                quantidade = aleatorio.randint(1, 3)
+                creditar = aleatorio.random() < 0.3
+
+                for tentativa in range(1, TENTATIVAS_CONFLITO * 3 + 1):
+                    try:
+                        saldos = (
+                            session.query(SaldoTecnico)
+                            .filter(*filtros)
+                            .order_by(SaldoTecnico.id.asc())
+                            .all()
+                        )
+
+                        if creditar:
+                            saldos[0].quantidade = int(saldos[0].quantidade or 0) + quantidade
+                        else:
+                            alocacoes, faltante = alocar_fifo(saldos, quantidade, lambda s: True)
+
+                            if faltante:
+                                session.rollback()
+                                with lock:
+                                    resultado["recusas"] += 1
+                                break
+
+                            debitar(alocacoes)
+
+                        session.commit()
+
+                        with lock:
+                            resultado["creditado" if creditar else "debitado"] += quantidade
+                        break
+
+                    except (StaleDataError, OperationalError):
+                        session.rollback()
+
+                        with lock:
+                            resultado["conflitos"] += 1
+
+                        time.sleep(aleatorio.uniform(0.001, 0.01) * tentativa)
+
+                else:
+                    with lock:
+                        resultado["desistencias"] += 1
+
+    inicio = time.perf_counter()
+    trabalhadores = [
+        threading.Thread(target=operar, args=(indice,))
+        for indice in range(threads)
+    ]
+
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+
+    for trabalhador in trabalhadores:
+        trabalhador.join()
+
+    duracao = time.perf_counter() - inicio
+
+    with Session(engine) as session:
+        saldos = [
+            int(quantidade or 0)
+            for (quantidade,) in session.query(SaldoTecnico.quantidade).filter(*filtros)
+        ]
+
+    engine.dispose()
+
+    if pasta_temporaria:
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+    esperado = saldo_inicial - resultado["debitado"] + resultado["creditado"]
+
+    click.echo(f"Banco: {engine.url.render_as_string(hide_password=True)}")
+    click.echo(f"Threads: {threads} x {operacoes} operações em {duracao:.2f}s")
+    click.echo(
+        f"Debitado: {resultado['debitado']} | Creditado: {resultado['creditado']} | "
+        f"Conflitos repetidos: {resultado['conflitos']} | "
+        f"Sem saldo: {resultado['recusas']} | Desistências: {resultado['desistencias']}"
+    )
+    click.echo(f"Saldo final: {sum(saldos)} (esperado {esperado}) por registro: {saldos}")
+
+    if any(quantidade < 0 for quantidade in saldos):
+        raise click.ClickException("Saldo negativo após o teste de concorrência.")
+
+    if sum(saldos) != esperado:
+        raise click.ClickException("Atualização perdida: saldo final diferente do esperado.")
+
+    click.echo("OK: nenhum saldo negativo e nenhuma atualização perdida.")
+
+
+@click.command("resumo-estoque")
+@click.option("--verificar", is_flag=True, help="Só compara o resumo com o Estoque, sem gravar.")
+@click.option("--limite", default=20, show_default=True, help="Divergências exibidas.")
+@with_appcontext
+def resumo_estoque(verificar, limite):
+    """
+    Reconstrói (ou, com --verificar, confere) a tabela estoque_resumo a
+    partir do Estoque.
+    """
+    from app.utils.resumo_estoque import reconstruir_resumo, verificar_resumo
+
+    if not verificar:
+        with db.engine.begin() as conexao:
+            reconstruir_resumo(conexao)
+
+        click.echo("Resumo de estoque reconstruído.")
+
+    with db.engine.connect() as conexao:
+        divergencias = verificar_resumo(conexao)
+
+    for chave, esperado, gravado in divergencias[:limite]:
+        click.echo(f"DIVERGENTE {chave}: esperado={esperado} gravado={gravado}")
+
+    if divergencias:
+        raise click.ClickException(
+            f"{len(divergencias)} linha(s) do resumo divergem do Estoque. "
+            "Rode `flask resumo-estoque` para reconstruir."
+        )
+
+    click.echo("Resumo de estoque confere com o Estoque.")
+
+
+@click.command("razao-snapshot")
+@with_appcontext
+def razao_snapshot():
+    """
+    Grava um ponto de controle do razão do estoque. Agendar (cron) para
+    que as consultas por data somem poucos lançamentos após o snapshot.
+    """
+    from app.utils.razao_estoque import criar_snapshot
+
+    with db.engine.begin() as conexao:
+        snapshot_id = criar_snapshot(conexao)
+
+    if snapshot_id:
+        click.echo(f"Snapshot {snapshot_id} criado.")
+    else:
+        click.echo("Nenhum lançamento novo desde o último snapshot.")
+
+
+@click.command("razao-verificar")
+@click.option("--limite", default=20, show_default=True, help="Divergências exibidas.")
+@with_appcontext
+def razao_verificar(limite):
+    """Confere se a soma do razão bate com Estoque e SaldoTecnico atuais."""
+    from app.utils.razao_estoque import DIMENSOES, verificar_razao
+
+    with db.engine.connect() as conexao:
+        divergencias = verificar_razao(conexao)
+
+    for chave, atual, razao in divergencias[:limite]:
+        click.echo(
+            f"DIVERGENTE {dict(zip(DIMENSOES, chave))}: saldo={atual} razao={razao}"
+        )
+
+    if divergencias:
+        raise click.ClickException(
+            f"{len(divergencias)} saldo(s) divergem do razão."
+        )
+
+    click.echo("Razão confere com os saldos atuais.")
+
+
+@click.command("tempos-inicializacao")
+@with_appcontext
+def tempos_inicializacao():
+    """Mostra o tempo de cada fase da subida deste processo."""
+    from flask import current_app
+
+    tempos = current_app.extensions.get("tempos_inicializacao")
+
+    if tempos is None:
+        raise click.ClickException("Tempos de inicialização não registrados.")
+
+    for nome, ms in tempos.fases:
+        click.echo(f"{nome:<20} {ms:8.1f} ms")
+
+    click.echo(f"{'total':<20} {tempos.total:8.1f} ms")
+
+
+# Telas de lista auditadas: (endpoint, perfil exigido). Cada uma deve
+# rodar um número fixo de consultas, qualquer que seja o volume.
+LISTAGENS_AUDITADAS = (
+    "baixa_desktop.baixas_pendentes",
+    "baixa_desktop.historico_baixas",
+    "baixa_desktop.baixas_realizadas",
+    "baixa_tecnico.pendentes_mobile",
+    "requisicoes_tecnicos.mobile_recebidas",
+    "requisicoes_tecnicos.historico",
+    "frota_vistoria.historico_vistorias",
+    "frota_vistoria.pdf_historico_vistorias",
+    "ferramentas_epis.historico",
+    "equipamentos.historico_equipamentos",
+)
+
+
+def _semear_listagens(quantidade, lote):
+    """Registros das telas auditadas, cada um com técnico e cliente próprios."""
+    tipo_servico = TipoServico.query.first()
+
+    if tipo_servico is None:
+        tipo_servico = TipoServico(nome="Instalação (auditoria)")
+        db.session.add(tipo_servico)
+        db.session.flush()
+
+    item = Item(
+        codigo=f"AUDIT-{lote}",
+        descricao="Item auditoria",
+        unidade="un",
+        valor=1,
+        tipo_servico_id=tipo_servico.id,
+    )
+    db.session.add(item)
+    db.session.flush()
+
+    for indice in range(quantidade):
+        sufixo = f"{lote}-{indice}"
+
+        tecnico = Tecnico(nome=f"Técnico {sufixo}", matricula=f"A{sufixo}", cpf=f"A{sufixo}")
+        cliente = Empresa(razao_social=f"Cliente {sufixo}", cnpj=sufixo, tipo_empresa="cliente")
+        veiculo = Veiculo(placa=f"AUD{sufixo}", marca="Marca", modelo="Modelo")
+        db.session.add_all([tecnico, cliente, veiculo])
+        db.session.flush()
+
+        ordem = OrdemServico(numero_os=f"OS-{sufixo}", cliente_id=cliente.id)
+        db.session.add(ordem)
+        db.session.flush()
+
+        for status in ("pendente", "confirmado"):
+            baixa = BaixaTecnica(
+                tecnico_id=tecnico.id,
+                tipo_servico_id=tipo_servico.id,
+                cliente_id=cliente.id,
+                ordem_servico_id=ordem.id,
+                os_cliente=ordem.numero_os,
+                observacao="Observação " * 50,
+                motivo_recusa="Motivo " * 50,
+                status=status,
+            )
+            baixa.itens = [
+                BaixaTecnicaItem(
+                    item_id=item.id,
+                    quantidade=1,
+                    valor_unitario=1,
+                    valor_total=1,
+                    tipo_estoque=tipo_estoque,
+                )
+                for tipo_estoque in ("empresa", "cliente")
+            ]
+            db.session.add(baixa)
+
+        requisicao = RequisicaoTecnico(
+            solicitante_responsavel="Responsável",
+            solicitante_tecnico=tecnico.nome,
+            solicitante_tecnico_id=tecnico.id,
+            cliente_id=cliente.id,
+            tipo_servico=tipo_servico.nome,
+            observacao="Observação " * 50,
+            origem_mobile=True,
+            status="pendente",
+        )
+        requisicao.itens = [
+            RequisicaoTecnicoItem(
+                codigo=item.codigo,
+                descricao=item.descricao,
+                unidade="un",
+                quantidade=1,
+                valor=1,
+            )
+        ]
+        db.session.add(requisicao)
+
+        db.session.add(
+            VistoriaVeiculo(
+                veiculo_id=veiculo.id,
+                tecnico_id=tecnico.id,
+                tipo_vistoria="saida",
+                responsavel="Responsável",
+                observacao_geral="Observação " * 50,
+            )
+        )
+
+        historico = HistoricoEquipamento(
+            item_id=item.id,
+            tecnico_id=tecnico.id,
+            tipo_movimentacao="entrega",
+            status="em_uso",
+            observacao="Observação " * 50,
+        )
+        historico.itens = [
+            HistoricoEquipamentoItem(item_id=item.id, quantidade=1)
+        ]
+        db.session.add(historico)
+
+    db.session.commit()
+
+
+def _contar_consultas_listagens(app, usuario_id):
+    from flask import url_for
+    from sqlalchemy import event
+
+    consultas = []
+
+    def contar(conn, cursor, statement, parameters, context, executemany):
+        consultas.append(statement)
+
+    resultado = {}
+    cliente = app.test_client()
+
+    with cliente.session_transaction() as sessao:
+        sessao["_user_id"] = str(usuario_id)
+        sessao["_fresh"] = True
+
+    with app.test_request_context():
+        urls = {endpoint: url_for(endpoint) for endpoint in LISTAGENS_AUDITADAS}
+
+    event.listen(db.engine, "before_cursor_execute", contar)
+
+    try:
+        for endpoint, url in urls.items():
+            consultas.clear()
+            resposta = cliente.get(url)
+
+            if resposta.status_code != 200:
+                raise click.ClickException(
+                    f"{endpoint} respondeu {resposta.status_code}."
+                )
+
+            resultado[endpoint] = len(consultas)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", contar)
+
+    return resultado
+
+
+@click.command("auditar-consultas-listagens")
+@click.option("--registros", default=20, show_default=True, help="Registros por tela na primeira rodada.")
+@click.option("--limite", default=20, show_default=True, help="Máximo de consultas por tela.")
+def auditar_consultas_listagens(registros, limite):
+    """
+    Abre cada tela de lista num banco temporário, com N e depois 2N
+    registros, e falha se alguma passar de --limite consultas ou se o
+    número de consultas crescer com o volume (N+1). Roda com
+    LISTAGENS_RAISELOAD: qualquer carga fora do perfil opcoes_listagem
+    levanta erro, o que também derruba a tela aqui.
+    """
+    import tempfile
+
+    from app import create_app
+
+    pasta_temporaria = tempfile.mkdtemp(prefix="logistock_consultas_")
+
+    try:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(pasta_temporaria, 'auditoria.db')}",
+            "ASSINATURAS_DIR": os.path.join(pasta_temporaria, "assinaturas"),
+            "EMAIL_FILA_WORKER": "processo",
+            "LISTAGENS_RAISELOAD": True,
+        })
+
+        with app.app_context():
+            usuario = Usuario(
+                nome="Auditoria",
+                email="auditoria@logistock.local",
+                senha_hash=generate_password_hash(os.urandom(16).hex()),
+                perfil="admin",
+            )
+            db.session.add(usuario)
+            db.session.commit()
+
+            _semear_listagens(registros, "1")
+            primeira = _contar_consultas_listagens(app, usuario.id)
+
+            _semear_listagens(registros, "2")
+            segunda = _contar_consultas_listagens(app, usuario.id)
+
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(pasta_temporaria, ignore_errors=True)
+
+    falhas = []
+
+    for endpoint in LISTAGENS_AUDITADAS:
+        antes = primeira[endpoint]
+        depois = segunda[endpoint]
+        situacao = "ok"
+
+        if depois > limite:
+            situacao = f"acima do limite ({limite})"
+        elif depois > antes:
+            situacao = "cresce com o volume"
+
+        if situacao != "ok":
+            falhas.append(endpoint)
+
+        click.echo(f"{endpoint:<45} {antes:>4} -> {depois:>4}  {situacao}")
+
+    if falhas:
+        raise click.ClickException(
+            f"{len(falhas)} tela(s) de lista fora do perfil de consultas."
+        )
+
+    click.echo("Todas as telas de lista com consultas constantes.")
+
+
+@click.command("gerar-pdfs-lote")
+@click.option("--tipo", type=click.Choice(["movimentacao", "baixa", "requisicao"]), required=True)
+@click.option("--inicio", type=click.DateTime(formats=["%Y-%m-%d"]), help="Data inicial (inclusive).")
+@click.option("--fim", type=click.DateTime(formats=["%Y-%m-%d"]), help="Data final (inclusive).")
+@click.option("--ids", default="", help="IDs separados por vírgula.")
+@click.option("--tecnico-id", type=int, help="Só documentos deste técnico.")
+@click.option("--processos", type=int, help="Processos em paralelo (padrão: PDF_LOTE_PROCESSOS).")
+@click.option("--saida", type=click.Path(dir_okay=False, writable=True), help="Arquivo ZIP de saída.")
+@with_appcontext
+def gerar_pdfs_lote(tipo, inicio, fim, ids, tecnico_id, processos, saida):
+    """
+    Gera num ZIP os comprovantes de um período ou de uma lista de IDs,
+    montando os PDFs em vários processos (fechamento do mês).
+    """
+    from app.utils.lote_pdf import escrever_zip, processos_padrao, selecionar_ids
+
+    try:
+        lista_ids = [int(parte) for parte in ids.split(",") if parte.strip()]
+    except ValueError:
+        raise click.BadParameter("use números separados por vírgula", param_hint="--ids")
+
+    if not (lista_ids or inicio or fim):
+        raise click.UsageError("Informe --inicio/--fim ou --ids.")
+
+    selecionados = selecionar_ids(
+        tipo,
+        ids=lista_ids,
+        data_inicio=inicio.date() if inicio else None,
+        data_fim=fim.date() if fim else None,
+        tecnico_id=tecnico_id,
+    )
+
+    if not selecionados:
+        raise click.ClickException("Nenhum documento no filtro informado.")
+
+    processos = processos or processos_padrao()
+    saida = saida or f"comprovantes_{tipo}_{datetime.now():%Y%m%d_%H%M%S}.zip"
+
+    click.echo(f"{len(selecionados)} documento(s), {processos} processo(s) -> {saida}")
+
+    def progresso(prontos, total):
+        if prontos == total or prontos % 10 == 0:
+            click.echo(f"  {prontos}/{total}")
+
+    inicio_geracao = datetime.now()
+
+    with open(saida, "wb") as arquivo:
+        gerados, falhas = escrever_zip(
+            arquivo,
+            tipo,
+            selecionados,
+            processos=processos,
+            progresso=progresso,
+        )
+
+    segundos = (datetime.now() - inicio_geracao).total_seconds()
+    click.echo(f"{gerados} PDF(s) em {segundos:.1f}s.")
+
+    if falhas:
+        for registro_id, erro in falhas:
+            click.echo(f"FALHA {tipo} #{registro_id}: {erro}")
+
+        raise click.ClickException(f"{len(falhas)} documento(s) não gerado(s); veja ERROS.txt no ZIP.")
+
+
+@click.command("otimizar-fotos")
+@click.option("--threads", type=int, help="Fotos processadas em paralelo (padrão: FOTOS_THREADS).")
+@with_appcontext
+def otimizar_fotos(threads):
+    """
+    Gera as versões reduzidas (miniatura e PDF) das fotos de baixa e de
+    vistoria que ainda não têm, inclusive uploads pendentes no pool. Fotos
+    que o Pillow já recusou (<nome>.falhou) ficam de fora.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from flask import current_app
+
+    from app.utils.fotos import fotos_cadastradas, otimizar_foto
+
+    caminhos = fotos_cadastradas()
+    threads = threads or current_app.config.get("FOTOS_THREADS") or 2
+    app = current_app._get_current_object()
+
+    click.echo(f"{len(caminhos)} foto(s), {threads} thread(s).")
+
+    def otimizar(caminho):
+        with app.app_context():
+            return otimizar_foto(caminho)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        gravados = sum(executor.map(otimizar, caminhos))
+
+    click.echo(f"{gravados} arquivo(s) gerado(s).")
+
+
+@click.command("gerar-estaticos")
+@with_appcontext
+def gerar_estaticos():
+    """
+    Gera static/dist: imagens no tamanho de uso (PNG otimizado e WebP),
+    CSS/JS e manifestos dos PWAs com o hash do conteúdo no nome. Rodar
+    depois de trocar qualquer um deles e versionar o resultado.
+    """
+    from app.utils.estaticos import gerar_estaticos as gerar
+
+    antes_total = 0
+    depois_total = 0
+
+    for logico, antes, depois in gerar():
+        antes_total += antes
+        depois_total += depois
+        click.echo(f"{logico:<32} {antes / 1024:>9.1f} KB -> {depois / 1024:>8.1f} KB")
+
+    click.echo(f"Total: {antes_total / 1024:.1f} KB -> {depois_total / 1024:.1f} KB")
+
+
+@click.command("manutencao-sqlite")
+@click.option(
+    "--modo",
+    type=click.Choice(["PASSIVE", "FULL", "RESTART", "TRUNCATE"]),
+    default="TRUNCATE",
+    show_default=True,
+)
+@with_appcontext
+def manutencao_sqlite_banco(modo):
+    """Checkpoint do WAL e PRAGMA optimize (a thread dos workers usa PASSIVE)."""
+    from app.utils.sqlite_perfil import manutencao_sqlite
+
+    if db.engine.url.get_backend_name() != "sqlite":
+        raise click.ClickException("Banco não é SQLite.")
+
+    with db.engine.connect() as conexao:
+        modo_journal = conexao.execute(text("PRAGMA journal_mode")).scalar()
+
+    resultado = manutencao_sqlite(modo)
+
+    click.echo(f"journal_mode: {modo_journal}")
+    click.echo(
+        f"Checkpoint {modo}: {resultado['paginas_copiadas']} de {resultado['paginas_wal']}"
+        f" página(s) do WAL copiadas{' (banco ocupado)' if resultado['ocupado'] else ''}."
+    )
+    click.echo("PRAGMA optimize executado.")
+
+
+@click.command("benchmark-sqlite")
+@click.option("--segundos", default=5, show_default=True, type=int)
+@click.option("--leitores", default=12, show_default=True, type=int)
+@click.option("--escritores", default=4, show_default=True, type=int)
+@click.option("--linhas", default=20000, show_default=True, type=int)
+@with_appcontext
+def benchmark_sqlite(segundos, leitores, escritores, linhas):
+    """
+    Leituras e escritas concorrentes num banco temporário, com as conexões
+    como o SQLite abre ("padrao") e com o perfil configurado.
+    """
+    from app.utils.sqlite_perfil import PERFIS, medir_concorrencia, pragmas_do_perfil
+
+    perfis = [("padrao", PERFIS["padrao"]), ("configurado", pragmas_do_perfil(current_app.config))]
+
+    click.echo(
+        f"{leitores} leitor(es), {escritores} escritor(es), {segundos} s, {linhas} linhas iniciais"
+    )
+    click.echo(
+        f"{'perfil':<12} {'leituras/s':>11} {'escritas/s':>11} {'erros':>6}"
+        f" {'escrita p50':>12} {'escrita p95':>12}"
+    )
+
+    for nome, pragmas in perfis:
+        resultado = medir_concorrencia(pragmas, segundos, leitores, escritores, linhas)
+        click.echo(
+            f"{nome:<12} {resultado['leituras_s']:>11.0f} {resultado['escritas_s']:>11.0f}"
+            f" {resultado['erros']:>6} {resultado['escrita_p50_ms']:>9.1f} ms"
+            f" {resultado['escrita_p95_ms']:>9.1f} ms"
+        )
@@ -1,6 +1,8 @@
 from flask_login import UserMixin  # Se você tiver um modelo de usuário
 from datetime import datetime
 from app.extensions import db
+from flask import current_app, has_app_context
+from sqlalchemy.orm import lazyload, load_only, raiseload, selectinload
 import uuid
 
 # 🔥 COLOCA AQUI NO TOPO
@@ -13,6 +15,31 @@ class Cliente(db.Model):
 
 # resto das classes abaixo...
 
+
+# Perfis de carga das telas de lista (opcoes_listagem): cada modelo largo
+# traz só as colunas que a tela mostra e as relações usadas, em lote.
+# O resto (Text, assinatura, motivo_recusa...) fica de fora. Em produção é
+# carregado sob demanda, se alguma tela pedir; com LISTAGENS_RAISELOAD
+# (auditoria `flask auditar-consultas-listagens`, testes) levanta erro,
+# para a consulta por linha aparecer em vez de passar sem ninguém ver.
+def _listagem_estrita():
+    return has_app_context() and current_app.config.get("LISTAGENS_RAISELOAD", False)
+
+
+def _colunas_listagem(*colunas):
+    return load_only(*colunas, raiseload=_listagem_estrita())
+
+
+def _demais_relacoes():
+    return raiseload("*") if _listagem_estrita() else lazyload("*")
+
+
+def _relacao_listagem(relacao, *colunas):
+    return selectinload(relacao).options(
+        _colunas_listagem(*colunas),
+        _demais_relacoes(),
+    )
+
 class TokenAcessoTecnico(db.Model):
     __tablename__ = 'token_acesso_tecnico'
 
@@ -56,6 +83,18 @@ class Item(db.Model):
 class Estoque(db.Model):
     __tablename__ = 'estoque'
 
+    # Índice da busca de saldo (consumo FIFO, saldo por item/cliente/condição)
+    __table_args__ = (
+        db.Index(
+            'ix_estoque_busca_saldo',
+            'item_id',
+            'tipo_servico_id',
+            'tipo_estoque',
+            'cliente_id',
+            'condicao_material'
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     # Relacionamento com Item
@@ -118,6 +157,20 @@ class Estoque(db.Model):
         nullable=True
     )
 
+    # Controle de concorrência otimista: todo UPDATE confere a versão lida
+    # (UPDATE ... WHERE id = ? AND versao = ?) e falha com StaleDataError
+    # se outra requisição alterou o saldo no meio do caminho.
+    versao = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0'
+    )
+
+    __mapper_args__ = {
+        'version_id_col': versao
+    }
+
     # Relacionamentos
     cliente = db.relationship(
         'Empresa',
@@ -139,6 +192,60 @@ class Estoque(db.Model):
         return f"<Estoque Item:{self.item_id} Qtd:{self.quantidade} Tipo:{self.tipo_estoque}>"
 
 
+class EstoqueResumo(db.Model):
+    """
+    Saldo do estoque consolidado por (item, tipo_estoque, cliente,
+    tipo_servico), mantido por app/utils/resumo_estoque.py na mesma
+    transação que altera o Estoque. Lido pela tela e pelo Excel de saldo.
+    """
+    __tablename__ = 'estoque_resumo'
+
+    __table_args__ = (
+        db.Index(
+            'ix_estoque_resumo_chave',
+            'item_id',
+            'tipo_estoque',
+            'cliente_id',
+            'tipo_servico_id'
+        ),
+        db.Index('ix_estoque_resumo_tipo_cliente', 'tipo_estoque', 'cliente_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    item_id = db.Column(
+        db.Integer,
+        db.ForeignKey('itens.id'),
+        nullable=False
+    )
+
+    tipo_estoque = db.Column(db.String(20))
+
+    cliente_id = db.Column(
+        db.Integer,
+        db.ForeignKey('empresas.id'),
+        nullable=True
+    )
+
+    tipo_servico_id = db.Column(
+        db.Integer,
+        db.ForeignKey('tipo_servico.id'),
+        nullable=True
+    )
+
+    # Quantidades por condição do material
+    disponivel = db.Column(db.Integer, nullable=False, default=0)
+    usado_bom = db.Column(db.Integer, nullable=False, default=0)
+    novo_defeito = db.Column(db.Integer, nullable=False, default=0)
+    usado_defeito = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+
+    # Maiores valores entre os registros do grupo (como na consulta antiga)
+    valor_unitario = db.Column(db.Float)
+    quantidade_minima = db.Column(db.Integer)
+    endereco = db.Column(db.String(100))
+
+
 # =======================
 # NOVA FUNCIONALIDADE: REQUISIÇÕES TÉCNICOS
 # =======================
@@ -199,9 +306,11 @@ class RequisicaoTecnico(db.Model):
     # Identifica se veio da tela mobile do técnico
     origem_mobile = db.Column(db.Boolean, default=False)
 
-    # Assinatura
-    assinatura_path = db.Column(db.String(255))
-    assinatura_base64 = db.Column(db.Text)
+    # Assinatura: SHA-256 do PNG no repositório (app/utils/assinaturas.py).
+    # assinatura_path só existe em registros antigos (PNG em static/).
+    # Adiadas: só a tela de detalhe e o PDF leem, numa consulta para as duas.
+    assinatura_path = db.deferred(db.Column(db.String(255)), group="assinatura")
+    assinatura_base64 = db.deferred(db.Column(db.String(64)), group="assinatura")
 
     # Status e data
     data_hora = db.Column(db.DateTime, default=datetime.utcnow)
@@ -215,6 +324,22 @@ class RequisicaoTecnico(db.Model):
         cascade="all, delete-orphan"
     )
 
+    @classmethod
+    def opcoes_listagem(cls, *extras):
+        """Histórico e recebidas mobile: sem observações nem assinatura."""
+        return (
+            _colunas_listagem(
+                cls.solicitante_tecnico,
+                cls.tipo_servico,
+                cls.tipo_estoque,
+                cls.data_hora,
+                cls.status,
+                *extras
+            ),
+            _relacao_listagem(cls.itens, RequisicaoTecnicoItem.requisicao_id),
+            _demais_relacoes(),
+        )
+
 
 class RequisicaoTecnicoItem(db.Model):
     __tablename__ = 'requisicoes_tecnicos_itens'
@@ -241,6 +366,10 @@ class RequisicaoTecnicoItem(db.Model):
 class NotaFiscalEntrada(db.Model):
     __tablename__ = 'notas_fiscais_entrada'
 
+    __table_args__ = (
+        db.Index('ix_notas_fiscais_entrada_data_hora', 'data_hora'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     numero_nf = db.Column(
@@ -334,6 +463,11 @@ class NotaFiscalEntrada(db.Model):
 class NotaFiscalItem(db.Model):
     __tablename__ = 'notas_fiscais_itens'
 
+    # Itens da nota (totais da pesquisa e categoria pelo primeiro item)
+    __table_args__ = (
+        db.Index('ix_notas_fiscais_itens_nota', 'nota_fiscal_id', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     nota_fiscal_id = db.Column(db.Integer, db.ForeignKey('notas_fiscais_entrada.id'))
     item_id = db.Column(db.Integer, db.ForeignKey('itens.id'))
@@ -395,8 +529,9 @@ class TransferenciaExterna(db.Model):
     tipo_servico_id = db.Column(db.Integer, db.ForeignKey('tipo_servico.id'), nullable=False)
     data_hora = db.Column(db.DateTime, default=datetime.utcnow)
 
-    # 🔹 NOVO CAMPO: DataURL completo do canvas ("data:image/png;base64,...")
-    assinatura_base64 = db.Column(db.Text)
+    # SHA-256 do PNG no repositório de assinaturas (app/utils/assinaturas.py);
+    # adiada: carregada só quando lida.
+    assinatura_base64 = db.deferred(db.Column(db.String(64)))
 
     # Relacionamentos
     empresa = db.relationship('Empresa', back_populates='transferencias')
@@ -470,7 +605,9 @@ class KitInicial(db.Model):
     observacao = db.Column(db.String(255))
     data_hora = db.Column(db.DateTime, default=datetime.utcnow)
 
-    assinatura_base64 = db.Column(db.Text)
+    # SHA-256 do PNG no repositório de assinaturas (app/utils/assinaturas.py);
+    # adiada: carregada só quando lida.
+    assinatura_base64 = db.deferred(db.Column(db.String(64)))
 
     tecnico = db.relationship('Tecnico')
     tipo_servico = db.relationship('TipoServico')
@@ -511,6 +648,16 @@ class KitInicialItem(db.Model):
 class MovimentacaoEstoque(db.Model):
     __tablename__ = 'movimentacoes_estoque'
 
+    # Histórico ordena por data_hora DESC NULLS LAST, id DESC. O SQLite
+    # percorre o índice simples de trás para frente nessa ordem (e não
+    # aceita NULLS LAST em índice); o PostgreSQL precisa do índice já
+    # nessa ordem (declarado logo abaixo da classe).
+    __table_args__ = (
+        db.Index(
+            'ix_movimentacoes_estoque_data_hora', 'data_hora', 'id'
+        ).ddl_if(dialect='sqlite'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     origem_tipo = db.Column(db.String(20), nullable=False)
@@ -551,7 +698,9 @@ class MovimentacaoEstoque(db.Model):
     tipo_movimentacao = db.Column(db.String(30), nullable=True)
     motivo_retorno = db.Column(db.String(255), nullable=True)
 
-    assinatura = db.Column(db.Text, nullable=True)
+    # SHA-256 do PNG no repositório de assinaturas (app/utils/assinaturas.py);
+    # adiada: carregada só quando lida (o histórico a pede com undefer).
+    assinatura = db.deferred(db.Column(db.String(64), nullable=True))
     assinado_por = db.Column(db.String(50), nullable=True)
     termo_pdf = db.Column(db.String(255), nullable=True)
 
@@ -577,9 +726,20 @@ class MovimentacaoEstoque(db.Model):
     )
 
 
+db.Index(
+    'ix_movimentacoes_estoque_data_hora',
+    MovimentacaoEstoque.data_hora.desc().nulls_last(),
+    MovimentacaoEstoque.id.desc(),
+).ddl_if(dialect='postgresql')
+
+
 class MovimentacaoEstoqueItem(db.Model):
     __tablename__ = 'movimentacoes_estoque_itens'
 
+    __table_args__ = (
+        db.Index('ix_movimentacoes_estoque_itens_movimentacao', 'movimentacao_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     movimentacao_id = db.Column(
@@ -636,6 +796,11 @@ class Usuario(db.Model, UserMixin):
 class BaixaTecnica(db.Model):
     __tablename__ = 'baixas_tecnicas'
 
+    __table_args__ = (
+        db.Index('ix_baixas_tecnicas_data_hora', 'data_hora'),
+        db.Index('ix_baixas_tecnicas_status', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     tecnico_id = db.Column(
@@ -693,6 +858,36 @@ class BaixaTecnica(db.Model):
         cascade='all, delete-orphan'
     )
 
+    @classmethod
+    def opcoes_listagem(cls, *extras):
+        """
+        Pendentes, realizadas e histórico: colunas da tabela e, dos itens,
+        só tipo de estoque e valor (contagem e totais da linha).
+        """
+        return (
+            _colunas_listagem(
+                cls.tecnico_id,
+                cls.tipo_servico_id,
+                cls.cliente_id,
+                cls.ordem_servico_id,
+                cls.os_cliente,
+                cls.data_hora,
+                cls.status,
+                *extras
+            ),
+            _relacao_listagem(cls.tecnico, Tecnico.nome),
+            _relacao_listagem(cls.tipo_servico, TipoServico.nome),
+            _relacao_listagem(cls.cliente, Empresa.razao_social),
+            _relacao_listagem(cls.ordem_servico, OrdemServico.numero_os),
+            _relacao_listagem(
+                cls.itens,
+                BaixaTecnicaItem.baixa_tecnica_id,
+                BaixaTecnicaItem.tipo_estoque,
+                BaixaTecnicaItem.valor_total,
+            ),
+            _demais_relacoes(),
+        )
+
 
 class BaixaTecnicaItem(db.Model):
     __tablename__ = 'baixas_tecnicas_itens'
@@ -902,6 +1097,19 @@ class InventarioEstoqueItem(db.Model):
 class SaldoTecnico(db.Model):
     __tablename__ = 'saldo_tecnico'
 
+    # Índice da busca de saldo do técnico (baixa, devolução, inventário)
+    __table_args__ = (
+        db.Index(
+            'ix_saldo_tecnico_busca_saldo',
+            'tecnico_id',
+            'item_id',
+            'tipo_servico_id',
+            'tipo_estoque',
+            'cliente_id',
+            'ordem_servico_id'
+        ),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
 
     tecnico_id = db.Column(
@@ -973,6 +1181,18 @@ class SaldoTecnico(db.Model):
         nullable=True
     )
 
+    # Controle de concorrência otimista (ver Estoque.versao)
+    versao = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+        server_default='0'
+    )
+
+    __mapper_args__ = {
+        'version_id_col': versao
+    }
+
     tecnico = db.relationship(
         'Tecnico',
         back_populates='saldos'
@@ -1048,8 +1268,11 @@ class HistoricoEquipamento(db.Model):
     valor_desconto = db.Column(db.Float, default=0)
 
     termo_pdf = db.Column(db.String(255), nullable=True)
-    assinatura_tecnico = db.Column(db.Text, nullable=True)
-    assinatura_logistica = db.Column(db.Text, nullable=True)
+
+    # SHA-256 do PNG no repositório de assinaturas (app/utils/assinaturas.py);
+    # adiadas: carregadas juntas, só quando lidas.
+    assinatura_tecnico = db.deferred(db.Column(db.String(64), nullable=True), group="assinaturas")
+    assinatura_logistica = db.deferred(db.Column(db.String(64), nullable=True), group="assinaturas")
     email_enviado = db.Column(db.Boolean, default=False)
 
     data_hora = db.Column(db.DateTime, default=datetime.utcnow)
@@ -1063,6 +1286,25 @@ class HistoricoEquipamento(db.Model):
         cascade='all, delete-orphan'
     )
 
+    @classmethod
+    def opcoes_listagem(cls, *extras):
+        """Históricos de ferramentas/EPIs e equipamentos: sem assinaturas."""
+        return (
+            _colunas_listagem(
+                cls.item_id,
+                cls.tecnico_id,
+                cls.categoria,
+                cls.tipo_movimentacao,
+                cls.status,
+                cls.data_hora,
+                *extras
+            ),
+            _relacao_listagem(cls.item, Item.codigo, Item.descricao),
+            _relacao_listagem(cls.tecnico, Tecnico.nome),
+            _relacao_listagem(cls.itens, HistoricoEquipamentoItem.historico_id),
+            _demais_relacoes(),
+        )
+
     def __repr__(self):
         return f"<HistoricoEquipamento {self.id} - {self.tipo_movimentacao}>"
 
@@ -1318,12 +1560,32 @@ class VistoriaVeiculo(db.Model):
 
     observacao_geral = db.Column(db.Text, nullable=True)
 
-    assinatura_tecnico = db.Column(db.Text, nullable=True)
-    assinatura_responsavel = db.Column(db.Text, nullable=True)
+    # SHA-256 do PNG no repositório de assinaturas (app/utils/assinaturas.py);
+    # adiadas: carregadas juntas, só quando lidas.
+    assinatura_tecnico = db.deferred(db.Column(db.String(64), nullable=True), group="assinaturas")
+    assinatura_responsavel = db.deferred(db.Column(db.String(64), nullable=True), group="assinaturas")
 
     veiculo = db.relationship("Veiculo", backref="vistorias")
     tecnico = db.relationship("Tecnico", backref="vistorias_veiculo")
 
+    @classmethod
+    def opcoes_listagem(cls, *extras):
+        """Histórico de vistorias (tela e PDF): sem assinaturas."""
+        return (
+            _colunas_listagem(
+                cls.veiculo_id,
+                cls.tecnico_id,
+                cls.tipo_vistoria,
+                cls.responsavel,
+                cls.data_hora,
+                cls.km_atual,
+                *extras
+            ),
+            _relacao_listagem(cls.veiculo, Veiculo.placa, Veiculo.marca, Veiculo.modelo),
+            _relacao_listagem(cls.tecnico, Tecnico.nome),
+            _demais_relacoes(),
+        )
+
 
 class VistoriaVeiculoItem(db.Model):
     __tablename__ = "vistorias_veiculos_itens"
@@ -1372,3 +1634,173 @@ class VistoriaVeiculoFoto(db.Model):
             cascade="all, delete-orphan"
         )
     )
+
+
+# ==================================================
+# FILA DE E-MAILS (OUTBOX)
+# ==================================================
+
+class EmailFila(db.Model):
+    __tablename__ = "emails_fila"
+
+    __table_args__ = (
+        db.Index("ix_emails_fila_status_proxima", "status", "proxima_tentativa"),
+        db.Index("ix_emails_fila_referencia", "tipo", "referencia_id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    # requisicao | baixa_aprovada | baixa_recusada | movimentacao | termo_ferramenta
+    tipo = db.Column(db.String(30), nullable=False)
+    referencia_id = db.Column(db.Integer, nullable=False)
+
+    # Parâmetros do envio em JSON (attach_pdf, motivo, aprovações)
+    parametros = db.Column(db.Text, nullable=True)
+
+    # pendente | enviando | enviado | falha | sem_destinatario
+    status = db.Column(db.String(20), nullable=False, default="pendente")
+    tentativas = db.Column(db.Integer, nullable=False, default=0)
+    proxima_tentativa = db.Column(db.DateTime, default=datetime.utcnow)
+    ultimo_erro = db.Column(db.Text, nullable=True)
+
+    # Identifica o lote que reservou o registro no worker
+    lote = db.Column(db.String(36), nullable=True)
+
+    destinatario = db.Column(db.String(255), nullable=True)
+
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    enviado_em = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<EmailFila {self.id} {self.tipo}:{self.referencia_id} {self.status}>"
+
+
+# ==================================================
+# RAZÃO DO ESTOQUE (LANÇAMENTOS IMUTÁVEIS)
+# ==================================================
+
+class RazaoEstoque(db.Model):
+    """
+    Um lançamento por alteração de quantidade em Estoque ou SaldoTecnico,
+    gravado por app/utils/razao_estoque.py na mesma transação. Nunca é
+    alterado nem apagado; sem chaves estrangeiras para sobreviver à
+    exclusão de cadastros.
+    """
+    __tablename__ = "razao_estoque"
+
+    __table_args__ = (
+        db.Index("ix_razao_estoque_data_hora", "data_hora"),
+        db.Index("ix_razao_estoque_tecnico_item", "tecnico_id", "item_id", "id"),
+        db.Index("ix_razao_estoque_item", "item_id", "id"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    data_hora = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    # estoque | tecnico
+    saldo = db.Column(db.String(10), nullable=False)
+    saldo_id = db.Column(db.Integer, nullable=True)
+
+    item_id = db.Column(db.Integer, nullable=True)
+    tecnico_id = db.Column(db.Integer, nullable=True)
+    tipo_estoque = db.Column(db.String(20), nullable=True)
+    cliente_id = db.Column(db.Integer, nullable=True)
+    tipo_servico_id = db.Column(db.Integer, nullable=True)
+    ordem_servico_id = db.Column(db.Integer, nullable=True)
+    condicao_material = db.Column(db.String(30), nullable=True)
+
+    delta = db.Column(db.Integer, nullable=False)
+    quantidade_apos = db.Column(db.Integer, nullable=True)
+
+    # Documento que originou o lançamento (movimentacao, baixa, nota_fiscal,
+    # inventario_estoque, ...) e a rota/comando que gravou.
+    documento_tipo = db.Column(db.String(30), nullable=True)
+    documento_id = db.Column(db.Integer, nullable=True)
+    origem = db.Column(db.String(120), nullable=True)
+    usuario_id = db.Column(db.Integer, nullable=True)
+
+    def __repr__(self):
+        return f"<RazaoEstoque {self.id} {self.saldo}:{self.saldo_id} {self.delta:+d}>"
+
+
+class RazaoSnapshot(db.Model):
+    """
+    Ponto de controle do razão: saldo de cada chave somando todos os
+    lançamentos até `ultimo_lancamento_id`.
+    """
+    __tablename__ = "razao_snapshots"
+
+    id = db.Column(db.Integer, primary_key=True)
+    ultimo_lancamento_id = db.Column(db.Integer, nullable=False, index=True)
+
+    # Maior data_hora entre os lançamentos incluídos
+    data_corte = db.Column(db.DateTime, nullable=False, index=True)
+
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    saldos = db.relationship(
+        "RazaoSnapshotSaldo",
+        backref="snapshot",
+        cascade="all, delete-orphan"
+    )
+
+
+class RazaoSnapshotSaldo(db.Model):
+    __tablename__ = "razao_snapshot_saldos"
+
+    __table_args__ = (
+        db.Index(
+            "ix_razao_snapshot_saldos_busca",
+            "snapshot_id",
+            "tecnico_id",
+            "item_id"
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    snapshot_id = db.Column(
+        db.Integer,
+        db.ForeignKey("razao_snapshots.id"),
+        nullable=False
+    )
+
+    saldo = db.Column(db.String(10), nullable=False)
+    item_id = db.Column(db.Integer, nullable=True)
+    tecnico_id = db.Column(db.Integer, nullable=True)
+    tipo_estoque = db.Column(db.String(20), nullable=True)
+    cliente_id = db.Column(db.Integer, nullable=True)
+    tipo_servico_id = db.Column(db.Integer, nullable=True)
+    ordem_servico_id = db.Column(db.Integer, nullable=True)
+    condicao_material = db.Column(db.String(30), nullable=True)
+
+    quantidade = db.Column(db.Integer, nullable=False)
+
+
+# ==================================================
+# ENVIOS DO CELULAR (FILA OFFLINE)
+# ==================================================
+
+class EnvioOffline(db.Model):
+    """
+    Chave de idempotência de cada baixa/requisição enviada pelo celular.
+    O aparelho gera a chave ao abrir o formulário; reenvios da mesma chave
+    (fila offline, resposta perdida) devolvem o registro já gravado.
+    """
+    __tablename__ = "envios_offline"
+
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(64), nullable=False, unique=True)
+
+    # baixa | requisicao
+    tipo = db.Column(db.String(20), nullable=False)
+    registro_id = db.Column(db.Integer, nullable=False)
+    tecnico_id = db.Column(db.Integer, nullable=True)
+
+    # Hora em que o técnico preencheu (aparelho) e em que chegou ao servidor
+    criado_em = db.Column(db.DateTime, nullable=True)
+    recebido_em = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<EnvioOffline {self.chave} {self.tipo}:{self.registro_id}>"
@@ -0,0 +1,41 @@
+import os
+
+from flask import Blueprint, abort, send_file
+from flask_login import login_required
+
+from app.utils.assinaturas import caminho_assinatura, eh_chave
+
+bp_assinaturas = Blueprint(
+    "assinaturas",
+    __name__,
+    url_prefix="/assinaturas"
+)
+
+# O conteúdo de uma chave nunca muda: o navegador pode guardar para sempre.
+CACHE_SEGUNDOS = 365 * 24 * 3600
+
+
+@bp_assinaturas.route("/<chave>.png")
+@login_required
+def ver(chave):
+    if not eh_chave(chave):
+        abort(404)
+
+    caminho = caminho_assinatura(chave)
+
+    if not os.path.isfile(caminho):
+        abort(404)
+
+    resposta = send_file(
+        caminho,
+        mimetype="image/png",
+        max_age=CACHE_SEGUNDOS,
+        etag=chave,
+        conditional=True,
+    )
+    # Exige login: só o cache do navegador, nunca proxies compartilhados.
+    resposta.cache_control.public = False
+    resposta.cache_control.private = True
+    resposta.cache_control.immutable = True
+
+    return resposta
@@ -16,7 +16,6 @@ from flask_login import (
 )
 from flask_mail import Message
 import os
-import requests
 from werkzeug.security import generate_password_hash, check_password_hash
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
 from sqlalchemy import func, or_
@@ -387,6 +386,8 @@ def redefinir_senha_usuario(usuario_id):
 @auth_bp.route('/esqueci-senha', methods=['GET', 'POST'])
 def esqueci_senha():
 
+    import requests
+
     if request.method == 'POST':
 
         email = request.form.get('email', '').strip()
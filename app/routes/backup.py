@@ -1,14 +1,12 @@
-import os
-import io
-import sqlite3
-import tempfile
-from datetime import datetime
-
 from flask import Blueprint, jsonify, current_app, send_file
 from flask_login import login_required, current_user
 
-from app.extensions import db
-from app.utils.backup_drive import enviar_backup_google_drive
+from app.utils.backups import (
+    caminho_backup,
+    concluir_em_segundo_plano,
+    enviar_backup,
+    gerar_backup,
+)
 
 bp_backup = Blueprint(
     "backup",
@@ -17,34 +15,6 @@ bp_backup = Blueprint(
 )
 
 
-def localizar_banco_sqlite():
-    caminho_configurado = db.engine.url.database
-
-    if caminho_configurado:
-        caminho_configurado = os.path.abspath(caminho_configurado)
-
-        if os.path.exists(caminho_configurado):
-            return caminho_configurado
-
-    candidatos = [
-        os.path.join(os.getcwd(), "logistock.db"),
-        os.path.join(os.getcwd(), "instance", "logistock.db"),
-        os.path.join(current_app.root_path, "..", "logistock.db"),
-        os.path.join(current_app.instance_path, "logistock.db"),
-    ]
-
-    for caminho in candidatos:
-        caminho_absoluto = os.path.abspath(caminho)
-
-        if os.path.exists(caminho_absoluto):
-            return caminho_absoluto
-
-    raise Exception(
-        "Banco não encontrado. Caminhos testados: "
-        + " | ".join(os.path.abspath(c) for c in candidatos)
-    )
-
-
 @bp_backup.route("/executar")
 @login_required
 def executar_backup():
@@ -56,17 +26,21 @@ def executar_backup():
         }), 403
 
     try:
-        caminho_banco = localizar_banco_sqlite()
-
-        arquivo_id = enviar_backup_google_drive(
-            caminho_banco
-        )
+        manifesto = gerar_backup()
+        destino = current_app.config.get("BACKUP_DESTINO") or "drive"
+        enviados = enviar_backup(manifesto, destino)
+        concluir_em_segundo_plano(manifesto["nome"])
 
         return jsonify({
             "status": "ok",
-            "mensagem": "Backup enviado para o Google Drive",
-            "caminho_banco": caminho_banco,
-            "arquivo_id": arquivo_id
+            "mensagem": (
+                "Backup enviado para o Google Drive" if destino == "drive"
+                else f"Backup copiado para {destino}"
+            ),
+            "backup": manifesto["nome"],
+            "tipo": manifesto["tipo"],
+            "tamanho": manifesto["tamanho"],
+            "enviados": enviados
         })
 
     except Exception as e:
@@ -82,29 +56,21 @@ def download_backup():
     if getattr(current_user, "perfil", None) != "admin":
         return jsonify({"status": "erro", "mensagem": "Acesso apenas para admin"}), 403
 
-    caminho_banco = localizar_banco_sqlite()
-    arquivo_temporario = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
-    arquivo_temporario.close()
-
-    origem = sqlite3.connect(caminho_banco)
-    destino = sqlite3.connect(arquivo_temporario.name)
+    # Backup completo em disco, lido em blocos pelo send_file (o banco
+    # inteiro nunca passa pela memória).
     try:
-        origem.backup(destino)
-    finally:
-        destino.close()
-        origem.close()
+        manifesto = gerar_backup("completo")
+    except RuntimeError as e:
+        return jsonify({"status": "erro", "mensagem": str(e)}), 409
 
-    try:
-        with open(arquivo_temporario.name, "rb") as arquivo:
-            conteudo = io.BytesIO(arquivo.read())
-    finally:
-        os.remove(arquivo_temporario.name)
+    concluir_em_segundo_plano(manifesto["nome"])
 
-    conteudo.seek(0)
-    nome = f"logistock_render_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
     return send_file(
-        conteudo,
+        caminho_backup(manifesto),
         as_attachment=True,
-        download_name=nome,
-        mimetype="application/x-sqlite3",
+        download_name=manifesto["arquivo"],
+        mimetype=(
+            "application/gzip" if manifesto["banco"] == "sqlite"
+            else "application/octet-stream"
+        ),
     )
@@ -19,31 +19,6 @@ from sqlalchemy import func
 
 import io
 import os
-import pandas as pd
-
-from openpyxl.styles import (
-    Font,
-    PatternFill,
-    Alignment,
-    Border,
-    Side
-)
-
-from openpyxl.utils import get_column_letter
-
-from reportlab.lib.pagesizes import A4
-
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Table,
-    TableStyle,
-    Paragraph,
-    Spacer,
-    Image
-)
-
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from xml.sax.saxutils import escape
 
 from app import db
@@ -64,6 +39,16 @@ from app.utils.mailer import (
     send_baixa_aprovada_email
 )
 from app.utils.baixa_sobras import transferir_sobras_cliente_para_empresa
+from app.utils.cache_pdf import documento_pdf
+from app.utils.contadores_pendentes import obter_contadores
+from app.utils.fotos import remover_foto
+from app.utils.saldos import (
+    campos_iguais,
+    carregar_saldos_tecnico,
+    consumir_fifo,
+    disponivel,
+    repetir_em_conflito,
+)
 
 bp_baixa_desktop = Blueprint(
     "baixa_desktop",
@@ -71,6 +56,9 @@ bp_baixa_desktop = Blueprint(
     url_prefix="/baixa_desktop"
 )
 
+# Mudou o layout do PDF da baixa? Incremente para renovar o cache.
+VERSAO_LAYOUT_PDF = 1
+
 
 def buscar_saldo_tecnico(
     tecnico_id,
@@ -155,46 +143,40 @@ def valor_saldo_tecnico(
     return float(item.valor or 0) if item else 0
 
 
-def debitar_saldo_tecnico(
-    tecnico_id,
-    item_id,
-    tipo_servico_id,
-    tipo_estoque,
-    cliente_id,
-    ordem_servico_id,
-    quantidade
-):
-    saldos = buscar_saldo_tecnico(
-        tecnico_id=tecnico_id,
-        item_id=item_id,
-        tipo_servico_id=tipo_servico_id,
-        tipo_estoque=tipo_estoque,
-        cliente_id=cliente_id,
-        ordem_servico_id=ordem_servico_id
-    )
-
-    disponivel = sum(int(s.quantidade or 0) for s in saldos)
-
-    if disponivel < quantidade:
-        return False
-
-    restante = quantidade
+def carregar_saldos_baixa(baixa, itens_baixa):
+    """
+    Saldos do técnico para todos os itens da baixa em uma única consulta
+    (com bloqueio de linha no PostgreSQL), ordenados FIFO.
+    """
+    # Mesma regra de buscar_saldo_tecnico: o saldo físico é Instalação.
+    tipo_servico_id = 1 if baixa.tipo_servico_id else baixa.tipo_servico_id
 
-    for saldo in saldos:
-        atual = int(saldo.quantidade or 0)
+    return carregar_saldos_tecnico(
+        [item_baixa.item_id for item_baixa in itens_baixa],
+        SaldoTecnico.tecnico_id == baixa.tecnico_id,
+        SaldoTecnico.tipo_servico_id == tipo_servico_id
+    )
 
-        if atual <= 0:
-            continue
 
-        if atual >= restante:
-            saldo.quantidade = atual - restante
-            restante = 0
-            break
+def filtro_saldo_item_baixa(baixa, item_baixa):
+    """
+    Predicado equivalente aos filtros de buscar_saldo_tecnico para o item
+    da baixa: empresa usa o saldo geral; cliente exige cliente e O.S.
+    """
+    tipo_estoque = item_baixa.tipo_estoque or "empresa"
 
-        saldo.quantidade = 0
-        restante -= atual
+    if tipo_estoque == "cliente":
+        return campos_iguais(
+            item_id=item_baixa.item_id,
+            tipo_estoque=tipo_estoque,
+            cliente_id=item_baixa.cliente_estoque_id,
+            ordem_servico_id=baixa.ordem_servico_id
+        )
 
-    return restante == 0
+    return campos_iguais(
+        item_id=item_baixa.item_id,
+        tipo_estoque=tipo_estoque
+    )
 
 
 def baixa_pode_ser_excluida(baixa):
@@ -616,29 +598,18 @@ def detalhe_baixa(baixa_id):
 
             baixa_id_excluida = baixa.id
 
-            for foto in list(baixa.fotos):
-                caminho = (foto.caminho_arquivo or "").strip()
-
-                if caminho:
-                    caminho_abs = os.path.abspath(
-                        os.path.join(current_app.root_path, "static", caminho)
-                    )
-                    static_root = os.path.abspath(
-                        os.path.join(current_app.root_path, "static")
-                    )
-
-                    if (
-                        caminho_abs.startswith(static_root + os.sep)
-                        and os.path.exists(caminho_abs)
-                    ):
-                        try:
-                            os.remove(caminho_abs)
-                        except OSError:
-                            pass
+            caminhos_fotos = [
+                (foto.caminho_arquivo or "").strip()
+                for foto in baixa.fotos
+            ]
 
             db.session.delete(baixa)
             db.session.commit()
 
+            # Depois do commit: foto igual enviada em outra baixa continua.
+            for caminho in caminhos_fotos:
+                remover_foto(caminho)
+
             flash(f"Baixa #{baixa_id_excluida} excluída com sucesso.", "success")
             return redirect(url_for("baixa_desktop.baixas_pendentes"))
 
@@ -663,124 +634,112 @@ def detalhe_baixa(baixa_id):
                 flash("Selecione pelo menos um item para aprovar.", "warning")
                 return redirect(url_for("baixa_desktop.detalhe_baixa", baixa_id=baixa.id))
 
-            selecionados = (
-                BaixaTecnicaItem.query
-                .filter(
-                    BaixaTecnicaItem.baixa_tecnica_id == baixa.id,
-                    BaixaTecnicaItem.id.in_(itens_ids),
-                    BaixaTecnicaItem.status.in_(["pendente", "pendente_ajuste"])
+            # Só este trecho é repetido em conflito de saldo.
+            def gravar():
+                selecionados = (
+                    BaixaTecnicaItem.query
+                    .filter(
+                        BaixaTecnicaItem.baixa_tecnica_id == baixa.id,
+                        BaixaTecnicaItem.id.in_(itens_ids),
+                        BaixaTecnicaItem.status.in_(["pendente", "pendente_ajuste"])
+                    )
+                    .all()
                 )
-                .all()
-            )
 
-            erros = []
-            aprovacoes = []
+                erros = []
+                aprovacoes = []
 
-            for item_baixa in selecionados:
-                solicitado = int(item_baixa.quantidade or 0)
-                qtd_aprovar = int(qtd_digitada.get(item_baixa.id, solicitado) or 0)
+                saldos = carregar_saldos_baixa(baixa, selecionados)
 
-                cliente_ref = (
-                    item_baixa.cliente_estoque_id
-                    if item_baixa.tipo_estoque == "cliente"
-                    else None
-                )
+                for item_baixa in selecionados:
+                    solicitado = int(item_baixa.quantidade or 0)
+                    qtd_aprovar = int(qtd_digitada.get(item_baixa.id, solicitado) or 0)
 
-                disponivel = saldo_disponivel(
-                    tecnico_id=baixa.tecnico_id,
-                    item_id=item_baixa.item_id,
-                    tipo_servico_id=baixa.tipo_servico_id,
-                    tipo_estoque=item_baixa.tipo_estoque or "empresa",
-                    cliente_id=cliente_ref,
-                    ordem_servico_id=(
-                        baixa.ordem_servico_id
-                        if item_baixa.tipo_estoque == "cliente"
-                        else None
-                    )
-                )
+                    atende = filtro_saldo_item_baixa(baixa, item_baixa)
+                    maximo = min(solicitado, disponivel(saldos, atende))
 
-                maximo = min(solicitado, disponivel)
+                    if qtd_aprovar <= 0 or qtd_aprovar > maximo:
+                        codigo = getattr(item_baixa.item, "codigo", item_baixa.item_id)
+                        erros.append(f"Item {codigo}: informe entre 1 e {maximo}.")
+                        continue
 
-                if qtd_aprovar <= 0 or qtd_aprovar > maximo:
-                    codigo = getattr(item_baixa.item, "codigo", item_baixa.item_id)
-                    erros.append(f"Item {codigo}: informe entre 1 e {maximo}.")
-                    continue
+                    aprovacoes.append((item_baixa, qtd_aprovar, atende))
 
-                aprovacoes.append((item_baixa, qtd_aprovar, cliente_ref))
-
-            if erros:
-                flash("Não foi possível aprovar: " + " ".join(erros), "danger")
-                return redirect(url_for("baixa_desktop.detalhe_baixa", baixa_id=baixa.id))
+                if erros:
+                    flash("Não foi possível aprovar: " + " ".join(erros), "danger")
+                    return redirect(url_for("baixa_desktop.detalhe_baixa", baixa_id=baixa.id))
 
-            for item_baixa, qtd_aprovar, cliente_ref in aprovacoes:
-
-                ok = debitar_saldo_tecnico(
-                    tecnico_id=baixa.tecnico_id,
-                    item_id=item_baixa.item_id,
-                    tipo_servico_id=baixa.tipo_servico_id,
-                    tipo_estoque=item_baixa.tipo_estoque or "empresa",
-                    cliente_id=cliente_ref,
-                    ordem_servico_id=(
-                        baixa.ordem_servico_id
-                        if item_baixa.tipo_estoque == "cliente"
-                        else None
-                    ),
-                    quantidade=qtd_aprovar
+                faltas = consumir_fifo(
+                    saldos,
+                    [
+                        (item_baixa.id, qtd_aprovar, atende)
+                        for item_baixa, qtd_aprovar, atende in aprovacoes
+                    ]
                 )
 
-                if not ok:
-                    db.session.rollback()
+                if faltas:
+                    item_baixa = next(
+                        item for item, _, _ in aprovacoes
+                        if item.id in faltas
+                    )
                     codigo = getattr(item_baixa.item, "codigo", item_baixa.item_id)
+                    db.session.rollback()
                     flash(f"Erro ao debitar item {codigo}.", "danger")
                     return redirect(url_for("baixa_desktop.detalhe_baixa", baixa_id=baixa.id))
 
-                item_baixa.quantidade_aprovada += qtd_aprovar
-                item_baixa.quantidade -= qtd_aprovar
+                for item_baixa, qtd_aprovar, _ in aprovacoes:
+                    item_baixa.quantidade_aprovada += qtd_aprovar
+                    item_baixa.quantidade -= qtd_aprovar
 
-                if item_baixa.quantidade <= 0:
-                    item_baixa.quantidade = 0
-                    item_baixa.status = "confirmado"
-                else:
-                    item_baixa.status = "pendente"
+                    if item_baixa.quantidade <= 0:
+                        item_baixa.quantidade = 0
+                        item_baixa.status = "confirmado"
+                    else:
+                        item_baixa.status = "pendente"
 
-            pendentes = (
-                BaixaTecnicaItem.query
-                .filter(
-                    BaixaTecnicaItem.baixa_tecnica_id == baixa.id,
-                    BaixaTecnicaItem.status.in_(["pendente", "pendente_ajuste"])
+                pendentes = (
+                    BaixaTecnicaItem.query
+                    .filter(
+                        BaixaTecnicaItem.baixa_tecnica_id == baixa.id,
+                        BaixaTecnicaItem.status.in_(["pendente", "pendente_ajuste"])
+                    )
+                    .count()
                 )
-                .count()
-            )
 
-            if pendentes == 0:
-                baixa.status = "confirmado"
-                baixa.visualizado_tecnico = True
-            else:
-                baixa.status = "pendente"
+                if pendentes == 0:
+                    baixa.status = "confirmado"
+                    baixa.visualizado_tecnico = True
+                else:
+                    baixa.status = "pendente"
+
+                if baixa.ordem_servico_id:
+                    ordem = OrdemServico.query.get(baixa.ordem_servico_id)
+
+                    if ordem:
+                        baixas_abertas = (
+                            BaixaTecnica.query
+                            .filter(
+                                BaixaTecnica.ordem_servico_id == baixa.ordem_servico_id,
+                                BaixaTecnica.status.in_(["pendente", "revisada"])
+                            )
+                            .count()
+                        )
 
-            if baixa.ordem_servico_id:
-                ordem = OrdemServico.query.get(baixa.ordem_servico_id)
+                        if baixas_abertas == 0:
+                            ordem.status = "finalizada"
+                            transferir_sobras_cliente_para_empresa(
+                                tecnico_id=baixa.tecnico_id,
+                                ordem_servico_id=baixa.ordem_servico_id
+                            )
+                        else:
+                            ordem.status = "em_andamento"
 
-                if ordem:
-                    baixas_abertas = (
-                        BaixaTecnica.query
-                        .filter(
-                            BaixaTecnica.ordem_servico_id == baixa.ordem_servico_id,
-                            BaixaTecnica.status.in_(["pendente", "revisada"])
-                        )
-                        .count()
-                    )
+                db.session.commit()
 
-                    if baixas_abertas == 0:
-                        ordem.status = "finalizada"
-                        transferir_sobras_cliente_para_empresa(
-                            tecnico_id=baixa.tecnico_id,
-                            ordem_servico_id=baixa.ordem_servico_id
-                        )
-                    else:
-                        ordem.status = "em_andamento"
+            resposta = repetir_em_conflito(gravar)
 
-            db.session.commit()
+            if resposta is not None:
+                return resposta
 
             flash("Baixa aprovada com sucesso.", "success")
             return redirect(url_for("baixa_desktop.baixas_pendentes"))
@@ -844,6 +803,7 @@ def baixas_pendentes():
 
     baixas = (
         BaixaTecnica.query
+        .options(*BaixaTecnica.opcoes_listagem(BaixaTecnica.observacao))
         .filter(
             BaixaTecnica.status.in_(["pendente", "revisada"])
         )
@@ -871,7 +831,7 @@ def historico_baixas():
     data_inicio = request.args.get("data_inicio")
     data_fim = request.args.get("data_fim")
 
-    query = BaixaTecnica.query
+    query = BaixaTecnica.query.options(*BaixaTecnica.opcoes_listagem())
 
     if tecnico_id:
         query = query.filter(BaixaTecnica.tecnico_id == tecnico_id)
@@ -934,7 +894,14 @@ def baixas_realizadas():
     data_inicio = request.args.get("data_inicio")
     data_fim = request.args.get("data_fim")
 
-    query = BaixaTecnica.query.filter_by(status="confirmado")
+    query = (
+        BaixaTecnica.query
+        .options(*BaixaTecnica.opcoes_listagem(
+            BaixaTecnica.observacao,
+            BaixaTecnica.responsavel
+        ))
+        .filter_by(status="confirmado")
+    )
 
     if tecnico_id:
         query = query.filter(BaixaTecnica.tecnico_id == tecnico_id)
@@ -975,6 +942,10 @@ def baixas_realizadas():
 @login_required
 def exportar_baixa_excel(baixa_id):
 
+    import pandas as pd
+    from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+    from openpyxl.utils import get_column_letter
+
     baixa = BaixaTecnica.query.get_or_404(baixa_id)
 
     dados = []
@@ -1229,11 +1200,18 @@ def exportar_baixa_excel(baixa_id):
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
     
-@bp_baixa_desktop.route("/detalhe/<int:baixa_id>/pdf")
-@login_required
-def exportar_baixa_pdf(baixa_id):
-
-    baixa = BaixaTecnica.query.get_or_404(baixa_id)
+def _desenhar_baixa_pdf(baixa):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import (
+        SimpleDocTemplate,
+        Table,
+        TableStyle,
+        Paragraph,
+        Spacer,
+        Image,
+    )
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 
     buffer = io.BytesIO()
 
@@ -1631,6 +1609,29 @@ def exportar_baixa_pdf(baixa_id):
     pdf = buffer.getvalue()
     buffer.close()
 
+    return pdf
+
+
+@bp_baixa_desktop.route("/detalhe/<int:baixa_id>/pdf")
+@login_required
+def exportar_baixa_pdf(baixa_id):
+    baixa = BaixaTecnica.query.get_or_404(baixa_id)
+
+    pdf = documento_pdf(
+        "baixa_desktop",
+        baixa.id,
+        VERSAO_LAYOUT_PDF,
+        [
+            baixa,
+            baixa.tecnico,
+            baixa.cliente,
+            baixa.tipo_servico,
+            baixa.ordem_servico,
+            [[item, item.item] for item in baixa.itens],
+        ],
+        lambda: _desenhar_baixa_pdf(baixa),
+    )
+
     response = make_response(pdf)
     response.headers["Content-Type"] = "application/pdf"
     response.headers["Content-Disposition"] = (
@@ -1642,12 +1643,6 @@ def exportar_baixa_pdf(baixa_id):
 
 @bp_baixa_desktop.route("/api/pendentes/count")
 def api_baixas_pendentes_count():
-    count = (
-        BaixaTecnica.query
-        .filter(
-            BaixaTecnica.status.in_(["pendente", "revisada"])
-        )
-        .count()
-    )
+    count = obter_contadores()["baixas"]
 
     return {"count": count}
@@ -18,9 +18,7 @@ from flask_login import (
 
 from datetime import datetime
 from sqlalchemy import func, or_
-import os
 
-from werkzeug.utils import secure_filename
 from werkzeug.security import (
     generate_password_hash,
     check_password_hash
@@ -41,6 +39,15 @@ from app.models import (
     OrdemServico
 )
 from app.utils.baixa_sobras import transferir_sobras_cliente_para_empresa
+from app.utils.catalogo_itens import obter_catalogo
+from app.utils.envios_offline import (
+    EnvioRecusado,
+    envio_existente,
+    ler_chave,
+    registrar_envio,
+)
+from app.utils.fotos import guardar_foto
+from app.utils.saldos import repetir_em_conflito
 
 bp_baixa_tecnico = Blueprint(
     "baixa_tecnico",
@@ -300,75 +307,162 @@ def formulario_mobile_dedicado(tecnico_id=None):
 # API O.S POR CLIENTE - BASEADA NO SALDO TÉCNICO
 # ==========================================================
 
-@bp_baixa_tecnico.route("/api/os-por-cliente")
-@login_required
-def api_os_por_cliente():
-    tecnico_id = request.args.get("tecnico_id", type=int)
-    cliente_id = request.args.get("cliente_id", type=int)
-    baixa_id_corrigir = request.args.get("baixa_id_corrigir", type=int)
-
-    if not tecnico_id or not cliente_id:
-        return jsonify({"ordens": []})
-
+STATUS_BAIXA_OCUPA_OS = [
+    "pendente",
+    "revisada",
+    "pendente_ajuste",
+    "recusado",
+    "confirmado",
+    "aprovada",
+    "aprovada_parcial"
+]
+
+
+def ordens_servico_disponiveis(cliente_id=None, ignorar_baixa_id=None):
+    """
+    O.S abertas ainda sem baixa (de um cliente, ou de todos quando
+    cliente_id é None). ignorar_baixa_id libera a O.S da baixa em correção.
+    """
     filtro_baixas = db.session.query(BaixaTecnica.id).filter(
         BaixaTecnica.ordem_servico_id == OrdemServico.id,
-        BaixaTecnica.status.in_([
-            "pendente",
-            "revisada",
-            "pendente_ajuste",
-            "recusado",
-            "confirmado",
-            "aprovada",
-            "aprovada_parcial"
-        ])
+        BaixaTecnica.status.in_(STATUS_BAIXA_OCUPA_OS)
     )
 
-    if baixa_id_corrigir:
-        baixa_correcao = BaixaTecnica.query.filter(
-            BaixaTecnica.id == baixa_id_corrigir,
-            BaixaTecnica.tecnico_id == tecnico_id,
-            BaixaTecnica.status.in_(["recusado", "pendente_ajuste"]),
-            BaixaTecnica.origem_mobile == True
-        ).first()
-        if baixa_correcao:
-            filtro_baixas = filtro_baixas.filter(
-                BaixaTecnica.id != baixa_correcao.id
-            )
+    if ignorar_baixa_id:
+        filtro_baixas = filtro_baixas.filter(
+            BaixaTecnica.id != ignorar_baixa_id
+        )
 
-    registros = (
+    query = (
         db.session.query(
             OrdemServico.id.label("ordem_servico_id"),
+            OrdemServico.cliente_id,
             OrdemServico.numero_os,
             OrdemServico.endereco
         )
         .filter(
-            OrdemServico.cliente_id == cliente_id,
             or_(
                 OrdemServico.status.is_(None),
                 OrdemServico.status.in_(["aberta", "em_andamento"])
             ),
             ~filtro_baixas.exists()
         )
-        .order_by(
-            OrdemServico.numero_os
-        )
-        .all()
     )
 
+    if cliente_id:
+        query = query.filter(OrdemServico.cliente_id == cliente_id)
+
     ordens = []
 
-    for r in registros:
+    for r in query.order_by(OrdemServico.numero_os).all():
         ordens.append({
             "ordem_servico_id": r.ordem_servico_id,
+            "cliente_id": r.cliente_id,
             "numero_os": r.numero_os,
             "endereco": r.endereco or "",
             "tipo_servico_id": "",
             "tipo_servico_nome": ""
         })
 
+    return ordens
+
+
+@bp_baixa_tecnico.route("/api/os-por-cliente")
+@login_required
+def api_os_por_cliente():
+    tecnico_id = request.args.get("tecnico_id", type=int)
+    cliente_id = request.args.get("cliente_id", type=int)
+    baixa_id_corrigir = request.args.get("baixa_id_corrigir", type=int)
+
+    if not tecnico_id or not cliente_id:
+        return jsonify({"ordens": []})
+
+    baixa_correcao = None
+
+    if baixa_id_corrigir:
+        baixa_correcao = BaixaTecnica.query.filter(
+            BaixaTecnica.id == baixa_id_corrigir,
+            BaixaTecnica.tecnico_id == tecnico_id,
+            BaixaTecnica.status.in_(["recusado", "pendente_ajuste"]),
+            BaixaTecnica.origem_mobile == True
+        ).first()
+
+    ordens = ordens_servico_disponiveis(
+        cliente_id,
+        ignorar_baixa_id=baixa_correcao.id if baixa_correcao else None
+    )
+
     return jsonify({"ordens": ordens})
 
 
+def saldos_offline_tecnico(tecnico_id):
+    """
+    Saldo do técnico no formato de /api/itens, uma linha por item/estoque/
+    cliente/O.S, para o celular montar a baixa sem conexão. O valor segue
+    valor_saldo_tecnico: o do registro de saldo mais antigo ou o do item.
+    """
+    registros = (
+        SaldoTecnico.query
+        .filter(
+            SaldoTecnico.tecnico_id == tecnico_id,
+            SaldoTecnico.tipo_servico_id == 1,
+            SaldoTecnico.tipo_estoque.in_(["empresa", "cliente"]),
+            SaldoTecnico.quantidade > 0
+        )
+        .order_by(SaldoTecnico.id.asc())
+        .all()
+    )
+
+    catalogo = obter_catalogo()
+    linhas = {}
+
+    for saldo in registros:
+        if saldo.tipo_estoque == "cliente":
+            chave = (saldo.item_id, "cliente", saldo.cliente_id, saldo.ordem_servico_id)
+        elif saldo.cliente_id is None and saldo.ordem_servico_id is None:
+            chave = (saldo.item_id, "empresa", None, None)
+        else:
+            continue
+
+        if chave not in linhas:
+            item = catalogo.por_id.get(saldo.item_id)
+
+            if item is None:
+                registro = db.session.get(Item, saldo.item_id)
+
+                if registro is None:
+                    continue
+
+                item = {
+                    "codigo": registro.codigo,
+                    "descricao": registro.descricao,
+                    "unidade": registro.unidade,
+                    "valor": float(registro.valor or 0),
+                }
+
+            valor = (
+                float(saldo.valor_unitario)
+                if saldo.valor_unitario is not None
+                else item["valor"]
+            )
+
+            linhas[chave] = {
+                "item_id": saldo.item_id,
+                "codigo": item["codigo"],
+                "descricao": item["descricao"],
+                "unidade": item["unidade"],
+                "tipo_estoque": chave[1],
+                "cliente_id": chave[2],
+                "ordem_servico_id": chave[3],
+                "saldo": 0,
+                "valor": valor
+            }
+
+        linhas[chave]["saldo"] += int(saldo.quantidade or 0)
+
+    return list(linhas.values())
+
+
 # ==========================================================
 # ALTERAR SENHA TÉCNICO
 # ==========================================================
@@ -482,24 +576,36 @@ def api_itens():
     )
 
     resultado = []
+    catalogo = obter_catalogo()
 
     for item_id, tipo_registro, saldo in rows:
-        item = Item.query.get(item_id)
+        # Código/descrição/unidade vêm do catálogo em memória; item criado
+        # há pouco em outro worker ainda pode não estar nele.
+        item = catalogo.por_id.get(item_id)
+
+        if item is None:
+            registro = db.session.get(Item, item_id)
+            item = registro and {
+                "id": registro.id,
+                "codigo": registro.codigo,
+                "descricao": registro.descricao,
+                "unidade": registro.unidade,
+            }
 
         if item and int(saldo or 0) > 0:
             valor = valor_saldo_tecnico(
                 tecnico_id=tecnico_id,
-                item_id=item.id,
+                item_id=item["id"],
                 tipo_estoque=tipo_estoque,
                 cliente_id=cliente_id,
                 ordem_servico_id=ordem_servico_id
             )
 
             resultado.append({
-                "item_id": item.id,
-                "codigo": item.codigo,
-                "descricao": item.descricao,
-                "unidade": item.unidade,
+                "item_id": item["id"],
+                "codigo": item["codigo"],
+                "descricao": item["descricao"],
+                "unidade": item["unidade"],
                 "saldo": int(saldo or 0),
                 "valor": valor
             })
@@ -514,46 +620,12 @@ def api_itens():
 # REGISTRAR BAIXA MOBILE
 # ==========================================================
 
-@bp_baixa_tecnico.route("/registrar", methods=["POST"])
-@login_required
-def registrar():
-    tecnico_id = request.form.get("tecnico_id", type=int)
-    tipo_servico_id = request.form.get("tipo_servico_id", type=int)
-    cliente_id = request.form.get("cliente_id", type=int)
-    ordem_servico_id = request.form.get("ordem_servico_id", type=int)
-    baixa_id_corrigir = request.form.get("baixa_id_corrigir", type=int)
-
-    endereco = request.form.get("endereco", "").strip()
-    observacao = request.form.get("observacao", "").strip() or "N/D"
-    ordem_servico = request.form.get("ordem_servico", "").strip()
-
-    tecnico = Tecnico.query.get(tecnico_id)
-    responsavel = tecnico.nome if tecnico else "Técnico"
-
-    if not tecnico_id or not tipo_servico_id:
-        flash("Preencha Tipo de Serviço.", "warning")
-        return redirect(
-            url_for(
-                "baixa_tecnico.formulario_mobile_dedicado",
-                tecnico_id=tecnico_id
-            )
-        )
-
-    item_ids = request.form.getlist("item_id[]")
-    quantidades = request.form.getlist("quantidade[]")
-    tipos_estoque = request.form.getlist("tipo_estoque[]")
-    clientes_estoque = request.form.getlist("cliente_estoque_id[]")
-
-    if not item_ids:
-        flash("Adicione ao menos um item à baixa.", "warning")
-        return redirect(
-            url_for(
-                "baixa_tecnico.formulario_mobile_dedicado",
-                tecnico_id=tecnico_id
-            )
-        )
-
-    cliente = Empresa.query.get(cliente_id) if cliente_id else None
+def _itens_baixa_formulario(form):
+    """Itens do formulário agrupados por item/estoque/cliente de origem."""
+    item_ids = form.getlist("item_id[]")
+    quantidades = form.getlist("quantidade[]")
+    tipos_estoque = form.getlist("tipo_estoque[]")
+    clientes_estoque = form.getlist("cliente_estoque_id[]")
 
     itens_por_origem = {}
 
@@ -595,16 +667,44 @@ def registrar():
 
             itens_por_origem[chave_item]["quantidade"] += qtd
 
-    itens_validos = list(itens_por_origem.values())
+    return list(itens_por_origem.values())
+
+
+def gravar_baixa_mobile(form, files):
+    """
+    Grava (sem commit) a baixa enviada pelo formulário mobile, nova ou
+    correção de uma devolvida. Usada pelo formulário e pelo envio em lote
+    da fila offline (tecnico_mobile.api_envios).
+
+    Retorna (baixa, revisada, fotos_recusadas), esta com os nomes dos
+    arquivos que não são imagem; validação que impede a gravação levanta
+    EnvioRecusado com a mensagem para o técnico.
+    """
+    tecnico_id = form.get("tecnico_id", type=int)
+    tipo_servico_id = form.get("tipo_servico_id", type=int)
+    cliente_id = form.get("cliente_id", type=int)
+    ordem_servico_id = form.get("ordem_servico_id", type=int)
+    baixa_id_corrigir = form.get("baixa_id_corrigir", type=int)
+
+    endereco = form.get("endereco", "").strip()
+    observacao = form.get("observacao", "").strip() or "N/D"
+    ordem_servico = form.get("ordem_servico", "").strip()
+
+    tecnico = Tecnico.query.get(tecnico_id)
+    responsavel = tecnico.nome if tecnico else "Técnico"
+
+    if not tecnico_id or not tipo_servico_id:
+        raise EnvioRecusado("Preencha Tipo de Serviço.")
+
+    if not form.getlist("item_id[]"):
+        raise EnvioRecusado("Adicione ao menos um item à baixa.")
+
+    cliente = Empresa.query.get(cliente_id) if cliente_id else None
+
+    itens_validos = _itens_baixa_formulario(form)
 
     if not itens_validos:
-        flash("Informe ao menos um item com quantidade.", "warning")
-        return redirect(
-            url_for(
-                "baixa_tecnico.formulario_mobile_dedicado",
-                tecnico_id=tecnico_id
-            )
-        )
+        raise EnvioRecusado("Informe ao menos um item com quantidade.")
 
     for dados in itens_validos:
         saldo_total = quantidade_saldo_tecnico(
@@ -621,196 +721,209 @@ def registrar():
 
         if int(dados["quantidade"] or 0) > saldo_total:
             item = Item.query.get(dados["item_id"])
-            flash(
+            raise EnvioRecusado(
                 f"Quantidade maior que o saldo disponível para {item.descricao if item else dados['item_id']}.",
                 "danger"
             )
-            return redirect(
-                url_for(
-                    "baixa_tecnico.formulario_mobile_dedicado",
-                    tecnico_id=tecnico_id
-                )
-            )
 
-    try:
-        nome_cliente_os = None
-
-        if cliente:
-            nome_cliente_os = cliente.razao_social
-
-            if getattr(cliente, "numero_os", None):
-                nome_cliente_os += f" - {cliente.numero_os}"
-            elif ordem_servico:
-                nome_cliente_os += f" - {ordem_servico}"
-
-        baixa_existente = None
-
-        if baixa_id_corrigir:
-            baixa_existente = (
-                BaixaTecnica.query
-                .filter(
-                    BaixaTecnica.id == baixa_id_corrigir,
-                    BaixaTecnica.tecnico_id == tecnico_id,
-                    BaixaTecnica.status.in_(["recusado", "pendente_ajuste"]),
-                    BaixaTecnica.origem_mobile == True
-                )
-                .first()
-            )
+    nome_cliente_os = None
 
-            if not baixa_existente:
-                flash("Baixa devolvida para correção não encontrada.", "danger")
-                return redirect(
-                    url_for(
-                        "baixa_tecnico.formulario_mobile_dedicado",
-                        tecnico_id=tecnico_id
-                    )
-                )
-        if baixa_existente:
-            baixa = baixa_existente
+    if cliente:
+        nome_cliente_os = cliente.razao_social
 
-            baixa.tipo_servico_id = tipo_servico_id
-            baixa.cliente_id = cliente_id
-            baixa.ordem_servico_id = ordem_servico_id
-            baixa.os_cliente = nome_cliente_os
-            baixa.endereco = endereco
-            baixa.observacao = observacao
-            baixa.status = "revisada"
-            baixa.motivo_recusa = None
-            baixa.visualizado_tecnico = False
+        if getattr(cliente, "numero_os", None):
+            nome_cliente_os += f" - {cliente.numero_os}"
+        elif ordem_servico:
+            nome_cliente_os += f" - {ordem_servico}"
 
-            for item_antigo in list(baixa.itens):
-                if item_antigo.status in ["recusado", "pendente_ajuste"]:
-                    db.session.delete(item_antigo)
+    baixa_existente = None
 
-            db.session.flush()
+    if baixa_id_corrigir:
+        baixa_existente = (
+            BaixaTecnica.query
+            .filter(
+                BaixaTecnica.id == baixa_id_corrigir,
+                BaixaTecnica.tecnico_id == tecnico_id,
+                BaixaTecnica.status.in_(["recusado", "pendente_ajuste"]),
+                BaixaTecnica.origem_mobile == True
+            )
+            .first()
+        )
 
-        else:
-            baixa = BaixaTecnica(
-                tecnico_id=tecnico_id,
-                tipo_servico_id=tipo_servico_id,
-                cliente_id=cliente_id,
-                ordem_servico_id=ordem_servico_id,
-                os_cliente=nome_cliente_os,
-                endereco=endereco,
-                responsavel=responsavel,
-                observacao=observacao,
-                status="pendente",
-                origem_mobile=True,
-                data_hora=datetime.now()
+        if not baixa_existente:
+            raise EnvioRecusado(
+                "Baixa devolvida para correção não encontrada.",
+                "danger"
             )
 
-            db.session.add(baixa)
-            db.session.flush()
+    if baixa_existente:
+        baixa = baixa_existente
+
+        baixa.tipo_servico_id = tipo_servico_id
+        baixa.cliente_id = cliente_id
+        baixa.ordem_servico_id = ordem_servico_id
+        baixa.os_cliente = nome_cliente_os
+        baixa.endereco = endereco
+        baixa.observacao = observacao
+        baixa.status = "revisada"
+        baixa.motivo_recusa = None
+        baixa.visualizado_tecnico = False
 
-        if ordem_servico_id:
-            ordem = OrdemServico.query.get(ordem_servico_id)
-            if ordem and ordem.status != "finalizada":
-                ordem.status = "em_andamento"
+        for item_antigo in list(baixa.itens):
+            if item_antigo.status in ["recusado", "pendente_ajuste"]:
+                db.session.delete(item_antigo)
 
-        fotos = request.files.getlist("fotos[]")
-        legendas = request.form.getlist("legenda_foto[]")
+        db.session.flush()
 
-        pasta_upload = os.path.join(
-            "app",
-            "static",
-            "uploads",
-            "baixas"
+    else:
+        baixa = BaixaTecnica(
+            tecnico_id=tecnico_id,
+            tipo_servico_id=tipo_servico_id,
+            cliente_id=cliente_id,
+            ordem_servico_id=ordem_servico_id,
+            os_cliente=nome_cliente_os,
+            endereco=endereco,
+            responsavel=responsavel,
+            observacao=observacao,
+            status="pendente",
+            origem_mobile=True,
+            data_hora=datetime.now()
         )
 
-        os.makedirs(pasta_upload, exist_ok=True)
+        db.session.add(baixa)
+        db.session.flush()
 
-        for i, foto in enumerate(fotos):
+    if ordem_servico_id:
+        ordem = OrdemServico.query.get(ordem_servico_id)
+        if ordem and ordem.status != "finalizada":
+            ordem.status = "em_andamento"
 
-            if not foto or not foto.filename:
-                continue
+    fotos = files.getlist("fotos[]")
+    legendas = form.getlist("legenda_foto[]")
+    fotos_recusadas = []
 
-            nome_original = secure_filename(foto.filename)
-            extensao = os.path.splitext(nome_original)[1]
+    for i, foto in enumerate(fotos):
 
-            nome_arquivo = (
-                f"baixa_{baixa.id}_{datetime.now().strftime('%Y%m%d%H%M%S')}_{i}{extensao}"
-            )
+        if not foto or not foto.filename:
+            continue
 
-            caminho_salvar = os.path.join(pasta_upload, nome_arquivo)
+        # Redimensionamento e miniaturas ficam para o pool de fotos.
+        caminho_arquivo = guardar_foto(foto)
 
-            foto.save(caminho_salvar)
+        if not caminho_arquivo:
+            fotos_recusadas.append(foto.filename)
+            continue
 
-            legenda = legendas[i].strip() if i < len(legendas) else ""
+        legenda = legendas[i].strip() if i < len(legendas) else ""
 
-            db.session.add(
-                BaixaTecnicaFoto(
-                    baixa_tecnica_id=baixa.id,
-                    caminho_arquivo=f"uploads/baixas/{nome_arquivo}",
-                    legenda=legenda
-                )
+        db.session.add(
+            BaixaTecnicaFoto(
+                baixa_tecnica_id=baixa.id,
+                caminho_arquivo=caminho_arquivo,
+                legenda=legenda
             )
+        )
 
-        for dados in itens_validos:
-            valor_unitario = valor_saldo_tecnico(
-                tecnico_id=tecnico_id,
+    for dados in itens_validos:
+        valor_unitario = valor_saldo_tecnico(
+            tecnico_id=tecnico_id,
+            item_id=dados["item_id"],
+            tipo_estoque=dados["tipo_estoque"],
+            cliente_id=dados["cliente_estoque_id"],
+            ordem_servico_id=(
+                ordem_servico_id
+                if dados["tipo_estoque"] == "cliente"
+                else None
+            )
+        )
+
+        existente = (
+            BaixaTecnicaItem.query
+            .filter_by(
+                baixa_tecnica_id=baixa.id,
                 item_id=dados["item_id"],
                 tipo_estoque=dados["tipo_estoque"],
-                cliente_id=dados["cliente_estoque_id"],
-                ordem_servico_id=(
-                    ordem_servico_id
-                    if dados["tipo_estoque"] == "cliente"
-                    else None
-                )
+                cliente_estoque_id=dados["cliente_estoque_id"]
             )
+            .first()
+        )
+
+        if existente and existente.status in ["pendente", "pendente_ajuste"]:
+            existente.quantidade = dados["quantidade"]
+            existente.valor_unitario = valor_unitario
+            existente.valor_total = float(dados["quantidade"] or 0) * valor_unitario
+            existente.status = "pendente"
 
-            existente = (
-                BaixaTecnicaItem.query
-                .filter_by(
+        else:
+            db.session.add(
+                BaixaTecnicaItem(
                     baixa_tecnica_id=baixa.id,
                     item_id=dados["item_id"],
                     tipo_estoque=dados["tipo_estoque"],
-                    cliente_estoque_id=dados["cliente_estoque_id"]
+                    cliente_estoque_id=dados["cliente_estoque_id"],
+                    quantidade=dados["quantidade"],
+                    quantidade_aprovada=0,
+                    valor_unitario=valor_unitario,
+                    valor_total=(
+                        float(dados["quantidade"] or 0)
+                        * valor_unitario
+                    ),
+                    status="pendente"
                 )
-                .first()
             )
 
-            if existente and existente.status in ["pendente", "pendente_ajuste"]:
-                existente.quantidade = dados["quantidade"]
-                existente.valor_unitario = valor_unitario
-                existente.valor_total = float(dados["quantidade"] or 0) * valor_unitario
-                existente.status = "pendente"
+    return baixa, baixa_existente is not None, fotos_recusadas
 
-            else:
-                db.session.add(
-                    BaixaTecnicaItem(
-                        baixa_tecnica_id=baixa.id,
-                        item_id=dados["item_id"],
-                        tipo_estoque=dados["tipo_estoque"],
-                        cliente_estoque_id=dados["cliente_estoque_id"],
-                        quantidade=dados["quantidade"],
-                        quantidade_aprovada=0,
-                        valor_unitario=valor_unitario,
-                        valor_total=(
-                            float(dados["quantidade"] or 0)
-                            * valor_unitario
-                        ),
-                        status="pendente"
-                    )
-                )
+
+@bp_baixa_tecnico.route("/registrar", methods=["POST"])
+@login_required
+def registrar():
+    tecnico_id = request.form.get("tecnico_id", type=int)
+    chave = ler_chave(request.form.get("chave_envio"))
+
+    destino = redirect(
+        url_for(
+            "baixa_tecnico.formulario_mobile_dedicado",
+            tecnico_id=tecnico_id
+        )
+    )
+
+    # Mesmo formulário reenviado (clique duplo, fila offline): já gravado.
+    if envio_existente(chave):
+        flash("Baixa já recebida. Aguarde aprovação.", "info")
+        return destino
+
+    try:
+        baixa, revisada, fotos_recusadas = gravar_baixa_mobile(
+            request.form,
+            request.files
+        )
+        registrar_envio(chave, "baixa", baixa.id, tecnico_id)
 
         db.session.commit()
 
-        if baixa_existente:
+        if revisada:
             flash("Baixa revisada e reenviada para aprovação.", "success")
         else:
             flash("Baixa enviada com sucesso. Aguarde aprovação.", "success")
 
+        if fotos_recusadas:
+            flash(
+                "Fotos ignoradas (não são imagens válidas): "
+                + ", ".join(fotos_recusadas),
+                "warning"
+            )
+
+    except EnvioRecusado as e:
+        db.session.rollback()
+        flash(str(e), e.categoria)
+
     except Exception as e:
         db.session.rollback()
         print("ERRO BAIXA MOBILE:", e)
         flash("Erro ao registrar baixa.", "danger")
 
-    return redirect(
-        url_for(
-            "baixa_tecnico.formulario_mobile_dedicado",
-            tecnico_id=tecnico_id
-        )
-    )
+    return destino
     
     # ==========================================================
 # BAIXAS PENDENTES MOBILE - APROVAÇÃO EM CAMPO
@@ -825,6 +938,10 @@ def pendentes_mobile():
 
     baixas = (
         BaixaTecnica.query
+        .options(*BaixaTecnica.opcoes_listagem(
+            BaixaTecnica.endereco,
+            BaixaTecnica.origem_mobile
+        ))
         .filter(
             BaixaTecnica.status.in_(["pendente", "revisada"])
         )
@@ -948,25 +1065,26 @@ def aprovar_mobile(baixa_id):
 
     baixa = BaixaTecnica.query.get_or_404(baixa_id)
 
-    itens_pendentes = (
-        BaixaTecnicaItem.query
-        .filter(
-            BaixaTecnicaItem.baixa_tecnica_id == baixa.id,
-            BaixaTecnicaItem.status.in_(["pendente", "pendente_ajuste"])
-        )
-        .all()
-    )
-
-    if not itens_pendentes:
-        flash("Nenhum item pendente encontrado para aprovação.", "warning")
-        return redirect(
-            url_for(
-                "baixa_tecnico.detalhe_pendente_mobile",
-                baixa_id=baixa.id
+    # Só este trecho é repetido em conflito de saldo: os itens pendentes
+    # são relidos a cada tentativa.
+    def gravar():
+        itens_pendentes = (
+            BaixaTecnicaItem.query
+            .filter(
+                BaixaTecnicaItem.baixa_tecnica_id == baixa.id,
+                BaixaTecnicaItem.status.in_(["pendente", "pendente_ajuste"])
             )
+            .all()
         )
 
-    try:
+        if not itens_pendentes:
+            flash("Nenhum item pendente encontrado para aprovação.", "warning")
+            return redirect(
+                url_for(
+                    "baixa_tecnico.detalhe_pendente_mobile",
+                    baixa_id=baixa.id
+                )
+            )
 
         for item_baixa in itens_pendentes:
 
@@ -1066,6 +1184,12 @@ def aprovar_mobile(baixa_id):
 
         db.session.commit()
 
+    try:
+        resposta = repetir_em_conflito(gravar)
+
+        if resposta is not None:
+            return resposta
+
         flash("Baixa aprovada com sucesso.", "success")
 
     except Exception as e:
@@ -0,0 +1,79 @@
+from flask import Blueprint, jsonify, request
+from flask_login import login_required
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models import Item
+from app.utils.busca_itens import CAMPOS, LIMITE_PADRAO, buscar_itens
+from app.utils.catalogo_itens import responder as responder_catalogo
+
+bp_busca_itens = Blueprint(
+    "busca_itens",
+    __name__,
+    url_prefix="/api/itens"
+)
+
+
+@bp_busca_itens.route("/search")
+@login_required
+def search():
+    """
+    Busca de itens para os seletores (autocompletar): sem acento, código
+    por trecho, descrição por prefixo e o código exato primeiro.
+
+    q: termo; campo: "codigo" ou "descricao" (padrão: os dois);
+    categoria: filtra Item.categoria sem diferenciar maiúsculas;
+    limite: máximo de resultados.
+    """
+    termo = (request.args.get("q") or "").strip()
+    campo = request.args.get("campo") or None
+    categoria = (request.args.get("categoria") or "").strip()
+    limite = request.args.get("limite", LIMITE_PADRAO, type=int)
+
+    if campo and campo not in CAMPOS:
+        return jsonify({"erro": "Campo inválido."}), 400
+
+    if not termo:
+        return jsonify([])
+
+    # Com categoria o filtro vem depois da busca: pede folga para não
+    # devolver menos itens do que o limite.
+    ids = buscar_itens(termo, limite * 5 if categoria else limite, campo)
+
+    if not ids:
+        return jsonify([])
+
+    query = db.session.query(Item).filter(Item.id.in_(ids))
+
+    if categoria:
+        # Categorias gravadas em maiúsculas e minúsculas ("EPI", "epi").
+        query = query.filter(func.lower(Item.categoria) == categoria.lower())
+
+    itens = {item.id: item for item in query}
+    ordenados = [itens[item_id] for item_id in ids if item_id in itens][:limite]
+
+    return jsonify([
+        {
+            "id": item.id,
+            "codigo": item.codigo,
+            "descricao": item.descricao,
+            "unidade": item.unidade,
+            "valor": float(item.valor or 0),
+            "categoria": item.categoria,
+        }
+        for item in ordenados
+    ])
+
+
+@bp_busca_itens.route("/catalogo")
+@login_required
+def catalogo():
+    """
+    Catálogo completo (código, descrição, unidade, valor, categoria) para
+    os seletores do celular. O aparelho guarda a resposta e revalida pelo
+    ETag: enquanto nenhum item mudar, volta só um 304.
+    """
+    return responder_catalogo(
+        "catalogo",
+        lambda catalogo: {"versao": catalogo.versao, "itens": catalogo.itens},
+    )
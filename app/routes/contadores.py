@@ -0,0 +1,129 @@
+import json
+import threading
+import time
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_login import current_user, login_required
+
+from app.utils.contadores import metricas_contadores
+from app.utils.contadores_pendentes import (
+    aguardar_mudanca,
+    etag_contadores,
+    obter_contadores,
+)
+
+bp_contadores = Blueprint(
+    "contadores",
+    __name__,
+    url_prefix="/contadores"
+)
+
+# Cada stream ocupa uma thread do worker; passado o limite o navegador
+# recebe 204 e cai no polling condicional (ETag/304).
+MAX_STREAMS_PADRAO = 8
+
+# O stream é encerrado periodicamente e o EventSource reconecta sozinho,
+# liberando a thread e revalidando a sessão do usuário.
+DURACAO_STREAM_SEGUNDOS = 300
+HEARTBEAT_SEGUNDOS = 20
+RECONEXAO_MS = 5000
+
+_streams_lock = threading.Lock()
+_streams_abertos = 0
+
+
+def _reservar_stream():
+    global _streams_abertos
+
+    limite = current_app.config.get("CONTADORES_SSE_MAX_STREAMS", MAX_STREAMS_PADRAO)
+
+    with _streams_lock:
+        if _streams_abertos >= limite:
+            return False
+
+        _streams_abertos += 1
+        return True
+
+
+def _liberar_stream():
+    global _streams_abertos
+
+    with _streams_lock:
+        _streams_abertos -= 1
+
+
+def _evento_sse(valores):
+    return (
+        f"id: {etag_contadores(valores)}\n"
+        "event: contadores\n"
+        f"data: {json.dumps(valores)}\n\n"
+    )
+
+
+@bp_contadores.route("/pendentes")
+@login_required
+def pendentes():
+    valores = obter_contadores()
+
+    response = jsonify(valores)
+    response.set_etag(etag_contadores(valores))
+    response.headers["Cache-Control"] = "no-cache"
+
+    return response.make_conditional(request)
+
+
+@bp_contadores.route("/metricas")
+@login_required
+def metricas():
+    if getattr(current_user, "perfil", None) != "admin":
+        return jsonify({"erro": "Acesso permitido apenas para administrador"}), 403
+
+    return jsonify(metricas_contadores())
+
+
+@bp_contadores.route("/stream")
+@login_required
+def stream():
+    if not _reservar_stream():
+        return Response(status=204)
+
+    app = current_app._get_current_object()
+    ultimo_etag = request.headers.get("Last-Event-ID")
+
+    def gerar():
+        nonlocal ultimo_etag
+
+        try:
+            yield f"retry: {RECONEXAO_MS}\n\n"
+
+            valores = obter_contadores()
+
+            if etag_contadores(valores) != ultimo_etag:
+                ultimo_etag = etag_contadores(valores)
+                yield _evento_sse(valores)
+
+            fim = time.monotonic() + DURACAO_STREAM_SEGUNDOS
+
+            while time.monotonic() < fim:
+                espera = min(HEARTBEAT_SEGUNDOS, fim - time.monotonic())
+                valores = aguardar_mudanca(ultimo_etag, espera)
+                etag = etag_contadores(valores)
+
+                if etag != ultimo_etag:
+                    ultimo_etag = etag
+                    yield _evento_sse(valores)
+                else:
+                    yield ": ping\n\n"
+
+        except Exception:
+            app.logger.exception("Erro no stream de contadores pendentes")
+
+    response = Response(
+        stream_with_context(gerar()),
+        mimetype="text/event-stream"
+    )
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.call_on_close(_liberar_stream)
+
+    return response
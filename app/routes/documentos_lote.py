@@ -0,0 +1,131 @@
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, flash, redirect, render_template, request, stream_with_context, url_for
+from flask_login import current_user, login_required
+
+from app.models import Tecnico
+from app.utils.lote_pdf import (
+    TIPOS_DOCUMENTO,
+    liberar_lote,
+    reservar_lote,
+    selecionar_ids,
+    zip_em_fluxo,
+)
+
+bp_documentos_lote = Blueprint(
+    "documentos_lote",
+    __name__,
+    url_prefix="/documentos-lote"
+)
+
+PERFIS_LOTE = {"admin", "estoque"}
+
+NOMES_TIPO = {
+    "movimentacao": "Movimentações de estoque",
+    "baixa": "Baixas técnicas",
+    "requisicao": "Requisições de material",
+}
+
+
+def _pode_gerar_lote():
+    return getattr(current_user, "perfil", None) in PERFIS_LOTE
+
+
+def _ler_data(valor):
+    valor = (valor or "").strip()
+    return datetime.strptime(valor, "%Y-%m-%d").date() if valor else None
+
+
+def _ler_ids(valor):
+    return [int(parte) for parte in (valor or "").replace(";", ",").split(",") if parte.strip()]
+
+
+@bp_documentos_lote.route("/")
+@login_required
+def index():
+    if not _pode_gerar_lote():
+        flash("Acesso permitido apenas para administrador ou estoque.", "danger")
+        return redirect(url_for("home.home"))
+
+    tecnicos = Tecnico.query.order_by(Tecnico.nome).all()
+
+    return render_template(
+        "documentos_lote/index.html",
+        tipos=NOMES_TIPO,
+        tecnicos=tecnicos,
+        limite=current_app.config.get("PDF_LOTE_MAX_DOCUMENTOS", 1000)
+    )
+
+
+@bp_documentos_lote.route("/zip")
+@login_required
+def baixar_zip():
+    if not _pode_gerar_lote():
+        flash("Acesso permitido apenas para administrador ou estoque.", "danger")
+        return redirect(url_for("home.home"))
+
+    tipo = request.args.get("tipo", "")
+
+    if tipo not in TIPOS_DOCUMENTO:
+        flash("Escolha o tipo de documento.", "warning")
+        return redirect(url_for("documentos_lote.index"))
+
+    try:
+        data_inicio = _ler_data(request.args.get("data_inicio"))
+        data_fim = _ler_data(request.args.get("data_fim"))
+        ids = _ler_ids(request.args.get("ids"))
+    except ValueError:
+        flash("Datas ou IDs inválidos.", "warning")
+        return redirect(url_for("documentos_lote.index"))
+
+    if not (ids or data_inicio or data_fim):
+        flash("Informe um período ou uma lista de IDs.", "warning")
+        return redirect(url_for("documentos_lote.index"))
+
+    selecionados = selecionar_ids(
+        tipo,
+        ids=ids,
+        data_inicio=data_inicio,
+        data_fim=data_fim,
+        tecnico_id=request.args.get("tecnico_id", type=int),
+    )
+
+    limite = current_app.config.get("PDF_LOTE_MAX_DOCUMENTOS", 1000)
+
+    if not selecionados:
+        flash("Nenhum documento no filtro informado.", "warning")
+        return redirect(url_for("documentos_lote.index"))
+
+    if len(selecionados) > limite:
+        flash(
+            f"{len(selecionados)} documentos no filtro; o limite por download é {limite}. "
+            "Reduza o período ou use `flask gerar-pdfs-lote`.",
+            "warning"
+        )
+        return redirect(url_for("documentos_lote.index"))
+
+    # Um lote por vez por worker (PDF_LOTE_SIMULTANEOS): o pool de
+    # processos é compartilhado e o excedente só disputaria as mesmas CPUs.
+    if not reservar_lote():
+        return Response(
+            "Outro lote de comprovantes está sendo gerado. Tente novamente em instantes.",
+            status=429,
+            mimetype="text/plain",
+            headers={"Retry-After": "30"}
+        )
+
+    # O ZIP sai em streaming, um documento por vez; o total vai no
+    # cabeçalho para quem quiser acompanhar o progresso.
+    response = Response(
+        stream_with_context(zip_em_fluxo(tipo, selecionados)),
+        mimetype="application/zip"
+    )
+    # Libera a vaga quando a resposta fecha, inclusive se o cliente desistir.
+    response.call_on_close(liberar_lote)
+    response.headers["Content-Disposition"] = (
+        f"attachment; filename=comprovantes_{tipo}_{datetime.now():%Y%m%d_%H%M}.zip"
+    )
+    response.headers["X-Total-Documentos"] = str(len(selecionados))
+    response.headers["X-Accel-Buffering"] = "no"
+
+    return response
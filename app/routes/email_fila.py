@@ -0,0 +1,93 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models import EmailFila
+from app.utils.email_fila import (
+    STATUS_ENVIADO,
+    STATUS_ENVIANDO,
+    STATUS_FALHA,
+    STATUS_PENDENTE,
+    STATUS_SEM_DESTINATARIO,
+    reenviar_email,
+)
+
+bp_email_fila = Blueprint(
+    "email_fila",
+    __name__,
+    url_prefix="/emails"
+)
+
+PERFIS_FILA_EMAILS = {"admin", "estoque"}
+FILA_POR_PAGINA = 50
+
+
+def _pode_ver_fila():
+    return getattr(current_user, "perfil", None) in PERFIS_FILA_EMAILS
+
+
+@bp_email_fila.route("/fila")
+@login_required
+def fila():
+    if not _pode_ver_fila():
+        flash("Acesso permitido apenas para administrador ou estoque.", "danger")
+        return redirect(url_for("home.home"))
+
+    status = request.args.get("status", "")
+    page = request.args.get("page", 1, type=int)
+
+    contagens = dict(
+        db.session.query(EmailFila.status, func.count(EmailFila.id))
+        .group_by(EmailFila.status)
+        .all()
+    )
+
+    query = EmailFila.query
+
+    if status:
+        query = query.filter(EmailFila.status == status)
+
+    emails = (
+        query
+        .order_by(EmailFila.id.desc())
+        .paginate(
+            page=page,
+            per_page=FILA_POR_PAGINA,
+            error_out=False
+        )
+    )
+
+    return render_template(
+        "email_fila/fila.html",
+        emails=emails,
+        contagens=contagens,
+        status=status,
+        status_opcoes=[
+            (STATUS_PENDENTE, "Pendente"),
+            (STATUS_ENVIANDO, "Enviando"),
+            (STATUS_ENVIADO, "Enviado"),
+            (STATUS_FALHA, "Falha"),
+            (STATUS_SEM_DESTINATARIO, "Sem destinatário"),
+        ]
+    )
+
+
+@bp_email_fila.route("/fila/<int:email_id>/reenviar", methods=["POST"])
+@login_required
+def reenviar(email_id):
+    if not _pode_ver_fila():
+        flash("Acesso permitido apenas para administrador ou estoque.", "danger")
+        return redirect(url_for("home.home"))
+
+    entrada = EmailFila.query.get_or_404(email_id)
+
+    if entrada.status in [STATUS_ENVIADO, STATUS_ENVIANDO]:
+        flash("Este e-mail já foi enviado ou está em envio.", "warning")
+        return redirect(url_for("email_fila.fila"))
+
+    reenviar_email(entrada)
+    db.session.commit()
+
+    flash(f"E-mail #{entrada.id} recolocado na fila de envio.", "success")
+    return redirect(url_for("email_fila.fila", status=request.args.get("status", "")))
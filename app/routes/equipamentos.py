@@ -3,6 +3,7 @@ from app.extensions import db
 from app.models import Item, Tecnico, TipoServico, Estoque, EquipamentoTecnico, HistoricoEquipamento
 from datetime import datetime
 from sqlalchemy import func
+from app.utils.catalogo_itens import responder as responder_catalogo
 
 bp_equipamentos = Blueprint('equipamentos', __name__, url_prefix='/equipamentos')
 
@@ -97,15 +98,28 @@ def nova_movimentacao():
 # 📊 API - ITENS FILTRADOS POR TIPO DE SERVIÇO
 @bp_equipamentos.route('/api/itens_equipamentos/<int:tipo_servico_id>')
 def api_itens_equipamentos(tipo_servico_id):
-    itens = Item.query.filter_by(eh_equipamento=True).all()
-    resultado = [{"codigo": item.codigo, "descricao": item.descricao} for item in itens]
-    return jsonify(resultado)
+    return responder_catalogo(
+        "equipamentos",
+        lambda catalogo: [
+            {"codigo": item["codigo"], "descricao": item["descricao"]}
+            for item in catalogo.itens
+            if item["eh_equipamento"]
+        ],
+    )
 
 
 # 📅 HISTÓRICO COMPLETO
 @bp_equipamentos.route('/historico')
 def historico_equipamentos():
-    historico = HistoricoEquipamento.query.order_by(HistoricoEquipamento.data_hora.desc()).all()
+    historico = (
+        HistoricoEquipamento.query
+        .options(*HistoricoEquipamento.opcoes_listagem(
+            HistoricoEquipamento.local,
+            HistoricoEquipamento.observacao
+        ))
+        .order_by(HistoricoEquipamento.data_hora.desc())
+        .all()
+    )
     return render_template('equipamentos/historico_equipamento.html', historico=historico)
 
 
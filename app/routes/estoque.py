@@ -1,12 +1,15 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from app import db
-from app.models import Item, Estoque, TipoServico
-import pandas as pd
+from app.models import Item, Estoque, EstoqueResumo, TipoServico
+from sqlalchemy import func
 from flask_login import login_required
-from app.utils.valores_estoque import sincronizar_valor_empresa_item
+from app.utils.busca_itens import condicao_busca
 
 bp = Blueprint('estoque', __name__, url_prefix='/estoque')
 
+# Linhas com aviso/erro exibidas no resumo da importação.
+LIMITE_LINHAS_RESUMO = 500
+
 
 # ------------------------
 # Cadastro de Item Manual
@@ -61,10 +64,10 @@ def listar_itens():
     query = Item.query
 
     if codigo:
-        query = query.filter(Item.codigo.ilike(f'%{codigo}%'))
+        query = query.filter(condicao_busca(codigo, "codigo"))
 
     if descricao:
-        query = query.filter(Item.descricao.ilike(f'%{descricao}%'))
+        query = query.filter(condicao_busca(descricao, "descricao"))
 
     if categoria:
         query = query.filter(Item.categoria == categoria)
@@ -113,6 +116,9 @@ def converter_valor(valor_raw):
 @bp.route('/importar', methods=['POST'])
 @login_required
 def importar_itens():
+    import pandas as pd
+    from app.utils.importacao_itens import importar_planilha_itens
+
     arquivo = request.files.get('arquivo')
     
     categoria_importacao = request.form.get(
@@ -120,121 +126,46 @@ def importar_itens():
     'MATERIAL'
     ).strip().upper()
 
-    if categoria_importacao not in [
-        'MATERIAL',
-        'FERRAMENTA',
-        'EPI'
-    ]:
-        categoria_importacao = 'MATERIAL'
+    simular = request.form.get('simular') == '1'
 
     if not arquivo:
         flash('Nenhum arquivo selecionado.', 'danger')
         return redirect(url_for('estoque.cadastrar_item'))
 
     try:
-        df = pd.read_excel(arquivo)
-
-        importados = 0
-        atualizados = 0
-
-        for _, row in df.iterrows():
-
-            codigo = str(
-                row.get(
-                    'Código',
-                    row.get(
-                        'CODIGO',
-                        row.get('codigo', '')
-                    )
-                )
-            ).strip().upper()
-
-            descricao = str(
-                row.get(
-                    'Descrição',
-                    row.get(
-                        'DESCRICAO',
-                        row.get('descricao', '')
-                    )
-                )
-            ).strip()
-
-            unidade = str(
-                row.get(
-                    'Unidade de Medida',
-                    row.get(
-                        'Unidade',
-                        row.get(
-                            'UNIDADE',
-                            row.get('unidade', '')
-                        )
-                    )
-                )
-            ).strip()
-
-            valor_raw = row.get(
-                'Valor',
-                row.get(
-                    'Valor Unitário',
-                    row.get(
-                        'VALOR',
-                        row.get('valor', 0)
-                    )
-                )
-            )
-
-            categoria = categoria_importacao
-
-            try:
-                valor = converter_valor(valor_raw)
-            except Exception:
-                valor = 0.0
-
-            if not codigo or codigo == 'NAN':
-                continue
-
-            if not descricao or descricao.upper() == 'NAN':
-                descricao = 'ITEM IMPORTADO'
-
-            if not unidade or unidade.upper() == 'NAN':
-                unidade = 'UN'
-
-            item_existente = Item.query.filter_by(codigo=codigo).first()
-
-            if item_existente:
-                item_existente.descricao = descricao
-                item_existente.unidade = unidade
-                item_existente.valor = valor
-                item_existente.categoria = categoria
-                item_existente.eh_equipamento = categoria in ['FERRAMENTA', 'EPI']
-                sincronizar_valor_empresa_item(item_existente.id, valor)
-                atualizados += 1
-
-            else:
-                novo_item = Item(
-                    codigo=codigo,
-                    descricao=descricao,
-                    unidade=unidade,
-                    valor=valor,
-                    categoria=categoria,
-                    eh_equipamento=categoria in ['FERRAMENTA', 'EPI']
-                )
-
-                db.session.add(novo_item)
-                importados += 1
+        # dtype=object mantém o texto/número como veio da célula
+        # (código "00123" não vira 123.0).
+        df = pd.read_excel(arquivo, dtype=object)
+
+        resultado = importar_planilha_itens(
+            df,
+            categoria=categoria_importacao,
+            simular=simular
+        )
 
-        db.session.commit()
+        if simular:
+            db.session.rollback()
+        else:
+            db.session.commit()
 
         flash(
-            f'Importação concluída! Novos: {importados} | Atualizados: {atualizados}',
-            'success'
+            f'{"Simulação" if simular else "Importação"} concluída! '
+            f'Novos: {resultado["novos"]} | Atualizados: {resultado["atualizados"]} | '
+            f'Sem alteração: {resultado["inalterados"]} | Ignorados: {resultado["ignorados"]}',
+            'info' if simular else 'success'
         )
 
     except Exception as e:
         db.session.rollback()
         flash(f'Erro ao importar itens: {str(e)}', 'danger')
+        return redirect(url_for('estoque.cadastrar_item'))
 
-    return redirect(url_for('estoque.cadastrar_item'))
+    return render_template(
+        'estoque/cadastro.html',
+        resultado_importacao=resultado,
+        importacao_simulada=simular,
+        limite_linhas_importacao=LIMITE_LINHAS_RESUMO
+    )
 
 
 # ------------------------
@@ -302,6 +233,64 @@ def buscar_alertas_estoque(tipo_servico_id=None):
 
     return alertas
 
+# ------------------------
+# Saldo consolidado (tabela estoque_resumo)
+# ------------------------
+def _query_saldo_resumo(*colunas):
+    """
+    Soma as linhas do resumo (uma por item/tipo/cliente/tipo de serviço)
+    no lugar dos SUM(CASE ...) sobre todo o Estoque.
+    """
+    return db.session.query(
+        *colunas,
+        func.coalesce(
+            func.max(EstoqueResumo.valor_unitario),
+            Item.valor
+        ).label("valor"),
+        func.sum(EstoqueResumo.disponivel).label("disponivel"),
+        func.sum(EstoqueResumo.usado_bom).label("usado_bom"),
+        func.sum(EstoqueResumo.novo_defeito).label("novo_defeito"),
+        func.sum(EstoqueResumo.usado_defeito).label("usado_defeito"),
+        func.sum(EstoqueResumo.total).label("total"),
+        func.max(EstoqueResumo.quantidade_minima).label("quantidade_minima"),
+        func.max(EstoqueResumo.endereco).label("endereco")
+    ).join(
+        Item,
+        EstoqueResumo.item_id == Item.id
+    )
+
+
+def _filtrar_saldo_resumo(query, tipo_estoque, cliente_id, tipo_servico_id, categoria):
+    if categoria:
+        query = query.filter(Item.categoria == categoria)
+
+    if tipo_estoque == "empresa":
+        query = query.filter(
+            db.or_(
+                EstoqueResumo.tipo_estoque == "empresa",
+                EstoqueResumo.tipo_estoque == None
+            )
+        )
+
+    elif tipo_estoque == "cliente":
+        query = query.filter(EstoqueResumo.tipo_estoque == "cliente")
+
+        if cliente_id:
+            query = query.filter(EstoqueResumo.cliente_id == cliente_id)
+
+    tipo_servico_consulta_id = tipo_servico_id
+
+    if tipo_servico_id and tipo_servico_id != 1:
+        tipo_servico_consulta_id = 1
+
+    if tipo_servico_consulta_id:
+        query = query.filter(
+            EstoqueResumo.tipo_servico_id == tipo_servico_consulta_id
+        )
+
+    return query
+
+
 # ------------------------
 # API: Estoque
 # ------------------------
@@ -309,7 +298,6 @@ def buscar_alertas_estoque(tipo_servico_id=None):
 @login_required
 def saldo_estoque():
 
-    from sqlalchemy import func, case
     from app.models import Empresa, TipoServico
 
     codigo = request.args.get('codigo', '').strip()
@@ -364,119 +352,40 @@ def saldo_estoque():
             categoria=categoria
         )
 
-    disponivel = func.sum(
-        case(
-            (
-                db.or_(
-                    Estoque.condicao_material == None,
-                    Estoque.condicao_material == "",
-                    Estoque.condicao_material == "DISPONIVEL"
-                ),
-                Estoque.quantidade
-            ),
-            else_=0
-        )
-    ).label("disponivel")
-
-    usado_bom = func.sum(
-        case(
-            (
-                Estoque.condicao_material == "USADO_BOM",
-                Estoque.quantidade
-            ),
-            else_=0
-        )
-    ).label("usado_bom")
-
-    novo_defeito = func.sum(
-        case(
-            (
-                Estoque.condicao_material == "NOVO_DEF",
-                Estoque.quantidade
-            ),
-            else_=0
-        )
-    ).label("novo_defeito")
-
-    usado_defeito = func.sum(
-        case(
-            (
-                Estoque.condicao_material == "USADO_DEF",
-                Estoque.quantidade
-            ),
-            else_=0
-        )
-    ).label("usado_defeito")
-
-    total = func.sum(Estoque.quantidade).label("total")
-
-    valor_estoque = func.coalesce(
-        func.max(Estoque.valor_unitario),
-        Item.valor
-    ).label("valor")
-
     query = (
-        db.session.query(
+        _query_saldo_resumo(
             Item.codigo,
             Item.descricao,
             Item.unidade,
             Item.categoria,
-            valor_estoque,
-            disponivel,
-            usado_bom,
-            novo_defeito,
-            usado_defeito,
-            total,
-            func.max(Estoque.quantidade_minima).label('quantidade_minima'),
-            func.max(Estoque.endereco).label('endereco'),
-            Estoque.item_id,
-            Estoque.tipo_estoque,
-            Estoque.cliente_id,
+            EstoqueResumo.item_id,
+            EstoqueResumo.tipo_estoque,
+            EstoqueResumo.cliente_id,
             Empresa.razao_social.label("cliente_nome")
         )
-        .join(Item, Estoque.item_id == Item.id)
-        .outerjoin(Empresa, Estoque.cliente_id == Empresa.id)
+        .outerjoin(Empresa, EstoqueResumo.cliente_id == Empresa.id)
     )
 
     if codigo:
-        query = query.filter(Item.codigo.ilike(f'%{codigo}%'))
+        query = query.filter(condicao_busca(codigo, "codigo"))
 
     if descricao:
-        query = query.filter(Item.descricao.ilike(f'%{descricao}%'))
-
-    if categoria:
-        query = query.filter(Item.categoria == categoria)
-
-    if tipo_estoque == "cliente":
-        query = query.filter(
-            Estoque.tipo_estoque == "cliente",
-            Estoque.cliente_id == cliente_id
-        )
-
-    elif tipo_estoque == "empresa":
-        query = query.filter(
-            db.or_(
-                Estoque.tipo_estoque == "empresa",
-                Estoque.tipo_estoque == None
-            )
-        )
-
-    tipo_servico_consulta_id = tipo_servico_id
-
-    if tipo_servico_id and tipo_servico_id != 1:
-        tipo_servico_consulta_id = 1
-
-    if tipo_servico_consulta_id:
-        query = query.filter(
-            Estoque.tipo_servico_id == tipo_servico_consulta_id
-        )
+        query = query.filter(condicao_busca(descricao, "descricao"))
+
+    query = _filtrar_saldo_resumo(
+        query,
+        tipo_estoque,
+        cliente_id,
+        tipo_servico_id,
+        categoria
+    )
 
     resultados = (
         query
         .group_by(
-            Estoque.item_id,
-            Estoque.tipo_estoque,
-            Estoque.cliente_id,
+            EstoqueResumo.item_id,
+            EstoqueResumo.tipo_estoque,
+            EstoqueResumo.cliente_id,
             Item.codigo,
             Item.descricao,
             Item.unidade,
@@ -484,7 +393,7 @@ def saldo_estoque():
             Item.valor,
             Empresa.razao_social
         )
-        .having(func.sum(Estoque.quantidade) > 0)
+        .having(func.sum(EstoqueResumo.total) > 0)
         .order_by(
             Empresa.razao_social,
             Item.descricao
@@ -890,6 +799,7 @@ def exportar_criticos():
 @login_required
 def exportar_alertas_excel():
     from flask import send_file
+    import pandas as pd
     import io
     from datetime import datetime
 
@@ -1081,7 +991,6 @@ def exportar_saldo_excel():
     import pandas as pd
     import io
     from datetime import datetime
-    from sqlalchemy import func, case
     from app.models import Empresa, TipoServico
 
     tipo_estoque = request.args.get("tipo_estoque")
@@ -1100,109 +1009,28 @@ def exportar_saldo_excel():
         tipo_servico = TipoServico.query.get(tipo_servico_id)
         tipo_servico_nome = tipo_servico.nome if tipo_servico else "Todos"
 
-    disponivel = func.sum(
-        case(
-            (
-                db.or_(
-                    Estoque.condicao_material == None,
-                    Estoque.condicao_material == "",
-                    Estoque.condicao_material == "DISPONIVEL"
-                ),
-                Estoque.quantidade
-            ),
-            else_=0
-        )
-    ).label("disponivel")
-
-    usado_bom = func.sum(
-        case(
-            (
-                Estoque.condicao_material == "USADO_BOM",
-                Estoque.quantidade
-            ),
-            else_=0
-        )
-    ).label("usado_bom")
-
-    novo_defeito = func.sum(
-        case(
-            (
-                Estoque.condicao_material == "NOVO_DEF",
-                Estoque.quantidade
-            ),
-            else_=0
-        )
-    ).label("novo_defeito")
-
-    usado_defeito = func.sum(
-        case(
-            (
-                Estoque.condicao_material == "USADO_DEF",
-                Estoque.quantidade
-            ),
-            else_=0
-        )
-    ).label("usado_defeito")
-
-    total = func.sum(Estoque.quantidade).label("total")
-
-    valor_estoque = func.coalesce(
-        func.max(Estoque.valor_unitario),
-        Item.valor
-    ).label("valor")
-
-    query = db.session.query(
+    query = _query_saldo_resumo(
         Item.codigo,
         Item.descricao,
-        Item.unidade,
-        valor_estoque,
-        disponivel,
-        usado_bom,
-        novo_defeito,
-        usado_defeito,
-        total,
-        func.max(Estoque.quantidade_minima).label("quantidade_minima"),
-        func.max(Estoque.endereco).label("endereco")
-    ).join(
-        Item,
-        Estoque.item_id == Item.id
+        Item.unidade
     )
 
-    if categoria:
-        query = query.filter(Item.categoria == categoria)
-
-    if tipo_estoque == "empresa":
-        query = query.filter(
-            db.or_(
-                Estoque.tipo_estoque == "empresa",
-                Estoque.tipo_estoque == None
-            )
-        )
-
-    elif tipo_estoque == "cliente":
-        query = query.filter(Estoque.tipo_estoque == "cliente")
-
-        if cliente_id:
-            query = query.filter(Estoque.cliente_id == cliente_id)
-
-    tipo_servico_consulta_id = tipo_servico_id
-
-    if tipo_servico_id and tipo_servico_id != 1:
-        tipo_servico_consulta_id = 1
-
-    if tipo_servico_consulta_id:
-        query = query.filter(
-            Estoque.tipo_servico_id == tipo_servico_consulta_id
-        )
+    query = _filtrar_saldo_resumo(
+        query,
+        tipo_estoque,
+        cliente_id,
+        tipo_servico_id,
+        categoria
+    )
 
     resultados = query.group_by(
-        Estoque.item_id,
+        EstoqueResumo.item_id,
         Item.codigo,
         Item.descricao,
         Item.unidade,
         Item.valor
     ).having(
-        func.sum(Estoque.quantidade) > 0
+        func.sum(EstoqueResumo.total) > 0
     ).order_by(
         Item.descricao
     ).all()
@@ -15,16 +15,11 @@ from flask_login import login_required
 from datetime import datetime
 
 import io
-import pandas as pd
 
-from sqlalchemy import func, or_
+from sqlalchemy import func
 
 import os
 
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-
 from app.extensions import db
 
 from app.models import (
@@ -35,6 +30,10 @@ from app.models import (
     HistoricoEquipamento,
     HistoricoEquipamentoItem,
 )
+from app.utils.assinaturas import guardar_assinatura, ler_assinatura
+from app.utils.busca_itens import condicao_busca
+from app.utils.cache_pdf import colunas_registro, documento_pdf
+from app.utils.saldos import alocar_fifo, carregar_posse_tecnico, repetir_em_conflito
 
 
 bp_ferramentas_epis = Blueprint(
@@ -48,6 +47,9 @@ bp_ferramentas_epis = Blueprint(
 # HELPERS
 # ==========================================================
 
+# Mudou o layout do termo? Incremente para renovar o cache de PDFs.
+VERSAO_LAYOUT_PDF = 1
+
 MOTIVOS_RETORNO = [
     "devolucao",
     "troca",
@@ -103,39 +105,30 @@ def creditar_estoque_empresa(item_id, quantidade):
     return estoque
 
 
-def remover_posse_tecnico(item_id, tecnico_id, quantidade, novo_status, motivo=None):
-    registros = (
-        EquipamentoTecnico.query
-        .filter_by(
-            item_id=item_id,
-            tecnico_id=tecnico_id,
-            status="tecnico"
-        )
-        .order_by(EquipamentoTecnico.data_hora.asc())
-        .all()
+def remover_posse_tecnico(registros, item_id, quantidade, novo_status, motivo=None):
+    """
+    Retira a posse do técnico em FIFO sobre os registros já carregados por
+    carregar_posse_tecnico (uma consulta para o retorno inteiro).
+    """
+    alocacoes, faltante = alocar_fifo(
+        registros,
+        quantidade,
+        lambda reg: reg.item_id == item_id and reg.status == "tecnico"
     )
 
-    saldo_total = sum(r.quantidade or 0 for r in registros)
-
-    if saldo_total < quantidade:
+    if faltante > 0:
         return False
 
-    restante = quantidade
-
-    for reg in registros:
-        if restante <= 0:
-            break
-
+    for reg, baixa in alocacoes:
         qtd_reg = reg.quantidade or 0
 
-        if qtd_reg <= restante:
+        if baixa >= qtd_reg:
             reg.status = novo_status
             reg.local = motivo or novo_status
             reg.data_hora = datetime.utcnow()
-            restante -= qtd_reg
 
         else:
-            reg.quantidade = qtd_reg - restante
+            reg.quantidade = qtd_reg - baixa
 
             novo = EquipamentoTecnico(
                 item_id=reg.item_id,
@@ -143,14 +136,13 @@ def remover_posse_tecnico(item_id, tecnico_id, quantidade, novo_status, motivo=N
                 categoria=reg.categoria,
                 local=motivo or novo_status,
                 status=novo_status,
-                quantidade=restante,
+                quantidade=baixa,
                 valor_unitario=reg.valor_unitario,
-                valor_total=(reg.valor_unitario or 0) * restante,
+                valor_total=(reg.valor_unitario or 0) * baixa,
                 data_hora=datetime.utcnow()
             )
 
             db.session.add(novo)
-            restante = 0
 
     return True
 
@@ -176,8 +168,8 @@ def transferencia():
         tecnico_id = request.form.get("tecnico_id")
         motivo_retorno = request.form.get("motivo_retorno")
         observacao = (request.form.get("observacao") or "").strip() or "N/D"
-        assinatura_tecnico = request.form.get("assinatura_tecnico")
-        assinatura_logistica = request.form.get("assinatura_logistica")
+        assinatura_tecnico = guardar_assinatura(request.form.get("assinatura_tecnico"))
+        assinatura_logistica = guardar_assinatura(request.form.get("assinatura_logistica"))
 
         item_ids = request.form.getlist("item_id[]")
         quantidades = request.form.getlist("quantidade[]")
@@ -226,132 +218,150 @@ def transferencia():
                 motivo_geral = mapa_motivo[motivo_retorno]
                 local_geral = "EMPRESA" if motivo_retorno == "devolucao" else "BAIXA PATRIMONIAL"
 
-            primeiro_item_id = item_ids[0] if item_ids else None
-
-            historico = HistoricoEquipamento(
-                item_id=primeiro_item_id,
-                tecnico_id=tecnico_id,
-                categoria="multiplo",
-                tipo_movimentacao=tipo_transferencia,
-                local=local_geral,
-                status=status_geral,
-                motivo=motivo_geral,
-                observacao=observacao,
-                assinatura_tecnico=assinatura_tecnico,
-                assinatura_logistica=assinatura_logistica,
-                email_enviado=False,
-                data_hora=datetime.utcnow()
-            )
-
-            db.session.add(historico)
-            db.session.flush()
+            historico = None
+            enviado = False
+
+            # Só este trecho é repetido em conflito de saldo.
+            def gravar():
+                nonlocal historico, enviado
+
+                primeiro_item_id = item_ids[0] if item_ids else None
+
+                historico = HistoricoEquipamento(
+                    item_id=primeiro_item_id,
+                    tecnico_id=tecnico_id,
+                    categoria="multiplo",
+                    tipo_movimentacao=tipo_transferencia,
+                    local=local_geral,
+                    status=status_geral,
+                    motivo=motivo_geral,
+                    observacao=observacao,
+                    assinatura_tecnico=assinatura_tecnico,
+                    assinatura_logistica=assinatura_logistica,
+                    email_enviado=False,
+                    data_hora=datetime.utcnow()
+                )
 
-            itens_processados = 0
+                db.session.add(historico)
+                db.session.flush()
 
-            for item_id, qtd in zip(item_ids, quantidades):
-                quantidade = int(qtd or 0)
+                itens_processados = 0
 
-                if not item_id or quantidade <= 0:
-                    continue
+                posse_tecnico = (
+                    carregar_posse_tecnico(tecnico_id, item_ids)
+                    if tipo_transferencia == "retorno"
+                    else []
+                )
 
-                item = Item.query.get_or_404(item_id)
-                categoria = normalizar_categoria(item.categoria)
+                for item_id, qtd in zip(item_ids, quantidades):
+                    quantidade = int(qtd or 0)
 
-                if categoria not in ["FERRAMENTA", "EPI"]:
-                    db.session.rollback()
-                    flash(f"O item {item.descricao} não é Ferramenta nem EPI.", "danger")
-                    return redirect(url_for("ferramentas_epis.transferencia"))
+                    if not item_id or quantidade <= 0:
+                        continue
 
-                valor_unitario = item_valor(item)
-                valor_total = valor_unitario * quantidade
+                    item = Item.query.get_or_404(item_id)
+                    categoria = normalizar_categoria(item.categoria)
 
-                if tipo_transferencia == "saida":
-                    if not debitar_estoque_empresa(item.id, quantidade):
+                    if categoria not in ["FERRAMENTA", "EPI"]:
                         db.session.rollback()
-                        flash(f"Estoque insuficiente para {item.descricao}.", "danger")
+                        flash(f"O item {item.descricao} não é Ferramenta nem EPI.", "danger")
                         return redirect(url_for("ferramentas_epis.transferencia"))
 
-                    posse = EquipamentoTecnico(
+                    valor_unitario = item_valor(item)
+                    valor_total = valor_unitario * quantidade
+
+                    if tipo_transferencia == "saida":
+                        if not debitar_estoque_empresa(item.id, quantidade):
+                            db.session.rollback()
+                            flash(f"Estoque insuficiente para {item.descricao}.", "danger")
+                            return redirect(url_for("ferramentas_epis.transferencia"))
+
+                        posse = EquipamentoTecnico(
+                            item_id=item.id,
+                            tecnico_id=tecnico_id,
+                            categoria=categoria.lower(),
+                            local="TÉCNICO",
+                            status="tecnico",
+                            quantidade=quantidade,
+                            valor_unitario=valor_unitario,
+                            valor_total=valor_total,
+                            data_hora=datetime.utcnow()
+                        )
+                        db.session.add(posse)
+
+                    else:
+                        ok = remover_posse_tecnico(
+                            posse_tecnico,
+                            item_id=item.id,
+                            quantidade=quantidade,
+                            novo_status=status_geral,
+                            motivo=motivo_geral
+                        )
+
+                        if not ok:
+                            db.session.rollback()
+                            flash(f"O técnico não possui saldo suficiente do item {item.descricao}.", "danger")
+                            return redirect(url_for("ferramentas_epis.transferencia"))
+
+                        if motivo_retorno == "devolucao":
+                            creditar_estoque_empresa(item.id, quantidade)
+
+                    historico_item = HistoricoEquipamentoItem(
+                        historico_id=historico.id,
                         item_id=item.id,
-                        tecnico_id=tecnico_id,
-                        categoria=categoria.lower(),
-                        local="TÉCNICO",
-                        status="tecnico",
                         quantidade=quantidade,
+                        categoria=categoria.lower(),
                         valor_unitario=valor_unitario,
-                        valor_total=valor_total,
-                        data_hora=datetime.utcnow()
+                        valor_total=valor_total
                     )
-                    db.session.add(posse)
 
-                else:
-                    ok = remover_posse_tecnico(
-                        item_id=item.id,
-                        tecnico_id=tecnico_id,
-                        quantidade=quantidade,
-                        novo_status=status_geral,
-                        motivo=motivo_geral
-                    )
+                    db.session.add(historico_item)
+                    itens_processados += 1
 
-                    if not ok:
-                        db.session.rollback()
-                        flash(f"O técnico não possui saldo suficiente do item {item.descricao}.", "danger")
-                        return redirect(url_for("ferramentas_epis.transferencia"))
+                if itens_processados == 0:
+                    db.session.rollback()
+                    flash("Nenhum item válido foi informado.", "warning")
+                    return redirect(url_for("ferramentas_epis.transferencia"))
 
-                    if motivo_retorno == "devolucao":
-                        creditar_estoque_empresa(item.id, quantidade)
+                from app.utils.mailer import send_termo_ferramenta_email
 
-                historico_item = HistoricoEquipamentoItem(
-                    historico_id=historico.id,
-                    item_id=item.id,
-                    quantidade=quantidade,
-                    categoria=categoria.lower(),
-                    valor_unitario=valor_unitario,
-                    valor_total=valor_total
-                )
+                # Na mesma transação da transferência. email_enviado é marcado
+                # pelo worker da fila após o envio; se ele chegar antes do termo
+                # abaixo, tenta de novo mais tarde.
+                enviado = send_termo_ferramenta_email(historico)
+
+                db.session.commit()
 
-                db.session.add(historico_item)
-                itens_processados += 1
+            resposta = repetir_em_conflito(gravar)
 
-            if itens_processados == 0:
-                db.session.rollback()
-                flash("Nenhum item válido foi informado.", "warning")
-                return redirect(url_for("ferramentas_epis.transferencia"))
+            if resposta is not None:
+                return resposta
 
-            db.session.commit()
             
             # ==================================================
-# GERAR TERMO PDF E ENVIAR E-MAIL AO TÉCNICO
+# GERAR TERMO PDF
 # ==================================================
             try:
                 with current_app.test_request_context():
                     gerar_termo(historico.id)
 
-                from app.utils.mailer import send_termo_ferramenta_email
-
                 historico = HistoricoEquipamento.query.get(historico.id)
 
-                enviado = send_termo_ferramenta_email(historico)
-
-                if enviado:
-                    historico.email_enviado = True
-                    db.session.commit()
-
             except Exception as e:
                 current_app.logger.exception(
-                    f"Erro ao gerar/enviar termo por e-mail: {e}"
+                    f"Erro ao gerar termo: {e}"
                 )
 
             if tipo_transferencia == "saida":
     
                 if enviado:
                     flash(
-                        f"Saída registrada com sucesso. Termo enviado para {historico.tecnico.email}.",
+                        f"Saída registrada com sucesso. Termo na fila de envio para {historico.tecnico.email}.",
                         "success"
                     )
                 else:
                     flash(
-                        "Saída registrada com sucesso, porém o e-mail não foi enviado.",
+                        "Saída registrada com sucesso, porém o e-mail não foi colocado na fila de envio.",
                         "warning"
                     )
 
@@ -359,12 +369,12 @@ def transferencia():
 
                 if enviado:
                     flash(
-                        f"Retorno registrado com sucesso. Termo enviado para {historico.tecnico.email}.",
+                        f"Retorno registrado com sucesso. Termo na fila de envio para {historico.tecnico.email}.",
                         "success"
                     )
                 else:
                     flash(
-                        "Retorno registrado com sucesso, porém o e-mail não foi enviado.",
+                        "Retorno registrado com sucesso, porém o e-mail não foi colocado na fila de envio.",
                         "warning"
                 )
             return redirect(url_for("ferramentas_epis.historico"))
@@ -543,6 +553,8 @@ def saldo_tecnico():
 @login_required
 def exportar_saldo_tecnico():
 
+    import pandas as pd
+
     tecnico_id = request.args.get("tecnico_id")
     categoria = request.args.get("categoria")
 
@@ -746,6 +758,7 @@ def historico():
 
     query = (
         HistoricoEquipamento.query
+        .options(*HistoricoEquipamento.opcoes_listagem(HistoricoEquipamento.motivo))
         .outerjoin(Tecnico, Tecnico.id == HistoricoEquipamento.tecnico_id)
     )
 
@@ -766,12 +779,7 @@ def historico():
             query
             .join(HistoricoEquipamentoItem, HistoricoEquipamentoItem.historico_id == HistoricoEquipamento.id)
             .join(Item, Item.id == HistoricoEquipamentoItem.item_id)
-            .filter(
-                or_(
-                    Item.codigo.ilike(f"%{item_busca}%"),
-                    Item.descricao.ilike(f"%{item_busca}%")
-                )
-            )
+            .filter(condicao_busca(item_busca))
         )
 
     if data_inicio:
@@ -813,6 +821,8 @@ def historico():
 @login_required
 def exportar_relatorio_gerencial():
 
+    import pandas as pd
+
     tecnico_id = request.args.get("tecnico_id")
     tipo_movimentacao = request.args.get("tipo_movimentacao")
     status = request.args.get("status")
@@ -851,12 +861,7 @@ def exportar_relatorio_gerencial():
         query = query.filter(HistoricoEquipamento.status == status)
 
     if item_busca:
-        query = query.filter(
-            or_(
-                Item.codigo.ilike(f"%{item_busca}%"),
-                Item.descricao.ilike(f"%{item_busca}%")
-            )
-        )
+        query = query.filter(condicao_busca(item_busca))
 
     if data_inicio:
         query = query.filter(HistoricoEquipamento.data_hora >= data_inicio)
@@ -1127,38 +1132,13 @@ def detalhes(id):
 # GERAR TERMO PDF
 # ==========================================================
 
-@bp_ferramentas_epis.route("/gerar-termo/<int:id>")
-@login_required
-def gerar_termo(id):
-
-    historico = HistoricoEquipamento.query.get_or_404(id)
-
-    itens_historico = (
-        HistoricoEquipamentoItem.query
-        .join(Item, Item.id == HistoricoEquipamentoItem.item_id)
-        .filter(HistoricoEquipamentoItem.historico_id == historico.id)
-        .order_by(Item.descricao.asc())
-        .all()
-    )
-
-    pasta_termos = os.path.join(
-        current_app.root_path,
-        "static",
-        "termos_ferramentas"
-    )
-
-    os.makedirs(pasta_termos, exist_ok=True)
-
-    nome_arquivo = f"termo_ferramenta_epi_{historico.id}.pdf"
-
-    caminho_completo = os.path.join(
-        pasta_termos,
-        nome_arquivo
-    )
-
-    caminho_relativo = f"termos_ferramentas/{nome_arquivo}"
+def _desenhar_termo(historico, itens_historico):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+    from reportlab.lib import colors
 
-    c = canvas.Canvas(caminho_completo, pagesize=A4)
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
 
     largura, altura = A4
 
@@ -1441,8 +1421,8 @@ def gerar_termo(id):
     # ASSINATURAS
     # ==================================================
 
-    assinatura_tecnico = getattr(historico, "assinatura_tecnico", None)
-    assinatura_logistica = getattr(historico, "assinatura_logistica", None)
+    assinatura_tecnico = ler_assinatura(getattr(historico, "assinatura_tecnico", None))
+    assinatura_logistica = ler_assinatura(getattr(historico, "assinatura_logistica", None))
 
     box_largura = 250
     box_altura = 105
@@ -1457,15 +1437,11 @@ def gerar_termo(id):
     c.roundRect(x2, y - 18, box_largura, box_altura, 6, fill=0, stroke=1)
 
     try:
-        import base64
         from io import BytesIO
         from reportlab.lib.utils import ImageReader
 
         if assinatura_tecnico:
-            if "," in assinatura_tecnico:
-                assinatura_tecnico = assinatura_tecnico.split(",", 1)[1]
-
-            img_tecnico = ImageReader(BytesIO(base64.b64decode(assinatura_tecnico)))
+            img_tecnico = ImageReader(BytesIO(assinatura_tecnico))
 
             c.drawImage(
                 img_tecnico,
@@ -1486,10 +1462,7 @@ def gerar_termo(id):
             )
 
         if assinatura_logistica:
-            if "," in assinatura_logistica:
-                assinatura_logistica = assinatura_logistica.split(",", 1)[1]
-
-            img_logistica = ImageReader(BytesIO(base64.b64decode(assinatura_logistica)))
+            img_logistica = ImageReader(BytesIO(assinatura_logistica))
 
             c.drawImage(
                 img_logistica,
@@ -1564,10 +1537,63 @@ def gerar_termo(id):
 
     c.save()
 
-    historico.termo_pdf = caminho_relativo
-    db.session.commit()
+    return buffer.getvalue()
+
+
+@bp_ferramentas_epis.route("/gerar-termo/<int:id>")
+@login_required
+def gerar_termo(id):
+
+    historico = HistoricoEquipamento.query.get_or_404(id)
+
+    itens_historico = (
+        HistoricoEquipamentoItem.query
+        .join(Item, Item.id == HistoricoEquipamentoItem.item_id)
+        .filter(HistoricoEquipamentoItem.historico_id == historico.id)
+        .order_by(Item.descricao.asc())
+        .all()
+    )
+
+    pasta_termos = os.path.join(
+        current_app.root_path,
+        "static",
+        "termos_ferramentas"
+    )
+
+    os.makedirs(pasta_termos, exist_ok=True)
+
+    nome_arquivo = f"termo_ferramenta_epi_{historico.id}.pdf"
+
+    caminho_completo = os.path.join(
+        pasta_termos,
+        nome_arquivo
+    )
+
+    caminho_relativo = f"termos_ferramentas/{nome_arquivo}"
+
+    conteudo = documento_pdf(
+        "termo_ferramenta",
+        historico.id,
+        VERSAO_LAYOUT_PDF,
+        [
+            # Gravar o caminho do termo ou enviar o e-mail não muda o documento.
+            colunas_registro(historico, "termo_pdf", "email_enviado"),
+            historico.tecnico,
+            [[item, item.item] for item in itens_historico],
+        ],
+        lambda: _desenhar_termo(historico, itens_historico),
+    )
+
+    # O arquivo em static/ continua sendo o anexo do e-mail do termo.
+    with open(caminho_completo, "wb") as arquivo:
+        arquivo.write(conteudo)
+
+    if historico.termo_pdf != caminho_relativo:
+        historico.termo_pdf = caminho_relativo
+        db.session.commit()
 
     return send_file(
-        caminho_completo,
+        io.BytesIO(conteudo),
+        mimetype="application/pdf",
         as_attachment=False
     )
@@ -17,17 +17,6 @@ from flask import (
 from flask_login import login_required
 from werkzeug.utils import secure_filename
 
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4, landscape
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Table,
-    TableStyle,
-    Paragraph,
-    Spacer
-)
-
 from app import db
 from app.models import (
     Veiculo,
@@ -728,6 +717,16 @@ def excluir_documento(documento_id):
 
 def gerar_pdf_frota(titulo, colunas, dados):
     
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import (
+        SimpleDocTemplate,
+        Table,
+        TableStyle,
+        Paragraph,
+        Spacer,
+    )
     from reportlab.lib.units import cm
     from reportlab.lib.enums import TA_CENTER
     from reportlab.platypus import Image
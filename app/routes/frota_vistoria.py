@@ -1,5 +1,3 @@
-import os
-
 from flask import (
     Blueprint,
     render_template,
@@ -7,12 +5,10 @@ from flask import (
     redirect,
     url_for,
     flash,
-    current_app,
     send_file
 )
 
 from flask_login import login_required
-from werkzeug.utils import secure_filename
 
 from app.extensions import db
 
@@ -27,6 +23,8 @@ from app.models import (
 from datetime import datetime
 
 from app.routes.frota import gerar_pdf_frota
+from app.utils.assinaturas import ler_assinatura
+from app.utils.fotos import caminho_foto_pdf, guardar_foto
 
 
 bp_frota_vistoria = Blueprint(
@@ -118,41 +116,18 @@ def nova_vistoria():
         # SALVAR FOTOS DA VISTORIA
         # ==================================================
         fotos = request.files.getlist("fotos")
-
-        pasta_fotos = os.path.join(
-            current_app.root_path,
-            "static",
-            "uploads",
-            "frota",
-            "vistorias"
-        )
-
-        os.makedirs(pasta_fotos, exist_ok=True)
+        fotos_recusadas = []
 
         for index, foto in enumerate(fotos):
 
             if foto and foto.filename:
 
-                nome_original = secure_filename(foto.filename)
-
-                extensao = nome_original.rsplit(".", 1)[1].lower()
-
-                nome_salvo = (
-                    f"vistoria_{vistoria.id}_"
-                    f"{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}_"
-                    f"{index + 1}.{extensao}"
-                )
-
-                caminho_completo = os.path.join(
-                    pasta_fotos,
-                    nome_salvo
-                )
-
-                foto.save(caminho_completo)
+                # Redimensionamento e miniaturas ficam para o pool de fotos.
+                caminho_relativo = guardar_foto(foto)
 
-                caminho_relativo = (
-                    f"uploads/frota/vistorias/{nome_salvo}"
-                )
+                if not caminho_relativo:
+                    fotos_recusadas.append(foto.filename)
+                    continue
 
                 descricao_foto = request.form.get(
                     f"descricao_foto_{index}",
@@ -193,6 +168,13 @@ def nova_vistoria():
             "success"
         )
 
+        if fotos_recusadas:
+            flash(
+                "Fotos ignoradas (não são imagens válidas): "
+                + ", ".join(fotos_recusadas),
+                "warning"
+            )
+
         return redirect(
             url_for(
                 "frota_vistoria.detalhe_vistoria",
@@ -236,7 +218,7 @@ def historico_vistorias():
     data_inicio = request.args.get("data_inicio", "").strip()
     data_fim = request.args.get("data_fim", "").strip()
 
-    query = VistoriaVeiculo.query
+    query = VistoriaVeiculo.query.options(*VistoriaVeiculo.opcoes_listagem())
 
     if veiculo_id:
         query = query.filter(
@@ -324,6 +306,11 @@ def pdf_historico_vistorias():
 
     vistorias = (
         VistoriaVeiculo.query
+        .options(*VistoriaVeiculo.opcoes_listagem(
+            VistoriaVeiculo.combustivel,
+            VistoriaVeiculo.local_vistoria,
+            VistoriaVeiculo.observacao_geral
+        ))
         .order_by(
             VistoriaVeiculo.data_hora.desc()
         )
@@ -386,7 +373,6 @@ def pdf_historico_vistorias():
 @login_required
 def pdf_detalhe_vistoria(vistoria_id):
 
-    import base64
     from io import BytesIO
     from reportlab.lib import colors
     from reportlab.lib.pagesizes import A4
@@ -488,13 +474,10 @@ def pdf_detalhe_vistoria(vistoria_id):
         )
 
         for foto in vistoria.fotos:
-            caminho_foto = os.path.join(
-                current_app.root_path,
-                "static",
-                foto.caminho_arquivo
-            )
+            # Versão reduzida: a foto da câmera deixaria o PDF com megabytes.
+            caminho_foto = caminho_foto_pdf(foto.caminho_arquivo)
 
-            if os.path.exists(caminho_foto):
+            if caminho_foto:
                 elementos.append(Spacer(1, 10))
 
                 elementos.append(
@@ -513,8 +496,7 @@ def pdf_detalhe_vistoria(vistoria_id):
 
         if assinatura:
             try:
-                assinatura_data = assinatura.split(",", 1)[1] if "," in assinatura else assinatura
-                img = Image(BytesIO(base64.b64decode(assinatura_data)), width=150, height=52)
+                img = Image(BytesIO(ler_assinatura(assinatura)), width=150, height=52)
                 conteudo.append(img)
             except Exception:
                 conteudo.append(Paragraph("<b>Assinatura física</b>", styles["Normal"]))
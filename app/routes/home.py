@@ -1,26 +1,16 @@
-from datetime import datetime, timedelta
-
 from flask import Blueprint, flash, redirect, render_template, session, url_for
 from flask_login import current_user, login_required, logout_user
-from sqlalchemy import func, or_
 
-from app.extensions import db
 from app.models import (
     BaixaTecnica,
-    Estoque,
-    Item,
     MovimentacaoEstoque,
     NotaFiscalEntrada,
-    RequisicaoTecnico,
-    Tecnico,
 )
+from app.utils.contadores import obter_contadores
 
 home_bp = Blueprint('home', __name__)
 
 
-def db_count(column):
-    return db.session.query(func.count(column))
-
 @home_bp.route('/')
 @login_required
 def home():
@@ -33,39 +23,21 @@ def home():
         )
         return redirect(url_for("auth.login"))
 
-    hoje = datetime.utcnow()
-    inicio_30_dias = hoje - timedelta(days=30)
-
-    estoque_baixo = (
-        db_count(Estoque.id)
-        .filter(
-            Estoque.quantidade_minima > 0,
-            Estoque.quantidade <= Estoque.quantidade_minima
-        )
-        .scalar()
-        or 0
+    indicadores = obter_contadores(
+        "itens",
+        "tecnicos_ativos",
+        "estoque_baixo",
+        "requisicoes_pendentes",
+        "baixas_pendentes",
+        "notas_30_dias",
     )
 
-    indicadores = {
-        "itens": db_count(Item.id).scalar() or 0,
-        "tecnicos_ativos": db_count(Tecnico.id).filter(
-            or_(Tecnico.status.is_(None), Tecnico.status == "Ativo")
-        ).scalar() or 0,
-        "estoque_baixo": estoque_baixo,
-        "requisicoes_pendentes": db_count(RequisicaoTecnico.id).filter_by(
-            status="pendente"
-        ).scalar() or 0,
-        "baixas_pendentes": db_count(BaixaTecnica.id).filter(
-            BaixaTecnica.status.in_( ["pendente", "revisada"] )
-        ).scalar() or 0,
-        "notas_30_dias": db_count(NotaFiscalEntrada.id).filter(
-            NotaFiscalEntrada.data_hora >= inicio_30_dias
-        ).scalar() or 0,
-    }
-
     movimentacoes_recentes = (
         MovimentacaoEstoque.query
-        .order_by(MovimentacaoEstoque.data_hora.desc())
+        .order_by(
+            MovimentacaoEstoque.data_hora.desc().nulls_last(),
+            MovimentacaoEstoque.id.desc()
+        )
         .limit(5)
         .all()
     )
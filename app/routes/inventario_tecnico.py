@@ -2,7 +2,6 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from datetime import datetime
 from sqlalchemy import func
 from types import SimpleNamespace
-import pandas as pd
 import io
 
 from app.models import (
@@ -455,6 +454,8 @@ def detalhes_inventario(id):
 @bp_inventario.route('/exportar/<int:id>')
 def exportar_inventario(id):
 
+    import pandas as pd
+
     inventario = InventarioTecnico.query.get_or_404(id)
 
     dados = []
@@ -100,7 +100,10 @@ def editar(id):
 def excluir(id):
     item = Item.query.get_or_404(id)
 
-    Estoque.query.filter_by(item_id=item.id).delete()
+    # Exclusão pelo ORM: o after_flush lança a saída no razão e atualiza
+    # o resumo de saldo.
+    for estoque in Estoque.query.filter_by(item_id=item.id).all():
+        db.session.delete(estoque)
     NotaFiscalItem.query.filter_by(item_id=item.id).delete()
     RequisicaoTecnicoItem.query.filter_by(codigo=item.codigo).delete()
 
@@ -1,11 +1,22 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, send_file
 from flask_login import login_required, current_user
 from datetime import datetime
-from io import BytesIO
-from sqlalchemy import func, or_
+import os
+import tempfile
+from sqlalchemy import and_, case, func, or_
+from sqlalchemy.orm import selectinload, undefer
 
 from app.extensions import db
+from app.utils.assinaturas import guardar_assinatura
 from app.utils.mailer import send_movimentacao_email, _build_movimentacao_pdf
+from app.utils.saldos import (
+    campos_iguais,
+    carregar_estoques,
+    carregar_saldos_tecnico,
+    condicao_estoque_empresa,
+    consumir_fifo,
+    repetir_em_conflito,
+)
 
 from app.models import (
     MovimentacaoEstoque,
@@ -16,7 +27,8 @@ from app.models import (
     Item,
     Estoque,
     SaldoTecnico,
-    NotaFiscalEntrada
+    NotaFiscalEntrada,
+    OrdemServico
 )
 
 bp_movimentacao = Blueprint(
@@ -42,6 +54,8 @@ MARCADOR_NF_CANCELADA = '[NF_CANCELADA]'
 PERFIS_CORRECAO_LEGADO = {'admin', 'estoque'}
 MOVIMENTACAO_CORRECAO_MOV7 = 7
 NOTA_FISCAL_CORRECAO_MOV7 = 9
+HISTORICO_POR_PAGINA = 50
+EXPORTACAO_LOTE = 1000
 
 
 def _normalizar_condicao_material(valor):
@@ -500,20 +514,31 @@ def _aplicar_correcao_legado_pdfs(previa):
     return total_ajustado
 
 
-def _buscar_ou_criar_estoque_empresa(item_id, tipo_servico_id, condicao):
-    query = Estoque.query.filter_by(
-        item_id=item_id,
-        tipo_servico_id=tipo_servico_id,
-        tipo_estoque='empresa'
+def _estoques_destino_empresa(item_ids, tipo_servico_id, condicao):
+    """
+    Estoque empresa que recebe a devolução, carregado de uma vez para
+    todos os itens. Retorna {item_id: Estoque}.
+    """
+    if not item_ids:
+        return {}
+
+    query = Estoque.query.filter(
+        Estoque.item_id.in_(item_ids),
+        Estoque.tipo_servico_id == tipo_servico_id,
+        Estoque.tipo_estoque == 'empresa'
     )
 
     query = _filtro_condicao_estoque(query, condicao)
 
-    estoque = query.first()
+    estoques = {}
+
+    for estoque in query.order_by(Estoque.id.asc()).all():
+        estoques.setdefault(estoque.item_id, estoque)
 
-    if estoque:
-        return estoque
+    return estoques
 
+
+def _criar_estoque_empresa(item_id, tipo_servico_id, condicao):
     estoque = Estoque(
         item_id=item_id,
         tipo_servico_id=tipo_servico_id,
@@ -525,110 +550,111 @@ def _buscar_ou_criar_estoque_empresa(item_id, tipo_servico_id, condicao):
     _atribuir_condicao_estoque(estoque, condicao)
 
     db.session.add(estoque)
-    db.session.flush()
 
     return estoque
 
-def _consumir_estoque_empresa(
-    item_id,
-    tipo_servico_id,
-    quantidade,
-    usar_usado_bom=False
-):
-    query = Estoque.query.filter(
-        Estoque.item_id == item_id,
-        Estoque.tipo_servico_id == tipo_servico_id,
-        Estoque.tipo_estoque == 'empresa',
-        Estoque.quantidade > 0
-    )
 
-    if _estoque_tem_condicao():
-        if usar_usado_bom:
-            query = query.filter(
-                Estoque.condicao_material == 'USADO_BOM'
-            )
-        else:
-            query = query.filter(
-                or_(
-                    Estoque.condicao_material.is_(None),
-                    Estoque.condicao_material == ''
-                )
-            )
-
-    registros = query.order_by(Estoque.id.asc()).all()
-
-    saldo_total = sum(int(e.quantidade or 0) for e in registros)
-
-    if saldo_total < int(quantidade or 0):
-        return False
+def _saldos_destino_tecnico(tecnico_id, item_ids, **filtros):
+    """
+    Saldo do técnico que recebe o material, carregado de uma vez para
+    todos os itens. Retorna {item_id: SaldoTecnico}.
+    """
+    if not item_ids:
+        return {}
 
-    restante = int(quantidade or 0)
+    saldos = {}
 
-    for estoque in registros:
-        if restante <= 0:
-            break
+    query = (
+        SaldoTecnico.query
+        .filter_by(tecnico_id=tecnico_id, **filtros)
+        .filter(SaldoTecnico.item_id.in_(item_ids))
+        .order_by(SaldoTecnico.id.asc())
+    )
 
-        saldo = int(estoque.quantidade or 0)
-        baixa = min(saldo, restante)
-        estoque.quantidade = saldo - baixa
-        restante -= baixa
+    for saldo in query.all():
+        saldos.setdefault(saldo.item_id, saldo)
 
-    return True
+    return saldos
 
 
-def _consumir_saldo_tecnico(
-    tecnico_id,
-    item_id,
+def _consumir_origem_movimentacao(
+    origem_tipo,
+    linhas,
     tipo_servico_id,
-    quantidade,
+    usar_usado_bom=False,
+    tecnico_id=None,
     saldo_tecnico_tipo='empresa',
     cliente_id=None,
     ordem_servico_id=None
 ):
     """
-    Devolução Técnico -> Empresa.
-    Consome saldo do técnico por tipo empresa ou cliente.
-    Para cliente, cliente/O.S são filtros opcionais.
+    Debita a origem de todas as linhas da movimentação com uma única
+    consulta de saldos. Cada linha é debitada por inteiro ou não é
+    debitada. Retorna {indice_linha: faltante}.
     """
-    query = SaldoTecnico.query.filter(
-        SaldoTecnico.tecnico_id == tecnico_id,
-        SaldoTecnico.item_id == item_id,
-        SaldoTecnico.tipo_servico_id == tipo_servico_id,
-        SaldoTecnico.tipo_estoque == saldo_tecnico_tipo,
-        SaldoTecnico.quantidade > 0
-    )
+    item_ids = [linha['item'].id for linha in linhas]
 
-    if saldo_tecnico_tipo == 'empresa':
-        query = query.filter(
-            SaldoTecnico.cliente_id.is_(None),
-            SaldoTecnico.ordem_servico_id.is_(None)
-        )
-    else:
-        if cliente_id:
-            query = query.filter(SaldoTecnico.cliente_id == cliente_id)
+    condicao_registro = None
+
+    if origem_tipo == 'empresa':
+        condicoes = [
+            Estoque.tipo_servico_id == tipo_servico_id,
+            Estoque.tipo_estoque == 'empresa'
+        ]
+
+        if _estoque_tem_condicao():
+            condicao_sql, condicao_registro = condicao_estoque_empresa(usar_usado_bom)
+            condicoes.append(condicao_sql)
 
-        if ordem_servico_id:
-            query = query.filter(SaldoTecnico.ordem_servico_id == ordem_servico_id)
+        registros = carregar_estoques(item_ids, *condicoes)
 
-    registros = query.order_by(SaldoTecnico.id.asc()).all()
+    elif origem_tipo == 'cliente':
+        registros = carregar_estoques(
+            item_ids,
+            Estoque.tipo_servico_id == tipo_servico_id,
+            Estoque.tipo_estoque == 'cliente',
+            Estoque.cliente_id == cliente_id
+        )
 
-    saldo_total = sum(int(s.quantidade or 0) for s in registros)
+    else:
+        # Devolução Técnico -> Empresa, por tipo empresa ou cliente.
+        # Para cliente, cliente/O.S são filtros opcionais.
+        condicoes = [
+            SaldoTecnico.tecnico_id == tecnico_id,
+            SaldoTecnico.tipo_servico_id == tipo_servico_id,
+            SaldoTecnico.tipo_estoque == saldo_tecnico_tipo
+        ]
 
-    if saldo_total < quantidade:
-        return False
+        if saldo_tecnico_tipo == 'empresa':
+            condicoes += [
+                SaldoTecnico.cliente_id.is_(None),
+                SaldoTecnico.ordem_servico_id.is_(None)
+            ]
+        else:
+            if cliente_id:
+                condicoes.append(SaldoTecnico.cliente_id == cliente_id)
 
-    restante = int(quantidade)
+            if ordem_servico_id:
+                condicoes.append(SaldoTecnico.ordem_servico_id == ordem_servico_id)
 
-    for saldo in registros:
-        if restante <= 0:
-            break
+        registros = carregar_saldos_tecnico(item_ids, *condicoes)
 
-        saldo_atual = int(saldo.quantidade or 0)
-        baixa = min(saldo_atual, restante)
-        saldo.quantidade = saldo_atual - baixa
-        restante -= baixa
+    def atende_item(item_id):
+        if condicao_registro:
+            return lambda registro: (
+                registro.item_id == item_id
+                and condicao_registro(registro)
+            )
 
-    return True
+        return campos_iguais(item_id=item_id)
+
+    return consumir_fifo(
+        registros,
+        [
+            (indice, linha['quantidade'], atende_item(linha['item'].id))
+            for indice, linha in enumerate(linhas)
+        ]
+    )
 
 
 @bp_movimentacao.route('/nova', methods=['GET', 'POST'])
@@ -671,7 +697,7 @@ def nova_movimentacao():
 
         tipo_movimentacao = request.form.get('tipo_movimentacao')
         motivo_retorno = request.form.get('motivo_retorno')
-        assinatura = request.form.get('assinatura')
+        assinatura = guardar_assinatura(request.form.get('assinatura'))
 
         saldo_tecnico_tipo = (
             request.form.get('saldo_tecnico_tipo') or 'empresa'
@@ -911,192 +937,186 @@ def nova_movimentacao():
             flash('Destino inválido.', 'danger')
             return redirect(url_for('movimentacao_estoque.nova_movimentacao'))
 
-        # ==================================================
-        # CRIAR MOVIMENTAÇÃO
-        # ==================================================
-
-        nova_mov = MovimentacaoEstoque(
-            origem_tipo=origem_tipo,
-            origem_id=origem_id,
-
-            destino_tipo=destino_tipo,
-            destino_id=destino_id,
-
-            tipo_servico_id=tipo_servico_id,
-
-            ordem_servico_id=ordem_servico_id if ordem_servico_id else None,
-            nota_fiscal_id=nota_fiscal_id if nota_fiscal_id else None,
-
-            observacao=observacao,
-            usuario_id=current_user.id,
-            data_hora=datetime.utcnow(),
-
-            categoria_movimentacao=categoria_movimentacao,
-            tipo_movimentacao=tipo_movimentacao,
-            motivo_retorno=motivo_retorno,
-
-            assinatura=assinatura,
-
-            assinado_por=(
-                'tecnico'
-                if tipo_movimentacao == 'saida'
-                else 'logistica'
-                if tipo_movimentacao == 'retorno'
-                else None
-            ),
-
-            termo_pdf=None,
-            email_enviado=False
-        )
-
-        db.session.add(nova_mov)
-        db.session.flush()
+        # Só este trecho é repetido em conflito de saldo.
+        def gravar():
+            # ==================================================
+            # CRIAR MOVIMENTAÇÃO
+            # ==================================================
 
-        sucesso = False
+            nova_mov = MovimentacaoEstoque(
+                origem_tipo=origem_tipo,
+                origem_id=origem_id,
 
-        # ==================================================
-        # PROCESSAR ITENS
-        # ==================================================
+                destino_tipo=destino_tipo,
+                destino_id=destino_id,
 
-        codigos_processados = set()
+                tipo_servico_id=tipo_servico_id,
 
-        for i in range(len(codigos)):
+                ordem_servico_id=ordem_servico_id if ordem_servico_id else None,
+                nota_fiscal_id=nota_fiscal_id if nota_fiscal_id else None,
 
-            codigo = codigos[i].strip() if codigos[i] else ''
+                observacao=observacao,
+                usuario_id=current_user.id,
+                data_hora=datetime.utcnow(),
 
-            if codigo in codigos_processados:
-                continue
+                categoria_movimentacao=categoria_movimentacao,
+                tipo_movimentacao=tipo_movimentacao,
+                motivo_retorno=motivo_retorno,
 
-            codigos_processados.add(codigo)
+                assinatura=assinatura,
 
-            if not codigo:
-                continue
+                assinado_por=(
+                    'tecnico'
+                    if tipo_movimentacao == 'saida'
+                    else 'logistica'
+                    if tipo_movimentacao == 'retorno'
+                    else None
+                ),
 
-            try:
-                quantidade = int(quantidades[i])
-            except Exception:
-                continue
+                termo_pdf=None,
+                email_enviado=False
+            )
 
-            if quantidade <= 0:
-                continue
+            db.session.add(nova_mov)
+            db.session.flush()
 
-            item = Item.query.filter_by(codigo=codigo).first()
+            sucesso = False
 
-            if not item:
-                flash(f'Item {codigo} não encontrado.', 'danger')
-                continue
+            # ==================================================
+            # PROCESSAR ITENS
+            # ==================================================
 
-            item_categoria = (item.categoria or 'MATERIAL').strip().upper()
+            codigos_processados = set()
+            linhas = []
 
-            if categoria_movimentacao == 'PATRIMONIO':
-                if item_categoria not in ['FERRAMENTA', 'EPI']:
-                    flash(f'O item {item.codigo} não é Ferramenta/EPI.', 'danger')
-                    continue
-            else:
-                if item_categoria in ['FERRAMENTA', 'EPI']:
-                    flash(f'O item {item.codigo} é Ferramenta/EPI. Use Ferramentas & EPIs.', 'danger')
-                    continue
+            codigos_validos = [
+                (codigo or '').strip()
+                for codigo in codigos
+                if (codigo or '').strip()
+            ]
 
-            # Para saldos pertencentes à empresa, o cadastro do item é a
-            # fonte oficial do valor. Não confie no campo enviado pela tela:
-            # saldos antigos podem conservar um valor_unitario desatualizado.
-            if origem_tipo == 'empresa' or (
-                origem_tipo == 'tecnico'
-                and saldo_tecnico_tipo == 'empresa'
-            ):
-                valor_unitario = float(item.valor or 0)
-            else:
-                valor_unitario = parse_valor_br(valores[i] if i < len(valores) else 0)
+            itens_por_codigo = {}
 
-            try:
-                quantidade_minima = int(minimos[i]) if minimos[i] else 0
-            except Exception:
-                quantidade_minima = 0
+            if codigos_validos:
+                for item in (
+                    Item.query
+                    .filter(Item.codigo.in_(codigos_validos))
+                    .order_by(Item.id.asc())
+                    .all()
+                ):
+                    itens_por_codigo.setdefault(item.codigo, item)
 
             # ==================================================
-            # 1 - SAÍDA DA ORIGEM
+            # 1 - VALIDAR LINHAS
             # ==================================================
 
-            if origem_tipo == 'empresa':
+            for i in range(len(codigos)):
 
-                if not _consumir_estoque_empresa(
-                    item_id=item.id,
-                    tipo_servico_id=tipo_servico_saldo,
-                    quantidade=quantidade,
-                    usar_usado_bom=usar_usado_bom
-                ):
-                    flash(f'Saldo insuficiente na empresa para o item {item.codigo}.', 'danger')
+                codigo = codigos[i].strip() if codigos[i] else ''
+
+                if codigo in codigos_processados:
                     continue
 
-            elif origem_tipo == 'cliente':
+                codigos_processados.add(codigo)
 
-                estoque_origem = Estoque.query.filter_by(
-                    item_id=item.id,
-                    tipo_servico_id=tipo_servico_saldo,
-                    tipo_estoque='cliente',
-                    cliente_id=int(cliente_os_id) if cliente_os_id else None
-                ).first()
+                if not codigo:
+                    continue
 
-                if not estoque_origem:
-                    flash(f'Item {item.codigo} sem saldo no estoque do Cliente.', 'danger')
+                try:
+                    quantidade = int(quantidades[i])
+                except Exception:
                     continue
 
-                if int(estoque_origem.quantidade or 0) < int(quantidade or 0):
-                    flash(f'Saldo insuficiente no Cliente para o item {item.codigo}.', 'danger')
+                if quantidade <= 0:
                     continue
 
-                estoque_origem.quantidade = int(estoque_origem.quantidade or 0) - int(quantidade or 0)
+                item = itens_por_codigo.get(codigo)
 
-            elif origem_tipo == 'tecnico':
+                if not item:
+                    flash(f'Item {codigo} não encontrado.', 'danger')
+                    continue
 
-                if not _consumir_saldo_tecnico(
-                    tecnico_id=int(tecnico_id),
-                    item_id=item.id,
-                    tipo_servico_id=tipo_servico_saldo,
-                    quantidade=quantidade,
-                    saldo_tecnico_tipo=saldo_tecnico_tipo,
-                    cliente_id=int(cliente_os_id) if cliente_os_id else None,
-                    ordem_servico_id=ordem_servico_id
+                item_categoria = (item.categoria or 'MATERIAL').strip().upper()
+
+                if categoria_movimentacao == 'PATRIMONIO':
+                    if item_categoria not in ['FERRAMENTA', 'EPI']:
+                        flash(f'O item {item.codigo} não é Ferramenta/EPI.', 'danger')
+                        continue
+                else:
+                    if item_categoria in ['FERRAMENTA', 'EPI']:
+                        flash(f'O item {item.codigo} é Ferramenta/EPI. Use Ferramentas & EPIs.', 'danger')
+                        continue
+
+                # Para saldos pertencentes à empresa, o cadastro do item é a
+                # fonte oficial do valor. Não confie no campo enviado pela tela:
+                # saldos antigos podem conservar um valor_unitario desatualizado.
+                if origem_tipo == 'empresa' or (
+                    origem_tipo == 'tecnico'
+                    and saldo_tecnico_tipo == 'empresa'
                 ):
-                    flash(f'Saldo insuficiente do técnico para o item {item.codigo}.', 'danger')
-                    continue
+                    valor_unitario = float(item.valor or 0)
+                else:
+                    valor_unitario = parse_valor_br(valores[i] if i < len(valores) else 0)
+
+                try:
+                    quantidade_minima = int(minimos[i]) if minimos[i] else 0
+                except Exception:
+                    quantidade_minima = 0
+
+                linhas.append({
+                    'item': item,
+                    'quantidade': quantidade,
+                    'valor_unitario': valor_unitario,
+                    'quantidade_minima': quantidade_minima
+                })
 
             # ==================================================
-            # 2 - REGISTRAR ITEM DA MOVIMENTAÇÃO
+            # 2 - SAÍDA DA ORIGEM (todas as linhas em lote)
             # ==================================================
 
-            item_mov = MovimentacaoEstoqueItem(
-                movimentacao_id=nova_mov.id,
-                item_id=item.id,
-                quantidade=quantidade,
-                valor_unitario=valor_unitario,
-                condicao_material=(
-                    condicao_material
-                    if origem_tipo == 'tecnico'
-                    and destino_tipo == 'empresa'
-                    else None
-                )
+            faltas = _consumir_origem_movimentacao(
+                origem_tipo=origem_tipo,
+                linhas=linhas,
+                tipo_servico_id=tipo_servico_saldo,
+                usar_usado_bom=usar_usado_bom,
+                tecnico_id=int(tecnico_id) if tecnico_id else None,
+                saldo_tecnico_tipo=saldo_tecnico_tipo,
+                cliente_id=int(cliente_os_id) if cliente_os_id else None,
+                ordem_servico_id=ordem_servico_id
             )
 
-            db.session.add(item_mov)
+            mensagens_falta = {
+                'empresa': 'Saldo insuficiente na empresa para o item {codigo}.',
+                'cliente': 'Saldo insuficiente no Cliente para o item {codigo}.',
+                'tecnico': 'Saldo insuficiente do técnico para o item {codigo}.'
+            }
+
+            for indice in sorted(faltas):
+                flash(
+                    mensagens_falta[origem_tipo].format(codigo=linhas[indice]['item'].codigo),
+                    'danger'
+                )
+
+            linhas = [
+                linha
+                for indice, linha in enumerate(linhas)
+                if indice not in faltas
+            ]
+
+            item_ids = [linha['item'].id for linha in linhas]
 
             # ==================================================
-            # 3 - ENTRADA NO DESTINO
+            # 3 - DESTINO (saldos carregados em lote)
             # ==================================================
 
-            if destino_tipo == 'tecnico':
+            volta_para_estoque = True
 
-                if origem_tipo == 'empresa':
+            if categoria_movimentacao == 'PATRIMONIO':
+                volta_para_estoque = motivo_retorno == 'devolucao'
 
-                    tipo_estoque_destino = 'empresa'
-                    cliente_destino_id = None
-                    ordem_servico_destino_id = None
-                    endereco_destino = ""
-                    bairro_destino = ""
-                    codigo_imovel_destino = ""
-                    tipo_servico_destino = tipo_servico_saldo
+            if destino_tipo == 'tecnico':
 
-                elif origem_tipo == 'cliente':
+                if origem_tipo == 'cliente':
 
                     tipo_estoque_destino = 'cliente'
                     cliente_destino_id = int(cliente_os_id) if cliente_os_id else None
@@ -1104,7 +1124,6 @@ def nova_movimentacao():
                     endereco_destino = endereco_os
                     bairro_destino = bairro_os
                     codigo_imovel_destino = codigo_imovel_os
-                    tipo_servico_destino = tipo_servico_saldo
 
                 else:
 
@@ -1114,106 +1133,146 @@ def nova_movimentacao():
                     endereco_destino = ""
                     bairro_destino = ""
                     codigo_imovel_destino = ""
-                    tipo_servico_destino = tipo_servico_saldo
 
-                saldo_destino = SaldoTecnico.query.filter_by(
+                tipo_servico_destino = tipo_servico_saldo
+
+                saldos_destino = _saldos_destino_tecnico(
                     tecnico_id=int(tecnico_id),
-                    item_id=item.id,
+                    item_ids=item_ids,
                     tipo_servico_id=tipo_servico_destino,
                     tipo_estoque=tipo_estoque_destino,
                     cliente_id=cliente_destino_id,
                     ordem_servico_id=ordem_servico_destino_id
-                ).first()
-
-                if saldo_destino:
-                    saldo_destino.quantidade += quantidade
-                    saldo_destino.valor_unitario = valor_unitario
-                    saldo_destino.quantidade_minima = (
-                        quantidade_minima
-                        if origem_tipo == 'empresa'
-                        else saldo_destino.quantidade_minima
-                    )
-                    saldo_destino.endereco = endereco_destino
-                    saldo_destino.bairro = bairro_destino
-                    saldo_destino.codigo_imovel = codigo_imovel_destino
-
-                else:
-                    novo_saldo = SaldoTecnico(
-                        tecnico_id=int(tecnico_id),
-                        item_id=item.id,
-                        tipo_servico_id=tipo_servico_destino,
-                        quantidade=quantidade,
-                        quantidade_minima=quantidade_minima if origem_tipo == 'empresa' else 0,
-                        valor_unitario=valor_unitario,
-                        tipo_estoque=tipo_estoque_destino,
-                        cliente_id=cliente_destino_id,
-                        ordem_servico_id=ordem_servico_destino_id,
-                        endereco=endereco_destino,
-                        bairro=bairro_destino,
-                        codigo_imovel=codigo_imovel_destino
-                    )
+                )
 
-                    db.session.add(novo_saldo)
+            elif destino_tipo == 'empresa' and volta_para_estoque:
 
-            elif destino_tipo == 'empresa':
+                estoques_destino = _estoques_destino_empresa(
+                    item_ids=item_ids,
+                    tipo_servico_id=tipo_servico_saldo,
+                    condicao=condicao_material
+                )
 
-                volta_para_estoque = True
+            for linha in linhas:
 
-                if categoria_movimentacao == 'PATRIMONIO':
-                    volta_para_estoque = motivo_retorno == 'devolucao'
+                item = linha['item']
+                quantidade = linha['quantidade']
+                valor_unitario = linha['valor_unitario']
+                quantidade_minima = linha['quantidade_minima']
 
-                if volta_para_estoque:
+                # ==================================================
+                # REGISTRAR ITEM DA MOVIMENTAÇÃO
+                # ==================================================
 
-                    estoque_destino = _buscar_ou_criar_estoque_empresa(
-                        item_id=item.id,
-                        tipo_servico_id=tipo_servico_saldo,
-                        condicao=condicao_material
+                item_mov = MovimentacaoEstoqueItem(
+                    movimentacao_id=nova_mov.id,
+                    item_id=item.id,
+                    quantidade=quantidade,
+                    valor_unitario=valor_unitario,
+                    condicao_material=(
+                        condicao_material
+                        if origem_tipo == 'tecnico'
+                        and destino_tipo == 'empresa'
+                        else None
                     )
+                )
+
+                db.session.add(item_mov)
+
+                # ==================================================
+                # ENTRADA NO DESTINO
+                # ==================================================
+
+                if destino_tipo == 'tecnico':
+
+                    saldo_destino = saldos_destino.get(item.id)
+
+                    if saldo_destino:
+                        saldo_destino.quantidade += quantidade
+                        saldo_destino.valor_unitario = valor_unitario
+                        saldo_destino.quantidade_minima = (
+                            quantidade_minima
+                            if origem_tipo == 'empresa'
+                            else saldo_destino.quantidade_minima
+                        )
+                        saldo_destino.endereco = endereco_destino
+                        saldo_destino.bairro = bairro_destino
+                        saldo_destino.codigo_imovel = codigo_imovel_destino
+
+                    else:
+                        novo_saldo = SaldoTecnico(
+                            tecnico_id=int(tecnico_id),
+                            item_id=item.id,
+                            tipo_servico_id=tipo_servico_destino,
+                            quantidade=quantidade,
+                            quantidade_minima=quantidade_minima if origem_tipo == 'empresa' else 0,
+                            valor_unitario=valor_unitario,
+                            tipo_estoque=tipo_estoque_destino,
+                            cliente_id=cliente_destino_id,
+                            ordem_servico_id=ordem_servico_destino_id,
+                            endereco=endereco_destino,
+                            bairro=bairro_destino,
+                            codigo_imovel=codigo_imovel_destino
+                        )
+
+                        db.session.add(novo_saldo)
+                        saldos_destino[item.id] = novo_saldo
+
+                elif destino_tipo == 'empresa' and volta_para_estoque:
+
+                    estoque_destino = estoques_destino.get(item.id)
+
+                    if not estoque_destino:
+                        estoque_destino = _criar_estoque_empresa(
+                            item_id=item.id,
+                            tipo_servico_id=tipo_servico_saldo,
+                            condicao=condicao_material
+                        )
+                        estoques_destino[item.id] = estoque_destino
 
                     estoque_destino.quantidade = int(estoque_destino.quantidade or 0) + int(quantidade or 0)
                     estoque_destino.valor_unitario = valor_unitario
 
-            sucesso = True
-
-        # ==================================================
-        # FINALIZAÇÃO
-        # ==================================================
+                sucesso = True
 
-        if not sucesso:
-            db.session.rollback()
-            flash('Nenhum item movimentado.', 'danger')
-            return redirect(url_for('movimentacao_estoque.nova_movimentacao'))
+            # ==================================================
+            # FINALIZAÇÃO
+            # ==================================================
 
-        # ==================================================
-        # ATUALIZA STATUS DA O.S SOMENTE MATERIAL
-        # ==================================================
+            if not sucesso:
+                db.session.rollback()
+                flash('Nenhum item movimentado.', 'danger')
+                return redirect(url_for('movimentacao_estoque.nova_movimentacao'))
 
-        if categoria_movimentacao == 'MATERIAL' and cliente_os_id:
+            # ==================================================
+            # ATUALIZA STATUS DA O.S SOMENTE MATERIAL
+            # ==================================================
 
-            cliente_os = Empresa.query.get(cliente_os_id)
+            if categoria_movimentacao == 'MATERIAL' and cliente_os_id:
 
-            if cliente_os:
-                cliente_os.status_os = 'em_andamento'
+                cliente_os = Empresa.query.get(cliente_os_id)
 
-        db.session.commit()
+                if cliente_os:
+                    cliente_os.status_os = 'em_andamento'
 
-        try:
-            enviado = send_movimentacao_email(
+            # Na mesma transação da movimentação. email_enviado/data_envio_email
+            # são marcados pelo worker da fila quando o SMTP confirma a entrega.
+            send_movimentacao_email(
                 nova_mov,
                 attach_pdf=True
             )
 
-            if enviado:
-                nova_mov.email_enviado = True
-                db.session.commit()
+            db.session.commit()
 
-        except Exception as e:
-            print(f'Erro ao enviar e-mail da movimentação: {e}')
+        resposta = repetir_em_conflito(gravar)
+
+        if resposta is not None:
+            return resposta
 
         if categoria_movimentacao == 'PATRIMONIO':
-            flash('Movimentação registrada e enviada ao e-mail do técnico.', 'success')
+            flash('Movimentação registrada. Comprovante na fila de envio ao e-mail do técnico.', 'success')
         else:
-            flash('Movimentação realizada e enviada ao e-mail do técnico.', 'success')
+            flash('Movimentação realizada. Comprovante na fila de envio ao e-mail do técnico.', 'success')
 
         return redirect(
             url_for('movimentacao_estoque.historico')
@@ -1227,161 +1286,457 @@ def nova_movimentacao():
     )
 
 
-@bp_movimentacao.route('/historico')
-@login_required
-def historico():
+def _parse_data_filtro(valor, fim_do_dia=False):
+    try:
+        data = datetime.strptime(valor, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
 
-    movimentacoes = MovimentacaoEstoque.query.order_by(
-        MovimentacaoEstoque.data_hora.desc()
-    ).all()
+    if fim_do_dia:
+        data = data.replace(hour=23, minute=59, second=59, microsecond=999999)
 
-    tecnicos = Tecnico.query.all()
-    empresas = Empresa.query.all()
+    return data
 
-    tecnicos_dict = {
-        t.id: t.nome
-        for t in tecnicos
+
+def _filtros_historico():
+    return {
+        'data_inicio': request.args.get('data_inicio') or '',
+        'data_fim': request.args.get('data_fim') or '',
+        'tecnico_id': request.args.get('tecnico_id', type=int),
+        'cliente_id': request.args.get('cliente_id', type=int),
+        'categoria': (request.args.get('categoria') or '').strip().upper(),
     }
 
-    empresas_dict = {
-        e.id: e.razao_social
-        for e in empresas
+
+def _aplicar_filtros_historico(query, filtros):
+    inicio = _parse_data_filtro(filtros.get('data_inicio'))
+    fim = _parse_data_filtro(filtros.get('data_fim'), fim_do_dia=True)
+
+    if inicio:
+        query = query.filter(MovimentacaoEstoque.data_hora >= inicio)
+
+    if fim:
+        query = query.filter(MovimentacaoEstoque.data_hora <= fim)
+
+    tecnico_id = filtros.get('tecnico_id')
+
+    if tecnico_id:
+        query = query.filter(
+            or_(
+                and_(
+                    MovimentacaoEstoque.destino_tipo == 'tecnico',
+                    MovimentacaoEstoque.destino_id == tecnico_id
+                ),
+                and_(
+                    MovimentacaoEstoque.origem_tipo == 'tecnico',
+                    MovimentacaoEstoque.origem_id == tecnico_id
+                )
+            )
+        )
+
+    cliente_id = filtros.get('cliente_id')
+
+    if cliente_id:
+        query = query.filter(
+            MovimentacaoEstoque.origem_tipo.in_(['cliente', 'empresa']),
+            MovimentacaoEstoque.origem_id == cliente_id
+        )
+
+    if filtros.get('categoria'):
+        query = query.filter(
+            MovimentacaoEstoque.categoria_movimentacao == filtros['categoria']
+        )
+
+    return query
+
+
+# Marca do cursor quando a última linha exibida não tem data_hora.
+CURSOR_SEM_DATA = 'sem-data'
+
+
+def _cursor_historico(movimentacao):
+    if movimentacao.data_hora is None:
+        return f"{CURSOR_SEM_DATA}_{movimentacao.id}"
+
+    return f"{movimentacao.data_hora.isoformat()}_{movimentacao.id}"
+
+
+def _ler_cursor_historico(valor):
+    """
+    Cursor da paginação por chave: "<data_hora ISO>_<id>" da última linha
+    exibida ("sem-data_<id>" se ela não tem data). Retorna (data_hora ou
+    None, id); cursor inválido volta para a primeira página.
+    """
+    try:
+        data_hora, movimentacao_id = (valor or '').rsplit('_', 1)
+        movimentacao_id = int(movimentacao_id)
+
+        if data_hora == CURSOR_SEM_DATA:
+            return None, movimentacao_id
+
+        return datetime.fromisoformat(data_hora), movimentacao_id
+    except ValueError:
+        return None
+
+
+def _filtro_cursor_historico(cursor_data, cursor_id):
+    """
+    Linhas depois do cursor na ordem data_hora DESC NULLS LAST, id DESC:
+    as sem data ficam no fim, em qualquer banco.
+    """
+    sem_data = MovimentacaoEstoque.data_hora.is_(None)
+
+    if cursor_data is None:
+        return and_(sem_data, MovimentacaoEstoque.id < cursor_id)
+
+    return or_(
+        MovimentacaoEstoque.data_hora < cursor_data,
+        and_(
+            MovimentacaoEstoque.data_hora == cursor_data,
+            MovimentacaoEstoque.id < cursor_id
+        ),
+        sem_data
+    )
+
+
+def _resumo_historico(query):
+    total, tecnico, devolucao, emails = (
+        query
+        .order_by(None)
+        .with_entities(
+            func.count(MovimentacaoEstoque.id),
+            func.coalesce(func.sum(
+                case((MovimentacaoEstoque.destino_tipo == 'tecnico', 1), else_=0)
+            ), 0),
+            func.coalesce(func.sum(
+                case(
+                    (
+                        and_(
+                            MovimentacaoEstoque.origem_tipo == 'tecnico',
+                            MovimentacaoEstoque.destino_tipo == 'empresa'
+                        ),
+                        1
+                    ),
+                    else_=0
+                )
+            ), 0),
+            func.coalesce(func.sum(
+                case((MovimentacaoEstoque.email_enviado.is_(True), 1), else_=0)
+            ), 0)
+        )
+        .one()
+    )
+
+    return {
+        'total': int(total or 0),
+        'tecnico': int(tecnico or 0),
+        'devolucao': int(devolucao or 0),
+        'emails': int(emails or 0),
     }
 
+
+def _query_agregados_itens():
+    condicao = func.nullif(MovimentacaoEstoqueItem.condicao_material, '')
+
+    return (
+        db.session.query(
+            MovimentacaoEstoqueItem.movimentacao_id.label('movimentacao_id'),
+            func.count(MovimentacaoEstoqueItem.id).label('itens'),
+            func.count(func.distinct(condicao)).label('condicoes'),
+            func.min(condicao).label('condicao'),
+            func.coalesce(func.sum(
+                MovimentacaoEstoqueItem.quantidade
+                * func.coalesce(MovimentacaoEstoqueItem.valor_unitario, 0)
+            ), 0).label('total')
+        )
+        .group_by(MovimentacaoEstoqueItem.movimentacao_id)
+    )
+
+
+def _resumo_condicao(condicoes, condicao_unica):
+    if not condicoes:
+        return None
+
+    if condicoes == 1:
+        return condicao_unica
+
+    return 'MISTO'
+
+
+def _agregados_itens_movimentacoes(movimentacao_ids):
+    """
+    Resumo de condição e valor total por movimentação, calculado no banco.
+    Retorna {movimentacao_id: (condicao_resumo, valor_total)}.
+    """
+    if not movimentacao_ids:
+        return {}
+
+    linhas = (
+        _query_agregados_itens()
+        .filter(MovimentacaoEstoqueItem.movimentacao_id.in_(movimentacao_ids))
+        .all()
+    )
+
+    return {
+        linha.movimentacao_id: (
+            _resumo_condicao(linha.condicoes, linha.condicao),
+            float(linha.total or 0)
+        )
+        for linha in linhas
+    }
+
+
+def _nomes_participantes(movimentacoes):
+    tecnico_ids = set()
+    empresa_ids = set()
+
     for m in movimentacoes:
+        for tipo, participante_id in (
+            (m.origem_tipo, m.origem_id),
+            (m.destino_tipo, m.destino_id)
+        ):
+            if not participante_id:
+                continue
 
-        condicoes = [
-            item.condicao_material
-            for item in m.itens
-            if item.condicao_material
-        ]
+            if tipo == 'tecnico':
+                tecnico_ids.add(participante_id)
+            elif tipo in ('cliente', 'empresa'):
+                empresa_ids.add(participante_id)
+
+    tecnicos_dict = {}
+    empresas_dict = {}
 
-        if not condicoes:
-            m.condicao_material_resumo = None
+    if tecnico_ids:
+        tecnicos_dict = dict(
+            db.session.query(Tecnico.id, Tecnico.nome)
+            .filter(Tecnico.id.in_(tecnico_ids))
+            .all()
+        )
 
-        elif len(set(condicoes)) == 1:
-            m.condicao_material_resumo = condicoes[0]
+    if empresa_ids:
+        empresas_dict = dict(
+            db.session.query(Empresa.id, Empresa.razao_social)
+            .filter(Empresa.id.in_(empresa_ids))
+            .all()
+        )
 
-        else:
-            m.condicao_material_resumo = "MISTO"
+    return tecnicos_dict, empresas_dict
+
+
+@bp_movimentacao.route('/historico')
+@login_required
+def historico():
+
+    filtros = _filtros_historico()
+
+    query = _aplicar_filtros_historico(MovimentacaoEstoque.query, filtros)
+    resumo = _resumo_historico(query)
+
+    cursor = _ler_cursor_historico(request.args.get('cursor'))
+
+    if cursor:
+        query = query.filter(_filtro_cursor_historico(*cursor))
+
+    movimentacoes = (
+        query
+        .options(
+            # A lista mostra "Assinado": a chave vem na mesma consulta.
+            undefer(MovimentacaoEstoque.assinatura),
+            selectinload(MovimentacaoEstoque.itens),
+            selectinload(MovimentacaoEstoque.tipo_servico),
+            selectinload(MovimentacaoEstoque.ordem_servico)
+        )
+        .order_by(
+            MovimentacaoEstoque.data_hora.desc().nulls_last(),
+            MovimentacaoEstoque.id.desc()
+        )
+        .limit(HISTORICO_POR_PAGINA + 1)
+        .all()
+    )
+
+    proximo_cursor = None
+
+    if len(movimentacoes) > HISTORICO_POR_PAGINA:
+        movimentacoes = movimentacoes[:HISTORICO_POR_PAGINA]
+        proximo_cursor = _cursor_historico(movimentacoes[-1])
+
+    agregados = _agregados_itens_movimentacoes([m.id for m in movimentacoes])
+
+    for m in movimentacoes:
+        condicao, total = agregados.get(m.id, (None, 0.0))
+        m.condicao_material_resumo = condicao
+        m.valor_total = total
+
+    tecnicos_dict, empresas_dict = _nomes_participantes(movimentacoes)
+
+    tecnicos = (
+        db.session.query(Tecnico.id, Tecnico.nome)
+        .order_by(Tecnico.nome)
+        .all()
+    )
+
+    clientes = (
+        db.session.query(Empresa.id, Empresa.razao_social)
+        .filter(func.lower(Empresa.tipo_empresa) == 'cliente')
+        .order_by(Empresa.razao_social)
+        .all()
+    )
 
     return render_template(
         'movimentacao_estoque/historico.html',
         movimentacoes=movimentacoes,
         tecnicos_dict=tecnicos_dict,
-        empresas_dict=empresas_dict
+        empresas_dict=empresas_dict,
+        resumo=resumo,
+        filtros=filtros,
+        tecnicos=tecnicos,
+        clientes=clientes,
+        proximo_cursor=proximo_cursor,
+        pagina_inicial=not cursor
     )
 
 
-@bp_movimentacao.route('/historico/excel')
-@login_required
-def exportar_historico_excel():
+def _cliente_os_historico(origem_tipo, destino_tipo, origem_id, numero_os, empresas_dict):
+    cliente_os = '-'
 
-    import pandas as pd
+    if origem_tipo == 'cliente':
+        cliente_os = empresas_dict.get(int(origem_id or 0), '-')
 
-    movimentacoes = MovimentacaoEstoque.query.order_by(
-        MovimentacaoEstoque.data_hora.desc()
-    ).all()
+    elif (
+        origem_tipo == 'empresa'
+        and destino_tipo == 'tecnico'
+        and int(origem_id or 0) > 0
+    ):
+        cliente_os = empresas_dict.get(int(origem_id or 0), '-')
 
-    tecnicos_dict = {
-        t.id: t.nome
-        for t in Tecnico.query.all()
-    }
+    elif origem_tipo == 'empresa' and destino_tipo == 'tecnico':
+        cliente_os = 'Empresa'
 
-    empresas_dict = {
-        e.id: e.razao_social
-        for e in Empresa.query.all()
-    }
+    elif origem_tipo == 'tecnico' and destino_tipo == 'empresa':
+        cliente_os = 'Não se aplica'
 
-    linhas = []
+    if numero_os:
+        cliente_os = f"{cliente_os} - {numero_os}"
 
-    for mov in movimentacoes:
-        tecnico = '-'
+    return cliente_os
 
-        if mov.destino_tipo == 'tecnico':
-            tecnico = tecnicos_dict.get(int(mov.destino_id or 0), '-')
 
-        elif mov.origem_tipo == 'tecnico':
-            tecnico = tecnicos_dict.get(int(mov.origem_id or 0), '-')
+COLUNAS_EXPORTACAO_HISTORICO = [
+    'ID',
+    'Data/Hora',
+    'Origem',
+    'Destino',
+    'Técnico',
+    'Cliente / O.S',
+    'Tipo Serviço',
+    'Categoria',
+    'Tipo Movimentação',
+    'Condição',
+    'Itens',
+    'Valor Total',
+    'Assinatura',
+    'E-mail',
+    'Observação',
+]
 
-        cliente_os = '-'
 
-        if mov.origem_tipo == 'cliente':
-            cliente_os = empresas_dict.get(int(mov.origem_id or 0), '-')
+def _linhas_exportacao_historico(filtros):
+    """
+    Gera as linhas do Excel em lotes (yield_per), com cursor no servidor
+    no PostgreSQL. Itens são agregados no banco, sem carregar objetos ORM.
+    """
+    tecnicos_dict = dict(db.session.query(Tecnico.id, Tecnico.nome).all())
+    empresas_dict = dict(db.session.query(Empresa.id, Empresa.razao_social).all())
 
-        elif (
-            mov.origem_tipo == 'empresa'
-            and mov.destino_tipo == 'tecnico'
-            and int(mov.origem_id or 0) > 0
-        ):
-            cliente_os = empresas_dict.get(int(mov.origem_id or 0), '-')
+    agregados = _query_agregados_itens().subquery()
 
-        elif mov.origem_tipo == 'empresa' and mov.destino_tipo == 'tecnico':
-            cliente_os = 'Empresa'
+    assinado = case(
+        (
+            and_(
+                MovimentacaoEstoque.assinatura.isnot(None),
+                MovimentacaoEstoque.assinatura != ''
+            ),
+            True
+        ),
+        else_=False
+    )
 
-        elif mov.origem_tipo == 'tecnico' and mov.destino_tipo == 'empresa':
-            cliente_os = 'Não se aplica'
+    query = (
+        db.session.query(
+            MovimentacaoEstoque.id,
+            MovimentacaoEstoque.data_hora,
+            MovimentacaoEstoque.origem_tipo,
+            MovimentacaoEstoque.origem_id,
+            MovimentacaoEstoque.destino_tipo,
+            MovimentacaoEstoque.destino_id,
+            MovimentacaoEstoque.categoria_movimentacao,
+            MovimentacaoEstoque.tipo_movimentacao,
+            MovimentacaoEstoque.email_enviado,
+            MovimentacaoEstoque.observacao,
+            assinado.label('assinado'),
+            TipoServico.nome.label('tipo_servico'),
+            OrdemServico.numero_os,
+            agregados.c.itens,
+            agregados.c.condicoes,
+            agregados.c.condicao,
+            agregados.c.total
+        )
+        .outerjoin(TipoServico, TipoServico.id == MovimentacaoEstoque.tipo_servico_id)
+        .outerjoin(OrdemServico, OrdemServico.id == MovimentacaoEstoque.ordem_servico_id)
+        .outerjoin(agregados, agregados.c.movimentacao_id == MovimentacaoEstoque.id)
+    )
 
-        if mov.ordem_servico:
-            cliente_os = f"{cliente_os} - {mov.ordem_servico.numero_os}"
+    query = _aplicar_filtros_historico(query, filtros)
 
-        condicoes = [
-            item.condicao_material
-            for item in mov.itens
-            if item.condicao_material
-        ]
+    query = query.order_by(
+        MovimentacaoEstoque.data_hora.desc().nulls_last(),
+        MovimentacaoEstoque.id.desc()
+    )
 
-        if not condicoes:
-            condicao = 'Disponível'
-        elif len(set(condicoes)) == 1:
-            condicao = condicoes[0]
-        else:
-            condicao = 'MISTO'
+    for mov in query.yield_per(EXPORTACAO_LOTE):
+        tecnico = '-'
 
-        total = sum(
-            (item.quantidade or 0) * (item.valor_unitario or 0)
-            for item in mov.itens
-        )
+        if mov.destino_tipo == 'tecnico':
+            tecnico = tecnicos_dict.get(int(mov.destino_id or 0), '-')
 
-        linhas.append({
-            'ID': mov.id,
-            'Data/Hora': (
+        elif mov.origem_tipo == 'tecnico':
+            tecnico = tecnicos_dict.get(int(mov.origem_id or 0), '-')
+
+        yield [
+            mov.id,
+            (
                 mov.data_hora.strftime('%d/%m/%Y %H:%M')
                 if mov.data_hora else '-'
             ),
-            'Origem': (mov.origem_tipo or '-').capitalize(),
-            'Destino': (mov.destino_tipo or '-').capitalize(),
-            'Técnico': tecnico,
-            'Cliente / O.S': cliente_os,
-            'Tipo Serviço': mov.tipo_servico.nome if mov.tipo_servico else '-',
-            'Categoria': mov.categoria_movimentacao or '-',
-            'Tipo Movimentação': mov.tipo_movimentacao or '-',
-            'Condição': condicao,
-            'Itens': len(mov.itens or []),
-            'Valor Total': total,
-            'Assinatura': 'Sim' if mov.assinatura else 'Não',
-            'E-mail': 'Enviado' if mov.email_enviado else 'Pendente',
-            'Observação': mov.observacao or '-'
-        })
-
-    output = BytesIO()
+            (mov.origem_tipo or '-').capitalize(),
+            (mov.destino_tipo or '-').capitalize(),
+            tecnico,
+            _cliente_os_historico(
+                mov.origem_tipo,
+                mov.destino_tipo,
+                mov.origem_id,
+                mov.numero_os,
+                empresas_dict
+            ),
+            mov.tipo_servico or '-',
+            mov.categoria_movimentacao or '-',
+            mov.tipo_movimentacao or '-',
+            _resumo_condicao(mov.condicoes, mov.condicao) or 'Disponível',
+            int(mov.itens or 0),
+            float(mov.total or 0),
+            'Sim' if mov.assinado else 'Não',
+            'Enviado' if mov.email_enviado else 'Pendente',
+            mov.observacao or '-'
+        ]
 
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df = pd.DataFrame(linhas)
 
-        if df.empty:
-            df = pd.DataFrame([{
-                'Mensagem': 'Nenhuma movimentação encontrada.'
-            }])
+def _gravar_exportacao_historico(caminho, filtros):
+    import xlsxwriter
 
-        df.to_excel(
-            writer,
-            index=False,
-            sheet_name='Histórico'
-        )
+    workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
 
-        workbook = writer.book
-        worksheet = writer.sheets['Histórico']
+    try:
+        worksheet = workbook.add_worksheet('Histórico')
 
         header_format = workbook.add_format({
             'bold': True,
@@ -1394,28 +1749,69 @@ def exportar_historico_excel():
             'num_format': 'R$ #,##0.00'
         })
 
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
+        # constant_memory grava linha a linha: larguras antes das linhas.
+        for col_num, value in enumerate(COLUNAS_EXPORTACAO_HISTORICO):
             largura = max(14, min(38, len(str(value)) + 6))
             worksheet.set_column(col_num, col_num, largura)
 
-        if 'Valor Total' in df.columns:
-            valor_col = df.columns.get_loc('Valor Total')
-            worksheet.set_column(valor_col, valor_col, 16, money_format)
+        valor_col = COLUNAS_EXPORTACAO_HISTORICO.index('Valor Total')
+        worksheet.set_column(valor_col, valor_col, 16, money_format)
+
+        worksheet.write_row(0, 0, COLUNAS_EXPORTACAO_HISTORICO, header_format)
+
+        total_linhas = 0
+
+        for total_linhas, linha in enumerate(
+            _linhas_exportacao_historico(filtros),
+            start=1
+        ):
+            worksheet.write_row(total_linhas, 0, linha)
+
+        if not total_linhas:
+            worksheet.write(1, 0, 'Nenhuma movimentação encontrada.')
 
         worksheet.freeze_panes(1, 0)
-        worksheet.autofilter(0, 0, len(df), len(df.columns) - 1)
+        worksheet.autofilter(
+            0,
+            0,
+            max(total_linhas, 1),
+            len(COLUNAS_EXPORTACAO_HISTORICO) - 1
+        )
+    finally:
+        workbook.close()
 
-    output.seek(0)
+
+@bp_movimentacao.route('/historico/excel')
+@login_required
+def exportar_historico_excel():
+
+    filtros = _filtros_historico()
+
+    descritor, caminho = tempfile.mkstemp(suffix='.xlsx')
+    os.close(descritor)
+
+    try:
+        _gravar_exportacao_historico(caminho, filtros)
+    except Exception:
+        os.remove(caminho)
+        raise
 
     data_arquivo = datetime.now().strftime('%Y%m%d_%H%M%S')
 
-    return send_file(
-        output,
+    # send_file lê o arquivo em blocos; o temporário sai quando o servidor
+    # fecha a resposta, tenha o download terminado ou não. Sem
+    # direct_passthrough o Werkzeug embrulha o arquivo num ClosingIterator,
+    # que é o que chama o call_on_close.
+    resposta = send_file(
+        caminho,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
         as_attachment=True,
         download_name=f'historico_movimentacoes_{data_arquivo}.xlsx',
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
     )
+    resposta.direct_passthrough = False
+    resposta.call_on_close(lambda: os.remove(caminho))
+
+    return resposta
 
 
 @bp_movimentacao.route('/correcao-legado-saldo-pdfs-julho-2026', methods=['GET', 'POST'])
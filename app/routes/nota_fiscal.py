@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, make_response, current_app
 from app import db
-from sqlalchemy import func, or_
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import selectinload
 from app.models import (
     NotaFiscalEntrada,
     NotaFiscalItem,
@@ -14,11 +15,24 @@ from app.models import (
 
 from flask_login import current_user
 from datetime import datetime
+from app.utils.busca_itens import condicao_busca
+from app.utils.cache_pdf import documento_pdf
+from app.utils.catalogo_itens import responder as responder_catalogo
 from app.utils.valores_estoque import sincronizar_valor_empresa_item
+from app.utils.saldos import (
+    campos_iguais,
+    carregar_estoques,
+    carregar_saldos_tecnico,
+    consumir_fifo,
+    repetir_em_conflito,
+)
 import os, pdfkit, re
 
 bp = Blueprint('nota_fiscal', __name__, url_prefix='/nota')
 
+# Mudou nota_pdf.html? Incremente para renovar o cache de PDFs.
+VERSAO_LAYOUT_PDF = 1
+
 MARCADOR_NF_CANCELADA = '[NF_CANCELADA]'
 
 # ------------------------
@@ -140,70 +154,56 @@ def _validar_cancelamento_nota(nota, itens):
     return bloqueios
 
 
-def _consumir_registros_quantidade(registros, quantidade):
-    restante = int(quantidade or 0)
-
-    for registro in registros:
-        if restante <= 0:
-            break
-
-        atual = int(registro.quantidade or 0)
-        baixa = min(atual, restante)
-        registro.quantidade = atual - baixa
-        restante -= baixa
-
-    return restante == 0
-
-
 def _aplicar_cancelamento_nota(nota, itens):
+    """
+    Estorna o saldo da nota: consome primeiro o estoque (empresa ou
+    cliente) e, para nota de cliente, o restante do saldo dos técnicos.
+    Os candidatos de todos os itens são carregados em uma consulta por
+    tabela.
+    """
     tipo_servico_saldo_id = _tipo_servico_saldo_nota(nota)
+    item_ids = [item_nf.item_id for item_nf in itens]
+    cliente_estoque_id = nota.cliente_id if nota.tipo_estoque == 'cliente' else None
+
+    estoques = carregar_estoques(
+        item_ids,
+        Estoque.tipo_servico_id == tipo_servico_saldo_id,
+        Estoque.tipo_estoque == nota.tipo_estoque,
+        Estoque.cliente_id == cliente_estoque_id
+    )
 
-    for item_nf in itens:
-        restante = int(item_nf.quantidade or 0)
-
-        estoques = (
-            Estoque.query
-            .filter(
-                Estoque.item_id == item_nf.item_id,
-                Estoque.tipo_servico_id == tipo_servico_saldo_id,
-                Estoque.tipo_estoque == nota.tipo_estoque,
-                Estoque.cliente_id == (
-                    nota.cliente_id
-                    if nota.tipo_estoque == 'cliente'
-                    else None
-                ),
-                Estoque.quantidade > 0
-            )
-            .order_by(Estoque.id.asc())
-            .all()
-        )
+    faltas = consumir_fifo(
+        estoques,
+        [
+            (indice, item_nf.quantidade, campos_iguais(item_id=item_nf.item_id))
+            for indice, item_nf in enumerate(itens)
+        ],
+        parcial=True
+    )
 
-        for estoque in estoques:
-            if restante <= 0:
-                break
+    if not faltas:
+        return
 
-            atual = int(estoque.quantidade or 0)
-            baixa = min(atual, restante)
-            estoque.quantidade = atual - baixa
-            restante -= baixa
+    if nota.tipo_estoque == 'cliente':
+        saldos_tecnico = carregar_saldos_tecnico(
+            [itens[indice].item_id for indice in faltas],
+            SaldoTecnico.tipo_servico_id == tipo_servico_saldo_id,
+            SaldoTecnico.tipo_estoque == 'cliente',
+            SaldoTecnico.cliente_id == nota.cliente_id
+        )
 
-        if restante > 0 and nota.tipo_estoque == 'cliente':
-            saldos_tecnico = (
-                SaldoTecnico.query
-                .filter(
-                    SaldoTecnico.item_id == item_nf.item_id,
-                    SaldoTecnico.tipo_servico_id == tipo_servico_saldo_id,
-                    SaldoTecnico.tipo_estoque == 'cliente',
-                    SaldoTecnico.cliente_id == nota.cliente_id,
-                    SaldoTecnico.quantidade > 0
-                )
-                .order_by(SaldoTecnico.id.asc())
-                .all()
-            )
+        faltas = consumir_fifo(
+            saldos_tecnico,
+            [
+                (indice, restante, campos_iguais(item_id=itens[indice].item_id))
+                for indice, restante in sorted(faltas.items())
+            ]
+        )
 
-            if not _consumir_registros_quantidade(saldos_tecnico, restante):
-                codigo = item_nf.item.codigo if item_nf.item else item_nf.item_id
-                raise ValueError(f'Saldo insuficiente para cancelar o item {codigo}.')
+        if faltas:
+            item_nf = itens[min(faltas)]
+            codigo = item_nf.item.codigo if item_nf.item else item_nf.item_id
+            raise ValueError(f'Saldo insuficiente para cancelar o item {codigo}.')
 
 # ------------------------
 # Nova Nota Fiscal
@@ -601,8 +601,6 @@ def exportar_pdf(id):
         logo_path=f"file:///{logo_path.replace(os.sep, '/')}"
     )
 
-    html = render_template('nota_fiscal/nota_pdf.html', **ctx)
-
     options = {
         'page-size': 'A4',
         'encoding': 'UTF-8',
@@ -615,11 +613,23 @@ def exportar_pdf(id):
         'load-media-error-handling': 'ignore',
     }
 
-    pdf_bytes = pdfkit.from_string(
-        html,
-        False,
-        configuration=_pdfcfg,
-        options=options
+    def gerar():
+        html = render_template('nota_fiscal/nota_pdf.html', **ctx)
+
+        return pdfkit.from_string(
+            html,
+            False,
+            configuration=_pdfcfg,
+            options=options
+        )
+
+    # wkhtmltopdf é o passo caro: mesma nota e mesmos itens, mesmo arquivo.
+    pdf_bytes = documento_pdf(
+        'nota_fiscal',
+        nota.id,
+        VERSAO_LAYOUT_PDF,
+        [nota, itens, ctx['cliente'], ctx['tipo_servico'], ctx['usuario']],
+        gerar
     )
 
     resp = make_response(pdf_bytes)
@@ -878,10 +888,10 @@ def historico_valores():
     )
 
     if codigo:
-        query = query.filter(Item.codigo.ilike(f"%{codigo}%"))
+        query = query.filter(condicao_busca(codigo, "codigo"))
 
     if descricao:
-        query = query.filter(Item.descricao.ilike(f"%{descricao}%"))
+        query = query.filter(condicao_busca(descricao, "descricao"))
 
     if fornecedor:
         query = query.filter(NotaFiscalEntrada.fornecedor.ilike(f"%{fornecedor}%"))
@@ -965,10 +975,10 @@ def exportar_historico_valores_excel():
     )
 
     if codigo:
-        query = query.filter(Item.codigo.ilike(f"%{codigo}%"))
+        query = query.filter(condicao_busca(codigo, "codigo"))
 
     if descricao:
-        query = query.filter(Item.descricao.ilike(f"%{descricao}%"))
+        query = query.filter(condicao_busca(descricao, "descricao"))
 
     if fornecedor:
         query = query.filter(NotaFiscalEntrada.fornecedor.ilike(f"%{fornecedor}%"))
@@ -1313,6 +1323,95 @@ def exportar_historico_valores_excel():
         mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
     )
     
+PESQUISA_POR_PAGINA = 50
+
+
+def _categoria_nota_expr():
+    """
+    Categoria da nota = categoria do primeiro item lançado (MATERIAL quando
+    não há itens ou o item não tem categoria), como subconsulta correlata
+    para poder filtrar no banco.
+    """
+    categoria_item = func.upper(func.nullif(Item.categoria, ''))
+
+    primeira_categoria = (
+        db.session.query(categoria_item)
+        .select_from(NotaFiscalItem)
+        .outerjoin(Item, Item.id == NotaFiscalItem.item_id)
+        .filter(NotaFiscalItem.nota_fiscal_id == NotaFiscalEntrada.id)
+        .order_by(NotaFiscalItem.id.asc())
+        .limit(1)
+        .correlate(NotaFiscalEntrada)
+        .scalar_subquery()
+    )
+
+    return func.coalesce(primeira_categoria, 'MATERIAL')
+
+
+def _cursor_pesquisa(nota):
+    return f"{nota.data_hora.isoformat()}_{nota.id}"
+
+
+def _ler_cursor_pesquisa(valor):
+    """
+    Cursor da paginação por chave: "<data_hora ISO>_<id>" da última nota
+    exibida. Cursor inválido volta para a primeira página.
+    """
+    try:
+        data_hora, nota_id = (valor or '').rsplit('_', 1)
+        return datetime.fromisoformat(data_hora), int(nota_id)
+    except ValueError:
+        return None
+
+
+def _resumo_pesquisa(nota_ids):
+    total_notas = nota_ids.count()
+
+    total_itens, total_valor = (
+        db.session.query(
+            func.coalesce(func.sum(NotaFiscalItem.quantidade), 0),
+            func.coalesce(func.sum(
+                NotaFiscalItem.quantidade * NotaFiscalItem.valor_unitario
+            ), 0)
+        )
+        .filter(NotaFiscalItem.nota_fiscal_id.in_(nota_ids.subquery().select()))
+        .one()
+    )
+
+    return {
+        'total': int(total_notas or 0),
+        'itens': int(total_itens or 0),
+        'valor': float(total_valor or 0),
+    }
+
+
+def _totais_notas(nota_ids):
+    """
+    Quantidade e valor total por nota em uma consulta agrupada.
+    Retorna {nota_fiscal_id: (total_itens, total_nota)}.
+    """
+    if not nota_ids:
+        return {}
+
+    linhas = (
+        db.session.query(
+            NotaFiscalItem.nota_fiscal_id,
+            func.coalesce(func.sum(NotaFiscalItem.quantidade), 0),
+            func.coalesce(func.sum(
+                NotaFiscalItem.quantidade * NotaFiscalItem.valor_unitario
+            ), 0)
+        )
+        .filter(NotaFiscalItem.nota_fiscal_id.in_(nota_ids))
+        .group_by(NotaFiscalItem.nota_fiscal_id)
+        .all()
+    )
+
+    return {
+        nota_id: (int(total_itens or 0), float(total_nota or 0))
+        for nota_id, total_itens, total_nota in linhas
+    }
+
+
 # ------------------------
 # Pesquisar Nota Fiscal
 # ------------------------
@@ -1325,6 +1424,8 @@ def pesquisar():
     tipo_estoque = request.args.get('tipo_estoque', '').strip()
     categoria = request.args.get('categoria', '').strip().upper()
 
+    categoria_nota = _categoria_nota_expr()
+
     query = NotaFiscalEntrada.query
 
     # 🔎 filtro por número NF
@@ -1357,55 +1458,81 @@ def pesquisar():
         except:
             pass
 
-    notas = query.order_by(
-        NotaFiscalEntrada.data_hora.desc()
-    ).all()
+    # 🔥 FILTRO POR CATEGORIA (no banco)
+    if categoria:
+        query = query.filter(categoria_nota == categoria)
 
-    # 🔥 cálculo dos totais
-    notas_com_totais = []
+    resumo = _resumo_pesquisa(query.with_entities(NotaFiscalEntrada.id))
 
-    for nota in notas:
+    cursor = _ler_cursor_pesquisa(request.args.get('cursor'))
 
-        itens = NotaFiscalItem.query.filter_by(
-            nota_fiscal_id=nota.id
-        ).all()
+    if cursor:
+        cursor_data, cursor_id = cursor
+        query = query.filter(
+            or_(
+                NotaFiscalEntrada.data_hora < cursor_data,
+                and_(
+                    NotaFiscalEntrada.data_hora == cursor_data,
+                    NotaFiscalEntrada.id < cursor_id
+                )
+            )
+        )
 
-        # =========================
-        # CATEGORIA DA NOTA
-        # =========================
-        categoria_nota = 'MATERIAL'
+    linhas = (
+        query
+        .add_columns(categoria_nota.label('categoria_nota'))
+        .options(
+            selectinload(NotaFiscalEntrada.cliente),
+            selectinload(NotaFiscalEntrada.tipo_servico_ref),
+            selectinload(NotaFiscalEntrada.usuario)
+        )
+        .order_by(
+            NotaFiscalEntrada.data_hora.desc(),
+            NotaFiscalEntrada.id.desc()
+        )
+        .limit(PESQUISA_POR_PAGINA + 1)
+        .all()
+    )
 
-        if itens and itens[0].item and itens[0].item.categoria:
-            categoria_nota = itens[0].item.categoria.upper()
+    proximo_cursor = None
 
-        # 🔥 FILTRO POR CATEGORIA
-        if categoria and categoria_nota != categoria:
-            continue
+    if len(linhas) > PESQUISA_POR_PAGINA:
+        linhas = linhas[:PESQUISA_POR_PAGINA]
 
-        total_nota = sum(
-            i.quantidade * i.valor_unitario
-            for i in itens
-        )
+        if linhas[-1][0].data_hora:
+            proximo_cursor = _cursor_pesquisa(linhas[-1][0])
 
-        total_itens = sum(
-            i.quantidade
-            for i in itens
-        )
+    # 🔥 cálculo dos totais (uma consulta agrupada para a página)
+    totais = _totais_notas([nota.id for nota, _ in linhas])
+
+    notas_com_totais = []
+
+    for nota, categoria_linha in linhas:
+        total_itens, total_nota = totais.get(nota.id, (0, 0.0))
 
         notas_com_totais.append({
             'nota': nota,
+            'categoria': categoria_linha or 'MATERIAL',
             'total_nota': total_nota,
             'total_itens': total_itens
         })
 
+    filtros = {
+        'numero': numero,
+        'fornecedor': fornecedor,
+        'data_emissao': data_emissao,
+        'tipo_estoque': tipo_estoque,
+        'categoria': categoria,
+    }
+
     return render_template(
         'nota_fiscal/pesquisar.html',
         notas=notas_com_totais,
-        numero=numero,
-        fornecedor=fornecedor,
-        data_emissao=data_emissao,
-        tipo_estoque=tipo_estoque,
-        categoria=categoria
+        resumo=resumo,
+        filtros={chave: valor for chave, valor in filtros.items() if valor},
+        proximo_cursor=proximo_cursor,
+        pagina_inicial=not cursor,
+        **filtros
     )
 # ------------------------
 # API: Buscar Item
@@ -1442,27 +1569,30 @@ def api_responsavel(tipo_servico_id):
 @bp.route('/excluir/<int:id>', methods=['POST'])
 def excluir_nota(id):
     nota = NotaFiscalEntrada.query.get_or_404(id)
-    itens = NotaFiscalItem.query.filter_by(nota_fiscal_id=nota.id).all()
 
-    if _nota_cancelada(nota):
-        flash('Esta nota fiscal já está cancelada.', 'warning')
-        return redirect(url_for('nota_fiscal.historico'))
+    # Só este trecho é repetido em conflito de saldo: validação e
+    # estorno relidos a cada tentativa.
+    def gravar():
+        itens = NotaFiscalItem.query.filter_by(nota_fiscal_id=nota.id).all()
 
-    if not itens:
-        flash('Nota fiscal sem itens para cancelar.', 'warning')
-        return redirect(url_for('nota_fiscal.historico'))
+        if _nota_cancelada(nota):
+            flash('Esta nota fiscal já está cancelada.', 'warning')
+            return redirect(url_for('nota_fiscal.historico'))
 
-    bloqueios = _validar_cancelamento_nota(nota, itens)
+        if not itens:
+            flash('Nota fiscal sem itens para cancelar.', 'warning')
+            return redirect(url_for('nota_fiscal.historico'))
 
-    if bloqueios:
-        flash(
-            'Nota não cancelada. Saldo insuficiente para desfazer a entrada: '
-            + ' | '.join(bloqueios),
-            'danger'
-        )
-        return redirect(url_for('nota_fiscal.historico'))
+        bloqueios = _validar_cancelamento_nota(nota, itens)
+
+        if bloqueios:
+            flash(
+                'Nota não cancelada. Saldo insuficiente para desfazer a entrada: '
+                + ' | '.join(bloqueios),
+                'danger'
+            )
+            return redirect(url_for('nota_fiscal.historico'))
 
-    try:
         _aplicar_cancelamento_nota(nota, itens)
 
         usuario = (
@@ -1486,6 +1616,12 @@ def excluir_nota(id):
 
         db.session.commit()
 
+    try:
+        resposta = repetir_em_conflito(gravar)
+
+        if resposta is not None:
+            return resposta
+
     except Exception as e:
         db.session.rollback()
         flash(f'Nota não cancelada: {e}', 'danger')
@@ -1518,20 +1654,17 @@ def api_itens():
 
     categoria = request.args.get('categoria', '').strip().lower()
 
-    query = Item.query
+    def montar(catalogo):
+        itens = catalogo.da_categoria(categoria) if categoria else catalogo.itens
 
-    if categoria:
-        query = query.filter(
-            func.lower(Item.categoria) == categoria
-        )
-
-    itens = query.order_by(Item.descricao.asc()).all()
+        return [
+            {
+                'codigo': item['codigo'],
+                'descricao': item['descricao'],
+                'valor': item['valor']
+            }
+            for item in itens
+        ]
 
-    return jsonify([
-        {
-            'codigo': item.codigo,
-            'descricao': item.descricao,
-            'valor': item.valor
-        }
-        for item in itens
-    ])
+    # Catálogo em memória com ETag: o navegador só revalida (304).
+    return responder_catalogo(f'nota_fiscal:{categoria}', montar)
@@ -0,0 +1,265 @@
+from datetime import datetime, timedelta
+
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask_login import login_required, current_user
+
+from app.extensions import db
+from app.models import Empresa, Item, RazaoEstoque, Tecnico
+from app.utils.razao_estoque import (
+    SALDO_ESTOQUE,
+    SALDO_TECNICO,
+    filtro,
+    saldos_em,
+)
+
+bp_razao_estoque = Blueprint(
+    "razao_estoque",
+    __name__,
+    url_prefix="/razao"
+)
+
+PERFIS_RAZAO = {"admin", "estoque"}
+LANCAMENTOS_LIMITE_PADRAO = 200
+LANCAMENTOS_LIMITE_MAXIMO = 5000
+
+
+def _pode_ver_razao():
+    return getattr(current_user, "perfil", None) in PERFIS_RAZAO
+
+
+def _ler_data(valor, fim_do_dia=True):
+    """
+    Aceita "AAAA-MM-DD" (fim do dia, inclusive) ou data/hora ISO.
+    Retorna None para vazio; ValueError para formato inválido.
+    """
+    valor = (valor or "").strip()
+
+    if not valor:
+        return None
+
+    if len(valor) == 10:
+        data = datetime.strptime(valor, "%Y-%m-%d")
+        return data + timedelta(days=1, microseconds=-1) if fim_do_dia else data
+
+    return datetime.fromisoformat(valor)
+
+
+def _filtros_saldo(args):
+    condicoes = []
+
+    saldo = args.get("saldo", "").strip()
+
+    if saldo in (SALDO_ESTOQUE, SALDO_TECNICO):
+        condicoes.append(filtro("saldo", saldo))
+
+    for campo in ("tecnico_id", "item_id", "cliente_id", "tipo_servico_id"):
+        valor = args.get(campo, type=int)
+
+        if valor:
+            condicoes.append(filtro(campo, valor))
+
+    return condicoes
+
+
+def _nomes(linhas):
+    item_ids = {linha["item_id"] for linha in linhas if linha["item_id"]}
+    tecnico_ids = {linha["tecnico_id"] for linha in linhas if linha["tecnico_id"]}
+    cliente_ids = {linha["cliente_id"] for linha in linhas if linha["cliente_id"]}
+
+    itens = {
+        item_id: (codigo, descricao)
+        for item_id, codigo, descricao in (
+            db.session.query(Item.id, Item.codigo, Item.descricao)
+            .filter(Item.id.in_(item_ids))
+            if item_ids else []
+        )
+    }
+
+    tecnicos = dict(
+        db.session.query(Tecnico.id, Tecnico.nome)
+        .filter(Tecnico.id.in_(tecnico_ids))
+        .all()
+    ) if tecnico_ids else {}
+
+    clientes = dict(
+        db.session.query(Empresa.id, Empresa.razao_social)
+        .filter(Empresa.id.in_(cliente_ids))
+        .all()
+    ) if cliente_ids else {}
+
+    return itens, tecnicos, clientes
+
+
+def _saldos_serializados(linhas):
+    itens, tecnicos, clientes = _nomes(linhas)
+    saldos = []
+
+    for linha in linhas:
+        codigo, descricao = itens.get(linha["item_id"], (None, None))
+
+        saldos.append(dict(
+            linha,
+            quantidade=int(linha["quantidade"]),
+            item_codigo=codigo,
+            item_descricao=descricao,
+            tecnico_nome=tecnicos.get(linha["tecnico_id"]),
+            cliente_nome=clientes.get(linha["cliente_id"]),
+        ))
+
+    saldos.sort(key=lambda s: (
+        s["saldo"],
+        s["tecnico_nome"] or "",
+        s["item_descricao"] or "",
+    ))
+
+    return saldos
+
+
+# ------------------------
+# API: saldo em uma data
+# ------------------------
+@bp_razao_estoque.route("/api/saldos")
+@login_required
+def api_saldos():
+    if not _pode_ver_razao():
+        return jsonify({"erro": "Acesso permitido apenas para administrador ou estoque"}), 403
+
+    try:
+        data_hora = _ler_data(request.args.get("data")) or datetime.utcnow()
+    except ValueError:
+        return jsonify({"erro": "Data inválida. Use AAAA-MM-DD ou data/hora ISO."}), 400
+
+    snapshot, linhas = saldos_em(data_hora, *_filtros_saldo(request.args))
+
+    return jsonify({
+        "data": data_hora.isoformat(),
+        "snapshot_id": snapshot["id"] if snapshot else None,
+        "saldos": _saldos_serializados(linhas),
+    })
+
+
+# ------------------------
+# API: lançamentos (extrato)
+# ------------------------
+@bp_razao_estoque.route("/api/lancamentos")
+@login_required
+def api_lancamentos():
+    if not _pode_ver_razao():
+        return jsonify({"erro": "Acesso permitido apenas para administrador ou estoque"}), 403
+
+    try:
+        inicio = _ler_data(request.args.get("inicio"), fim_do_dia=False)
+        fim = _ler_data(request.args.get("fim"))
+    except ValueError:
+        return jsonify({"erro": "Data inválida. Use AAAA-MM-DD ou data/hora ISO."}), 400
+
+    # Entre 1 e o máximo: 0 ou negativo viraria lista vazia ou LIMIT -1.
+    limite = max(1, min(
+        request.args.get("limite", LANCAMENTOS_LIMITE_PADRAO, type=int),
+        LANCAMENTOS_LIMITE_MAXIMO
+    ))
+    antes_de = request.args.get("antes_de", type=int)
+
+    query = RazaoEstoque.query
+
+    for condicao in _filtros_saldo(request.args):
+        query = query.filter(condicao(RazaoEstoque))
+
+    if inicio:
+        query = query.filter(RazaoEstoque.data_hora >= inicio)
+
+    if fim:
+        query = query.filter(RazaoEstoque.data_hora <= fim)
+
+    # Paginação por chave: próxima página com antes_de=<menor id recebido>
+    if antes_de:
+        query = query.filter(RazaoEstoque.id < antes_de)
+
+    lancamentos = query.order_by(RazaoEstoque.id.desc()).limit(limite).all()
+
+    return jsonify({
+        "lancamentos": [
+            {
+                "id": l.id,
+                "data_hora": l.data_hora.isoformat() if l.data_hora else None,
+                "saldo": l.saldo,
+                "saldo_id": l.saldo_id,
+                "item_id": l.item_id,
+                "tecnico_id": l.tecnico_id,
+                "tipo_estoque": l.tipo_estoque,
+                "cliente_id": l.cliente_id,
+                "tipo_servico_id": l.tipo_servico_id,
+                "ordem_servico_id": l.ordem_servico_id,
+                "condicao_material": l.condicao_material,
+                "delta": l.delta,
+                "quantidade_apos": l.quantidade_apos,
+                "documento_tipo": l.documento_tipo,
+                "documento_id": l.documento_id,
+                "origem": l.origem,
+                "usuario_id": l.usuario_id,
+            }
+            for l in lancamentos
+        ],
+        "proximo": lancamentos[-1].id if len(lancamentos) == limite else None,
+    })
+
+
+# ------------------------
+# Relatório: saldo em uma data
+# ------------------------
+@bp_razao_estoque.route("/relatorio")
+@login_required
+def relatorio():
+    if not _pode_ver_razao():
+        flash("Acesso permitido apenas para administrador ou estoque.", "danger")
+        return redirect(url_for("home.home"))
+
+    data = request.args.get("data", "").strip()
+    saldo = request.args.get("saldo", SALDO_TECNICO).strip()
+    tecnico_id = request.args.get("tecnico_id", type=int)
+    codigo = request.args.get("codigo", "").strip().upper()
+
+    tecnicos = (
+        db.session.query(Tecnico.id, Tecnico.nome)
+        .order_by(Tecnico.nome)
+        .all()
+    )
+
+    saldos = []
+    snapshot = None
+    consultado = bool(data)
+
+    if consultado:
+        try:
+            data_hora = _ler_data(data)
+        except ValueError:
+            flash("Data inválida.", "danger")
+            return redirect(url_for("razao_estoque.relatorio"))
+
+        condicoes = _filtros_saldo(request.args)
+
+        if codigo:
+            item = Item.query.filter_by(codigo=codigo).first()
+
+            if not item:
+                flash(f"Item {codigo} não encontrado.", "warning")
+                consultado = False
+            else:
+                condicoes.append(filtro("item_id", item.id))
+
+        if consultado:
+            snapshot, linhas = saldos_em(data_hora, *condicoes)
+            saldos = _saldos_serializados(linhas)
+
+    return render_template(
+        "razao_estoque/relatorio.html",
+        saldos=saldos,
+        snapshot=snapshot,
+        consultado=consultado,
+        tecnicos=tecnicos,
+        data=data,
+        saldo=saldo,
+        tecnico_id=tecnico_id,
+        codigo=codigo,
+        total=sum(s["quantidade"] for s in saldos)
+    )
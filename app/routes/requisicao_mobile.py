@@ -16,6 +16,12 @@ from app.models import (
     RequisicaoTecnico,
     RequisicaoTecnicoItem
 )
+from app.utils.envios_offline import (
+    EnvioRecusado,
+    envio_existente,
+    ler_chave,
+    registrar_envio,
+)
 
 bp_requisicao_mobile = Blueprint(
     "requisicao_mobile",
@@ -122,158 +128,169 @@ def item_eh_material(item):
     return categoria in ["", "material"]
 
 
-@bp_requisicao_mobile.route("/nova", methods=["GET", "POST"])
-@login_required
-def nova():
+def gravar_requisicao_mobile(tecnico, form):
+    """
+    Grava (sem commit) a requisição de material do formulário mobile.
+    Usada pelo formulário e pelo envio em lote da fila offline
+    (tecnico_mobile.api_envios). Validação que impede a gravação levanta
+    EnvioRecusado com a mensagem para o técnico.
+    """
+    # FORMULÁRIO MOBILE SIMPLIFICADO:
+    # Técnico solicita apenas MATERIAL do estoque EMPRESA.
+    tipo_estoque = "empresa"
+    tipo_servico_id = form.get("tipo_servico_id", type=int)
+    observacao = form.get("observacao", "").strip() or "N/D"
 
-    tecnico = get_tecnico_mobile_logado()
+    cliente_id = None
+    endereco = ""
+    os_cliente = None
 
-    if not tecnico:
-        flash("Técnico não localizado para este login.", "danger")
-        return redirect(url_for("requisicao_mobile.login"))
+    item_ids = form.getlist("item_id[]")
+    quantidades = form.getlist("quantidade[]")
 
-    if request.method == "POST":
+    tipo_servico = TipoServico.query.get(tipo_servico_id)
 
-        # FORMULÁRIO MOBILE SIMPLIFICADO:
-        # Técnico solicita apenas MATERIAL do estoque EMPRESA.
-        tipo_estoque = "empresa"
-        tipo_servico_id = request.form.get("tipo_servico_id", type=int)
-        observacao = request.form.get("observacao", "").strip() or "N/D"
+    if not tipo_servico:
+        raise EnvioRecusado("Selecione o tipo de serviço.")
 
-        cliente_id = None
-        endereco = ""
-        os_cliente = None
+    if not item_ids:
+        raise EnvioRecusado("Adicione pelo menos um item.")
 
-        item_ids = request.form.getlist("item_id[]")
-        quantidades = request.form.getlist("quantidade[]")        
-      
-        tipo_servico = TipoServico.query.get(tipo_servico_id)
+    requisicao = RequisicaoTecnico(
+        solicitante_responsavel=tecnico.nome,
+        solicitante_tecnico=tecnico.nome,
+        solicitante_tecnico_id=tecnico.id,
 
-        if not tipo_servico:
-            flash("Selecione o tipo de serviço.", "warning")
-            return redirect(url_for("requisicao_mobile.nova"))
+        tipo_estoque=tipo_estoque,
 
-        if not item_ids:
-            flash("Adicione pelo menos um item.", "warning")
-            return redirect(url_for("requisicao_mobile.nova"))
+        cliente_id=cliente_id,
+        os_cliente=os_cliente,
+
+        tipo_servico=tipo_servico.nome,
+
+        endereco=endereco,
+        observacao=observacao,
+
+        origem_mobile=True,
+        status="pendente",
+
+        data_hora=datetime.now()
+    )
+
+    db.session.add(requisicao)
+    db.session.flush()
+
+    total_itens = 0
+
+    for item_id, qtd in zip(item_ids, quantidades):
+
+        if not item_id or not qtd:
+            continue
 
         try:
+            item_id = int(item_id)
+            quantidade = int(qtd)
+        except ValueError:
+            continue
 
-            requisicao = RequisicaoTecnico(
-                solicitante_responsavel=tecnico.nome,
-                solicitante_tecnico=tecnico.nome,
-                solicitante_tecnico_id=tecnico.id,
+        if quantidade <= 0:
+            continue
 
-                tipo_estoque=tipo_estoque,
+        item = Item.query.get(item_id)
 
-                cliente_id=cliente_id,
-                os_cliente=os_cliente,
+        if not item:
+            continue
 
-                tipo_servico=tipo_servico.nome,
+        if not item_eh_material(item):
+            raise EnvioRecusado(
+                f"O item {item.codigo} - {item.descricao} não é material "
+                f"e não pode ser solicitado nesta requisição."
+            )
 
-                endereco=endereco,
-                observacao=observacao,
+        estoque_query = Estoque.query.filter(
+            Estoque.item_id == item.id,
+            Estoque.tipo_servico_id == 1,
+            Estoque.tipo_estoque == tipo_estoque,
+            Estoque.cliente_id.is_(None)
+        )
 
-                origem_mobile=True,
-                status="pendente",
+        estoques_item = estoque_query.all()
+        quantidade_estoque = sum(e.quantidade or 0 for e in estoques_item)
+        valor_estoque = next(
+            (
+                float(e.valor_unitario)
+                for e in estoques_item
+                if e.valor_unitario is not None
+            ),
+            float(item.valor or 0)
+        )
 
-                data_hora=datetime.now()
+        if quantidade_estoque <= 0:
+            raise EnvioRecusado(
+                f"O item {item.codigo} - {item.descricao} está sem saldo disponível."
             )
 
-            db.session.add(requisicao)
-            db.session.flush()
-
-            total_itens = 0
-
-            for item_id, qtd in zip(item_ids, quantidades):
-
-                if not item_id or not qtd:
-                    continue
-
-                try:
-                    item_id = int(item_id)
-                    quantidade = int(qtd)
-                except ValueError:
-                    continue
-
-                if quantidade <= 0:
-                    continue
-
-                item = Item.query.get(item_id)
-
-                if not item:
-                    continue
-
-                if not item_eh_material(item):
-                    db.session.rollback()
-                    flash(
-                        f"O item {item.codigo} - {item.descricao} não é material "
-                        f"e não pode ser solicitado nesta requisição.",
-                        "warning"
-                    )
-                    return redirect(url_for("requisicao_mobile.nova"))
-
-                estoque_query = Estoque.query.filter(
-                    Estoque.item_id == item.id,
-                    Estoque.tipo_servico_id == 1,
-                    Estoque.tipo_estoque == tipo_estoque,
-                    Estoque.cliente_id.is_(None)
-                )
-
-                estoques_item = estoque_query.all()
-                quantidade_estoque = sum(e.quantidade or 0 for e in estoques_item)
-                valor_estoque = next(
-                    (
-                        float(e.valor_unitario)
-                        for e in estoques_item
-                        if e.valor_unitario is not None
-                    ),
-                    float(item.valor or 0)
-                )
-
-                if quantidade_estoque <= 0:
-                    db.session.rollback()
-                    flash(
-                        f"O item {item.codigo} - {item.descricao} está sem saldo disponível.",
-                        "warning"
-                    )
-                    return redirect(url_for("requisicao_mobile.nova"))
-
-                if quantidade > quantidade_estoque:
-                    db.session.rollback()
-                    flash(
-                        f"Quantidade solicitada do item {item.codigo} é maior que o saldo disponível. "
-                        f"Saldo atual: {quantidade_estoque}.",
-                        "warning"
-                    )
-                    return redirect(url_for("requisicao_mobile.nova"))
-
-                novo_item = RequisicaoTecnicoItem(
-                    requisicao_id=requisicao.id,
-                    codigo=item.codigo,
-                    descricao=item.descricao,
-                    unidade=item.unidade,
-                    quantidade=quantidade,
-                    valor=valor_estoque,
-                    quantidade_estoque=quantidade_estoque
-                )
-
-                db.session.add(novo_item)
-                total_itens += 1
-
-            if total_itens == 0:
-                db.session.rollback()
-                flash("Adicione pelo menos um item válido.", "warning")
-                return redirect(url_for("requisicao_mobile.nova"))
+        if quantidade > quantidade_estoque:
+            raise EnvioRecusado(
+                f"Quantidade solicitada do item {item.codigo} é maior que o saldo disponível. "
+                f"Saldo atual: {quantidade_estoque}."
+            )
 
-            db.session.commit()
+        novo_item = RequisicaoTecnicoItem(
+            requisicao_id=requisicao.id,
+            codigo=item.codigo,
+            descricao=item.descricao,
+            unidade=item.unidade,
+            quantidade=quantidade,
+            valor=valor_estoque,
+            quantidade_estoque=quantidade_estoque
+        )
+
+        db.session.add(novo_item)
+        total_itens += 1
+
+    if total_itens == 0:
+        raise EnvioRecusado("Adicione pelo menos um item válido.")
+
+    return requisicao
+
+
+@bp_requisicao_mobile.route("/nova", methods=["GET", "POST"])
+@login_required
+def nova():
+
+    tecnico = get_tecnico_mobile_logado()
+
+    if not tecnico:
+        flash("Técnico não localizado para este login.", "danger")
+        return redirect(url_for("requisicao_mobile.login"))
+
+    if request.method == "POST":
 
-            return redirect(
-                url_for(
-                    "tecnico_mobile.home",
-                    sucesso="requisicao_enviada"
-                )
+        chave = ler_chave(request.form.get("chave_envio"))
+        enviada = redirect(
+            url_for(
+                "tecnico_mobile.home",
+                sucesso="requisicao_enviada"
             )
+        )
+
+        # Mesmo formulário reenviado (clique duplo, fila offline): já gravado.
+        if envio_existente(chave):
+            return enviada
+
+        try:
+            requisicao = gravar_requisicao_mobile(tecnico, request.form)
+            registrar_envio(chave, "requisicao", requisicao.id, tecnico.id)
+
+            db.session.commit()
+
+            return enviada
+
+        except EnvioRecusado as e:
+            db.session.rollback()
+            flash(str(e), e.categoria)
+            return redirect(url_for("requisicao_mobile.nova"))
 
         except Exception as e:
             db.session.rollback()
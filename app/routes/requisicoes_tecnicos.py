@@ -4,8 +4,6 @@ from flask import (
 )
 from flask_login import login_required, current_user
 from datetime import datetime
-import os
-import base64
 from io import BytesIO
 
 from app.extensions import db
@@ -20,7 +18,10 @@ from app.models import (
     Empresa
 )
 
+from app.utils.assinaturas import guardar_assinatura
 from app.utils.mailer import send_requisition_email, _build_requisition_pdf
+from app.utils.contadores_pendentes import obter_contadores
+from app.utils.saldos import repetir_em_conflito
 
 
 bp_requisicoes_tecnicos = Blueprint(
@@ -80,30 +81,12 @@ def usuario_atendente():
     return perfil in ["admin", "estoque", "tecnica", "supervisor"]
 
 
-def salvar_assinatura(assinatura_base64, requisicao_id, origem="mobile"):
-    if not assinatura_base64:
-        return None
-
+def salvar_assinatura(assinatura_base64):
+    """Guarda o PNG no repositório de assinaturas e devolve o SHA-256."""
     try:
-        if "," in assinatura_base64:
-            assinatura_data = assinatura_base64.split(",", 1)[1]
-        else:
-            assinatura_data = assinatura_base64
-
-        imagem_bytes = base64.b64decode(assinatura_data)
-
-        pasta = os.path.join("app", "static", "assinaturas")
-        os.makedirs(pasta, exist_ok=True)
-
-        nome = f"assinatura_{origem}_{requisicao_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}.png"
-        caminho = os.path.join(pasta, nome)
-
-        with open(caminho, "wb") as f:
-            f.write(imagem_bytes)
-
-        return f"assinaturas/{nome}"
+        return guardar_assinatura(assinatura_base64)
 
-    except Exception as e:
+    except OSError as e:
         current_app.logger.exception("Erro ao salvar assinatura: %s", e)
         return None
 
@@ -395,6 +378,7 @@ def nova_requisicao_mobile():
 def mobile_recebidas():
     requisicoes = (
         RequisicaoTecnico.query
+        .options(*RequisicaoTecnico.opcoes_listagem())
         .filter(
             RequisicaoTecnico.origem_mobile == True,
             RequisicaoTecnico.status == "pendente"
@@ -436,61 +420,63 @@ def mobile_detalhes(requisicao_id):
             flash("Selecione o Cliente / O.S para atender pelo estoque do cliente.", "warning")
             return redirect(url_for("requisicoes_tecnicos.mobile_detalhes", requisicao_id=requisicao.id))
 
-        requisicao.tipo_estoque = tipo_estoque
-        requisicao.cliente_id = cliente_id if tipo_estoque == "cliente" else requisicao.cliente_id
-        requisicao.observacao_estoque = observacao_estoque
+        enviado = False
 
-        for item in requisicao.itens:
-            nova_qtd = request.form.get(f"quantidade_{item.id}")
+        # Só este trecho é repetido em conflito de saldo.
+        def gravar():
+            nonlocal enviado
 
-            if nova_qtd:
-                try:
-                    qtd = int(nova_qtd)
-                    if qtd >= 0:
-                        item.quantidade = qtd
-                except Exception:
-                    pass
+            requisicao.tipo_estoque = tipo_estoque
+            requisicao.cliente_id = cliente_id if tipo_estoque == "cliente" else requisicao.cliente_id
+            requisicao.observacao_estoque = observacao_estoque
 
-        assinatura_base64 = (
-            request.form.get("assinatura_base64")
-            or request.form.get("assinatura")
-        )
+            for item in requisicao.itens:
+                nova_qtd = request.form.get(f"quantidade_{item.id}")
 
-        if novo_status == "material_entregue":
-            if assinatura_base64:
-                caminho = salvar_assinatura(
-                    assinatura_base64,
-                    requisicao.id,
-                    "mobile"
-                )
+                if nova_qtd:
+                    try:
+                        qtd = int(nova_qtd)
+                        if qtd >= 0:
+                            item.quantidade = qtd
+                    except Exception:
+                        pass
 
-                if caminho:
-                    requisicao.assinatura_path = caminho
-                    requisicao.assinatura_base64 = assinatura_base64
+            assinatura_base64 = (
+                request.form.get("assinatura_base64")
+                or request.form.get("assinatura")
+            )
 
-            ok, msg = movimentar_para_saldo_tecnico(requisicao)
+            if novo_status == "material_entregue":
+                if assinatura_base64:
+                    chave = salvar_assinatura(assinatura_base64)
 
-            if not ok:
-                db.session.rollback()
-                flash(msg, "danger")
-                return redirect(url_for("requisicoes_tecnicos.mobile_detalhes", requisicao_id=requisicao.id))
+                    if chave:
+                        requisicao.assinatura_base64 = chave
 
-            requisicao.status = "material_entregue"
+                ok, msg = movimentar_para_saldo_tecnico(requisicao)
 
-        db.session.commit()
+                if not ok:
+                    db.session.rollback()
+                    flash(msg, "danger")
+                    return redirect(url_for("requisicoes_tecnicos.mobile_detalhes", requisicao_id=requisicao.id))
 
-        if requisicao.status == "material_entregue":
-            try:
+                requisicao.status = "material_entregue"
+
+                # Na mesma transação da entrega: o e-mail é gravado junto com ela.
                 enviado = send_requisition_email(requisicao, attach_pdf=True)
 
-                if enviado:
-                    flash("Requisição finalizada e enviada ao e-mail do técnico.", "success")
-                else:
-                    flash("Requisição finalizada, mas o e-mail não foi enviado.", "warning")
+            db.session.commit()
+
+        resposta = repetir_em_conflito(gravar)
 
-            except Exception:
-                current_app.logger.exception("Erro ao enviar e-mail")
-                flash("Material entregue, mas ocorreu erro ao enviar e-mail.", "warning")
+        if resposta is not None:
+            return resposta
+
+        if requisicao.status == "material_entregue":
+            if enviado:
+                flash("Requisição finalizada. Comprovante na fila de envio ao e-mail do técnico.", "success")
+            else:
+                flash("Requisição finalizada, mas o e-mail não foi colocado na fila de envio.", "warning")
 
             return redirect(url_for("requisicoes_tecnicos.historico"))
 
@@ -526,6 +512,7 @@ def historico():
 
     query = (
         RequisicaoTecnico.query
+        .options(*RequisicaoTecnico.opcoes_listagem())
         .filter(RequisicaoTecnico.origem_mobile == True)
     )
 
@@ -657,15 +644,7 @@ def api_itens_disponiveis():
 @bp_requisicoes_tecnicos.route("/api/requisicoes/pendentes")
 @login_required
 def api_requisicoes_pendentes():
-
-    count = (
-        RequisicaoTecnico.query
-        .filter(
-            RequisicaoTecnico.origem_mobile == True,
-            RequisicaoTecnico.status == "pendente"
-        )
-        .count()
-    )
+    count = obter_contadores()["requisicoes"]
 
     return jsonify({"count": count})
 
@@ -673,14 +652,7 @@ def api_requisicoes_pendentes():
 @bp_requisicoes_tecnicos.route("/api/pendentes_count")
 @login_required
 def api_pendentes_count():
-    count = (
-        RequisicaoTecnico.query
-        .filter(
-            RequisicaoTecnico.origem_mobile == True,
-            RequisicaoTecnico.status == "pendente"
-        )
-        .count()
-    )
+    count = obter_contadores()["requisicoes"]
 
     return jsonify({"pendentes": count})
 
@@ -2,7 +2,6 @@ from flask import Blueprint, render_template, request, send_file
 from sqlalchemy import func
 from app.models import Tecnico, SaldoTecnico, TipoServico, Item, Empresa
 from app.extensions import db
-import pandas as pd
 import io
 
 try:
@@ -211,6 +210,8 @@ def saldo_detalhado(id_tecnico):
 
 @bp.route('/saldo_tecnico/<int:id_tecnico>/exportar')
 def exportar_saldo_tecnico(id_tecnico):
+    import pandas as pd
+
     tecnico = Tecnico.query.get_or_404(id_tecnico)
 
     tipo_servico_id = request.args.get('tipo_servico_id', 'todos')
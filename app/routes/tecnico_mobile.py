@@ -1,10 +1,48 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session
+import hashlib
+import json
+import os
+from datetime import datetime
+
+from flask import (
+    Blueprint,
+    current_app,
+    jsonify,
+    render_template,
+    request,
+    redirect,
+    url_for,
+    flash,
+    session,
+)
 from flask_login import login_user, logout_user, login_required, current_user
 from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from app.extensions import db
 from app.models import Usuario, Tecnico
+from app.routes.baixa_tecnico import (
+    gravar_baixa_mobile,
+    ordens_servico_disponiveis,
+    saldos_offline_tecnico,
+)
+from app.routes.requisicao_mobile import (
+    buscar_itens_por_estoque,
+    gravar_requisicao_mobile,
+)
+from app.utils.envios_offline import (
+    TIPOS_ENVIO,
+    EnvioRecusado,
+    envio_existente,
+    ler_chave,
+    ler_data_envio,
+    registrar_envio,
+)
+
+
+# Envios aceitos por chamada de /api/envios (a fila manda lotes de 10).
+MAXIMO_ENVIOS_POR_LOTE = 20
 
 
 bp_tecnico_mobile = Blueprint(
@@ -147,14 +185,211 @@ def home():
         return redirect(url_for("tecnico_mobile.login"))
 
     sucesso = request.args.get("sucesso")
+    offline = request.args.get("offline")
 
     return render_template(
         "tecnico_mobile/home.html",
         tecnico=tecnico,
-        sucesso=sucesso
+        sucesso=sucesso,
+        offline=offline
     )
 
 
+# ==========================================================
+# PORTAL OFFLINE (service worker + fila de envios)
+# ==========================================================
+
+@bp_tecnico_mobile.route("/sw.js")
+def service_worker():
+    # Servido daqui (e não de /static) para valer no site inteiro: o
+    # formulário de baixa e a requisição ficam fora de /tecnico-mobile.
+    # Vai com o mapa de static/dist na frente: o worker guarda as mesmas
+    # URLs versionadas que as páginas usam, e um build novo muda os bytes
+    # do worker, o que faz o navegador instalar a versão nova.
+    with open(os.path.join(current_app.static_folder, "sw_tecnico.js"), encoding="utf-8") as arquivo:
+        codigo = arquivo.read()
+
+    estaticos = {
+        logico: [
+            url_for("static", filename=entrada[chave])
+            for chave in ("arquivo", "webp")
+            if entrada.get(chave)
+        ]
+        for logico, entrada in current_app.extensions.get("estaticos", {}).items()
+    }
+    corpo = f"self.ESTATICOS = {json.dumps(estaticos, sort_keys=True)};\n\n{codigo}"
+
+    resposta = current_app.response_class(corpo, mimetype="application/javascript")
+    resposta.headers["Service-Worker-Allowed"] = "/"
+    resposta.cache_control.no_cache = True
+    resposta.set_etag(hashlib.sha256(corpo.encode("utf-8")).hexdigest()[:32])
+
+    return resposta.make_conditional(request)
+
+
+@bp_tecnico_mobile.route("/api/pacote-offline")
+@login_required
+def api_pacote_offline():
+    """Saldo do técnico, OS abertas e itens da requisição para uso sem sinal."""
+    tecnico = get_tecnico_logado()
+
+    if not tecnico:
+        return jsonify({"erro": "Técnico não localizado."}), 403
+
+    resposta = jsonify({
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "tecnico_id": tecnico.id,
+        "saldos": saldos_offline_tecnico(tecnico.id),
+        "ordens": ordens_servico_disponiveis(),
+        "requisicao": buscar_itens_por_estoque(1, "empresa")["itens"],
+    })
+    resposta.cache_control.private = True
+    resposta.cache_control.no_store = True
+
+    return resposta
+
+
+def _formulario_envio(envio):
+    """MultiDict de campos e arquivos de um envio, como viria do formulário."""
+    campos = MultiDict()
+
+    for nome, valores in (envio.get("campos") or {}).items():
+        for valor in valores if isinstance(valores, list) else [valores]:
+            campos.add(nome, "" if valor is None else str(valor))
+
+    arquivos = MultiDict()
+
+    for nome, referencias in (envio.get("arquivos") or {}).items():
+        for referencia in referencias if isinstance(referencias, list) else [referencias]:
+            arquivo = request.files.get(str(referencia))
+
+            if arquivo and arquivo.filename:
+                arquivos.add(nome, arquivo)
+
+    return campos, arquivos
+
+
+def _resultado_existente(existente, chave, tipo, tecnico):
+    """
+    Reenvio de uma chave já gravada: "duplicado" só se for o mesmo tipo e
+    o mesmo técnico; senão a chave é de outro envio e nada é devolvido.
+    """
+    if existente.tipo != tipo or existente.tecnico_id != tecnico.id:
+        return {
+            "chave": chave,
+            "status": "recusado",
+            "mensagem": "Chave já usada por outro envio.",
+        }
+
+    return {"chave": chave, "status": "duplicado", "registro_id": existente.registro_id}
+
+
+def _gravar_envio(tecnico, envio):
+    """Grava um envio da fila; devolve o resultado que volta ao aparelho."""
+    chave = ler_chave(envio.get("chave"))
+    tipo = envio.get("tipo")
+
+    if not chave or tipo not in TIPOS_ENVIO:
+        return {
+            "chave": envio.get("chave"),
+            "status": "recusado",
+            "mensagem": "Envio inválido.",
+        }
+
+    existente = envio_existente(chave)
+
+    if existente:
+        return _resultado_existente(existente, chave, tipo, tecnico)
+
+    campos, arquivos = _formulario_envio(envio)
+    fotos_recusadas = []
+
+    try:
+        if tipo == "baixa":
+            # A fila é de um aparelho só: não grava baixa em nome de outro técnico.
+            if campos.get("tecnico_id", type=int) != tecnico.id:
+                raise EnvioRecusado("Baixa de outro técnico.")
+
+            registro, _revisada, fotos_recusadas = gravar_baixa_mobile(campos, arquivos)
+        else:
+            registro = gravar_requisicao_mobile(tecnico, campos)
+
+        registrar_envio(
+            chave,
+            tipo,
+            registro.id,
+            tecnico.id,
+            ler_data_envio(envio.get("criado_em")),
+        )
+
+        db.session.commit()
+
+    except EnvioRecusado as e:
+        db.session.rollback()
+        return {"chave": chave, "status": "recusado", "mensagem": str(e)}
+
+    except IntegrityError:
+        # Mesmo envio gravado em paralelo (duas abas sincronizando).
+        db.session.rollback()
+        existente = envio_existente(chave)
+
+        if existente:
+            return _resultado_existente(existente, chave, tipo, tecnico)
+
+        current_app.logger.exception("Falha no envio offline %s", chave)
+        return {"chave": chave, "status": "erro"}
+
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Falha no envio offline %s", chave)
+        return {"chave": chave, "status": "erro"}
+
+    resultado = {"chave": chave, "status": "criado", "registro_id": registro.id}
+
+    if fotos_recusadas:
+        resultado["fotos_recusadas"] = fotos_recusadas
+
+    return resultado
+
+
+@bp_tecnico_mobile.route("/api/envios", methods=["POST"])
+@login_required
+def api_envios():
+    """
+    Recebe a fila offline do aparelho: campo "envios" com a lista JSON
+    [{chave, tipo, campos, arquivos, criado_em}] e as fotos como arquivos
+    do multipart, referenciados em "arquivos". Cada envio é gravado na sua
+    própria transação e devolve criado, duplicado, recusado (não adianta
+    reenviar) ou erro (tentar de novo depois). Em criado, fotos_recusadas
+    lista os arquivos que não eram imagem e ficaram de fora.
+    """
+    tecnico = get_tecnico_logado()
+
+    if not tecnico:
+        return jsonify({"erro": "Técnico não localizado."}), 403
+
+    try:
+        envios = json.loads(request.form.get("envios") or "[]")
+    except ValueError:
+        return jsonify({"erro": "Lista de envios inválida."}), 400
+
+    if not isinstance(envios, list):
+        return jsonify({"erro": "Lista de envios inválida."}), 400
+
+    if len(envios) > MAXIMO_ENVIOS_POR_LOTE:
+        return jsonify({
+            "erro": f"Envie no máximo {MAXIMO_ENVIOS_POR_LOTE} registros por vez."
+        }), 413
+
+    resultados = [
+        _gravar_envio(tecnico, envio)
+        for envio in envios
+        if isinstance(envio, dict)
+    ]
+
+    return jsonify({"resultados": resultados})
+
+
 @bp_tecnico_mobile.route("/alterar-senha", methods=["GET", "POST"])
 @login_required
 def alterar_senha():
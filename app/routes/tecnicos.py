@@ -2,7 +2,6 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import current_user, login_required
 from app.extensions import db
 from app.models import Tecnico, Usuario
-import qrcode
 import os
 from werkzeug.security import generate_password_hash
 
@@ -24,6 +23,8 @@ def senha_inicial_tecnico(tecnico):
 
 @bp.route('/cadastro', methods=['GET', 'POST'])
 def cadastrar_tecnico():
+    import qrcode
+
     if request.method == 'POST':
         nome = request.form.get('nome', '').strip()
         matricula = request.form.get('matricula', '').strip()
@@ -166,6 +167,8 @@ def listar_tecnicos():
 
 @bp.route('/qrcode/<int:tecnico_id>')
 def qrcode_tecnico(tecnico_id):
+    import qrcode
+
     tecnico = Tecnico.query.get_or_404(tecnico_id)
 
     login_tecnico_url = url_for(
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, jsonify, request, redirect, url_fo
 from app.extensions import db
 from app.models import Empresa, TransferenciaExterna, TransferenciaExternaItem, Item, Estoque, TipoServico
 from datetime import datetime
+from app.utils.assinaturas import guardar_assinatura
 
 bp_externa = Blueprint('transferencia_externa', __name__, url_prefix='/transferencias/externa')
 
@@ -58,8 +59,8 @@ def registrar_transferencia_externa():
     retirado_por = data.get('retirado_por')
     tipo_servico_id = data.get('tipo_servico_id')
 
-    # <-- assinatura: captura
-    assinatura_base64 = data.get('assinatura')
+    # <-- assinatura: captura (guarda o PNG no repositório, fica o SHA-256)
+    assinatura_base64 = guardar_assinatura(data.get('assinatura'))
 
     if not tipo_servico_id:
         flash('Tipo de serviço inválido.', 'danger')
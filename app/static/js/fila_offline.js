@@ -0,0 +1,218 @@
+// Fila offline do Portal Técnico (IndexedDB).
+//
+// Usada pelo service worker (sw_tecnico.js, via importScripts) e pelas
+// páginas (portal_tecnico.js). Cada envio guarda os campos do formulário,
+// as fotos (Blob) e a chave de idempotência (chave_envio); a sincronização
+// manda a fila em lotes para /tecnico-mobile/api/envios, que devolve o
+// resultado por chave. Reenviar a mesma chave nunca duplica o registro.
+
+(function (global) {
+  "use strict";
+
+  const BANCO = "logistock-tecnico";
+  const VERSAO_BANCO = 1;
+  const FILA = "fila";
+  const RECUSADOS = "recusados";
+
+  const URL_ENVIOS = "/tecnico-mobile/api/envios";
+  const ENVIOS_POR_LOTE = 10;
+
+  let sincronizando = null;
+
+  function abrirBanco() {
+    return new Promise(function (resolve, reject) {
+      const pedido = indexedDB.open(BANCO, VERSAO_BANCO);
+
+      pedido.onupgradeneeded = function () {
+        const banco = pedido.result;
+
+        if (!banco.objectStoreNames.contains(FILA)) {
+          banco.createObjectStore(FILA, { keyPath: "chave" });
+        }
+        if (!banco.objectStoreNames.contains(RECUSADOS)) {
+          banco.createObjectStore(RECUSADOS, { keyPath: "chave" });
+        }
+      };
+
+      pedido.onsuccess = function () { resolve(pedido.result); };
+      pedido.onerror = function () { reject(pedido.error); };
+    });
+  }
+
+  function transacao(loja, modo, operacao) {
+    return abrirBanco().then(function (banco) {
+      return new Promise(function (resolve, reject) {
+        const tx = banco.transaction(loja, modo);
+        const pedido = operacao(tx.objectStore(loja));
+
+        tx.oncomplete = function () {
+          banco.close();
+          resolve(pedido ? pedido.result : undefined);
+        };
+        tx.onerror = function () {
+          banco.close();
+          reject(tx.error);
+        };
+      });
+    });
+  }
+
+  function listar(loja) {
+    return transacao(loja, "readonly", function (store) { return store.getAll(); });
+  }
+
+  function gravar(loja, registro) {
+    return transacao(loja, "readwrite", function (store) { return store.put(registro); });
+  }
+
+  function remover(loja, chave) {
+    return transacao(loja, "readwrite", function (store) { return store.delete(chave); });
+  }
+
+  function novaChave() {
+    if (global.crypto && global.crypto.randomUUID) {
+      return global.crypto.randomUUID();
+    }
+
+    return "xxxxxxxx-xxxx-4xxx-yxxx-xxxxxxxxxxxx".replace(/[xy]/g, function (c) {
+      const r = Math.random() * 16 | 0;
+      return (c === "x" ? r : (r & 0x3 | 0x8)).toString(16);
+    });
+  }
+
+  // FormData do formulário -> envio guardado na fila.
+  function enfileirarFormData(tipo, dados) {
+    const campos = {};
+    const arquivos = [];
+
+    dados.forEach(function (valor, nome) {
+      if (typeof valor === "string") {
+        (campos[nome] = campos[nome] || []).push(valor);
+      } else if (valor && valor.size) {
+        arquivos.push({ nome: nome, arquivo: valor, nomeArquivo: valor.name || "foto.jpg" });
+      }
+    });
+
+    const envio = {
+      chave: (campos.chave_envio && campos.chave_envio[0]) || novaChave(),
+      tipo: tipo,
+      campos: campos,
+      arquivos: arquivos,
+      criado_em: new Date().toISOString()
+    };
+
+    return gravar(FILA, envio).then(function () { return envio; });
+  }
+
+  function enviarLote(lote) {
+    const corpo = new FormData();
+    const manifesto = lote.map(function (envio, i) {
+      const referencias = {};
+
+      envio.arquivos.forEach(function (anexo, j) {
+        const ref = "arquivo_" + i + "_" + j;
+        corpo.append(ref, anexo.arquivo, anexo.nomeArquivo);
+        (referencias[anexo.nome] = referencias[anexo.nome] || []).push(ref);
+      });
+
+      return {
+        chave: envio.chave,
+        tipo: envio.tipo,
+        campos: envio.campos,
+        arquivos: referencias,
+        criado_em: envio.criado_em
+      };
+    });
+
+    corpo.append("envios", JSON.stringify(manifesto));
+
+    return fetch(URL_ENVIOS, {
+      method: "POST",
+      body: corpo,
+      credentials: "same-origin",
+      headers: { "Accept": "application/json" }
+    }).then(function (resposta) {
+      const tipo = resposta.headers.get("Content-Type") || "";
+
+      // Sessão expirada: o login_required redireciona para a tela de login.
+      if (!resposta.ok || resposta.redirected || tipo.indexOf("application/json") === -1) {
+        throw new Error("sem_sessao");
+      }
+
+      return resposta.json();
+    });
+  }
+
+  function tratarResultados(lote, resultados) {
+    const envios = {};
+    lote.forEach(function (envio) { envios[envio.chave] = envio; });
+
+    return resultados.reduce(function (anterior, resultado) {
+      return anterior.then(function () {
+        const envio = envios[resultado.chave];
+
+        if (!envio || resultado.status === "erro") {
+          return null;
+        }
+
+        if (resultado.status === "recusado") {
+          return gravar(RECUSADOS, {
+            chave: envio.chave,
+            tipo: envio.tipo,
+            mensagem: resultado.mensagem || "Envio recusado.",
+            criado_em: envio.criado_em
+          }).then(function () { return remover(FILA, envio.chave); });
+        }
+
+        // criado | duplicado
+        return remover(FILA, envio.chave);
+      });
+    }, Promise.resolve());
+  }
+
+  // Envia a fila inteira; devolve {pendentes, recusados}. Chamadas
+  // simultâneas no mesmo contexto compartilham a mesma sincronização.
+  function sincronizar() {
+    if (sincronizando) {
+      return sincronizando;
+    }
+
+    sincronizando = listar(FILA)
+      .then(function (envios) {
+        let cadeia = Promise.resolve();
+
+        for (let inicio = 0; inicio < envios.length; inicio += ENVIOS_POR_LOTE) {
+          const lote = envios.slice(inicio, inicio + ENVIOS_POR_LOTE);
+
+          cadeia = cadeia.then(function () {
+            return enviarLote(lote).then(function (dados) {
+              return tratarResultados(lote, dados.resultados || []);
+            });
+          });
+        }
+
+        return cadeia;
+      })
+      .catch(function () {
+        // Sem rede ou sem sessão: a fila fica para a próxima tentativa.
+      })
+      .then(situacao)
+      .finally(function () { sincronizando = null; });
+
+    return sincronizando;
+  }
+
+  function situacao() {
+    return Promise.all([listar(FILA), listar(RECUSADOS)]).then(function (listas) {
+      return { pendentes: listas[0], recusados: listas[1] };
+    });
+  }
+
+  global.FilaOffline = {
+    novaChave: novaChave,
+    enfileirarFormData: enfileirarFormData,
+    sincronizar: sincronizar,
+    situacao: situacao,
+    dispensarRecusado: function (chave) { return remover(RECUSADOS, chave); }
+  };
+})(self);
@@ -0,0 +1,119 @@
+// Portal Técnico: registro do service worker, chave de envio dos
+// formulários e situação da fila offline na tela inicial.
+
+(function () {
+  "use strict";
+
+  const FORMULARIOS = ["formBaixa", "formRequisicao"];
+
+  // Usuário da sessão: o service worker refaz o cache quando ele muda.
+  const USUARIO = (document.currentScript && document.currentScript.dataset.usuario) || "";
+
+  // Cada abertura do formulário ganha uma chave; o servidor grava o envio
+  // uma vez só, mesmo que a fila ou um clique duplo o mande de novo.
+  function incluirChaveEnvio() {
+    FORMULARIOS.forEach(function (id) {
+      const form = document.getElementById(id);
+
+      if (!form || form.querySelector("input[name='chave_envio']")) {
+        return;
+      }
+
+      const campo = document.createElement("input");
+      campo.type = "hidden";
+      campo.name = "chave_envio";
+      campo.value = FilaOffline.novaChave();
+      form.appendChild(campo);
+    });
+  }
+
+  function mostrarFila(situacao) {
+    const painel = document.getElementById("filaOffline");
+
+    if (!painel || !situacao) {
+      return;
+    }
+
+    const pendentes = situacao.pendentes.length;
+    let html = "";
+
+    if (pendentes) {
+      html +=
+        "<div class='alert alert-warning shadow-sm mb-3 text-center'>" +
+        "<i class='bi bi-cloud-arrow-up me-1'></i>" +
+        pendentes + (pendentes === 1 ? " envio aguardando" : " envios aguardando") +
+        " conexão para ser enviado.</div>";
+    }
+
+    situacao.recusados.forEach(function (envio) {
+      const tipo = envio.tipo === "baixa" ? "Baixa" : "Requisição";
+      const data = new Date(envio.criado_em).toLocaleString("pt-BR");
+
+      html +=
+        "<div class='alert alert-danger alert-dismissible shadow-sm mb-3' role='alert'>" +
+        "<strong>" + tipo + " de " + data + " não foi aceita:</strong> " +
+        "<span></span>" +
+        "<button type='button' class='btn-close' data-chave='" + envio.chave + "' " +
+        "aria-label='Fechar'></button></div>";
+    });
+
+    painel.innerHTML = html;
+
+    // Mensagem do servidor entra como texto, não como HTML.
+    painel.querySelectorAll(".alert-danger span").forEach(function (span, i) {
+      span.textContent = situacao.recusados[i].mensagem;
+    });
+
+    painel.querySelectorAll("[data-chave]").forEach(function (botao) {
+      botao.addEventListener("click", function () {
+        FilaOffline.dispensarRecusado(botao.dataset.chave)
+          .then(FilaOffline.situacao)
+          .then(mostrarFila);
+      });
+    });
+  }
+
+  function sincronizar() {
+    if (!navigator.onLine) {
+      return FilaOffline.situacao().then(mostrarFila);
+    }
+
+    return FilaOffline.sincronizar().then(mostrarFila);
+  }
+
+  document.addEventListener("DOMContentLoaded", function () {
+    incluirChaveEnvio();
+
+    if (!("serviceWorker" in navigator) || !window.indexedDB) {
+      return;
+    }
+
+    navigator.serviceWorker
+      .register("/tecnico-mobile/sw.js", { scope: "/" })
+      .then(function () { return navigator.serviceWorker.ready; })
+      .then(function (registro) {
+        // Página aberta com sessão válida: o service worker decide se o
+        // cache de uso offline precisa ser atualizado.
+        if (navigator.onLine && registro.active) {
+          registro.active.postMessage({ acao: "aquecer", usuario: USUARIO });
+        }
+      })
+      .catch(function (erro) {
+        console.warn("Service worker do portal não registrado:", erro);
+      });
+
+    if (!document.getElementById("filaOffline")) {
+      return;
+    }
+
+    sincronizar();
+
+    window.addEventListener("online", sincronizar);
+
+    navigator.serviceWorker.addEventListener("message", function (evento) {
+      if (evento.data && evento.data.acao === "fila") {
+        FilaOffline.situacao().then(mostrarFila);
+      }
+    });
+  });
+})();
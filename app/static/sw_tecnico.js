@@ -0,0 +1,398 @@
+// Service worker do Portal Técnico.
+//
+// Servido por /tecnico-mobile/sw.js com escopo "/" (os formulários de
+// baixa e requisição ficam fora de /tecnico-mobile). Páginas e dados do
+// técnico: rede primeiro, cache quando não há sinal. Sem rede, a baixa e
+// a requisição vão para a fila (static/js/fila_offline.js) e são enviadas
+// por /tecnico-mobile/api/envios quando a conexão volta.
+
+importScripts("/static/js/fila_offline.js");
+
+const CACHE = "tecnico-logistock-v1";
+const TAG_SINCRONIZAR = "envios-tecnico";
+
+const PAGINAS = [
+  "/tecnico-mobile/home",
+  "/baixa_tecnico/mobile",
+  "/requisicao_mobile/nova"
+];
+
+const URL_PACOTE = "/tecnico-mobile/api/pacote-offline";
+const URL_CATALOGO = "/api/itens/catalogo";
+
+// Entrada do cache (não existe no servidor) com o usuário e a hora do
+// último aquecimento.
+const URL_AQUECIDO = "/tecnico-mobile/sw-aquecido";
+
+// Páginas e dados do técnico são baixados de novo no máximo uma vez neste
+// intervalo (ou quando outro usuário entra); nas visitas seguintes as
+// páginas já se atualizam pelo próprio acesso (rede primeiro).
+const AQUECER_A_CADA = 30 * 60 * 1000;
+
+// Arquivos das páginas offline, pelo nome em static/. A rota
+// /tecnico-mobile/sw.js define self.ESTATICOS (nome -> URLs geradas por
+// flask gerar-estaticos, com a versão WebP das imagens); sem o build, vai
+// o original.
+const ESTATICOS_OFFLINE = [
+  "manifest.json",
+  "js/fila_offline.js",
+  "js/portal_tecnico.js",
+  "img/icon-192.png",
+  "img/start_logo.png"
+];
+
+const ARQUIVOS = ESTATICOS_OFFLINE.reduce(function (urls, nome) {
+  return urls.concat((self.ESTATICOS || {})[nome] || ["/static/" + nome]);
+}, []);
+
+const CDN = [
+  "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+  "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js",
+  "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css",
+  "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+  "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.11.3/font/bootstrap-icons.min.css"
+];
+
+// POST dos formulários -> tipo do envio na fila.
+const FORMULARIOS = {
+  "/baixa_tecnico/registrar": "baixa",
+  "/requisicao_mobile/nova": "requisicao"
+};
+
+
+// ==========================================================
+// CACHE
+// ==========================================================
+
+function guardar(requisicao, resposta) {
+  // Redirecionamento (sessão expirada -> login) não substitui a cópia boa.
+  if (!resposta || resposta.redirected || (!resposta.ok && resposta.type !== "opaque")) {
+    return Promise.resolve(resposta);
+  }
+
+  const copia = resposta.clone();
+
+  return caches.open(CACHE)
+    .then(function (cache) { return cache.put(requisicao, copia); })
+    .then(function () { return resposta; });
+}
+
+function baixar(url, opcoes) {
+  return fetch(url, Object.assign({ credentials: "same-origin" }, opcoes))
+    .then(function (resposta) { return guardar(url, resposta); })
+    .catch(function () { return null; });
+}
+
+// Arquivos estáticos e da CDN que ainda não estão no cache. As URLs
+// mudam quando o conteúdo muda; as que não mudam se atualizam no uso.
+function baixarFaltantes() {
+  return caches.open(CACHE).then(function (cache) {
+    function seFaltar(url, opcoes) {
+      return cache.match(url).then(function (resposta) {
+        return resposta || baixar(url, opcoes);
+      });
+    }
+
+    return Promise.all(
+      ARQUIVOS.map(function (url) { return seFaltar(url); }).concat(CDN.map(function (url) {
+        return seFaltar(url, { mode: "no-cors", credentials: "omit" });
+      }))
+    );
+  });
+}
+
+function dadosRecentes(usuario) {
+  return doCache(URL_AQUECIDO)
+    .then(function (resposta) { return resposta ? resposta.json() : null; })
+    .then(function (ultimo) {
+      return Boolean(ultimo) && ultimo.usuario === usuario &&
+        Date.now() - ultimo.em < AQUECER_A_CADA;
+    })
+    .catch(function () { return false; });
+}
+
+// Páginas, pacote do técnico e catálogo. Chamado pela página depois do
+// login (postMessage "aquecer"): antes disso as páginas só devolveriam o
+// redirecionamento para o login.
+function aquecer(usuario) {
+  return Promise.all([
+    baixarFaltantes(),
+    dadosRecentes(usuario).then(function (recentes) {
+      if (recentes) {
+        return null;
+      }
+
+      return Promise.all(PAGINAS.concat([URL_CATALOGO]).map(function (url) {
+        return baixar(url);
+      }).concat(baixar(URL_PACOTE))).then(function (respostas) {
+        const pacote = respostas[respostas.length - 1];
+
+        // Sessão expirada ou sem rede: tenta de novo na próxima página.
+        if (!pacote || !pacote.ok || pacote.redirected) {
+          return null;
+        }
+
+        return caches.open(CACHE).then(function (cache) {
+          return cache.put(URL_AQUECIDO, json({ usuario: usuario, em: Date.now() }));
+        });
+      });
+    })
+  ]);
+}
+
+function doCache(requisicao) {
+  return caches.open(CACHE).then(function (cache) {
+    return cache.match(requisicao);
+  });
+}
+
+function redePrimeiro(requisicao, alternativa) {
+  return fetch(requisicao)
+    .then(function (resposta) {
+      if (requisicao.method === "GET" && requisicao.url.indexOf(self.location.origin) === 0) {
+        return guardar(requisicao, resposta);
+      }
+      return resposta;
+    })
+    .catch(function () {
+      return doCache(requisicao).then(function (resposta) {
+        return resposta || (alternativa ? alternativa() : Response.error());
+      });
+    });
+}
+
+function cachePrimeiro(requisicao) {
+  return doCache(requisicao).then(function (resposta) {
+    return resposta || fetch(requisicao).then(function (nova) {
+      return guardar(requisicao, nova);
+    });
+  });
+}
+
+
+// ==========================================================
+// RESPOSTAS SEM REDE (a partir do pacote do técnico)
+// ==========================================================
+
+function json(dados) {
+  return new Response(JSON.stringify(dados), {
+    headers: { "Content-Type": "application/json" }
+  });
+}
+
+function pacote() {
+  return doCache(URL_PACOTE).then(function (resposta) {
+    return resposta ? resposta.json() : null;
+  });
+}
+
+function paginaOffline(url) {
+  let caminho = url.pathname;
+
+  if (caminho.indexOf("/baixa_tecnico/mobile") === 0 || caminho === "/baixa_tecnico/formulario") {
+    caminho = "/baixa_tecnico/mobile";
+  }
+
+  return doCache(caminho).then(function (resposta) {
+    return resposta || doCache("/tecnico-mobile/home");
+  }).then(function (resposta) {
+    return resposta || new Response(
+      "<h3 style='font-family:sans-serif;padding:1rem'>Sem conexão. Abra o portal " +
+      "com sinal uma vez para usá-lo offline.</h3>",
+      { status: 503, headers: { "Content-Type": "text/html; charset=utf-8" } }
+    );
+  });
+}
+
+function itensBaixaOffline(url) {
+  const parametros = url.searchParams;
+  const tipoEstoque = (parametros.get("tipo_estoque") || "").toLowerCase();
+  const clienteId = parseInt(parametros.get("cliente_id"), 10) || null;
+  const ordemId = parseInt(parametros.get("ordem_servico_id"), 10) || null;
+
+  return pacote().then(function (dados) {
+    const tecnicoId = parseInt(parametros.get("tecnico_id"), 10);
+
+    if (!dados || dados.tecnico_id !== tecnicoId) {
+      return json({ itens: [], tipo_estoque: tipoEstoque });
+    }
+
+    const itens = dados.saldos.filter(function (linha) {
+      if (linha.tipo_estoque !== tipoEstoque) {
+        return false;
+      }
+      if (tipoEstoque === "cliente") {
+        return linha.cliente_id === clienteId && linha.ordem_servico_id === ordemId;
+      }
+      return linha.cliente_id === null && linha.ordem_servico_id === null;
+    }).map(function (linha) {
+      return {
+        item_id: linha.item_id,
+        codigo: linha.codigo,
+        descricao: linha.descricao,
+        unidade: linha.unidade,
+        saldo: linha.saldo,
+        valor: linha.valor
+      };
+    });
+
+    return json({ itens: itens, tipo_estoque: tipoEstoque });
+  });
+}
+
+function ordensOffline(url) {
+  const clienteId = parseInt(url.searchParams.get("cliente_id"), 10) || null;
+
+  return pacote().then(function (dados) {
+    return json({
+      ordens: dados ? dados.ordens.filter(function (os) { return os.cliente_id === clienteId; }) : []
+    });
+  });
+}
+
+function itensRequisicaoOffline(url) {
+  // /requisicao_mobile/api/itens/<tipo_servico>[/<tipo_estoque>]
+  const partes = url.pathname.split("/");
+  const tipoEstoque = partes.length > 5 ? partes[5] : "empresa";
+
+  return pacote().then(function (dados) {
+    return json({ itens: dados && tipoEstoque === "empresa" ? dados.requisicao : [] });
+  });
+}
+
+
+// ==========================================================
+// ENVIO DOS FORMULÁRIOS
+// ==========================================================
+
+function enviarFormulario(requisicao, tipo) {
+  const copia = requisicao.clone();
+
+  return fetch(requisicao).catch(function () {
+    return copia.formData()
+      .then(function (dados) { return FilaOffline.enfileirarFormData(tipo, dados); })
+      .then(function () {
+        if (self.registration.sync) {
+          return self.registration.sync.register(TAG_SINCRONIZAR).catch(function () {});
+        }
+      })
+      .then(function () {
+        return Response.redirect("/tecnico-mobile/home?offline=" + tipo, 303);
+      });
+  });
+}
+
+
+// ==========================================================
+// EVENTOS
+// ==========================================================
+
+self.addEventListener("install", function () {
+  self.skipWaiting();
+});
+
+// Versões geradas que saíram do build (o nome muda com o conteúdo).
+function limparVersoesAntigas() {
+  return caches.open(CACHE).then(function (cache) {
+    return cache.keys().then(function (requisicoes) {
+      return Promise.all(requisicoes.filter(function (requisicao) {
+        const caminho = new URL(requisicao.url).pathname;
+        return caminho.indexOf("/static/dist/") === 0 && ARQUIVOS.indexOf(caminho) === -1;
+      }).map(function (requisicao) { return cache.delete(requisicao); }));
+    });
+  });
+}
+
+self.addEventListener("activate", function (event) {
+  event.waitUntil(
+    caches.keys()
+      .then(function (nomes) {
+        return Promise.all(nomes.filter(function (nome) {
+          return nome.indexOf("tecnico-logistock-") === 0 && nome !== CACHE;
+        }).map(function (nome) { return caches.delete(nome); }));
+      })
+      .then(limparVersoesAntigas)
+      .then(function () { return self.clients.claim(); })
+  );
+});
+
+self.addEventListener("fetch", function (event) {
+  const requisicao = event.request;
+  const url = new URL(requisicao.url);
+
+  if (url.origin !== self.location.origin) {
+    if (url.hostname === "cdn.jsdelivr.net") {
+      event.respondWith(cachePrimeiro(requisicao));
+    }
+    return;
+  }
+
+  if (requisicao.method === "POST") {
+    if (FORMULARIOS[url.pathname]) {
+      event.respondWith(enviarFormulario(requisicao, FORMULARIOS[url.pathname]));
+    }
+    return;
+  }
+
+  if (requisicao.method !== "GET") {
+    return;
+  }
+
+  const caminho = url.pathname;
+
+  if (caminho === "/baixa_tecnico/api/itens") {
+    event.respondWith(fetch(requisicao).catch(function () { return itensBaixaOffline(url); }));
+  } else if (caminho === "/baixa_tecnico/api/os-por-cliente") {
+    event.respondWith(fetch(requisicao).catch(function () { return ordensOffline(url); }));
+  } else if (caminho.indexOf("/requisicao_mobile/api/itens/") === 0) {
+    event.respondWith(fetch(requisicao).catch(function () { return itensRequisicaoOffline(url); }));
+  } else if (caminho === URL_PACOTE || caminho === URL_CATALOGO) {
+    event.respondWith(redePrimeiro(requisicao));
+  } else if (requisicao.mode === "navigate" && (
+    caminho.indexOf("/tecnico-mobile/") === 0 ||
+    caminho.indexOf("/baixa_tecnico/mobile") === 0 ||
+    caminho === "/baixa_tecnico/formulario" ||
+    caminho === "/requisicao_mobile/nova"
+  )) {
+    event.respondWith(
+      fetch(requisicao)
+        .then(function (resposta) {
+          return PAGINAS.indexOf(caminho) !== -1 ? guardar(caminho, resposta) : resposta;
+        })
+        .catch(function () { return paginaOffline(url); })
+    );
+  } else if (caminho.indexOf("/static/dist/") === 0) {
+    // Versão gerada nunca muda: o cache basta.
+    event.respondWith(cachePrimeiro(requisicao));
+  } else if (caminho.indexOf("/static/") === 0) {
+    event.respondWith(redePrimeiro(requisicao));
+  }
+});
+
+self.addEventListener("sync", function (event) {
+  if (event.tag === TAG_SINCRONIZAR) {
+    event.waitUntil(FilaOffline.sincronizar().then(avisarPaginas));
+  }
+});
+
+self.addEventListener("message", function (event) {
+  const acao = event.data && event.data.acao;
+
+  if (acao === "aquecer") {
+    event.waitUntil(aquecer(String(event.data.usuario || "")));
+  } else if (acao === "sincronizar") {
+    event.waitUntil(FilaOffline.sincronizar().then(avisarPaginas));
+  }
+});
+
+function avisarPaginas(situacao) {
+  return self.clients.matchAll({ type: "window" }).then(function (janelas) {
+    janelas.forEach(function (janela) {
+      janela.postMessage({
+        acao: "fila",
+        pendentes: situacao.pendentes.length,
+        recusados: situacao.recusados.length
+      });
+    });
+  });
+}
@@ -0,0 +1,325 @@
+# app/utils/assinaturas.py
+#
+# Repositório de assinaturas endereçado por conteúdo.
+#
+# O PNG capturado no canvas ("data:image/png;base64,...") é gravado uma
+# única vez em disco, em <pasta>/<2 primeiros>/<sha256>.png, e as colunas
+# de assinatura guardam só o SHA-256 (64 caracteres). Assinaturas iguais
+# ocupam um arquivo só. Registros antigos que ainda tenham o base64 inline
+# continuam legíveis: `ler_assinatura` e `url_assinatura` aceitam os dois.
+
+import base64
+import binascii
+import hashlib
+import os
+import re
+import tempfile
+
+from flask import current_app, url_for
+from sqlalchemy import and_, func, inspect, select, update
+
+from app.extensions import db
+from app.models import (
+    HistoricoEquipamento,
+    KitInicial,
+    MovimentacaoEstoque,
+    RequisicaoTecnico,
+    TransferenciaExterna,
+    VistoriaVeiculo,
+)
+
+
+TAMANHO_CHAVE = 64
+TAMANHO_LOTE = 200
+
+_CHAVE = re.compile(r"^[0-9a-f]{64}$")
+
+# (tabela, coluna) que guardam assinatura.
+COLUNAS_ASSINATURA = (
+    (RequisicaoTecnico.__table__, "assinatura_base64"),
+    (TransferenciaExterna.__table__, "assinatura_base64"),
+    (KitInicial.__table__, "assinatura_base64"),
+    (MovimentacaoEstoque.__table__, "assinatura"),
+    (HistoricoEquipamento.__table__, "assinatura_tecnico"),
+    (HistoricoEquipamento.__table__, "assinatura_logistica"),
+    (VistoriaVeiculo.__table__, "assinatura_tecnico"),
+    (VistoriaVeiculo.__table__, "assinatura_responsavel"),
+)
+
+
+def eh_chave(valor):
+    return bool(valor) and bool(_CHAVE.match(valor))
+
+
+def pasta_assinaturas():
+    """
+    ASSINATURAS_DIR ou, por padrão, "assinaturas" ao lado do banco SQLite
+    (no Render, o disco persistente); sem SQLite, a pasta instance.
+    """
+    pasta = current_app.config.get("ASSINATURAS_DIR")
+
+    if not pasta:
+        banco = db.engine.url
+
+        if banco.get_backend_name() == "sqlite" and banco.database not in (None, "", ":memory:"):
+            pasta = os.path.join(os.path.dirname(os.path.abspath(banco.database)), "assinaturas")
+        else:
+            pasta = os.path.join(current_app.instance_path, "assinaturas")
+
+    return pasta
+
+
+def caminho_assinatura(chave):
+    return os.path.join(pasta_assinaturas(), chave[:2], f"{chave}.png")
+
+
+def decodificar_assinatura(valor):
+    """Bytes do PNG a partir de data URL ou base64 puro; None se inválido."""
+    if not valor:
+        return None
+
+    if "," in valor:
+        valor = valor.split(",", 1)[1]
+
+    try:
+        return base64.b64decode(valor, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def guardar_bytes(conteudo):
+    """Grava o PNG (se ainda não existir) e devolve o SHA-256."""
+    chave = hashlib.sha256(conteudo).hexdigest()
+    caminho = caminho_assinatura(chave)
+
+    if os.path.exists(caminho):
+        return chave
+
+    pasta = os.path.dirname(caminho)
+    os.makedirs(pasta, exist_ok=True)
+
+    # Grava em arquivo temporário e renomeia: leitores nunca veem um PNG
+    # pela metade, e duas gravações da mesma assinatura não se atrapalham.
+    descritor, temporario = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+
+    try:
+        with os.fdopen(descritor, "wb") as arquivo:
+            arquivo.write(conteudo)
+
+        os.replace(temporario, caminho)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+    return chave
+
+
+def guardar_assinatura(valor):
+    """
+    Recebe o valor enviado pelo formulário (data URL/base64) e devolve a
+    chave a gravar na coluna. Chave já existente passa direto; vazio ou
+    base64 inválido devolvem None.
+    """
+    if not valor:
+        return None
+
+    valor = valor.strip()
+
+    if eh_chave(valor):
+        return valor
+
+    conteudo = decodificar_assinatura(valor)
+
+    if not conteudo:
+        return None
+
+    return guardar_bytes(conteudo)
+
+
+def ler_assinatura(valor):
+    """Bytes do PNG para chave do repositório ou base64 legado; None se não houver."""
+    if not valor:
+        return None
+
+    if not eh_chave(valor):
+        return decodificar_assinatura(valor)
+
+    try:
+        with open(caminho_assinatura(valor), "rb") as arquivo:
+            return arquivo.read()
+    except FileNotFoundError:
+        current_app.logger.warning("Assinatura %s não encontrada no repositório.", valor)
+        return None
+
+
+def url_assinatura(valor):
+    """src da <img>: rota do repositório para chave; data URL legado como veio."""
+    if not valor:
+        return ""
+
+    if eh_chave(valor):
+        return url_for("assinaturas.ver", chave=valor)
+
+    if valor.startswith("data:"):
+        return valor
+
+    return f"data:image/png;base64,{valor}"
+
+
+# ------------------------
+# Migração dos dados inline
+# ------------------------
+def _colunas_existentes(conexao):
+    inspetor = inspect(conexao)
+    existentes = []
+
+    for tabela, coluna in COLUNAS_ASSINATURA:
+        if not inspetor.has_table(tabela.name):
+            continue
+
+        if coluna in {c["name"] for c in inspetor.get_columns(tabela.name)}:
+            existentes.append((tabela, coluna))
+
+    return existentes
+
+
+def _inline(coluna):
+    # Chave tem exatamente 64 caracteres; qualquer outro valor preenchido
+    # é base64/data URL gravado antes do repositório.
+    return and_(coluna != "", func.length(coluna) != TAMANHO_CHAVE)
+
+
+def assinaturas_inline_pendentes(conexao):
+    """True se alguma coluna ainda guarda o PNG em base64."""
+    for tabela, coluna in _colunas_existentes(conexao):
+        pendente = conexao.execute(
+            select(tabela.c.id)
+            .where(_inline(tabela.c[coluna]))
+            .limit(1)
+        ).first()
+
+        if pendente:
+            return True
+
+    return False
+
+
+def _converter_coluna(conexao, tabela, coluna, converter, condicao):
+    ids = conexao.execute(
+        select(tabela.c.id).where(condicao).order_by(tabela.c.id)
+    ).scalars().all()
+
+    convertidas = 0
+    invalidas = 0
+
+    for inicio in range(0, len(ids), TAMANHO_LOTE):
+        lote = ids[inicio:inicio + TAMANHO_LOTE]
+
+        linhas = conexao.execute(
+            select(tabela.c.id, tabela.c[coluna]).where(tabela.c.id.in_(lote))
+        ).all()
+
+        for registro_id, valor in linhas:
+            novo = converter(valor)
+
+            if novo is None:
+                invalidas += 1
+                continue
+
+            conexao.execute(
+                update(tabela)
+                .where(tabela.c.id == registro_id)
+                .values({coluna: novo})
+            )
+            convertidas += 1
+
+    return convertidas, invalidas
+
+
+def _importar_arquivo_estatico(caminho_relativo):
+    caminho = os.path.join(current_app.static_folder, caminho_relativo)
+
+    if not os.path.isfile(caminho):
+        return None
+
+    with open(caminho, "rb") as arquivo:
+        return guardar_bytes(arquivo.read())
+
+
+def migrar_assinaturas(conexao):
+    """
+    Move para o repositório as assinaturas ainda gravadas em base64 e
+    troca o valor da coluna pelo SHA-256. Requisições que só tinham o PNG
+    em static/ (assinatura_path) também entram. Retorna (convertidas,
+    inválidas); inválidas ficam como estão.
+    """
+    convertidas = 0
+    invalidas = 0
+
+    existentes = _colunas_existentes(conexao)
+
+    for tabela, coluna in existentes:
+        resultado = _converter_coluna(
+            conexao,
+            tabela,
+            coluna,
+            guardar_assinatura,
+            _inline(tabela.c[coluna]),
+        )
+        convertidas += resultado[0]
+        invalidas += resultado[1]
+
+    requisicoes = RequisicaoTecnico.__table__
+
+    if (requisicoes, "assinatura_base64") not in existentes:
+        return convertidas, invalidas
+
+    linhas = conexao.execute(
+        select(requisicoes.c.id, requisicoes.c.assinatura_path)
+        .where(
+            requisicoes.c.assinatura_path.isnot(None),
+            requisicoes.c.assinatura_path != "",
+            func.coalesce(requisicoes.c.assinatura_base64, "") == "",
+        )
+    ).all()
+
+    for registro_id, caminho in linhas:
+        chave = _importar_arquivo_estatico(caminho)
+
+        if chave is None:
+            invalidas += 1
+            continue
+
+        conexao.execute(
+            update(requisicoes)
+            .where(requisicoes.c.id == registro_id)
+            .values(assinatura_base64=chave)
+        )
+        convertidas += 1
+
+    return convertidas, invalidas
+
+
+def restaurar_assinaturas(conexao):
+    """Caminho inverso (downgrade): devolve o data URL para as colunas."""
+    restauradas = 0
+
+    def converter(valor):
+        conteudo = ler_assinatura(valor)
+
+        if conteudo is None:
+            return None
+
+        return "data:image/png;base64," + base64.b64encode(conteudo).decode("ascii")
+
+    for tabela, coluna in _colunas_existentes(conexao):
+        restauradas += _converter_coluna(
+            conexao,
+            tabela,
+            coluna,
+            converter,
+            func.length(tabela.c[coluna]) == TAMANHO_CHAVE,
+        )[0]
+
+    return restauradas
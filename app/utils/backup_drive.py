@@ -1,12 +1,42 @@
 import os
 from datetime import datetime
 
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 
+# Upload resumível em partes: uma parte que falha é reenviada sozinha, sem
+# recomeçar o arquivo.
+TAMANHO_PARTE = 8 * 1024 * 1024
+TENTATIVAS_POR_PARTE = 5
 
-def enviar_backup_google_drive(caminho_arquivo):
+
+def enviar_arquivo_drive(service, caminho_arquivo, metadata):
+
+    from googleapiclient.http import MediaFileUpload
+
+    media = MediaFileUpload(
+        caminho_arquivo,
+        mimetype="application/octet-stream",
+        chunksize=TAMANHO_PARTE,
+        resumable=True
+    )
+
+    requisicao = service.files().create(
+        body=metadata,
+        media_body=media,
+        fields="id, name"
+    )
+
+    resposta = None
+
+    while resposta is None:
+        _status, resposta = requisicao.next_chunk(num_retries=TENTATIVAS_POR_PARTE)
+
+    return resposta
+
+
+def enviar_backup_google_drive(caminho_arquivo, nome_backup=None):
+
+    from google.oauth2 import service_account
+    from googleapiclient.discovery import build
 
     credentials_file = os.getenv("GOOGLE_DRIVE_CREDENTIALS_FILE")
     folder_id = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
@@ -21,7 +51,7 @@ def enviar_backup_google_drive(caminho_arquivo):
         raise Exception(f"Arquivo de credenciais não encontrado: {credentials_file}")
 
     if not os.path.exists(caminho_arquivo):
-        raise Exception(f"Banco não encontrado: {caminho_arquivo}")
+        raise Exception(f"Arquivo de backup não encontrado: {caminho_arquivo}")
 
     credentials = service_account.Credentials.from_service_account_file(
         credentials_file,
@@ -34,7 +64,7 @@ def enviar_backup_google_drive(caminho_arquivo):
         credentials=credentials
     )
 
-    nome_backup = (
+    nome_backup = nome_backup or (
         f"logistock_backup_"
         f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
     )
@@ -44,15 +74,6 @@ def enviar_backup_google_drive(caminho_arquivo):
         "parents": [folder_id]
     }
 
-    media = MediaFileUpload(
-        caminho_arquivo,
-        mimetype="application/octet-stream"
-    )
-
-    arquivo = service.files().create(
-        body=metadata,
-        media_body=media,
-        fields="id"
-    ).execute()
+    arquivo = enviar_arquivo_drive(service, caminho_arquivo, metadata)
 
-    return arquivo.get("id")
\ No newline at end of file
+    return arquivo.get("id")
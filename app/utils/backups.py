@@ -0,0 +1,1062 @@
+# app/utils/backups.py
+#
+# Backups do banco.
+#
+# SQLite: o instantâneo sai pela API de backup online do SQLite, em passos
+# de BACKUP_PAGINAS_POR_PASSO páginas com uma pausa entre eles (os workers
+# continuam gravando), e é comprimido em gzip enquanto é lido, sem cópia
+# intermediária em memória. Entre dois backups completos, os incrementais
+# guardam só as páginas que mudaram desde o backup anterior da cadeia:
+#
+#   logistock_<data>_completo.db.gz        banco inteiro
+#   logistock_<data>_incremental.delta.gz  páginas alteradas
+#   <nome>.json                            manifesto (tipo, cadeia, sha256)
+#   <nome>.paginas                         hash de cada página (próximo delta)
+#
+# PostgreSQL: pg_dump no formato custom (já comprimido), sempre completo.
+#
+# As assinaturas ficam fora do banco (repositório endereçado por SHA-256,
+# app/utils/assinaturas.py): cada backup copia para <BACKUP_DIR>/assinaturas
+# os PNGs que ainda não estão lá. O repositório só cresce, então esse
+# espelho serve a qualquer backup e nunca passa pela retenção.
+#
+# Os arquivos ficam em BACKUP_DIR (padrão: "backups" ao lado do banco) e
+# podem ser enviados para o Google Drive (upload resumível) ou para outra
+# pasta (cópia que retoma de onde parou).
+#
+# Os manifestos formam o catálogo (flask listar-backups): sha256, tamanho,
+# linhas por tabela e o resultado da verificação, que reconstrói o banco
+# numa cópia temporária e roda PRAGMA integrity_check. A retenção
+# avô-pai-filho apaga o que não é o mais recente do dia, da semana ou do
+# mês (sem quebrar cadeias), e flask restaurar-backup troca o banco por
+# uma cópia verificada com um rename.
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.extensions import db
+from app.utils.assinaturas import COLUNAS_ASSINATURA, eh_chave, pasta_assinaturas
+
+
+PREFIXO = "logistock"
+EXTENSOES = {
+    "completo": ".db.gz",
+    "incremental": ".delta.gz",
+    "postgres": ".dump",
+}
+EXT_MANIFESTO = ".json"
+EXT_PAGINAS = ".paginas"
+
+PASTA_ASSINATURAS = "assinaturas"
+
+BLOCO = 1024 * 1024
+NIVEL_GZIP = 6
+
+MAGICA_DELTA = b"LOGISTOCK-DELTA-1\n"
+TAMANHO_HASH_PAGINA = 8
+_NUMERO_PAGINA = struct.Struct(">I")
+
+# Delta maior que esta fração do banco: sai um completo no lugar.
+FRACAO_MAXIMA_DELTA = 0.5
+
+# Trava de um backup anterior que morreu no meio é descartada depois disso.
+TRAVA_EXPIRA_EM = 6 * 3600
+
+
+class BackupCorrompido(ValueError):
+    """Arquivo de backup não confere com o manifesto."""
+
+
+# ==========================================================
+# LOCAIS
+# ==========================================================
+
+def _banco_sqlite():
+    banco = db.engine.url
+
+    if banco.get_backend_name() != "sqlite" or banco.database in (None, "", ":memory:"):
+        return None
+
+    return os.path.abspath(banco.database)
+
+
+def pasta_backups():
+    """
+    BACKUP_DIR ou, por padrão, "backups" ao lado do banco SQLite (no
+    Render, o disco persistente); sem SQLite, a pasta instance.
+    """
+    pasta = current_app.config.get("BACKUP_DIR")
+
+    if not pasta:
+        banco = _banco_sqlite()
+
+        if banco:
+            pasta = os.path.join(os.path.dirname(banco), "backups")
+        else:
+            pasta = os.path.join(current_app.instance_path, "backups")
+
+    return pasta
+
+
+def caminho_backup(manifesto, pasta=None):
+    return os.path.join(pasta or pasta_backups(), manifesto["arquivo"])
+
+
+def _caminho_manifesto(nome, pasta=None):
+    return os.path.join(pasta or pasta_backups(), nome + EXT_MANIFESTO)
+
+
+def _caminho_paginas(nome, pasta=None):
+    return os.path.join(pasta or pasta_backups(), nome + EXT_PAGINAS)
+
+
+@contextmanager
+def _trava(pasta):
+    caminho = os.path.join(pasta, ".backup.trava")
+
+    try:
+        if time.time() - os.path.getmtime(caminho) > TRAVA_EXPIRA_EM:
+            os.remove(caminho)
+    except OSError:
+        pass
+
+    try:
+        descritor = os.open(caminho, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        raise RuntimeError("Outro backup está em andamento.") from None
+
+    try:
+        os.write(descritor, str(os.getpid()).encode())
+        os.close(descritor)
+        yield
+    finally:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+# ==========================================================
+# MANIFESTOS
+# ==========================================================
+
+def _gravar_json(caminho, dados):
+    temporario = caminho + ".tmp"
+
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        json.dump(dados, arquivo, ensure_ascii=False, indent=2)
+        arquivo.write("\n")
+
+    os.replace(temporario, caminho)
+
+
+def ler_manifesto(nome, pasta=None):
+    with open(_caminho_manifesto(nome, pasta), encoding="utf-8") as arquivo:
+        return json.load(arquivo)
+
+
+def gravar_manifesto(manifesto, pasta=None):
+    _gravar_json(_caminho_manifesto(manifesto["nome"], pasta), manifesto)
+
+
+def listar_backups(pasta=None):
+    """Manifestos da pasta, do mais antigo para o mais novo."""
+    pasta = pasta or pasta_backups()
+    manifestos = []
+
+    try:
+        nomes = os.listdir(pasta)
+    except FileNotFoundError:
+        return []
+
+    for nome in nomes:
+        if not (nome.startswith(PREFIXO + "_") and nome.endswith(EXT_MANIFESTO)):
+            continue
+
+        try:
+            with open(os.path.join(pasta, nome), encoding="utf-8") as arquivo:
+                manifestos.append(json.load(arquivo))
+        except (OSError, ValueError):
+            continue
+
+    return sorted(manifestos, key=lambda m: (m["criado_em"], m["nome"]))
+
+
+def cadeia_backup(nome, pasta=None):
+    """[completo, incremental 1, ..., nome]: o que é preciso para restaurar."""
+    cadeia = []
+    atual = nome
+
+    while atual:
+        manifesto = ler_manifesto(atual, pasta)
+        cadeia.append(manifesto)
+        atual = manifesto.get("anterior")
+
+    cadeia.reverse()
+
+    if cadeia[0]["tipo"] not in ("completo", "postgres"):
+        raise BackupCorrompido(f"Cadeia de {nome} não começa num backup completo.")
+
+    return cadeia
+
+
+# ==========================================================
+# SQLITE
+# ==========================================================
+
+def copiar_sqlite(origem, destino, paginas_por_passo=None, pausa=None):
+    """
+    Cópia consistente de um banco SQLite em uso, pela API de backup
+    online, em passos com pausa: cada passo segura o banco só enquanto
+    copia aquelas páginas.
+    """
+    if paginas_por_passo is None:
+        paginas_por_passo = current_app.config.get("BACKUP_PAGINAS_POR_PASSO", 1024)
+
+    if pausa is None:
+        pausa = current_app.config.get("BACKUP_PAUSA_PASSO_MS", 20) / 1000
+
+    fonte = sqlite3.connect(origem)
+    copia = sqlite3.connect(destino)
+
+    try:
+        fonte.backup(copia, pages=paginas_por_passo, sleep=pausa)
+    finally:
+        copia.close()
+        fonte.close()
+
+
+def _tamanho_pagina(caminho):
+    conexao = sqlite3.connect(caminho)
+
+    try:
+        return conexao.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conexao.close()
+
+
+def _ler_paginas(caminho, tamanho_pagina):
+    with open(caminho, "rb") as arquivo:
+        while True:
+            pagina = arquivo.read(tamanho_pagina)
+
+            if not pagina:
+                return
+
+            yield pagina
+
+
+def _resumo(caminho, tamanho_pagina):
+    """(sha256 do arquivo, hash de cada página concatenados)."""
+    sha = hashlib.sha256()
+    hashes = bytearray()
+
+    for pagina in _ler_paginas(caminho, tamanho_pagina):
+        sha.update(pagina)
+        hashes += hashlib.blake2b(pagina, digest_size=TAMANHO_HASH_PAGINA).digest()
+
+    return sha.hexdigest(), bytes(hashes)
+
+
+def contar_linhas(caminho):
+    """Linhas por tabela de um arquivo SQLite."""
+    conexao = sqlite3.connect(caminho)
+
+    try:
+        tabelas = [
+            nome for (nome,) in conexao.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            )
+        ]
+
+        return {
+            tabela: conexao.execute(f'SELECT COUNT(*) FROM "{tabela}"').fetchone()[0]
+            for tabela in tabelas
+        }
+    finally:
+        conexao.close()
+
+
+def _paginas_alteradas(hashes, hashes_anteriores):
+    alteradas = []
+
+    for numero in range(len(hashes) // TAMANHO_HASH_PAGINA):
+        inicio = numero * TAMANHO_HASH_PAGINA
+        fim = inicio + TAMANHO_HASH_PAGINA
+
+        if hashes[inicio:fim] != hashes_anteriores[inicio:fim]:
+            alteradas.append(numero)
+
+    return alteradas
+
+
+def _sha256_arquivo(caminho):
+    sha = hashlib.sha256()
+
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(BLOCO), b""):
+            sha.update(bloco)
+
+    return sha.hexdigest()
+
+
+def _escrever_completo(instantaneo, destino):
+    with open(instantaneo, "rb") as entrada, gzip.open(destino, "wb", NIVEL_GZIP) as saida:
+        shutil.copyfileobj(entrada, saida, BLOCO)
+
+
+def _escrever_delta(instantaneo, destino, tamanho_pagina, total_paginas, alteradas):
+    cabecalho = json.dumps({"tamanho_pagina": tamanho_pagina, "paginas": total_paginas})
+
+    with open(instantaneo, "rb") as entrada, gzip.open(destino, "wb", NIVEL_GZIP) as saida:
+        saida.write(MAGICA_DELTA)
+        saida.write(cabecalho.encode() + b"\n")
+
+        for numero in alteradas:
+            entrada.seek(numero * tamanho_pagina)
+            saida.write(_NUMERO_PAGINA.pack(numero))
+            saida.write(entrada.read(tamanho_pagina))
+
+
+def _aplicar_delta(caminho_delta, arquivo_banco):
+    with gzip.open(caminho_delta, "rb") as entrada:
+        if entrada.readline() != MAGICA_DELTA:
+            raise BackupCorrompido(f"{os.path.basename(caminho_delta)} não é um delta.")
+
+        cabecalho = json.loads(entrada.readline())
+        tamanho_pagina = cabecalho["tamanho_pagina"]
+
+        while True:
+            numero = entrada.read(_NUMERO_PAGINA.size)
+
+            if not numero:
+                break
+
+            pagina = entrada.read(tamanho_pagina)
+
+            if len(numero) != _NUMERO_PAGINA.size or len(pagina) != tamanho_pagina:
+                raise BackupCorrompido(f"{os.path.basename(caminho_delta)} truncado.")
+
+            arquivo_banco.seek(_NUMERO_PAGINA.unpack(numero)[0] * tamanho_pagina)
+            arquivo_banco.write(pagina)
+
+    arquivo_banco.truncate(cabecalho["paginas"] * tamanho_pagina)
+
+
+def _anterior_para_incremental(tamanho_pagina):
+    """Último backup SQLite, se dá para encadear um incremental nele."""
+    backups = [m for m in listar_backups() if m["tipo"] in ("completo", "incremental")]
+
+    if not backups:
+        return None
+
+    anterior = backups[-1]
+    limite = current_app.config.get("BACKUP_INCREMENTAIS_POR_COMPLETO", 6)
+
+    if (
+        anterior.get("tamanho_pagina") != tamanho_pagina
+        or anterior.get("sequencia", 0) >= limite
+        or _status_verificacao(anterior) == "falhou"
+        or not os.path.exists(caminho_backup(anterior))
+        or not os.path.exists(_caminho_paginas(anterior["nome"]))
+    ):
+        return None
+
+    return anterior
+
+
+def _nome_livre(pasta, carimbo, tipo):
+    nome = f"{PREFIXO}_{carimbo}_{tipo}"
+    sufixo = 1
+
+    while os.path.exists(_caminho_manifesto(nome, pasta)):
+        sufixo += 1
+        nome = f"{PREFIXO}_{carimbo}_{sufixo}_{tipo}"
+
+    return nome
+
+
+def _backup_sqlite(banco, pasta, tipo):
+    inicio = time.perf_counter()
+    carimbo = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    with tempfile.TemporaryDirectory(dir=pasta, prefix=".instantaneo_") as temporaria:
+        instantaneo = os.path.join(temporaria, "banco.db")
+        copiar_sqlite(banco, instantaneo)
+
+        tamanho_pagina = _tamanho_pagina(instantaneo)
+        sha256, hashes = _resumo(instantaneo, tamanho_pagina)
+        total_paginas = len(hashes) // TAMANHO_HASH_PAGINA
+        linhas = contar_linhas(instantaneo)
+
+        anterior = _anterior_para_incremental(tamanho_pagina) if tipo != "completo" else None
+        alteradas = None
+
+        if anterior:
+            with open(_caminho_paginas(anterior["nome"]), "rb") as entrada:
+                alteradas = _paginas_alteradas(hashes, entrada.read())
+
+            if tipo == "auto" and len(alteradas) > total_paginas * FRACAO_MAXIMA_DELTA:
+                alteradas = None
+
+        if tipo == "incremental" and alteradas is None:
+            raise RuntimeError("Sem backup anterior compatível para um incremental.")
+
+        tipo_gerado = "incremental" if alteradas is not None else "completo"
+        nome = _nome_livre(pasta, carimbo, tipo_gerado)
+        arquivo = nome + EXTENSOES[tipo_gerado]
+        destino = os.path.join(pasta, arquivo)
+        parcial = destino + ".parcial"
+
+        if tipo_gerado == "completo":
+            _escrever_completo(instantaneo, parcial)
+        else:
+            _escrever_delta(instantaneo, parcial, tamanho_pagina, total_paginas, alteradas)
+
+        os.replace(parcial, destino)
+
+    with open(_caminho_paginas(nome, pasta), "wb") as saida:
+        saida.write(hashes)
+
+    manifesto = {
+        "nome": nome,
+        "tipo": tipo_gerado,
+        "banco": "sqlite",
+        "arquivo": arquivo,
+        "criado_em": datetime.now().isoformat(timespec="microseconds"),
+        "tamanho": os.path.getsize(destino),
+        "sha256_arquivo": _sha256_arquivo(destino),
+        "tamanho_banco": total_paginas * tamanho_pagina,
+        "sha256": sha256,
+        "tamanho_pagina": tamanho_pagina,
+        "paginas": total_paginas,
+        "paginas_gravadas": total_paginas if alteradas is None else len(alteradas),
+        "anterior": anterior["nome"] if alteradas is not None else None,
+        "sequencia": anterior.get("sequencia", 0) + 1 if alteradas is not None else 0,
+        "linhas": linhas,
+        "duracao_s": round(time.perf_counter() - inicio, 2),
+        "verificacao": None,
+        "enviado_para": [],
+    }
+    gravar_manifesto(manifesto, pasta)
+
+    return manifesto
+
+
+# ==========================================================
+# POSTGRESQL
+# ==========================================================
+
+def _backup_postgres(pasta):
+    inicio = time.perf_counter()
+    url = db.engine.url
+    nome = _nome_livre(pasta, datetime.now().strftime("%Y%m%d_%H%M%S"), "completo")
+    arquivo = nome + EXTENSOES["postgres"]
+    destino = os.path.join(pasta, arquivo)
+    parcial = destino + ".parcial"
+
+    # Senha pelo ambiente, não pela linha de comando (ps).
+    ambiente = dict(os.environ)
+
+    if url.password:
+        ambiente["PGPASSWORD"] = url.password
+
+    dsn = url.set(drivername="postgresql", password=None).render_as_string(hide_password=False)
+
+    try:
+        subprocess.run(
+            ["pg_dump", "--format=custom", "--compress=6", "--no-owner", "--file", parcial, dsn],
+            env=ambiente,
+            check=True,
+            capture_output=True,
+        )
+    except FileNotFoundError:
+        raise RuntimeError("pg_dump não encontrado no PATH.") from None
+    except subprocess.CalledProcessError as erro:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+        raise RuntimeError(f"pg_dump falhou: {erro.stderr.decode(errors='replace').strip()}") from None
+
+    os.replace(parcial, destino)
+
+    manifesto = {
+        "nome": nome,
+        "tipo": "postgres",
+        "banco": "postgresql",
+        "arquivo": arquivo,
+        "criado_em": datetime.now().isoformat(timespec="microseconds"),
+        "tamanho": os.path.getsize(destino),
+        "sha256_arquivo": _sha256_arquivo(destino),
+        "anterior": None,
+        "sequencia": 0,
+        "linhas": None,
+        "duracao_s": round(time.perf_counter() - inicio, 2),
+        "verificacao": None,
+        "enviado_para": [],
+    }
+    gravar_manifesto(manifesto, pasta)
+
+    return manifesto
+
+
+# ==========================================================
+# API
+# ==========================================================
+
+def gerar_backup(tipo="auto"):
+    """
+    Gera um backup e devolve o manifesto. tipo: "auto" (incremental
+    sobre o último, ou completo quando a cadeia chegou em
+    BACKUP_INCREMENTAIS_POR_COMPLETO ou o delta ficaria grande),
+    "completo" ou "incremental".
+    """
+    if tipo not in ("auto", "completo", "incremental"):
+        raise ValueError(f"Tipo de backup inválido: {tipo}")
+
+    pasta = pasta_backups()
+    os.makedirs(pasta, exist_ok=True)
+
+    with _trava(pasta):
+        if db.engine.url.get_backend_name() == "postgresql":
+            manifesto = _backup_postgres(pasta)
+        else:
+            banco = _banco_sqlite()
+
+            if not banco or not os.path.exists(banco):
+                raise RuntimeError(f"Banco SQLite não encontrado: {banco}")
+
+            manifesto = _backup_sqlite(banco, pasta, tipo)
+
+        # Depois do instantâneo: a assinatura é gravada antes do commit que
+        # a referencia, então tudo que o banco copiado cita já está no disco.
+        manifesto["assinaturas"] = espelhar_assinaturas(pasta)
+        gravar_manifesto(manifesto, pasta)
+
+        return manifesto
+
+
+def reconstruir_banco(nome, destino, pasta=None):
+    """
+    Monta em `destino` o banco SQLite do backup `nome` (completo + deltas
+    da cadeia) e confere o sha256 do resultado.
+    """
+    pasta = pasta or pasta_backups()
+    cadeia = cadeia_backup(nome, pasta)
+
+    if cadeia[-1]["banco"] != "sqlite":
+        raise ValueError("Só backups SQLite são reconstruídos; use pg_restore.")
+
+    parcial = destino + ".parcial"
+
+    try:
+        with open(parcial, "wb") as saida:
+            with gzip.open(caminho_backup(cadeia[0], pasta), "rb") as entrada:
+                shutil.copyfileobj(entrada, saida, BLOCO)
+
+        with open(parcial, "r+b") as arquivo_banco:
+            for manifesto in cadeia[1:]:
+                _aplicar_delta(caminho_backup(manifesto, pasta), arquivo_banco)
+
+        if _sha256_arquivo(parcial) != cadeia[-1]["sha256"]:
+            raise BackupCorrompido(f"Banco reconstruído de {nome} não confere com o manifesto.")
+
+        os.replace(parcial, destino)
+    finally:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+
+    return destino
+
+
+# ==========================================================
+# ASSINATURAS
+# ==========================================================
+
+def _pasta_espelho(pasta=None):
+    return os.path.join(pasta or pasta_backups(), PASTA_ASSINATURAS)
+
+
+def _pngs_assinatura(raiz):
+    """Caminhos relativos (<2 primeiros>/<sha256>.png) do repositório em raiz."""
+    try:
+        subpastas = sorted(os.listdir(raiz))
+    except FileNotFoundError:
+        return []
+
+    relativos = []
+
+    for subpasta in subpastas:
+        caminho = os.path.join(raiz, subpasta)
+
+        if len(subpasta) != 2 or not os.path.isdir(caminho):
+            continue
+
+        relativos.extend(
+            f"{subpasta}/{nome}"
+            for nome in sorted(os.listdir(caminho))
+            if nome.endswith(".png") and eh_chave(nome[:-4])
+        )
+
+    return relativos
+
+
+def _copiar_faltantes(origem, destino):
+    """Copia de origem os PNGs que destino ainda não tem. Devolve quantos."""
+    copiados = 0
+
+    for relativo in _pngs_assinatura(origem):
+        alvo = os.path.join(destino, *relativo.split("/"))
+
+        if os.path.exists(alvo):
+            continue
+
+        os.makedirs(os.path.dirname(alvo), exist_ok=True)
+        temporario = alvo + ".tmp"
+        shutil.copyfile(os.path.join(origem, *relativo.split("/")), temporario)
+        os.replace(temporario, alvo)
+        copiados += 1
+
+    return copiados
+
+
+def espelhar_assinaturas(pasta=None):
+    """Copia as assinaturas novas para o espelho da pasta de backups."""
+    espelho = _pasta_espelho(pasta)
+    novas = _copiar_faltantes(pasta_assinaturas(), espelho)
+
+    return {"novas": novas, "total": len(_pngs_assinatura(espelho))}
+
+
+def _chaves_referenciadas(caminho_banco):
+    conexao = sqlite3.connect(caminho_banco)
+    chaves = set()
+
+    try:
+        for tabela, coluna in COLUNAS_ASSINATURA:
+            try:
+                linhas = conexao.execute(
+                    f'SELECT DISTINCT "{coluna}" FROM "{tabela.name}" WHERE "{coluna}" IS NOT NULL'
+                )
+            except sqlite3.OperationalError:
+                # Backup anterior à tabela/coluna.
+                continue
+
+            chaves.update(valor for (valor,) in linhas if eh_chave(valor))
+    finally:
+        conexao.close()
+
+    return chaves
+
+
+def _assinaturas_sem_arquivo(caminho_banco, *repositorios):
+    """Chaves citadas no banco que não existem em nenhum dos repositórios."""
+    return sorted(
+        chave for chave in _chaves_referenciadas(caminho_banco)
+        if not any(
+            os.path.exists(os.path.join(raiz, chave[:2], f"{chave}.png"))
+            for raiz in repositorios
+        )
+    )
+
+
+def _enviar_assinaturas_drive(pasta, nome):
+    """
+    Sobe num .tar.gz as assinaturas do espelho que ainda não foram para o
+    Drive; as enviadas ficam listadas em <espelho>/.enviadas_drive.
+    """
+    import tarfile
+
+    from app.utils.backup_drive import enviar_backup_google_drive
+
+    espelho = _pasta_espelho(pasta)
+    registro = os.path.join(espelho, ".enviadas_drive")
+
+    try:
+        with open(registro, encoding="utf-8") as arquivo:
+            enviadas = set(arquivo.read().split())
+    except FileNotFoundError:
+        enviadas = set()
+
+    pendentes = [r for r in _pngs_assinatura(espelho) if r not in enviadas]
+
+    if not pendentes:
+        return 0
+
+    with tempfile.TemporaryDirectory(dir=pasta, prefix=".assinaturas_") as temporaria:
+        pacote = os.path.join(temporaria, f"{nome}_assinaturas.tar.gz")
+
+        with tarfile.open(pacote, "w:gz") as tar:
+            for relativo in pendentes:
+                tar.add(os.path.join(espelho, *relativo.split("/")), arcname=relativo)
+
+        enviar_backup_google_drive(pacote, os.path.basename(pacote))
+
+    with open(registro, "a", encoding="utf-8") as arquivo:
+        arquivo.write("\n".join(pendentes) + "\n")
+
+    return len(pendentes)
+
+
+# ==========================================================
+# ENVIO
+# ==========================================================
+
+def _enviar_para_pasta(origem, pasta_destino):
+    """
+    Copia em blocos para <pasta>/<nome>.parcial e renomeia no fim. Uma
+    cópia interrompida continua do tamanho que já tinha chegado.
+    """
+    os.makedirs(pasta_destino, exist_ok=True)
+    destino = os.path.join(pasta_destino, os.path.basename(origem))
+    parcial = destino + ".parcial"
+
+    tamanho = os.path.getsize(origem)
+    ja_copiado = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+
+    if ja_copiado > tamanho:
+        ja_copiado = 0
+
+    with open(origem, "rb") as entrada, open(parcial, "ab" if ja_copiado else "wb") as saida:
+        entrada.seek(ja_copiado)
+        shutil.copyfileobj(entrada, saida, BLOCO)
+        saida.flush()
+        os.fsync(saida.fileno())
+
+    os.replace(parcial, destino)
+
+    return destino
+
+
+def enviar_backup(manifesto, destino=None):
+    """
+    Envia o backup para `destino` ("drive" ou uma pasta; padrão
+    BACKUP_DESTINO), junto com os itens da cadeia e as assinaturas que
+    ainda não foram para lá: o destino sempre tem o necessário para
+    restaurar.
+    """
+    from app.utils.backup_drive import enviar_backup_google_drive
+
+    destino = destino or current_app.config.get("BACKUP_DESTINO")
+
+    if not destino:
+        raise RuntimeError("Destino do backup não configurado (BACKUP_DESTINO).")
+
+    pasta = pasta_backups()
+    cadeia = cadeia_backup(manifesto["nome"], pasta)
+    enviados = []
+
+    for item in cadeia:
+        if destino in item.get("enviado_para", []):
+            continue
+
+        arquivos = [caminho_backup(item, pasta), _caminho_manifesto(item["nome"], pasta)]
+
+        for arquivo in arquivos:
+            if destino == "drive":
+                enviar_backup_google_drive(arquivo, os.path.basename(arquivo))
+            else:
+                _enviar_para_pasta(arquivo, destino)
+
+        item.setdefault("enviado_para", []).append(destino)
+        gravar_manifesto(item, pasta)
+        enviados.append(item["nome"])
+
+    if destino == "drive":
+        assinaturas = _enviar_assinaturas_drive(pasta, manifesto["nome"])
+    else:
+        assinaturas = _copiar_faltantes(
+            _pasta_espelho(pasta), os.path.join(destino, PASTA_ASSINATURAS)
+        )
+
+    if assinaturas:
+        enviados.append(f"{assinaturas} assinatura(s)")
+
+    return enviados
+
+
+# ==========================================================
+# CATÁLOGO E VERIFICAÇÃO
+# ==========================================================
+
+def _status_verificacao(manifesto):
+    return (manifesto.get("verificacao") or {}).get("status")
+
+
+def _data_backup(manifesto):
+    return datetime.fromisoformat(manifesto["criado_em"])
+
+
+def _problemas_banco(caminho, manifesto):
+    """integrity_check e linhas por tabela contra o manifesto."""
+    conexao = sqlite3.connect(caminho)
+
+    try:
+        resultado = [linha[0] for linha in conexao.execute("PRAGMA integrity_check(20)")]
+    finally:
+        conexao.close()
+
+    if resultado != ["ok"]:
+        return resultado
+
+    esperadas = manifesto.get("linhas")
+
+    if esperadas is None:
+        return []
+
+    encontradas = contar_linhas(caminho)
+
+    return [
+        f"{tabela}: {esperadas.get(tabela)} linha(s) no manifesto, {encontradas.get(tabela)} no banco"
+        for tabela in sorted(set(esperadas) | set(encontradas))
+        if esperadas.get(tabela) != encontradas.get(tabela)
+    ]
+
+
+def verificar_backup(nome, pasta=None):
+    """
+    Reconstrói o backup numa cópia temporária, roda PRAGMA integrity_check,
+    confere as linhas por tabela e se toda assinatura citada está no
+    espelho. Grava o resultado no manifesto e o
+    devolve. PostgreSQL: só o sha256 do dump.
+    """
+    pasta = pasta or pasta_backups()
+    manifesto = ler_manifesto(nome, pasta)
+    inicio = time.perf_counter()
+
+    try:
+        if manifesto["banco"] != "sqlite":
+            iguais = _sha256_arquivo(caminho_backup(manifesto, pasta)) == manifesto["sha256_arquivo"]
+            problemas = [] if iguais else ["sha256 do dump não confere com o manifesto"]
+        else:
+            with tempfile.TemporaryDirectory(dir=pasta, prefix=".verificacao_") as temporaria:
+                copia = reconstruir_banco(nome, os.path.join(temporaria, "banco.db"), pasta)
+                problemas = _problemas_banco(copia, manifesto)
+                problemas += [
+                    f"assinatura {chave} sem arquivo em {PASTA_ASSINATURAS}/"
+                    for chave in _assinaturas_sem_arquivo(copia, _pasta_espelho(pasta))
+                ]
+    except (BackupCorrompido, OSError, EOFError, sqlite3.DatabaseError) as erro:
+        problemas = [str(erro)]
+
+    # Relido: o envio pode ter gravado o manifesto enquanto isso.
+    manifesto = ler_manifesto(nome, pasta)
+    manifesto["verificacao"] = {
+        "status": "falhou" if problemas else "ok",
+        "em": datetime.now().isoformat(timespec="seconds"),
+        "duracao_s": round(time.perf_counter() - inicio, 2),
+        "problemas": problemas,
+    }
+    gravar_manifesto(manifesto, pasta)
+
+    return manifesto
+
+
+def concluir_backup(nome):
+    """Depois de um backup novo: verificação e retenção."""
+    manifesto = verificar_backup(nome)
+
+    if _status_verificacao(manifesto) == "falhou":
+        current_app.logger.error(
+            "Backup %s falhou na verificação: %s", nome, "; ".join(manifesto["verificacao"]["problemas"])
+        )
+
+    aplicar_retencao()
+
+    return manifesto
+
+
+def concluir_em_segundo_plano(nome):
+    """concluir_backup numa thread: a requisição que gerou o backup não espera."""
+    app = current_app._get_current_object()
+
+    def tarefa():
+        with app.app_context():
+            try:
+                concluir_backup(nome)
+            except Exception:
+                app.logger.exception("Falha ao verificar o backup %s", nome)
+
+    thread = threading.Thread(target=tarefa, name="backup-verificacao", daemon=True)
+    thread.start()
+
+    return thread
+
+
+# ==========================================================
+# RETENÇÃO (avô-pai-filho)
+# ==========================================================
+
+def backups_retidos(manifestos, agora=None):
+    """
+    Nomes a manter: tudo das últimas BACKUP_RETER_HORAS, o mais recente
+    de cada um dos últimos BACKUP_RETER_DIARIOS dias, BACKUP_RETER_SEMANAIS
+    semanas e BACKUP_RETER_MENSAIS meses, o último backup (base do próximo
+    incremental) e os anteriores da cadeia de cada um deles.
+    """
+    config = current_app.config
+    agora = agora or datetime.now()
+    por_nome = {m["nome"]: m for m in manifestos}
+    manter = set()
+
+    if manifestos:
+        manter.add(manifestos[-1]["nome"])
+
+    recentes = agora - timedelta(hours=config.get("BACKUP_RETER_HORAS", 48))
+    manter.update(m["nome"] for m in manifestos if _data_backup(m) >= recentes)
+
+    # Backup reprovado na verificação não representa o dia/semana/mês.
+    validos = [m for m in manifestos if _status_verificacao(m) != "falhou"]
+
+    periodos = (
+        (lambda data: data.date(), config.get("BACKUP_RETER_DIARIOS", 7)),
+        (lambda data: tuple(data.isocalendar())[:2], config.get("BACKUP_RETER_SEMANAIS", 4)),
+        (lambda data: (data.year, data.month), config.get("BACKUP_RETER_MENSAIS", 12)),
+    )
+
+    for periodo, quantidade in periodos:
+        mais_recente = {}
+
+        for manifesto in validos:
+            mais_recente[periodo(_data_backup(manifesto))] = manifesto
+
+        for chave in sorted(mais_recente, reverse=True)[:quantidade]:
+            manter.add(mais_recente[chave]["nome"])
+
+    for nome in list(manter):
+        atual = por_nome.get(nome)
+
+        while atual and atual.get("anterior"):
+            manter.add(atual["anterior"])
+            atual = por_nome.get(atual["anterior"])
+
+    return manter
+
+
+def aplicar_retencao(simular=False, agora=None):
+    """Apaga (ou só lista, com simular) os backups fora da retenção."""
+    pasta = pasta_backups()
+
+    if not os.path.isdir(pasta):
+        return []
+
+    with _trava(pasta):
+        manifestos = listar_backups(pasta)
+        manter = backups_retidos(manifestos, agora)
+        apagar = [m for m in manifestos if m["nome"] not in manter]
+
+        if simular:
+            return apagar
+
+        for manifesto in apagar:
+            # Manifesto por último: se parar no meio, o item continua no
+            # catálogo e sai na próxima rodada.
+            for caminho in (
+                caminho_backup(manifesto, pasta),
+                _caminho_paginas(manifesto["nome"], pasta),
+                _caminho_manifesto(manifesto["nome"], pasta),
+            ):
+                try:
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    pass
+
+    return apagar
+
+
+# ==========================================================
+# RESTAURAÇÃO
+# ==========================================================
+
+def escolher_backup(ate=None):
+    """Backup SQLite mais recente criado até `ate` (padrão: agora), fora os reprovados."""
+    ate = ate or datetime.now()
+    candidatos = [
+        m for m in listar_backups()
+        if m["banco"] == "sqlite"
+        and _status_verificacao(m) != "falhou"
+        and _data_backup(m) <= ate
+    ]
+
+    return candidatos[-1] if candidatos else None
+
+
+def restaurar_backup(nome):
+    """
+    Troca o banco SQLite pelo backup `nome`. A cópia é reconstruída ao
+    lado do banco, verificada (integrity_check e linhas por tabela) e só
+    então entra no lugar com um rename; o banco atual fica salvo em
+    <banco>.antes_restauracao_<data>. As assinaturas do espelho que faltam
+    no repositório voltam para ele. Os workers precisam ser reiniciados
+    depois (conexões abertas seguem no arquivo antigo).
+    """
+    banco = _banco_sqlite()
+
+    if not banco:
+        raise RuntimeError("Restauração disponível só para SQLite; no PostgreSQL use pg_restore.")
+
+    pasta = pasta_backups()
+    manifesto = ler_manifesto(nome, pasta)
+    inicio = time.perf_counter()
+    carimbo = datetime.now().strftime("%Y%m%d_%H%M%S")
+    novo = os.path.join(os.path.dirname(banco), f".restauracao_{carimbo}.db")
+    anterior = None
+
+    with _trava(pasta):
+        try:
+            reconstruir_banco(nome, novo, pasta)
+            problemas = _problemas_banco(novo, manifesto)
+
+            if problemas:
+                raise BackupCorrompido(f"Backup {nome} reprovado: " + "; ".join(problemas))
+
+            espelho = _pasta_espelho(pasta)
+            sem_arquivo = _assinaturas_sem_arquivo(novo, espelho, pasta_assinaturas())
+
+            if sem_arquivo:
+                raise BackupCorrompido(
+                    f"Backup {nome} cita {len(sem_arquivo)} assinatura(s) sem arquivo "
+                    f"(ex.: {sem_arquivo[0]})"
+                )
+
+            if os.path.exists(banco):
+                anterior = f"{banco}.antes_restauracao_{carimbo}"
+                copiar_sqlite(banco, anterior)
+
+            db.session.remove()
+            db.engine.dispose()
+
+            os.replace(novo, banco)
+
+            # WAL/journal do banco antigo seriam aplicados sobre o novo.
+            for sufixo in ("-wal", "-shm", "-journal"):
+                try:
+                    os.remove(banco + sufixo)
+                except FileNotFoundError:
+                    pass
+        finally:
+            if os.path.exists(novo):
+                os.remove(novo)
+
+        assinaturas = _copiar_faltantes(espelho, pasta_assinaturas())
+
+    return {
+        "banco": banco,
+        "backup": nome,
+        "anterior": anterior,
+        "assinaturas": assinaturas,
+        "duracao_s": round(time.perf_counter() - inicio, 2),
+    }
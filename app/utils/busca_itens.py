@@ -0,0 +1,411 @@
+# app/utils/busca_itens.py
+#
+# Índice de busca de itens (código e descrição), sem acento.
+#
+# Código: trecho em qualquer posição ("001" acha CAB001), por LIKE na
+# coluna normalizada. Descrição: palavras por prefixo ("isol" acha
+# "isolante"), pelo índice de texto. As regras são as mesmas nos dois
+# bancos:
+#
+# SQLite: tabela virtual FTS5 (rowid = itens.id), ordenada por bm25.
+# PostgreSQL: tabela comum com tsvector ('simple') para as palavras e
+# índice trigram (pg_trgm) para o LIKE do código.
+# O texto entra já normalizado pelo Python (minúsculo, sem acento), então
+# nenhum dos dois bancos precisa da extensão unaccent.
+#
+# O índice acompanha a tabela itens por um listener de flush; sem o índice
+# (migração não aplicada, SQLite sem FTS5) as buscas voltam ao ilike.
+
+import re
+import unicodedata
+
+from sqlalchemy import bindparam, event, inspect, or_, select, text
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import Item
+
+
+TABELA = "itens_busca"
+
+# Tabelas internas do FTS5: nunca entram na limpeza operacional.
+TABELAS_INDICE = (
+    TABELA,
+    f"{TABELA}_data",
+    f"{TABELA}_idx",
+    f"{TABELA}_content",
+    f"{TABELA}_docsize",
+    f"{TABELA}_config",
+)
+
+CAMPOS = ("codigo", "descricao")
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 200
+
+# Código pesa mais que descrição no bm25.
+PESO_CODIGO = 10.0
+PESO_DESCRICAO = 1.0
+
+_PALAVRA = re.compile(r"\w+")
+
+# Existência do índice por banco (URL): evita inspecionar a cada flush.
+_disponivel = {}
+
+
+def normalizar(texto):
+    """Minúsculo, sem acento e com espaços simples: 'Cabo Elétrico' -> 'cabo eletrico'."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+def palavras(termo):
+    return _PALAVRA.findall(normalizar(termo))
+
+
+def _postgres(conexao):
+    return conexao.dialect.name == "postgresql"
+
+
+def indice_disponivel(conexao):
+    chave = str(conexao.engine.url)
+
+    if chave not in _disponivel:
+        _disponivel[chave] = inspect(conexao).has_table(TABELA)
+
+    return _disponivel[chave]
+
+
+# ==========================================================
+# CRIAÇÃO E CARGA
+# ==========================================================
+
+def criar_indice(conexao):
+    """Cria a tabela do índice (se faltar) e indexa todos os itens."""
+    if inspect(conexao).has_table(TABELA):
+        _disponivel[str(conexao.engine.url)] = True
+        return False
+
+    if _postgres(conexao):
+        conexao.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        conexao.execute(text(
+            f"CREATE TABLE {TABELA} ("
+            " item_id INTEGER PRIMARY KEY REFERENCES itens(id) ON DELETE CASCADE,"
+            " codigo TEXT NOT NULL,"
+            " descricao TEXT NOT NULL,"
+            " documento TSVECTOR NOT NULL)"
+        ))
+        conexao.execute(text(
+            f"CREATE INDEX ix_{TABELA}_documento ON {TABELA} USING GIN (documento)"
+        ))
+
+        for campo in CAMPOS:
+            conexao.execute(text(
+                f"CREATE INDEX ix_{TABELA}_{campo}_trgm "
+                f"ON {TABELA} USING GIN ({campo} gin_trgm_ops)"
+            ))
+    else:
+        conexao.execute(text(
+            f"CREATE VIRTUAL TABLE {TABELA} USING fts5("
+            "codigo, descricao, "
+            "tokenize = 'unicode61 remove_diacritics 2', "
+            "prefix = '2 3')"
+        ))
+
+    _disponivel[str(conexao.engine.url)] = True
+    indexar_itens(conexao)
+
+    return True
+
+
+def remover_indice(conexao):
+    conexao.execute(text(f"DROP TABLE IF EXISTS {TABELA}"))
+    _disponivel[str(conexao.engine.url)] = False
+
+
+def indexar_itens(conexao, ids=None):
+    """(Re)indexa os itens informados, ou todos quando ids é None."""
+    consulta = select(Item.id, Item.codigo, Item.descricao)
+
+    if ids is not None:
+        if not ids:
+            return 0
+
+        consulta = consulta.where(Item.id.in_(ids))
+
+    linhas = [
+        {
+            "id": item_id,
+            "codigo": normalizar(codigo),
+            "descricao": normalizar(descricao),
+        }
+        for item_id, codigo, descricao in conexao.execute(consulta)
+    ]
+
+    _remover(conexao, ids)
+
+    if not linhas:
+        return 0
+
+    if _postgres(conexao):
+        conexao.execute(
+            text(
+                f"INSERT INTO {TABELA} (item_id, codigo, descricao, documento) "
+                "VALUES (:id, :codigo, :descricao, "
+                "to_tsvector('simple', :codigo || ' ' || :descricao))"
+            ),
+            linhas,
+        )
+    else:
+        conexao.execute(
+            text(
+                f"INSERT INTO {TABELA} (rowid, codigo, descricao) "
+                "VALUES (:id, :codigo, :descricao)"
+            ),
+            linhas,
+        )
+
+    return len(linhas)
+
+
+def indexar_codigos(codigos):
+    """
+    Reindexa pelos códigos os itens gravados fora do unit of work
+    (bulk_insert_mappings/bulk_update_mappings não disparam o flush).
+    """
+    conexao = db.session.connection()
+
+    if not codigos or not indice_disponivel(conexao):
+        return 0
+
+    ids = conexao.execute(
+        select(Item.id).where(Item.codigo.in_(list(codigos)))
+    ).scalars().all()
+
+    return indexar_itens(conexao, ids)
+
+
+def _remover(conexao, ids):
+    coluna = "item_id" if _postgres(conexao) else "rowid"
+
+    if ids is None:
+        conexao.execute(text(f"DELETE FROM {TABELA}"))
+        return
+
+    if ids:
+        conexao.execute(
+            text(f"DELETE FROM {TABELA} WHERE {coluna} IN :ids")
+            .bindparams(bindparam("ids", expanding=True)),
+            {"ids": list(ids)},
+        )
+
+
+# ==========================================================
+# SINCRONIZAÇÃO
+# ==========================================================
+
+@event.listens_for(Session, "after_flush")
+def _sincronizar_indice(session, flush_context):
+    alterados = set()
+    excluidos = set()
+
+    for registro in session.new | session.dirty:
+        if isinstance(registro, Item) and registro.id:
+            estado = inspect(registro)
+
+            if registro in session.new or any(
+                estado.attrs[campo].history.has_changes() for campo in CAMPOS
+            ):
+                alterados.add(registro.id)
+
+    for registro in session.deleted:
+        if isinstance(registro, Item) and registro.id:
+            excluidos.add(registro.id)
+
+    if not (alterados or excluidos):
+        return
+
+    conexao = session.connection()
+
+    if not indice_disponivel(conexao):
+        return
+
+    if excluidos:
+        _remover(conexao, excluidos)
+
+    if alterados:
+        indexar_itens(conexao, alterados)
+
+
+# ==========================================================
+# CONSULTA
+# ==========================================================
+
+def _like(token):
+    token = token.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{token}%"
+
+
+def _ramo_codigo(tokens, coluna_id, parametros):
+    """Código contendo cada palavra, em qualquer posição ('001' acha CAB001)."""
+    condicoes = []
+
+    for indice, token in enumerate(tokens):
+        parametros[f"c{indice}"] = _like(token)
+        condicoes.append(f"codigo LIKE :c{indice} ESCAPE '\\'")
+
+    return (
+        f"SELECT {coluna_id} AS id, codigo, 0 AS relevancia FROM {TABELA} "
+        f"WHERE {' AND '.join(condicoes)}"
+    )
+
+
+def _ramo_palavras(conexao, tokens, campo, parametros):
+    """
+    Palavras por prefixo ('isol' acha 'isolante'), na descrição ou, sem
+    campo, em código e descrição. relevancia: menor é melhor.
+    """
+    if _postgres(conexao):
+        parametros["consulta"] = " & ".join(f"{token}:*" for token in tokens)
+        consulta = "to_tsquery('simple', :consulta)"
+        condicao = f"documento @@ {consulta}"
+
+        if campo:
+            # O GIN de documento filtra; o tsvector da coluna confere.
+            condicao += f" AND to_tsvector('simple', {campo}) @@ {consulta}"
+
+        return (
+            f"SELECT item_id AS id, codigo, -ts_rank(documento, {consulta}) AS relevancia "
+            f"FROM {TABELA} WHERE {condicao}"
+        )
+
+    if campo:
+        parametros["consulta"] = " AND ".join(f'{campo} : "{token}"*' for token in tokens)
+    else:
+        parametros["consulta"] = " ".join(f'"{token}"*' for token in tokens)
+
+    # bm25() não pode ir para a subconsulta (o SQLite a achata no GROUP
+    # BY); a coluna rank, configurada com os pesos, pode.
+    return (
+        f"SELECT rowid AS id, codigo, rank AS relevancia FROM {TABELA} "
+        f"WHERE {TABELA} MATCH :consulta "
+        f"AND rank MATCH 'bm25({PESO_CODIGO}, {PESO_DESCRICAO})'"
+    )
+
+
+def _select_ids(conexao, termo, campo, limite=None, ordenar=True):
+    """
+    SELECT dos ids que casam com todas as palavras, do mais relevante ao
+    menos. Mesmas regras nos dois bancos: código por trecho (LIKE na coluna
+    normalizada), descrição pelo índice de palavras; sem campo, os dois.
+    """
+    tokens = palavras(termo)
+    coluna_id = "item_id" if _postgres(conexao) else "rowid"
+    parametros = {}
+    ramos = []
+
+    if campo in (None, "codigo"):
+        ramos.append(_ramo_codigo(tokens, coluna_id, parametros))
+
+    if campo in (None, "descricao"):
+        ramos.append(_ramo_palavras(conexao, tokens, campo, parametros))
+
+    uniao = " UNION ALL ".join(ramos)
+
+    # Dentro de IN (...) a ordem não importa.
+    if not ordenar:
+        sql = f"SELECT id FROM ({uniao}) AS encontrados"
+    else:
+        # Código exato, depois código começando pelo termo, depois a
+        # relevância das palavras; quem só casou pelo trecho do código fica
+        # por último.
+        sql = (
+            f"SELECT id FROM ({uniao}) AS encontrados GROUP BY id, codigo "
+            "ORDER BY MAX(CASE WHEN codigo = :exato THEN 1 ELSE 0 END) DESC, "
+            "MAX(CASE WHEN codigo LIKE :inicio ESCAPE '\\' THEN 1 ELSE 0 END) DESC, "
+            "MIN(relevancia), codigo"
+        )
+        parametros["exato"] = normalizar(termo)
+        parametros["inicio"] = _like(normalizar(termo))[1:]
+
+    if limite:
+        sql += " LIMIT :limite"
+        parametros["limite"] = limite
+
+    return text(sql).bindparams(**parametros)
+
+
+def condicao_busca(termo, campo=None):
+    """
+    Filtro sobre Item.id para usar nas consultas existentes no lugar de
+    ilike('%termo%'). campo: "codigo", "descricao" ou None (os dois).
+    Termo só de pontuação ou banco sem o índice: volta ao ilike.
+    """
+    conexao = db.session.connection()
+
+    if not palavras(termo) or not indice_disponivel(conexao):
+        colunas = [getattr(Item, campo)] if campo else [Item.codigo, Item.descricao]
+        return or_(*[coluna.ilike(f"%{termo.strip()}%") for coluna in colunas])
+
+    ids = _select_ids(conexao, termo, campo, ordenar=False).columns(id=db.Integer).subquery()
+
+    return Item.id.in_(select(ids.c.id))
+
+
+def buscar_itens(termo, limite=LIMITE_PADRAO, campo=None):
+    """IDs dos itens em ordem de relevância (código exato primeiro)."""
+    tokens = palavras(termo)
+
+    if not tokens:
+        return []
+
+    limite = max(1, min(limite or LIMITE_PADRAO, LIMITE_MAXIMO))
+    conexao = db.session.connection()
+
+    if not indice_disponivel(conexao):
+        return [
+            item_id
+            for (item_id,) in db.session.query(Item.id)
+            .filter(condicao_busca(termo, campo))
+            .order_by(Item.descricao)
+            .limit(limite)
+        ]
+
+    return [
+        item_id
+        for (item_id,) in conexao.execute(_select_ids(conexao, termo, campo, limite))
+    ]
+
+
+def consultas_auditoria(conexao):
+    """
+    Consultas do índice de busca para o `flask auditar-indices`, no mesmo
+    formato de _consultas_criticas: (nome, índice esperado no plano, SQL).
+    No PostgreSQL confere o GIN do tsvector (palavras) e o pg_trgm (trecho
+    do código); no SQLite, só o MATCH do FTS5, porque o LIKE do código
+    percorre a tabela virtual inteira por natureza.
+    """
+    if not indice_disponivel(conexao):
+        return []
+
+    if _postgres(conexao):
+        return [
+            (
+                "busca_itens.descricao",
+                f"ix_{TABELA}_documento",
+                _select_ids(conexao, "cabo isol", "descricao", LIMITE_PADRAO),
+            ),
+            (
+                "busca_itens.codigo",
+                f"ix_{TABELA}_codigo_trgm",
+                _select_ids(conexao, "cab001", "codigo", LIMITE_PADRAO),
+            ),
+        ]
+
+    return [
+        (
+            "busca_itens.descricao",
+            "VIRTUAL TABLE INDEX",
+            _select_ids(conexao, "cabo isol", "descricao", LIMITE_PADRAO),
+        ),
+    ]
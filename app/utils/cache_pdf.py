@@ -0,0 +1,246 @@
+# app/utils/cache_pdf.py
+#
+# Cache em disco dos PDFs gerados (ReportLab e pdfkit).
+#
+# A chave é o SHA-256 de tudo o que o documento mostra: colunas do registro
+# e das linhas relacionadas, a versão do layout e a data do logo. Baixar de
+# novo o mesmo comprovante ou anexá-lo a outro e-mail custa uma leitura de
+# arquivo. Quando o registro muda a chave muda: o PDF anterior do mesmo
+# registro (mesma pasta <tipo>/<id>) é apagado ao gravar o novo. Acima de
+# PDF_CACHE_MAX_MB saem os arquivos usados há mais tempo (cada leitura
+# atualiza a data do arquivo); a varredura roda em segundo plano, depois
+# que o processo gravou uma fração do limite, e não a cada PDF novo.
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import inspect
+
+
+# Bytes gravados desde a última varredura que disparam a próxima: o cache
+# passa do limite em no máximo esta fração antes de ser podado.
+FRACAO_VARREDURA = 0.05
+
+_trava_varredura = threading.Lock()
+_gravados_desde_varredura = 0
+_varrendo = False
+
+
+def pasta_cache():
+    return (
+        current_app.config.get("PDF_CACHE_DIR")
+        or os.path.join(current_app.instance_path, "pdf_cache")
+    )
+
+
+def colunas_registro(registro, *ignorar):
+    """Valores das colunas de um objeto ORM (menos as ignoradas)."""
+    if registro is None:
+        return None
+
+    return {
+        coluna.key: getattr(registro, coluna.key)
+        for coluna in inspect(registro).mapper.column_attrs
+        if coluna.key not in ignorar
+    }
+
+
+def _serializavel(valor):
+    if isinstance(valor, dict):
+        return {str(chave): _serializavel(v) for chave, v in valor.items()}
+
+    if isinstance(valor, (list, tuple)):
+        return [_serializavel(v) for v in valor]
+
+    if isinstance(valor, (datetime, date, Decimal)):
+        return str(valor)
+
+    if hasattr(valor, "__mapper__"):
+        return _serializavel(colunas_registro(valor))
+
+    return valor
+
+
+def impressao_digital(*partes):
+    """SHA-256 do conteúdo; objetos ORM entram pelas suas colunas."""
+    conteudo = json.dumps(
+        _serializavel(partes),
+        sort_keys=True,
+        default=str,
+        separators=(",", ":"),
+    )
+
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def _data_logo():
+    # Trocar o logo precisa invalidar todos os documentos.
+    try:
+        return os.path.getmtime(
+            os.path.join(current_app.root_path, "static", "img", "start_logo.png")
+        )
+    except OSError:
+        return None
+
+
+def _gravar(caminho, conteudo):
+    pasta = os.path.dirname(caminho)
+    os.makedirs(pasta, exist_ok=True)
+
+    descritor, temporario = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+
+    try:
+        with os.fdopen(descritor, "wb") as arquivo:
+            arquivo.write(conteudo)
+
+        os.replace(temporario, caminho)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+def _remover_versoes_antigas(pasta, atual):
+    # A pasta é só do registro: poucas entradas, nunca o tipo inteiro.
+    for nome in os.listdir(pasta):
+        caminho = os.path.join(pasta, nome)
+
+        if nome.endswith(".pdf") and caminho != atual:
+            try:
+                os.remove(caminho)
+            except FileNotFoundError:
+                pass
+
+
+def _limite_bytes():
+    return current_app.config.get("PDF_CACHE_MAX_MB", 200) * 1024 * 1024
+
+
+def aplicar_limite(limite_bytes=None, pasta=None):
+    """Remove os PDFs usados há mais tempo até caber no limite."""
+    if limite_bytes is None:
+        limite_bytes = _limite_bytes()
+
+    if pasta is None:
+        pasta = pasta_cache()
+
+    arquivos = []
+    total = 0
+
+    for raiz, _, nomes in os.walk(pasta):
+        for nome in nomes:
+            if not nome.endswith(".pdf"):
+                continue
+
+            caminho = os.path.join(raiz, nome)
+
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+
+            arquivos.append((info.st_mtime, info.st_size, caminho))
+            total += info.st_size
+
+    removidos = 0
+
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= limite_bytes:
+            break
+
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+
+        # Pasta do registro que ficou vazia.
+        try:
+            os.rmdir(os.path.dirname(caminho))
+        except OSError:
+            pass
+
+        total -= tamanho
+        removidos += 1
+
+    return removidos
+
+
+def _varrer(limite_bytes, pasta, logger):
+    global _varrendo
+
+    try:
+        aplicar_limite(limite_bytes, pasta)
+    except OSError:
+        logger.warning("Falha ao podar o cache de PDF: %s", pasta, exc_info=True)
+    finally:
+        with _trava_varredura:
+            _varrendo = False
+
+
+def _contar_gravacao(tamanho):
+    """
+    Soma os bytes gravados e, passada a fração do limite, poda o cache numa
+    thread: a requisição que gerou o PDF não percorre a pasta inteira.
+    """
+    global _gravados_desde_varredura, _varrendo
+
+    limite_bytes = _limite_bytes()
+
+    with _trava_varredura:
+        _gravados_desde_varredura += tamanho
+
+        if _varrendo or _gravados_desde_varredura < limite_bytes * FRACAO_VARREDURA:
+            return
+
+        _gravados_desde_varredura = 0
+        _varrendo = True
+
+    threading.Thread(
+        target=_varrer,
+        args=(limite_bytes, pasta_cache(), current_app.logger),
+        name="poda-cache-pdf",
+        daemon=True,
+    ).start()
+
+
+def documento_pdf(tipo, registro_id, versao, partes, gerar):
+    """
+    Bytes do PDF `tipo` do registro: do cache, se o conteúdo (`partes`) e
+    a versão do layout não mudaram; senão chama `gerar()` e guarda.
+    Falha de disco no cache nunca impede o documento.
+    """
+    if current_app.config.get("PDF_CACHE_MAX_MB", 200) <= 0:
+        return gerar()
+
+    chave = impressao_digital(tipo, versao, _data_logo(), partes)
+    pasta = os.path.join(pasta_cache(), tipo, str(registro_id))
+    caminho = os.path.join(pasta, f"{chave}.pdf")
+
+    try:
+        with open(caminho, "rb") as arquivo:
+            conteudo = arquivo.read()
+
+        os.utime(caminho)
+        return conteudo
+    except FileNotFoundError:
+        pass
+    except OSError:
+        current_app.logger.warning("Cache de PDF ilegível: %s", caminho, exc_info=True)
+
+    conteudo = gerar()
+
+    try:
+        _gravar(caminho, conteudo)
+        _remover_versoes_antigas(pasta, caminho)
+        _contar_gravacao(len(conteudo))
+    except OSError:
+        current_app.logger.warning("Falha ao gravar cache de PDF: %s", caminho, exc_info=True)
+
+    return conteudo
+
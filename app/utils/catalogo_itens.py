@@ -0,0 +1,180 @@
+# app/utils/catalogo_itens.py
+#
+# Catálogo de itens (código, descrição, unidade, valor, categoria) em
+# memória, um por processo, para os seletores do celular.
+#
+# O JSON é montado uma vez por versão, já comprimido (gzip), e servido com
+# ETag: o aparelho baixa o catálogo uma vez e depois só revalida (304).
+# A versão é o hash do conteúdo, então dois workers com os mesmos itens
+# dão o mesmo ETag. Commits que gravam Item invalidam o catálogo do
+# processo na hora; gravações feitas por outro worker aparecem em até
+# VALIDADE_SEGUNDOS, como nos contadores (app/utils/contadores.py).
+
+import gzip
+import hashlib
+import json
+import threading
+import time
+
+from flask import Response, request
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import Item
+
+
+VALIDADE_SEGUNDOS = 60
+
+CAMPOS = ("id", "codigo", "descricao", "unidade", "valor", "categoria", "eh_equipamento")
+
+
+class Catalogo:
+    def __init__(self, itens):
+        self.itens = itens
+        self.por_id = {item["id"]: item for item in itens}
+        self.versao = _hash(itens)
+        self.expira_em = time.monotonic() + VALIDADE_SEGUNDOS
+        self._corpos = {}
+        self._trava = threading.Lock()
+
+    def da_categoria(self, categoria):
+        categoria = (categoria or "").lower()
+        return [item for item in self.itens if (item["categoria"] or "").lower() == categoria]
+
+    def corpo(self, chave, montar):
+        """
+        (etag, json, json gzip) de uma visão do catálogo. `montar` recebe
+        o catálogo e devolve o objeto a serializar; roda uma vez por versão
+        e chave (cada seletor usa a sua).
+        """
+        with self._trava:
+            if chave not in self._corpos:
+                dados = json.dumps(
+                    montar(self),
+                    ensure_ascii=False,
+                    separators=(",", ":"),
+                ).encode("utf-8")
+
+                self._corpos[chave] = (
+                    f"{self.versao}-{hashlib.sha256(chave.encode()).hexdigest()[:8]}",
+                    dados,
+                    gzip.compress(dados, compresslevel=6, mtime=0),
+                )
+
+            return self._corpos[chave]
+
+
+_trava = threading.Lock()
+_catalogo = None
+
+
+def _hash(itens):
+    conteudo = json.dumps(itens, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()[:16]
+
+
+def _carregar():
+    # Conexão própria: não abre transação na sessão da requisição.
+    with db.engine.connect() as conexao:
+        linhas = conexao.execute(
+            select(*(getattr(Item, campo) for campo in CAMPOS))
+            .order_by(Item.descricao, Item.id)
+        ).all()
+
+    return [
+        {
+            "id": linha.id,
+            "codigo": linha.codigo,
+            "descricao": linha.descricao,
+            "unidade": linha.unidade,
+            "valor": float(linha.valor or 0),
+            "categoria": linha.categoria,
+            "eh_equipamento": bool(linha.eh_equipamento),
+        }
+        for linha in linhas
+    ]
+
+
+def obter_catalogo():
+    global _catalogo
+
+    catalogo = _catalogo
+
+    if catalogo is not None and catalogo.expira_em > time.monotonic():
+        return catalogo
+
+    # Uma thread monta; as outras esperam e reaproveitam.
+    with _trava:
+        if _catalogo is None or _catalogo.expira_em <= time.monotonic():
+            _catalogo = Catalogo(_carregar())
+
+        return _catalogo
+
+
+def invalidar_catalogo():
+    global _catalogo
+
+    with _trava:
+        _catalogo = None
+
+
+def responder(chave, montar, max_age=0):
+    """
+    Resposta JSON de uma visão do catálogo atual, com ETag (fraco: o mesmo
+    para a versão comprimida e a sem compressão) e gzip quando o cliente
+    aceita.
+    Sem max_age o navegador guarda, mas revalida a cada uso.
+    """
+    etag, dados, dados_gzip = obter_catalogo().corpo(chave, montar)
+
+    resposta = Response(mimetype="application/json")
+    resposta.set_etag(etag, weak=True)
+    resposta.cache_control.private = True
+    resposta.cache_control.max_age = max_age
+
+    if max_age == 0:
+        resposta.cache_control.no_cache = True
+
+    resposta.vary.add("Accept-Encoding")
+
+    if request.if_none_match.contains_weak(etag):
+        resposta.status_code = 304
+        return resposta
+
+    if "gzip" in request.accept_encodings:
+        resposta.set_data(dados_gzip)
+        resposta.content_encoding = "gzip"
+    else:
+        resposta.set_data(dados)
+
+    return resposta
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_itens_alterados(session, flush_context):
+    for instancia in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instancia, Item):
+            session.info["catalogo_itens_alterado"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_apos_commit(session):
+    # Savepoint (begin_nested) liberado: a transação de fora ainda não gravou.
+    if session.in_nested_transaction():
+        return
+
+    if session.info.pop("catalogo_itens_alterado", None):
+        invalidar_catalogo()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_alteracao(session):
+    if not session.in_nested_transaction():
+        session.info.pop("catalogo_itens_alterado", None)
+
+
+def marcar_alteracao(session):
+    """Gravações em massa (bulk_*_mappings) não passam pelo after_flush."""
+    session.info["catalogo_itens_alterado"] = True
@@ -0,0 +1,242 @@
+# app/utils/contadores.py
+#
+# Cache em memória (compartilhado entre as threads do processo) para os
+# agregados exibidos no dashboard, no menu e no context processor.
+# Cada contador expira pelo TTL e é invalidado no after_commit de
+# qualquer sessão que tenha gravado um dos modelos dos quais ele depende.
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, or_, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import (
+    BaixaTecnica,
+    Estoque,
+    Item,
+    NotaFiscalEntrada,
+    RequisicaoTecnico,
+    Tecnico,
+)
+
+
+VALIDADE_PADRAO_SEGUNDOS = 30
+
+# Contadores do menu: mudanças gravadas por outro worker do gunicorn
+# aparecem em até este intervalo.
+VALIDADE_PENDENTES_SEGUNDOS = 5
+
+STATUS_BAIXAS_PENDENTES = ("pendente", "revisada")
+
+
+def _count_itens():
+    return select(func.count(Item.id))
+
+
+def _count_tecnicos_ativos():
+    return select(func.count(Tecnico.id)).where(
+        or_(Tecnico.status.is_(None), Tecnico.status == "Ativo")
+    )
+
+
+def _count_estoque_baixo():
+    return select(func.count(Estoque.id)).where(
+        Estoque.quantidade_minima > 0,
+        Estoque.quantidade <= Estoque.quantidade_minima,
+    )
+
+
+def _count_requisicoes_pendentes():
+    return select(func.count(RequisicaoTecnico.id)).where(
+        RequisicaoTecnico.status == "pendente"
+    )
+
+
+def _count_requisicoes_mobile_pendentes():
+    return select(func.count(RequisicaoTecnico.id)).where(
+        RequisicaoTecnico.origem_mobile == True,
+        RequisicaoTecnico.status == "pendente",
+    )
+
+
+def _count_baixas_pendentes():
+    return select(func.count(BaixaTecnica.id)).where(
+        BaixaTecnica.status.in_(STATUS_BAIXAS_PENDENTES)
+    )
+
+
+def _count_notas_30_dias():
+    inicio_30_dias = datetime.utcnow() - timedelta(days=30)
+
+    return select(func.count(NotaFiscalEntrada.id)).where(
+        NotaFiscalEntrada.data_hora >= inicio_30_dias
+    )
+
+
+# nome -> (consulta, modelos que invalidam, validade em segundos)
+CONTADORES = {
+    "itens": (_count_itens, (Item,), VALIDADE_PADRAO_SEGUNDOS),
+    "tecnicos_ativos": (_count_tecnicos_ativos, (Tecnico,), VALIDADE_PADRAO_SEGUNDOS),
+    "estoque_baixo": (_count_estoque_baixo, (Estoque,), VALIDADE_PADRAO_SEGUNDOS),
+    "requisicoes_pendentes": (
+        _count_requisicoes_pendentes,
+        (RequisicaoTecnico,),
+        VALIDADE_PENDENTES_SEGUNDOS,
+    ),
+    "requisicoes_mobile_pendentes": (
+        _count_requisicoes_mobile_pendentes,
+        (RequisicaoTecnico,),
+        VALIDADE_PENDENTES_SEGUNDOS,
+    ),
+    "baixas_pendentes": (
+        _count_baixas_pendentes,
+        (BaixaTecnica,),
+        VALIDADE_PENDENTES_SEGUNDOS,
+    ),
+    "notas_30_dias": (_count_notas_30_dias, (NotaFiscalEntrada,), VALIDADE_PADRAO_SEGUNDOS),
+}
+
+
+class _CacheContadores:
+    def __init__(self):
+        self.condicao = threading.Condition()
+        self.valores = {}
+        self.expira_em = {}
+        self.metricas = {
+            nome: {"hits": 0, "misses": 0, "invalidacoes": 0}
+            for nome in CONTADORES
+        }
+        self.versao = 0
+
+
+_cache = _CacheContadores()
+
+
+def _consultar(nomes):
+    """
+    Calcula vários contadores em um único SELECT de subconsultas escalares.
+    Usa conexão própria para não abrir transação na sessão da requisição.
+    """
+    colunas = [
+        CONTADORES[nome][0]().scalar_subquery().label(nome)
+        for nome in nomes
+    ]
+
+    with db.engine.connect() as conexao:
+        linha = conexao.execute(select(*colunas)).one()
+
+    return {nome: int(valor or 0) for nome, valor in zip(nomes, linha)}
+
+
+def obter_contadores(*nomes):
+    nomes = nomes or tuple(CONTADORES)
+    agora = time.monotonic()
+
+    with _cache.condicao:
+        faltando = []
+
+        for nome in nomes:
+            if _cache.expira_em.get(nome, 0) > agora:
+                _cache.metricas[nome]["hits"] += 1
+            else:
+                _cache.metricas[nome]["misses"] += 1
+                faltando.append(nome)
+
+        versao = _cache.versao
+
+    if faltando:
+        novos = _consultar(faltando)
+        agora = time.monotonic()
+
+        with _cache.condicao:
+            # Um commit no meio da consulta pode ter deixado o valor velho;
+            # nesse caso ele vale para esta resposta, mas não entra no cache.
+            if _cache.versao == versao:
+                for nome, valor in novos.items():
+                    _cache.valores[nome] = valor
+                    _cache.expira_em[nome] = agora + CONTADORES[nome][2]
+
+            resultado = {nome: _cache.valores.get(nome) for nome in nomes}
+            resultado.update(novos)
+
+            return resultado
+
+    with _cache.condicao:
+        return {nome: _cache.valores[nome] for nome in nomes}
+
+
+def obter_contador(nome):
+    return obter_contadores(nome)[nome]
+
+
+def invalidar_contadores(modelos=None):
+    with _cache.condicao:
+        for nome, (_, dependencias, _) in CONTADORES.items():
+            if modelos is None or any(m in dependencias for m in modelos):
+                if _cache.expira_em.pop(nome, None) is not None:
+                    _cache.metricas[nome]["invalidacoes"] += 1
+
+        _cache.versao += 1
+        _cache.condicao.notify_all()
+
+
+def aguardar_invalidacao(timeout):
+    """
+    Bloqueia até a próxima invalidação local (commit que alterou algum
+    modelo monitorado) ou até o timeout.
+    """
+    with _cache.condicao:
+        versao = _cache.versao
+        _cache.condicao.wait_for(lambda: _cache.versao != versao, timeout=timeout)
+
+
+def metricas_contadores():
+    with _cache.condicao:
+        metricas = {}
+
+        for nome, dados in _cache.metricas.items():
+            consultas = dados["hits"] + dados["misses"]
+            metricas[nome] = dict(
+                dados,
+                valor=_cache.valores.get(nome),
+                taxa_acerto=round(dados["hits"] / consultas, 3) if consultas else None,
+            )
+
+        return metricas
+
+
+_MODELOS_MONITORADOS = tuple({
+    modelo
+    for _, modelos, _ in CONTADORES.values()
+    for modelo in modelos
+})
+
+
+@event.listens_for(Session, "after_flush")
+def _registrar_modelos_alterados(session, flush_context):
+    alterados = session.info.setdefault("contadores_modelos_alterados", set())
+
+    for instancia in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(instancia, _MODELOS_MONITORADOS):
+            alterados.add(type(instancia))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_apos_commit(session):
+    # Savepoint (begin_nested) liberado: a transação de fora ainda não gravou.
+    if session.in_nested_transaction():
+        return
+
+    alterados = session.info.pop("contadores_modelos_alterados", None)
+
+    if alterados:
+        invalidar_contadores(alterados)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_modelos_alterados(session):
+    if not session.in_nested_transaction():
+        session.info.pop("contadores_modelos_alterados", None)
@@ -0,0 +1,52 @@
+# app/utils/contadores_pendentes.py
+
+import time
+
+from app.utils.contadores import (
+    VALIDADE_PENDENTES_SEGUNDOS,
+    aguardar_invalidacao,
+    obter_contadores as obter_contadores_cache,
+)
+
+
+# Os valores vêm do cache de app/utils/contadores.py: mudanças feitas
+# neste processo chegam na hora (after_commit); mudanças feitas por outro
+# worker do gunicorn aparecem quando o TTL expira, com uma única consulta
+# por processo, independente de quantas abas estejam abertas.
+
+
+def obter_contadores():
+    valores = obter_contadores_cache(
+        "baixas_pendentes",
+        "requisicoes_mobile_pendentes",
+    )
+
+    return {
+        "baixas": valores["baixas_pendentes"],
+        "requisicoes": valores["requisicoes_mobile_pendentes"],
+    }
+
+
+def etag_contadores(valores):
+    return f'{valores["baixas"]}-{valores["requisicoes"]}'
+
+
+def aguardar_mudanca(etag, timeout):
+    """
+    Bloqueia até os contadores mudarem em relação ao `etag` informado ou
+    até o timeout. Retorna os contadores atuais.
+    """
+    limite = time.monotonic() + timeout
+
+    while True:
+        valores = obter_contadores()
+
+        if etag_contadores(valores) != etag:
+            return valores
+
+        restante = limite - time.monotonic()
+
+        if restante <= 0:
+            return valores
+
+        aguardar_invalidacao(min(restante, VALIDADE_PENDENTES_SEGUNDOS))
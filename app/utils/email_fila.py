@@ -0,0 +1,345 @@
+# app/utils/email_fila.py
+
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import Session
+
+from app.extensions import db, mail
+from app.models import (
+    BaixaTecnica,
+    BaixaTecnicaItem,
+    EmailFila,
+    HistoricoEquipamento,
+    MovimentacaoEstoque,
+    RequisicaoTecnico,
+)
+
+
+STATUS_PENDENTE = "pendente"
+STATUS_ENVIANDO = "enviando"
+STATUS_ENVIADO = "enviado"
+STATUS_FALHA = "falha"
+STATUS_SEM_DESTINATARIO = "sem_destinatario"
+
+MAX_TENTATIVAS = 6
+BACKOFF_BASE_SEGUNDOS = 30
+BACKOFF_MAXIMO_SEGUNDOS = 3600
+TAMANHO_LOTE = 20
+INTERVALO_WORKER_SEGUNDOS = 15
+
+# Registro "enviando" parado há mais que isso volta para a fila
+# (worker derrubado no meio do envio).
+RESERVA_EXPIRADA = timedelta(minutes=10)
+
+_acordar_worker = threading.Event()
+_worker_lock = threading.Lock()
+_worker_thread = None
+
+
+def enfileirar_email(tipo, referencia_id, **parametros):
+    """
+    Adiciona o pedido à sessão de quem chama, sem commit (outbox): ele é
+    gravado junto com o registro de negócio. O worker é acordado depois
+    do commit.
+    """
+    agora = datetime.utcnow()
+
+    entrada = EmailFila(
+        tipo=tipo,
+        referencia_id=referencia_id,
+        parametros=json.dumps(parametros),
+        status=STATUS_PENDENTE,
+        tentativas=0,
+        proxima_tentativa=agora,
+        criado_em=agora,
+        atualizado_em=agora,
+    )
+
+    db.session.add(entrada)
+    db.session.flush()
+    db.session.info["email_fila_pendente"] = True
+
+    return entrada
+
+
+# Savepoints (begin_nested) também disparam after_commit/after_rollback:
+# só a transação de fora conta.
+@event.listens_for(Session, "after_commit")
+def _acordar_apos_commit(session):
+    if not session.in_nested_transaction() and session.info.pop("email_fila_pendente", None):
+        _acordar_worker.set()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_pendente(session):
+    if not session.in_nested_transaction():
+        session.info.pop("email_fila_pendente", None)
+
+
+def _backoff(tentativas):
+    segundos = BACKOFF_BASE_SEGUNDOS * (2 ** max(tentativas - 1, 0))
+    return timedelta(seconds=min(segundos, BACKOFF_MAXIMO_SEGUNDOS))
+
+
+def _mensagem_baixa_aprovada(baixa, aprovacoes=None, attach_pdf=True):
+    from app.utils.mailer import _mensagem_baixa_aprovada as montar
+
+    if aprovacoes is not None:
+        itens = {
+            item.id: item
+            for item in BaixaTecnicaItem.query.filter(
+                BaixaTecnicaItem.id.in_([item_id for item_id, _ in aprovacoes])
+            )
+        }
+
+        aprovacoes = [
+            (itens[item_id], quantidade)
+            for item_id, quantidade in aprovacoes
+            if item_id in itens
+        ]
+
+    return montar(baixa, aprovacoes=aprovacoes, attach_pdf=attach_pdf)
+
+
+def _tipos_email():
+    from app.utils import mailer
+
+    return {
+        "requisicao": (RequisicaoTecnico, mailer._mensagem_requisicao),
+        "baixa_aprovada": (BaixaTecnica, _mensagem_baixa_aprovada),
+        "baixa_recusada": (BaixaTecnica, mailer._mensagem_baixa_recusa),
+        "movimentacao": (MovimentacaoEstoque, mailer._mensagem_movimentacao),
+        "termo_ferramenta": (HistoricoEquipamento, mailer._mensagem_termo_ferramenta),
+    }
+
+
+def _montar_mensagem(entrada):
+    tipos = _tipos_email()
+
+    if entrada.tipo not in tipos:
+        raise ValueError(f"Tipo de e-mail desconhecido: {entrada.tipo}")
+
+    modelo, montar = tipos[entrada.tipo]
+    registro = db.session.get(modelo, entrada.referencia_id)
+
+    if not registro:
+        raise ValueError(
+            f"Registro {entrada.tipo} #{entrada.referencia_id} não encontrado."
+        )
+
+    parametros = json.loads(entrada.parametros or "{}")
+
+    return montar(registro, **parametros)
+
+
+def _marcar_registro_enviado(entrada, agora):
+    if entrada.tipo == "movimentacao":
+        MovimentacaoEstoque.query.filter_by(id=entrada.referencia_id).update(
+            {
+                MovimentacaoEstoque.email_enviado: True,
+                MovimentacaoEstoque.data_envio_email: agora,
+            },
+            synchronize_session=False,
+        )
+
+    elif entrada.tipo == "termo_ferramenta":
+        HistoricoEquipamento.query.filter_by(id=entrada.referencia_id).update(
+            {HistoricoEquipamento.email_enviado: True},
+            synchronize_session=False,
+        )
+
+
+def _reservar_lote(limite):
+    """
+    Reserva até `limite` e-mails vencidos com um UPDATE condicional,
+    para que dois workers (threads ou processos gunicorn) nunca peguem
+    o mesmo registro.
+    """
+    agora = datetime.utcnow()
+
+    disponivel = or_(
+        and_(
+            EmailFila.status == STATUS_PENDENTE,
+            EmailFila.proxima_tentativa <= agora,
+        ),
+        and_(
+            EmailFila.status == STATUS_ENVIANDO,
+            EmailFila.atualizado_em <= agora - RESERVA_EXPIRADA,
+        ),
+    )
+
+    ids = [
+        entrada_id
+        for (entrada_id,) in (
+            db.session.query(EmailFila.id)
+            .filter(disponivel)
+            .order_by(EmailFila.proxima_tentativa.asc(), EmailFila.id.asc())
+            .limit(limite)
+            .all()
+        )
+    ]
+
+    if not ids:
+        db.session.rollback()
+        return []
+
+    lote = str(uuid.uuid4())
+
+    EmailFila.query.filter(EmailFila.id.in_(ids), disponivel).update(
+        {
+            EmailFila.status: STATUS_ENVIANDO,
+            EmailFila.lote: lote,
+            EmailFila.atualizado_em: agora,
+        },
+        synchronize_session=False,
+    )
+    db.session.commit()
+
+    return EmailFila.query.filter_by(lote=lote).order_by(EmailFila.id.asc()).all()
+
+
+def _registrar_falha(entrada, erro):
+    agora = datetime.utcnow()
+
+    entrada.tentativas = int(entrada.tentativas or 0) + 1
+    entrada.ultimo_erro = str(erro)[:2000]
+    entrada.atualizado_em = agora
+
+    if entrada.tentativas >= MAX_TENTATIVAS:
+        entrada.status = STATUS_FALHA
+    else:
+        entrada.status = STATUS_PENDENTE
+        entrada.proxima_tentativa = agora + _backoff(entrada.tentativas)
+
+
+def _enviar_entrada(conexao, entrada):
+    msg = _montar_mensagem(entrada)
+    agora = datetime.utcnow()
+
+    entrada.atualizado_em = agora
+
+    if msg is None:
+        entrada.status = STATUS_SEM_DESTINATARIO
+        return False
+
+    conexao.send(msg)
+
+    entrada.status = STATUS_ENVIADO
+    entrada.destinatario = ", ".join(msg.send_to)[:255]
+    entrada.enviado_em = agora
+    entrada.ultimo_erro = None
+
+    _marcar_registro_enviado(entrada, agora)
+
+    current_app.logger.info(
+        "E-mail %s #%s enviado para %s",
+        entrada.tipo,
+        entrada.referencia_id,
+        entrada.destinatario,
+    )
+
+    return True
+
+
+def processar_fila_emails(limite=TAMANHO_LOTE):
+    """
+    Envia um lote da fila usando uma única conexão SMTP.
+    Retorna a quantidade de registros processados no lote.
+    """
+    pendentes = _reservar_lote(limite)
+    processados = len(pendentes)
+
+    if not pendentes:
+        return 0
+
+    try:
+        with mail.connect() as conexao:
+            while pendentes:
+                entrada = pendentes[0]
+
+                try:
+                    _enviar_entrada(conexao, entrada)
+
+                except Exception as e:
+                    db.session.rollback()
+
+                    current_app.logger.exception(
+                        "Falha ao enviar e-mail %s #%s: %s",
+                        entrada.tipo,
+                        entrada.referencia_id,
+                        e,
+                    )
+
+                    _registrar_falha(entrada, e)
+
+                db.session.commit()
+                pendentes.pop(0)
+
+    except Exception as e:
+        # Falha ao abrir/fechar a conexão SMTP: o restante volta para a fila.
+        db.session.rollback()
+        current_app.logger.exception("Falha na conexão SMTP: %s", e)
+
+        for entrada in pendentes:
+            _registrar_falha(entrada, e)
+
+        db.session.commit()
+
+    return processados
+
+
+def reenviar_email(entrada):
+    entrada.status = STATUS_PENDENTE
+    entrada.tentativas = 0
+    entrada.proxima_tentativa = datetime.utcnow()
+    entrada.atualizado_em = datetime.utcnow()
+    entrada.lote = None
+
+    _acordar_worker.set()
+
+
+def _loop_worker(app):
+    while True:
+        _acordar_worker.wait(timeout=INTERVALO_WORKER_SEGUNDOS)
+        _acordar_worker.clear()
+
+        with app.app_context():
+            try:
+                while processar_fila_emails() > 0:
+                    pass
+            except Exception:
+                app.logger.exception("Erro no worker da fila de e-mails")
+            finally:
+                db.session.remove()
+
+
+def iniciar_worker_emails(app):
+    """
+    Inicia (uma vez por processo) a thread que consome a fila.
+    Com EMAIL_FILA_WORKER=processo a fila é consumida por
+    `flask processar-emails --loop` em processo separado.
+    """
+    global _worker_thread
+
+    if app.config.get("EMAIL_FILA_WORKER") != "thread":
+        return
+
+    if _worker_thread and _worker_thread.is_alive():
+        return
+
+    with _worker_lock:
+        if _worker_thread and _worker_thread.is_alive():
+            return
+
+        _worker_thread = threading.Thread(
+            target=_loop_worker,
+            args=(app,),
+            name="logistock-email-fila",
+            daemon=True,
+        )
+        _worker_thread.start()
@@ -0,0 +1,67 @@
+# app/utils/envios_offline.py
+#
+# Idempotência dos envios do celular (baixa e requisição).
+#
+# O formulário leva uma chave gerada no aparelho (chave_envio). A chave é
+# gravada em envios_offline na mesma transação do registro: reenvio da
+# fila offline, clique duplo ou resposta perdida no meio do caminho caem
+# no registro que já existe em vez de criar outro.
+
+import re
+from datetime import datetime
+
+from app.extensions import db
+from app.models import EnvioOffline
+
+
+TIPOS_ENVIO = ("baixa", "requisicao")
+
+_CHAVE = re.compile(r"^[A-Za-z0-9-]{8,64}$")
+
+
+class EnvioRecusado(ValueError):
+    """Validação que impede gravar o envio; `categoria` é a do flash."""
+
+    def __init__(self, mensagem, categoria="warning"):
+        super().__init__(mensagem)
+        self.categoria = categoria
+
+
+def ler_chave(valor):
+    valor = (valor or "").strip()
+    return valor if _CHAVE.match(valor) else None
+
+
+def ler_data_envio(valor):
+    """Data/hora ISO informada pelo aparelho; None se ausente ou inválida."""
+    try:
+        data = datetime.fromisoformat((valor or "").strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+    # A coluna é naive, como o resto do banco.
+    return data.replace(tzinfo=None)
+
+
+def envio_existente(chave):
+    if not chave:
+        return None
+
+    return EnvioOffline.query.filter_by(chave=chave).first()
+
+
+def registrar_envio(chave, tipo, registro_id, tecnico_id=None, criado_em=None):
+    """Grava a chave junto do registro (sem commit: vai na mesma transação)."""
+    if not chave:
+        return None
+
+    envio = EnvioOffline(
+        chave=chave,
+        tipo=tipo,
+        registro_id=registro_id,
+        tecnico_id=tecnico_id,
+        criado_em=criado_em,
+    )
+    db.session.add(envio)
+
+    return envio
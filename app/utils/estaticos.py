@@ -0,0 +1,283 @@
+# app/utils/estaticos.py
+#
+# Arquivos estáticos versionados (flask gerar-estaticos).
+#
+# As imagens de static/img saem no tamanho em que são exibidas (PNG
+# otimizado e WebP) e CSS/JS são copiados como estão, todos em static/dist
+# com o hash do conteúdo no nome. O mapa nome lógico -> arquivo gerado fica
+# em static/dist/estaticos.json; com ele, url_for("static", filename=
+# "img/logo.png") já aponta para a versão gerada, e as respostas de
+# static/dist saem com cache de um ano (immutable): o nome muda sempre que
+# o conteúdo muda.
+#
+# Original alterado sem rodar o comando de novo: a entrada não confere
+# (tamanho e, nos arquivos pequenos, hash) e a URL volta para o original.
+
+import hashlib
+import io
+import json
+import os
+import re
+
+from flask import current_app, request, url_for
+from PIL import Image
+
+
+PASTA_SAIDA = "dist"
+ARQUIVO_MAPA = "estaticos.json"
+
+UM_ANO = 365 * 24 * 3600
+
+# Imagem -> lado maior, em px, em que ela é usada (2x a 3x o tamanho na
+# tela dos celulares; logos dos PDFs impressos em ~5 cm).
+IMAGENS = {
+    "img/icon-192.png": 192,
+    "img/icon-512.png": 512,
+    "img/logistock_favicon.png": 64,
+    "img/logo.png": 600,
+    "img/logo_mobile.png": 512,
+    "img/start_logo.png": 320,
+}
+
+# Manifestos dos PWAs: os ícones passam a apontar para a versão gerada.
+MANIFESTOS = ("manifest.json", "manifest_aprovador.json")
+
+# CSS/JS copiados com hash. Os service workers (sw_*.js) ficam de fora: a
+# URL do worker precisa ser estável.
+PASTAS_COPIADAS = ("css", "js")
+
+QUALIDADE_WEBP = 85
+
+# Na subida, originais até este tamanho são conferidos também pelo hash
+# (CSS/JS editados); acima, só pelo tamanho (imagens de megabytes).
+CONFERIR_HASH_ATE = 512 * 1024
+
+_VERSIONADO = re.compile(r"\.[0-9a-f]{10}\.[a-z0-9]+$")
+
+
+def _nome_com_hash(logico, conteudo, extensao=None):
+    base, ext = os.path.splitext(logico)
+    digest = hashlib.sha256(conteudo).hexdigest()[:10]
+    return f"{PASTA_SAIDA}/{base}.{digest}{extensao or ext}"
+
+
+def _hash_arquivo(caminho):
+    with open(caminho, "rb") as arquivo:
+        return hashlib.sha256(arquivo.read()).hexdigest()[:16]
+
+
+def _origem(caminho):
+    return {"tamanho": os.path.getsize(caminho), "hash": _hash_arquivo(caminho)}
+
+
+def _origem_confere(caminho, origem):
+    tamanho = os.path.getsize(caminho)
+
+    if tamanho != origem.get("tamanho"):
+        return False
+
+    return tamanho > CONFERIR_HASH_ATE or _hash_arquivo(caminho) == origem.get("hash")
+
+
+def _reduzir(origem, lado, formato):
+    with Image.open(origem) as imagem:
+        imagem.load()
+
+    if imagem.mode not in ("RGB", "RGBA"):
+        imagem = imagem.convert("RGBA" if "A" in imagem.getbands() else "RGB")
+
+    imagem.thumbnail((lado, lado), Image.LANCZOS)
+
+    saida = io.BytesIO()
+
+    if formato == "webp":
+        imagem.save(saida, "WEBP", quality=QUALIDADE_WEBP, method=6)
+        return saida.getvalue()
+
+    imagem.save(saida, "PNG", optimize=True)
+
+    # Logos e ícones têm poucas cores: a versão com paleta costuma sair com
+    # metade do tamanho. Fica a menor das duas.
+    metodo = Image.Quantize.FASTOCTREE if imagem.mode == "RGBA" else Image.Quantize.MEDIANCUT
+    paleta = io.BytesIO()
+    imagem.quantize(256, method=metodo).save(paleta, "PNG", optimize=True)
+
+    return min(saida.getvalue(), paleta.getvalue(), key=len)
+
+
+def gerar_estaticos(pasta_static=None):
+    """
+    Gera static/dist e o mapa. Devolve [(nome lógico, bytes antes,
+    bytes depois)]. Arquivos gerados por rodadas anteriores que não estão
+    no mapa novo são apagados.
+    """
+    pasta_static = pasta_static or current_app.static_folder
+    pasta_saida = os.path.join(pasta_static, PASTA_SAIDA)
+
+    mapa = {}
+    arquivos = {}
+    relatorio = []
+
+    def registrar(logico, conteudo, extensao=None):
+        nome = _nome_com_hash(logico, conteudo, extensao)
+        arquivos[nome] = conteudo
+        return nome
+
+    for logico, lado in IMAGENS.items():
+        origem = os.path.join(pasta_static, *logico.split("/"))
+
+        if not os.path.isfile(origem):
+            continue
+
+        png = _reduzir(origem, lado, "png")
+        webp = _reduzir(origem, lado, "webp")
+
+        mapa[logico] = {
+            "arquivo": registrar(logico, png),
+            "webp": registrar(logico, webp, ".webp"),
+            "origem": _origem(origem),
+        }
+        relatorio.append((logico, os.path.getsize(origem), len(png)))
+
+    for pasta in PASTAS_COPIADAS:
+        raiz = os.path.join(pasta_static, pasta)
+
+        for atual, _pastas, nomes in os.walk(raiz):
+            for nome in sorted(nomes):
+                if not nome.endswith((".css", ".js")):
+                    continue
+
+                origem = os.path.join(atual, nome)
+                logico = os.path.relpath(origem, pasta_static).replace(os.sep, "/")
+
+                with open(origem, "rb") as arquivo:
+                    conteudo = arquivo.read()
+
+                mapa[logico] = {
+                    "arquivo": registrar(logico, conteudo),
+                    "origem": _origem(origem),
+                }
+                relatorio.append((logico, len(conteudo), len(conteudo)))
+
+    # Manifestos por último: dependem dos nomes dos ícones.
+    for logico in MANIFESTOS:
+        origem = os.path.join(pasta_static, logico)
+
+        if not os.path.isfile(origem):
+            continue
+
+        with open(origem, encoding="utf-8") as arquivo:
+            manifesto = json.load(arquivo)
+
+        for icone in manifesto.get("icons", []):
+            src = icone.get("src", "")
+            chave = src.removeprefix("/static/")
+
+            if chave in mapa:
+                icone["src"] = f"/static/{mapa[chave]['arquivo']}"
+
+        conteudo = json.dumps(manifesto, ensure_ascii=False, indent=4).encode("utf-8")
+        mapa[logico] = {
+            "arquivo": registrar(logico, conteudo),
+            "origem": _origem(origem),
+        }
+        relatorio.append((logico, os.path.getsize(origem), len(conteudo)))
+
+    for nome, conteudo in arquivos.items():
+        destino = os.path.join(pasta_static, *nome.split("/"))
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+
+        if not os.path.exists(destino):
+            with open(destino, "wb") as arquivo:
+                arquivo.write(conteudo)
+
+    # Sobras de builds anteriores.
+    for atual, _pastas, nomes in os.walk(pasta_saida):
+        for nome in nomes:
+            caminho = os.path.join(atual, nome)
+            relativo = os.path.relpath(caminho, pasta_static).replace(os.sep, "/")
+
+            if _VERSIONADO.search(nome) and relativo not in arquivos:
+                os.remove(caminho)
+
+    os.makedirs(pasta_saida, exist_ok=True)
+
+    with open(os.path.join(pasta_saida, ARQUIVO_MAPA), "w", encoding="utf-8") as arquivo:
+        json.dump(mapa, arquivo, ensure_ascii=False, indent=2, sort_keys=True)
+        arquivo.write("\n")
+
+    return relatorio
+
+
+def carregar_mapa(app):
+    """
+    Mapa nome lógico -> entrada, só com as entradas cujo original não
+    mudou desde a geração. Sem static/dist: mapa vazio (URLs originais).
+    """
+    caminho = os.path.join(app.static_folder, PASTA_SAIDA, ARQUIVO_MAPA)
+
+    try:
+        with open(caminho, encoding="utf-8") as arquivo:
+            mapa = json.load(arquivo)
+    except (OSError, ValueError):
+        return {}
+
+    validos = {}
+
+    for logico, entrada in mapa.items():
+        origem = os.path.join(app.static_folder, *logico.split("/"))
+
+        try:
+            confere = _origem_confere(origem, entrada.get("origem") or {})
+        except OSError:
+            continue
+
+        if not confere:
+            app.logger.warning(
+                "Estático %s mudou depois do build; rode flask gerar-estaticos.", logico
+            )
+            continue
+
+        validos[logico] = entrada
+
+    return validos
+
+
+def iniciar_estaticos(app):
+    """Liga o mapa ao url_for("static") e o cache longo em static/dist."""
+    mapa = carregar_mapa(app)
+    app.extensions["estaticos"] = mapa
+
+    @app.url_defaults
+    def _versionar_estatico(endpoint, values):
+        if endpoint != "static":
+            return
+
+        entrada = mapa.get(values.get("filename"))
+
+        if entrada:
+            values["filename"] = entrada["arquivo"]
+
+    @app.after_request
+    def _cache_estatico_versionado(response):
+        if (
+            request.endpoint == "static"
+            and response.status_code in (200, 304)
+            and (request.view_args or {}).get("filename", "").startswith(f"{PASTA_SAIDA}/")
+        ):
+            response.cache_control.public = True
+            response.cache_control.max_age = UM_ANO
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+
+        return response
+
+
+def url_webp(filename):
+    """URL da versão WebP da imagem; a PNG quando não há WebP gerado."""
+    entrada = current_app.extensions.get("estaticos", {}).get(filename)
+
+    if entrada and entrada.get("webp"):
+        return url_for("static", filename=entrada["webp"])
+
+    return url_for("static", filename=filename)
@@ -0,0 +1,367 @@
+# app/utils/fotos.py
+#
+# Fotos de campo (evidências da baixa e da vistoria de frota).
+#
+# A requisição só grava os bytes enviados pelo celular, endereçados pelo
+# SHA-256 (uploads/fotos/<2 primeiros>/<sha256>.original): a mesma foto
+# enviada duas vezes ocupa um arquivo só. O trabalho pesado fica num pool
+# de threads (o Pillow solta o GIL para decodificar, redimensionar e
+# codificar): gira conforme o EXIF, reduz e recomprime em JPEG e gera as
+# versões menores, ao lado do arquivo principal:
+#
+#   <nome>.jpg           tela cheia (lado maior até 2048 px)
+#   <nome>_miniatura.jpg galerias
+#   <nome>_pdf.jpg       PDFs (ReportLab)
+#
+# Fotos antigas (uploads/baixas, uploads/frota/vistorias) ganham as versões
+# menores sob demanda ou pelo comando `flask otimizar-fotos`; enquanto uma
+# versão não existe, a galeria mostra o arquivo principal.
+#
+# Arquivo que não é imagem nem chega ao disco. Se o Pillow falhar depois
+# (foto antiga corrompida), <nome>.falhou registra o erro e a foto não
+# volta para o pool.
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, url_for
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from app.extensions import db
+from app.models import BaixaTecnicaFoto, VistoriaVeiculoFoto
+
+
+PASTA_FOTOS = "uploads/fotos"
+SUFIXO_ORIGINAL = ".original"
+SUFIXO_FALHA = ".falhou"
+
+# rendição: (lado maior em px, qualidade JPEG, sufixo do arquivo)
+RENDICOES = {
+    "tela": (2048, 85, ""),
+    "miniatura": (360, 75, "_miniatura"),
+    "pdf": (1200, 72, "_pdf"),
+}
+
+# HEIC/HEIF ficam de fora: o Pillow não os decodifica sem o pillow-heif.
+EXTENSOES_FOTO = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif")
+
+# Modelos que apontam para fotos (caminho_arquivo relativo a static/).
+MODELOS_FOTO = (BaixaTecnicaFoto, VistoriaVeiculoFoto)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Um arquivo é processado por uma thread de cada vez.
+_em_andamento = set()
+_andamento_lock = threading.Lock()
+
+
+def _pasta_static():
+    return current_app.static_folder
+
+
+def caminho_absoluto(caminho):
+    """Caminho em disco de um caminho_arquivo (relativo a static/)."""
+    return os.path.join(_pasta_static(), *caminho.split("/"))
+
+
+def caminho_rendicao(caminho, rendicao):
+    """caminho_arquivo da versão: 'x/a.jpg' -> 'x/a_miniatura.jpg'."""
+    base = os.path.splitext(caminho)[0]
+    return f"{base}{RENDICOES[rendicao][2]}.jpg"
+
+
+def _marca_falha(caminho):
+    return caminho_absoluto(os.path.splitext(caminho)[0] + SUFIXO_FALHA)
+
+
+def _gravar(destino, conteudo):
+    pasta = os.path.dirname(destino)
+    os.makedirs(pasta, exist_ok=True)
+
+    # Temporário + rename: quem lê nunca pega um arquivo pela metade.
+    descritor, temporario = tempfile.mkstemp(dir=pasta, suffix=".tmp")
+
+    try:
+        with os.fdopen(descritor, "wb") as arquivo:
+            arquivo.write(conteudo)
+
+        os.replace(temporario, destino)
+    except Exception:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+
+
+# ==========================================================
+# ENTRADA (requisição)
+# ==========================================================
+
+def extensao_permitida(nome_arquivo):
+    return os.path.splitext(nome_arquivo or "")[1].lower() in EXTENSOES_FOTO
+
+
+def imagem_valida(conteudo):
+    """True se o Pillow reconhece os bytes como imagem íntegra."""
+    try:
+        with Image.open(io.BytesIO(conteudo)) as imagem:
+            imagem.verify()
+    except Exception:
+        # verify() levanta tipos variados (SyntaxError, struct.error...)
+        # conforme o formato.
+        return False
+
+    return True
+
+
+def guardar_foto(arquivo):
+    """
+    Grava a foto enviada (FileStorage) e devolve o caminho_arquivo a
+    salvar no banco. Foto repetida devolve o caminho da que já existe.
+    Arquivo vazio, com extensão de outro tipo ou que não abre como imagem:
+    None. O processamento vai para o pool; a requisição não espera.
+    """
+    conteudo = arquivo.read()
+
+    if not conteudo:
+        return None
+
+    if not extensao_permitida(arquivo.filename) or not imagem_valida(conteudo):
+        current_app.logger.warning("Foto recusada (não é imagem): %s", arquivo.filename)
+        return None
+
+    chave = hashlib.sha256(conteudo).hexdigest()
+    caminho = f"{PASTA_FOTOS}/{chave[:2]}/{chave}.jpg"
+    destino = caminho_absoluto(caminho)
+    original = os.path.splitext(destino)[0] + SUFIXO_ORIGINAL
+
+    if os.path.exists(destino) or os.path.exists(original):
+        return caminho
+
+    _gravar(original, conteudo)
+    agendar(caminho)
+
+    return caminho
+
+
+def agendar(caminho):
+    """Processa a foto no pool de threads (fora da requisição)."""
+    if os.path.exists(_marca_falha(caminho)):
+        return
+
+    pool = _obter_pool()
+    app = current_app._get_current_object()
+
+    def tarefa():
+        with app.app_context():
+            try:
+                otimizar_foto(caminho)
+            except Exception:
+                app.logger.exception("Falha ao otimizar a foto %s", caminho)
+
+    pool.submit(tarefa)
+
+
+def _obter_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=max(1, current_app.config.get("FOTOS_THREADS") or 2),
+                thread_name_prefix="fotos",
+            )
+
+        return _pool
+
+
+# ==========================================================
+# PROCESSAMENTO
+# ==========================================================
+
+def _codificar(origem, rendicao):
+    lado, qualidade, _sufixo = RENDICOES[rendicao]
+
+    with Image.open(origem) as bruta:
+        # JPEG decodifica já reduzido (1/2, 1/4, 1/8): foto de 12 MP para
+        # miniatura não passa pela resolução cheia.
+        if bruta.format == "JPEG":
+            bruta.draft("RGB", (lado, lado))
+
+        imagem = ImageOps.exif_transpose(bruta)
+
+    if imagem.mode not in ("RGB", "L"):
+        imagem = imagem.convert("RGBA")
+        fundo = Image.new("RGB", imagem.size, "white")
+        fundo.paste(imagem, mask=imagem.getchannel("A"))
+        imagem = fundo
+
+    imagem.thumbnail((lado, lado), Image.LANCZOS)
+
+    saida = io.BytesIO()
+    # Sem EXIF: a rotação já foi aplicada e o GPS do celular não vaza.
+    imagem.save(saida, "JPEG", quality=qualidade, optimize=True, progressive=True)
+
+    return saida.getvalue()
+
+
+def otimizar_foto(caminho, rendicoes=None):
+    """
+    Gera as versões da foto (todas ou as informadas) que ainda não
+    existem. Upload novo: a tela cheia sai do .original, que é apagado no
+    fim. Foto que já falhou uma vez fica como está. Devolve quantos
+    arquivos gravou.
+    """
+    principal = caminho_absoluto(caminho)
+    original = os.path.splitext(principal)[0] + SUFIXO_ORIGINAL
+    marca_falha = _marca_falha(caminho)
+
+    if os.path.exists(marca_falha):
+        return 0
+
+    with _andamento_lock:
+        if principal in _em_andamento:
+            return 0
+        _em_andamento.add(principal)
+
+    try:
+        gravados = 0
+
+        if os.path.exists(original):
+            origem = original
+            pendentes = ["tela", "miniatura", "pdf"]
+        elif os.path.exists(principal):
+            origem = principal
+            pendentes = ["miniatura", "pdf"]
+        else:
+            return 0
+
+        for rendicao in rendicoes or pendentes:
+            if rendicao not in pendentes:
+                continue
+
+            destino = caminho_absoluto(caminho_rendicao(caminho, rendicao))
+
+            if rendicao != "tela" and os.path.exists(destino):
+                continue
+
+            try:
+                _gravar(destino, _codificar(origem, rendicao))
+            except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as erro:
+                current_app.logger.warning("Foto %s não processada: %s", caminho, erro)
+                _gravar(marca_falha, str(erro).encode("utf-8"))
+                return gravados
+
+            gravados += 1
+
+        if origem == original and os.path.exists(principal):
+            os.remove(original)
+
+        return gravados
+    finally:
+        with _andamento_lock:
+            _em_andamento.discard(principal)
+
+
+# ==========================================================
+# LEITURA
+# ==========================================================
+
+def caminho_foto_pdf(caminho):
+    """
+    Arquivo a embutir no PDF: a versão reduzida, gerada na hora se o pool
+    ainda não chegou nela. None se a foto não existe.
+    """
+    if not caminho:
+        return None
+
+    destino = caminho_absoluto(caminho_rendicao(caminho, "pdf"))
+
+    if not os.path.exists(destino):
+        otimizar_foto(caminho, ["tela", "pdf"])
+
+    principal = caminho_absoluto(caminho)
+
+    # Outra thread processando agora: fica com o que já existe.
+    for candidato in (destino, principal, os.path.splitext(principal)[0] + SUFIXO_ORIGINAL):
+        if os.path.exists(candidato):
+            return candidato
+
+    return None
+
+
+def url_foto(caminho, rendicao="tela"):
+    """
+    URL da versão pedida. Enquanto ela não existe, devolve a mais próxima
+    disponível e pede o processamento ao pool.
+    """
+    if not caminho:
+        return ""
+
+    procurar = [caminho_rendicao(caminho, rendicao)] if rendicao != "tela" else []
+    procurar.append(caminho)
+
+    for candidato in procurar:
+        if os.path.exists(caminho_absoluto(candidato)):
+            if candidato != procurar[0]:
+                agendar(caminho)
+
+            return url_for("static", filename=candidato)
+
+    # Upload recente ainda na fila: serve os bytes recebidos.
+    original = os.path.splitext(caminho)[0] + SUFIXO_ORIGINAL
+
+    if os.path.exists(caminho_absoluto(original)):
+        agendar(caminho)
+        return url_for("static", filename=original)
+
+    return url_for("static", filename=caminho)
+
+
+def remover_foto(caminho):
+    """
+    Apaga a foto e as versões, se nenhum outro registro usa o mesmo
+    arquivo (fotos iguais são gravadas uma vez só). Chamar depois de
+    excluir o registro na sessão.
+    """
+    if not caminho:
+        return False
+
+    pasta_static = os.path.abspath(_pasta_static())
+
+    if not os.path.abspath(caminho_absoluto(caminho)).startswith(pasta_static + os.sep):
+        return False
+
+    for modelo in MODELOS_FOTO:
+        if db.session.query(modelo.id).filter(modelo.caminho_arquivo == caminho).first():
+            return False
+
+    base = os.path.splitext(caminho)[0]
+    arquivos = [caminho, base + SUFIXO_ORIGINAL, base + SUFIXO_FALHA]
+    arquivos += [caminho_rendicao(caminho, rendicao) for rendicao in RENDICOES if rendicao != "tela"]
+
+    for arquivo in arquivos:
+        try:
+            os.remove(caminho_absoluto(arquivo))
+        except OSError:
+            pass
+
+    return True
+
+
+def fotos_cadastradas():
+    """caminho_arquivo de todas as fotos no banco, sem repetição."""
+    caminhos = set()
+
+    for modelo in MODELOS_FOTO:
+        caminhos.update(
+            caminho
+            for (caminho,) in db.session.query(modelo.caminho_arquivo).distinct()
+            if caminho
+        )
+
+    return sorted(caminhos)
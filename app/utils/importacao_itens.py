@@ -0,0 +1,243 @@
+# app/utils/importacao_itens.py
+#
+# Importação de itens via Excel em lote: a planilha é normalizada de uma
+# vez com pandas, comparada com todos os códigos já cadastrados (uma
+# consulta) e gravada com bulk_insert_mappings / bulk_update_mappings,
+# seguida de uma atualização em conjunto do valor dos saldos empresa.
+
+import pandas as pd
+
+from app.extensions import db
+from app.models import Item
+from app.utils.busca_itens import indexar_codigos
+from app.utils.catalogo_itens import marcar_alteracao
+from app.utils.valores_estoque import sincronizar_valor_empresa_itens
+
+
+CATEGORIAS = ('MATERIAL', 'FERRAMENTA', 'EPI')
+CATEGORIAS_EQUIPAMENTO = ('FERRAMENTA', 'EPI')
+
+# Primeira coluna encontrada na planilha vence (mesma ordem da importação
+# linha a linha que existia antes).
+COLUNAS = {
+    'codigo': ('Código', 'CODIGO', 'codigo'),
+    'descricao': ('Descrição', 'DESCRICAO', 'descricao'),
+    'unidade': ('Unidade de Medida', 'Unidade', 'UNIDADE', 'unidade'),
+    'valor': ('Valor', 'Valor Unitário', 'VALOR', 'valor'),
+}
+
+DESCRICAO_PADRAO = 'ITEM IMPORTADO'
+UNIDADE_PADRAO = 'UN'
+
+TAMANHO_CODIGO = Item.__table__.c.codigo.type.length
+TAMANHO_DESCRICAO = Item.__table__.c.descricao.type.length
+TAMANHO_UNIDADE = Item.__table__.c.unidade.type.length
+
+CAMPOS_COMPARADOS = ('descricao', 'unidade', 'valor', 'categoria', 'eh_equipamento')
+
+SITUACAO_NOVO = 'novo'
+SITUACAO_ATUALIZADO = 'atualizado'
+SITUACAO_INALTERADO = 'inalterado'
+SITUACAO_IGNORADO = 'ignorado'
+
+
+def _coluna(df, nomes):
+    for nome in nomes:
+        if nome in df.columns:
+            return df[nome]
+
+    return pd.Series([None] * len(df), index=df.index, dtype=object)
+
+
+def _texto(serie):
+    serie = serie.astype(object)
+    texto = serie.where(serie.notna(), '').astype(str).str.strip()
+
+    return texto.where(texto.str.lower() != 'nan', '')
+
+
+def converter_valores(serie):
+    """
+    Versão vetorizada de estoque.converter_valor: aceita "R$ 1.234,56"
+    e "1234.56". Retorna (valores, invalidos); valor inválido vira 0.
+    """
+    texto = (
+        _texto(serie)
+        .str.replace('R$', '', regex=False)
+        .str.replace(' ', '', regex=False)
+    )
+
+    vazio = texto == ''
+    brasileiro = texto.str.contains(',', regex=False)
+
+    texto = texto.where(
+        ~brasileiro,
+        texto.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    )
+
+    valores = pd.to_numeric(texto.where(~vazio, '0'), errors='coerce')
+    invalidos = valores.isna()
+
+    return valores.fillna(0.0).astype(float), invalidos
+
+
+def normalizar_planilha(df, categoria):
+    """
+    Converte a planilha para as colunas do Item e marca, por linha,
+    avisos e erros de validação. `linha` é o número da linha no Excel.
+    """
+    dados = pd.DataFrame(index=df.index)
+
+    dados['linha'] = df.index + 2
+    dados['codigo'] = _texto(_coluna(df, COLUNAS['codigo'])).str.upper()
+    dados['descricao'] = _texto(_coluna(df, COLUNAS['descricao']))
+    dados['unidade'] = _texto(_coluna(df, COLUNAS['unidade']))
+    dados['valor'], valor_invalido = converter_valores(_coluna(df, COLUNAS['valor']))
+    dados['categoria'] = categoria
+    dados['eh_equipamento'] = categoria in CATEGORIAS_EQUIPAMENTO
+
+    avisos = pd.Series([''] * len(dados), index=dados.index, dtype=object)
+    erros = pd.Series([''] * len(dados), index=dados.index, dtype=object)
+
+    def marcar(destino, mascara, mensagem):
+        destino[mascara] = destino[mascara] + mensagem + ' '
+
+    sem_descricao = dados['descricao'] == ''
+    dados.loc[sem_descricao, 'descricao'] = DESCRICAO_PADRAO
+    marcar(avisos, sem_descricao, f'Sem descrição: usado "{DESCRICAO_PADRAO}".')
+
+    sem_unidade = dados['unidade'] == ''
+    dados.loc[sem_unidade, 'unidade'] = UNIDADE_PADRAO
+    marcar(avisos, sem_unidade, f'Sem unidade: usado "{UNIDADE_PADRAO}".')
+
+    marcar(avisos, valor_invalido, 'Valor inválido: usado 0,00.')
+
+    descricao_longa = dados['descricao'].str.len() > TAMANHO_DESCRICAO
+    dados.loc[descricao_longa, 'descricao'] = dados.loc[descricao_longa, 'descricao'].str[:TAMANHO_DESCRICAO]
+    marcar(avisos, descricao_longa, f'Descrição cortada em {TAMANHO_DESCRICAO} caracteres.')
+
+    sem_codigo = dados['codigo'] == ''
+    marcar(erros, sem_codigo, 'Linha sem código.')
+
+    marcar(
+        erros,
+        dados['codigo'].str.len() > TAMANHO_CODIGO,
+        f'Código com mais de {TAMANHO_CODIGO} caracteres.'
+    )
+    marcar(
+        erros,
+        dados['unidade'].str.len() > TAMANHO_UNIDADE,
+        f'Unidade com mais de {TAMANHO_UNIDADE} caracteres.'
+    )
+
+    # Código repetido na planilha: a última linha vale, como na
+    # importação anterior.
+    repetido = ~sem_codigo & dados['codigo'].duplicated(keep='last')
+    marcar(erros, repetido, 'Código repetido mais abaixo na planilha (vale a última linha).')
+
+    dados['aviso'] = avisos.str.strip()
+    dados['erro'] = erros.str.strip()
+
+    return dados
+
+
+def _itens_existentes():
+    colunas = (Item.id, Item.codigo) + tuple(
+        getattr(Item, campo) for campo in CAMPOS_COMPARADOS
+    )
+
+    linhas = db.session.query(*colunas).all()
+
+    existentes = pd.DataFrame(
+        linhas,
+        columns=['id', 'codigo'] + [f'{campo}_atual' for campo in CAMPOS_COMPARADOS]
+    )
+
+    existentes['eh_equipamento_atual'] = existentes['eh_equipamento_atual'].fillna(False).astype(bool)
+    existentes['valor_atual'] = existentes['valor_atual'].fillna(0.0).astype(float)
+
+    return existentes
+
+
+def _resumo(dados):
+    contagem = dados['situacao'].value_counts()
+
+    linhas = [
+        {
+            'linha': int(linha.linha),
+            'codigo': linha.codigo,
+            'situacao': linha.situacao,
+            'mensagem': linha.erro or linha.aviso,
+        }
+        for linha in dados.itertuples()
+        if linha.erro or linha.aviso
+    ]
+
+    return {
+        'total': int(len(dados)),
+        'novos': int(contagem.get(SITUACAO_NOVO, 0)),
+        'atualizados': int(contagem.get(SITUACAO_ATUALIZADO, 0)),
+        'inalterados': int(contagem.get(SITUACAO_INALTERADO, 0)),
+        'ignorados': int(contagem.get(SITUACAO_IGNORADO, 0)),
+        'linhas': linhas,
+    }
+
+
+def importar_planilha_itens(df, categoria='MATERIAL', simular=False):
+    """
+    Importa (ou, com `simular`, apenas valida) a planilha de itens.
+
+    Retorna um resumo com os totais por situação e a lista das linhas
+    com aviso ou erro. Não faz commit: quem chama decide.
+    """
+    categoria = categoria if categoria in CATEGORIAS else 'MATERIAL'
+
+    dados = normalizar_planilha(df, categoria)
+    dados = dados.merge(_itens_existentes(), on='codigo', how='left')
+
+    valida = dados['erro'] == ''
+    existente = dados['id'].notna()
+
+    diferente = pd.Series(False, index=dados.index)
+
+    for campo in CAMPOS_COMPARADOS:
+        diferente |= dados[campo] != dados[f'{campo}_atual']
+
+    dados['situacao'] = SITUACAO_IGNORADO
+    dados.loc[valida & ~existente, 'situacao'] = SITUACAO_NOVO
+    dados.loc[valida & existente & diferente, 'situacao'] = SITUACAO_ATUALIZADO
+    dados.loc[valida & existente & ~diferente, 'situacao'] = SITUACAO_INALTERADO
+
+    resumo = _resumo(dados)
+
+    if simular:
+        return resumo
+
+    campos = ['codigo'] + list(CAMPOS_COMPARADOS)
+
+    novos = dados.loc[dados['situacao'] == SITUACAO_NOVO, campos]
+
+    atualizados = dados.loc[dados['situacao'] == SITUACAO_ATUALIZADO, ['id'] + campos]
+    atualizados = atualizados.astype({'id': int})
+
+    if not novos.empty:
+        db.session.bulk_insert_mappings(Item, novos.to_dict('records'))
+
+    if not atualizados.empty:
+        db.session.bulk_update_mappings(Item, atualizados.to_dict('records'))
+
+    # Gravação em massa não passa pelos listeners do índice de busca e
+    # do catálogo.
+    indexar_codigos(novos['codigo'].tolist() + atualizados['codigo'].tolist())
+
+    if not (novos.empty and atualizados.empty):
+        marcar_alteracao(db.session)
+
+    # Como na importação linha a linha, todo item existente da planilha
+    # realinha o valor dos saldos empresa; só as linhas divergentes são
+    # reescritas.
+    sincronizar_valor_empresa_itens(
+        dados.loc[valida & existente, 'id'].astype(int).tolist()
+    )
+
+    return resumo
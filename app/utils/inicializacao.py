@@ -0,0 +1,125 @@
+# app/utils/inicializacao.py
+#
+# Apoio à subida da aplicação (create_app): medição do tempo de cada fase
+# e a verificação rápida de que o banco já está no esquema atual, para
+# pular a inspeção tabela a tabela (create_all, colunas e índices) quando
+# as migrações já foram aplicadas.
+
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, text
+
+
+DIRETORIO_MIGRACOES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    "migrations",
+)
+
+_REVISAO = re.compile(r"^revision\s*=\s*['\"](\w+)['\"]", re.M)
+_ANTERIORES = re.compile(r"^down_revision\s*=\s*([^#\n]*)", re.M)
+_ID_REVISAO = re.compile(r"['\"](\w+)['\"]")
+
+
+class TemposInicializacao:
+    """Duração (ms) de cada fase da subida, na ordem em que rodaram."""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.fim = None
+        self.anteriores = 0.0
+        self.fases = []
+
+    def incluir(self, nome, ms):
+        """Fase medida antes de criar o objeto (ex.: importação do pacote)."""
+        self.fases.append((nome, ms))
+        self.anteriores += ms
+
+    def registrar(self, nome, inicio):
+        self.fases.append((nome, (time.perf_counter() - inicio) * 1000))
+
+    @contextmanager
+    def fase(self, nome):
+        inicio = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.registrar(nome, inicio)
+
+    def concluir(self):
+        self.fim = time.perf_counter()
+
+    @property
+    def total(self):
+        fim = self.fim if self.fim is not None else time.perf_counter()
+        return self.anteriores + (fim - self.inicio) * 1000
+
+    def resumo(self):
+        fases = ", ".join(f"{nome}={ms:.0f}ms" for nome, ms in self.fases)
+        return f"{self.total:.0f}ms ({fases})"
+
+
+def revisoes_head(diretorio=DIRETORIO_MIGRACOES):
+    """
+    Revisões head das migrações em disco (vazio se não houver pasta).
+    Lê revision/down_revision direto dos arquivos: carregar o
+    ScriptDirectory do Alembic custaria mais que a própria subida.
+    """
+    pasta = os.path.join(diretorio, "versions")
+
+    if not os.path.isdir(pasta):
+        return set()
+
+    revisoes = set()
+    anteriores = set()
+
+    for nome in os.listdir(pasta):
+        if not nome.endswith(".py"):
+            continue
+
+        with open(os.path.join(pasta, nome), encoding="utf-8") as arquivo:
+            conteudo = arquivo.read()
+
+        revisao = _REVISAO.search(conteudo)
+
+        if not revisao:
+            continue
+
+        revisoes.add(revisao.group(1))
+
+        anterior = _ANTERIORES.search(conteudo)
+
+        if anterior:
+            anteriores.update(_ID_REVISAO.findall(anterior.group(1)))
+
+    return revisoes - anteriores
+
+
+def revisoes_banco(conexao):
+    """Revisões gravadas em alembic_version (vazio se a tabela não existe)."""
+    if not inspect(conexao).has_table("alembic_version"):
+        return set()
+
+    return {
+        linha[0]
+        for linha in conexao.execute(text("SELECT version_num FROM alembic_version"))
+    }
+
+
+def esquema_atualizado(conexao, metadata, diretorio=DIRETORIO_MIGRACOES):
+    """
+    True quando o banco está na head das migrações e já tem todas as
+    tabelas dos modelos (algumas existem só via create_all). Nesse caso a
+    subida pode pular a inspeção de colunas e índices.
+    """
+    heads = revisoes_head(diretorio)
+
+    if not heads or revisoes_banco(conexao) != heads:
+        return False
+
+    existentes = set(inspect(conexao).get_table_names())
+
+    return set(metadata.tables) <= existentes
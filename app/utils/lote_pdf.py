@@ -0,0 +1,344 @@
+# app/utils/lote_pdf.py
+#
+# Comprovantes em lote (fechamento do mês): os PDFs de um período ou de
+# uma lista de IDs são montados num ProcessPoolExecutor e entram num ZIP à
+# medida que ficam prontos. O ReportLab segura o GIL durante todo o
+# layout, então threads não adiantariam: cada processo sobe a própria
+# aplicação (create_app) e passa pelo cache de PDFs (app/utils/cache_pdf.py),
+# o que faz um lote repetido custar só leitura de arquivos.
+#
+# O pool é um só por worker gunicorn, criado no primeiro lote e reaproveitado
+# (os processos sobem a aplicação uma vez). Lotes simultâneos no mesmo
+# worker são limitados por PDF_LOTE_SIMULTANEOS: a rota recusa o excedente
+# em vez de empilhar processos.
+
+import multiprocessing
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, time, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, or_
+
+from app.extensions import db
+from app.models import BaixaTecnica, MovimentacaoEstoque, RequisicaoTecnico
+
+
+TIPOS_DOCUMENTO = {
+    "movimentacao": MovimentacaoEstoque,
+    "baixa": BaixaTecnica,
+    "requisicao": RequisicaoTecnico,
+}
+
+PROCESSOS_PADRAO = 4
+
+# Configurações repassadas aos processos (o resto vem do config.py).
+_CONFIG_PROCESSO = (
+    "SQLALCHEMY_DATABASE_URI",
+    "ASSINATURAS_DIR",
+    "PDF_CACHE_DIR",
+    "PDF_CACHE_MAX_MB",
+)
+
+_app_processo = None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Vagas de lote deste worker (BoundedSemaphore criado no primeiro uso).
+_lotes = None
+
+
+def processos_padrao():
+    return max(
+        1,
+        min(
+            current_app.config.get("PDF_LOTE_PROCESSOS") or PROCESSOS_PADRAO,
+            os.cpu_count() or 1,
+        ),
+    )
+
+
+def selecionar_ids(tipo, ids=None, data_inicio=None, data_fim=None, tecnico_id=None):
+    """
+    IDs do lote em ordem de data. data_inicio/data_fim são datas
+    (inclusive); tecnico_id filtra pelo técnico do documento.
+    """
+    modelo = TIPOS_DOCUMENTO[tipo]
+    query = db.session.query(modelo.id)
+
+    if ids:
+        query = query.filter(modelo.id.in_(ids))
+
+    if data_inicio:
+        query = query.filter(
+            modelo.data_hora >= datetime.combine(data_inicio, time.min)
+        )
+
+    if data_fim:
+        query = query.filter(
+            modelo.data_hora < datetime.combine(data_fim + timedelta(days=1), time.min)
+        )
+
+    if tecnico_id:
+        if tipo == "baixa":
+            query = query.filter(BaixaTecnica.tecnico_id == tecnico_id)
+        elif tipo == "requisicao":
+            query = query.filter(RequisicaoTecnico.solicitante_tecnico_id == tecnico_id)
+        else:
+            query = query.filter(
+                or_(
+                    and_(
+                        MovimentacaoEstoque.destino_tipo == "tecnico",
+                        MovimentacaoEstoque.destino_id == tecnico_id,
+                    ),
+                    and_(
+                        MovimentacaoEstoque.origem_tipo == "tecnico",
+                        MovimentacaoEstoque.origem_id == tecnico_id,
+                    ),
+                )
+            )
+
+    return [
+        registro_id
+        for (registro_id,) in query.order_by(modelo.data_hora, modelo.id)
+    ]
+
+
+def _montar(tipo, registro_id):
+    """(nome do arquivo, bytes) do comprovante; None se o registro sumiu."""
+    from app.utils.mailer import (
+        _build_baixa_pdf,
+        _build_movimentacao_pdf,
+        _build_requisition_pdf,
+    )
+
+    registro = db.session.get(TIPOS_DOCUMENTO[tipo], registro_id)
+
+    if registro is None:
+        return None
+
+    if tipo == "movimentacao":
+        conteudo = _build_movimentacao_pdf(registro)
+    elif tipo == "baixa":
+        conteudo = _build_baixa_pdf(registro)
+    else:
+        conteudo = _build_requisition_pdf(registro)
+
+    data = f"{registro.data_hora:%Y%m%d}_" if registro.data_hora else ""
+
+    return f"{tipo}_{data}{registro_id}.pdf", conteudo
+
+
+def _iniciar_processo(configuracao):
+    global _app_processo
+
+    from app import create_app
+
+    _app_processo = create_app(configuracao)
+
+
+def _renderizar(tipo, registro_id):
+    with _app_processo.app_context():
+        try:
+            return _montar(tipo, registro_id)
+        finally:
+            db.session.remove()
+
+
+def _configuracao_processo():
+    configuracao = {
+        chave: current_app.config[chave]
+        for chave in _CONFIG_PROCESSO
+        if current_app.config.get(chave) is not None
+    }
+    # Os processos só montam PDF: nada de consumir a fila de e-mails.
+    configuracao["EMAIL_FILA_WORKER"] = "processo"
+
+    return configuracao
+
+
+def reservar_lote():
+    """
+    Ocupa uma vaga de lote neste worker; False quando já há
+    PDF_LOTE_SIMULTANEOS lotes em andamento. Quem reservou chama
+    liberar_lote() ao terminar (a rota: no fechamento da resposta).
+    """
+    global _lotes
+
+    with _pool_lock:
+        if _lotes is None:
+            _lotes = threading.BoundedSemaphore(
+                max(1, current_app.config.get("PDF_LOTE_SIMULTANEOS") or 1)
+            )
+
+    return _lotes.acquire(blocking=False)
+
+
+def liberar_lote():
+    _lotes.release()
+
+
+def _obter_pool(processos):
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            # spawn: processos filhos sem conexões de banco herdadas do pai.
+            _pool = ProcessPoolExecutor(
+                max_workers=processos,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_processo,
+                initargs=(_configuracao_processo(),),
+            )
+
+        return _pool
+
+
+def _descartar_pool(executor):
+    """
+    Processo do pool morreu: o próximo lote sobe um pool novo. True só
+    para quem de fato descartou (os demais futuros do lote caem aqui também).
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not executor:
+            return False
+
+        _pool = None
+
+    executor.shutdown(wait=False, cancel_futures=True)
+    return True
+
+
+def documentos(tipo, ids, processos=None):
+    """
+    Gera (registro_id, nome, bytes, erro) conforme cada PDF fica pronto.
+    Com um processo só (ou um documento) monta aqui mesmo, sem pool.
+    """
+    processos = processos or processos_padrao()
+
+    if processos <= 1 or len(ids) <= 1:
+        for registro_id in ids:
+            try:
+                resultado = _montar(tipo, registro_id)
+            except Exception as erro:
+                current_app.logger.exception("Falha no PDF %s #%s", tipo, registro_id)
+                yield registro_id, None, None, str(erro)
+                continue
+
+            if resultado is None:
+                yield registro_id, None, None, "registro não encontrado"
+            else:
+                yield (registro_id, *resultado, None)
+        return
+
+    executor = _obter_pool(processos)
+    futuros = {}
+
+    try:
+        for registro_id in ids:
+            futuros[executor.submit(_renderizar, tipo, registro_id)] = registro_id
+
+        for futuro in as_completed(futuros):
+            registro_id = futuros[futuro]
+
+            try:
+                resultado = futuro.result()
+            except BrokenProcessPool as erro:
+                if _descartar_pool(executor):
+                    current_app.logger.error("Pool de PDFs interrompido: %s", erro)
+                yield registro_id, None, None, str(erro)
+                continue
+            except Exception as erro:
+                current_app.logger.error("Falha no PDF %s #%s: %s", tipo, registro_id, erro)
+                yield registro_id, None, None, str(erro)
+                continue
+
+            if resultado is None:
+                yield registro_id, None, None, "registro não encontrado"
+            else:
+                yield (registro_id, *resultado, None)
+    finally:
+        # Cliente desistiu do download: o que ainda não começou sai da fila
+        # do pool compartilhado.
+        for futuro in futuros:
+            futuro.cancel()
+
+
+class _Fluxo:
+    """Destino de escrita sem seek: o zipfile grava em modo streaming."""
+
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        dados = b"".join(self.partes)
+        self.partes.clear()
+        return dados
+
+
+def escrever_zip(saida, tipo, ids, processos=None, progresso=None):
+    """
+    Grava o ZIP do lote em `saida` (arquivo ou fluxo). `progresso` recebe
+    (prontos, total) a cada documento; devolve (gerados, falhas), e as
+    falhas também vão para ERROS.txt dentro do ZIP.
+    """
+    resultado = (0, [])
+
+    for resultado in _escrever_zip(saida, tipo, ids, processos, progresso):
+        pass
+
+    return resultado
+
+
+def _escrever_zip(saida, tipo, ids, processos, progresso):
+    gerados = 0
+    falhas = []
+    total = len(ids)
+
+    # PDF já sai comprimido do ReportLab: ZIP_STORED não perde nada.
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_STORED) as arquivo_zip:
+        for prontos, (registro_id, nome, conteudo, erro) in enumerate(
+            documentos(tipo, ids, processos), start=1
+        ):
+            if erro:
+                falhas.append((registro_id, erro))
+            else:
+                arquivo_zip.writestr(nome, conteudo)
+                gerados += 1
+
+            if progresso:
+                progresso(prontos, total)
+
+            yield gerados, falhas
+
+        if falhas:
+            arquivo_zip.writestr(
+                "ERROS.txt",
+                "\n".join(f"{tipo} #{registro_id}: {erro}" for registro_id, erro in falhas),
+            )
+
+    yield gerados, falhas
+
+
+def zip_em_fluxo(tipo, ids, processos=None):
+    """Pedaços do ZIP para uma resposta em streaming, um por documento."""
+    fluxo = _Fluxo()
+
+    for _ in _escrever_zip(fluxo, tipo, ids, processos, None):
+        dados = fluxo.retirar()
+
+        if dados:
+            yield dados
@@ -6,24 +6,75 @@ import os
 from flask import current_app
 from flask_mail import Message
 
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Paragraph,
-    Spacer,
-    Table,
-    TableStyle,
-    Image,
-)
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import cm
-
-from app.extensions import mail
+from app.extensions import db
 from app.models import Tecnico
+from app.utils.assinaturas import ler_assinatura
+from app.utils.cache_pdf import colunas_registro, documento_pdf
+from app.utils.email_fila import enfileirar_email
+
+
+# Mudou o layout de algum PDF deste módulo? Incremente para renovar o cache.
+VERSAO_LAYOUT_PDF = 1
+
+
+def _enfileirar(tipo: str, registro, **parametros) -> bool:
+    """
+    O envio acontece no worker da fila (app/utils/email_fila.py);
+    aqui só registramos o pedido, sem montar PDF nem abrir SMTP.
+
+    Chamar antes do commit de quem chama: o pedido entra na mesma
+    transação do registro e os dois são gravados juntos (ou nenhum).
+    """
+    try:
+        # Savepoint: uma falha aqui desfaz só o pedido de e-mail, não o
+        # registro que a view ainda vai gravar. (No SQLite o savepoint só
+        # fica dentro da transação depois da primeira escrita, e quem chama
+        # sempre já gravou o registro.)
+        with db.session.begin_nested():
+            enfileirar_email(tipo, registro.id, **parametros)
+
+        return True
+
+    except Exception as e:
+        # Falha no flush do próprio registro: a sessão fica inutilizável
+        # até o rollback.
+        if not db.session.is_active:
+            db.session.rollback()
+
+        current_app.logger.exception(
+            "Falha ao enfileirar e-mail %s #%s: %s",
+            tipo,
+            registro.id,
+            e,
+        )
+
+        return False
 
 
 def _build_requisition_pdf(requisicao) -> bytes:
+    return documento_pdf(
+        "requisicao",
+        requisicao.id,
+        VERSAO_LAYOUT_PDF,
+        [requisicao, requisicao.itens, requisicao.cliente],
+        lambda: _desenhar_requisition_pdf(requisicao),
+    )
+
+
+def _desenhar_requisition_pdf(requisicao) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.platypus import (
+        SimpleDocTemplate,
+        Paragraph,
+        Spacer,
+        Table,
+        TableStyle,
+        Image,
+    )
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+
     buf = BytesIO()
 
     doc = SimpleDocTemplate(
@@ -264,8 +315,20 @@ def _build_requisition_pdf(requisicao) -> bytes:
     # ======================================================
 
     assinatura_img = None
+    assinatura_bytes = ler_assinatura(getattr(requisicao, "assinatura_base64", None))
 
-    if getattr(requisicao, "assinatura_path", None):
+    if assinatura_bytes:
+        try:
+            assinatura_img = Image(
+                BytesIO(assinatura_bytes),
+                width=6.2 * cm,
+                height=2.2 * cm
+            )
+        except Exception:
+            assinatura_img = None
+
+    # Registros antigos: PNG solto em static/assinaturas.
+    if not assinatura_img and getattr(requisicao, "assinatura_path", None):
 
         assinatura_abs = os.path.join(
             current_app.root_path,
@@ -280,21 +343,6 @@ def _build_requisition_pdf(requisicao) -> bytes:
                 height=2.2 * cm
             )
 
-    if not assinatura_img and getattr(requisicao, "assinatura_base64", None):
-        assinatura_base64 = requisicao.assinatura_base64
-        if "," in assinatura_base64:
-            assinatura_base64 = assinatura_base64.split(",", 1)[1]
-
-        try:
-            assinatura_bytes = base64.b64decode(assinatura_base64)
-            assinatura_img = Image(
-                BytesIO(assinatura_bytes),
-                width=6.2 * cm,
-                height=2.2 * cm
-            )
-        except Exception:
-            assinatura_img = None
-
     titulo_ass = Table(
         [["ASSINATURA DO TÉCNICO"]],
         colWidths=[17.5 * cm]
@@ -366,78 +414,64 @@ def _build_requisition_pdf(requisicao) -> bytes:
 # ENVIO DE E-MAIL - REQUISIÇÃO MOBILE
 # ==========================================================
 
-def send_requisition_email(requisicao, attach_pdf: bool = True) -> bool:
-    try:
-        tecnico_nome = (requisicao.solicitante_tecnico or "").strip()
+def _mensagem_requisicao(requisicao, attach_pdf: bool = True):
+    tecnico_nome = (requisicao.solicitante_tecnico or "").strip()
 
-        dest_email = None
+    dest_email = None
 
-        if tecnico_nome:
-            tecnico = Tecnico.query.filter_by(nome=tecnico_nome).first()
+    if tecnico_nome:
+        tecnico = Tecnico.query.filter_by(nome=tecnico_nome).first()
 
-            if tecnico and tecnico.email:
-                dest_email = tecnico.email
-
-        if not dest_email:
-            dest_email = current_app.config.get("MAIL_USERNAME")
-
-        assunto = (
-            f"[LogiStock] Comprovante de Entrega de Material "
-            f"#{requisicao.id}"
-        )
+        if tecnico and tecnico.email:
+            dest_email = tecnico.email
 
-        msg = Message(
-            subject=assunto,
-            recipients=[dest_email],
-        )
+    if not dest_email:
+        dest_email = current_app.config.get("MAIL_USERNAME")
 
-        msg.body = (
-            f"Olá, {tecnico_nome or 'Técnico'}.\n\n"
-            f"Segue em anexo o comprovante de entrega de material "
-            f"referente à requisição #{requisicao.id}.\n\n"
-            "Documento gerado automaticamente pelo LogiStock."
-        )
+    assunto = (
+        f"[LogiStock] Comprovante de Entrega de Material "
+        f"#{requisicao.id}"
+    )
 
-        msg.html = (
-            f"<p>Olá, <b>{tecnico_nome or 'Técnico'}</b>.</p>"
-            f"<p>Segue em anexo o comprovante de entrega de material "
-            f"referente à requisição <b>#{requisicao.id}</b>.</p>"
-            "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
-        )
+    msg = Message(
+        subject=assunto,
+        recipients=[dest_email],
+    )
 
-        cc_cfg = current_app.config.get("MAIL_CC_DEFAULT")
+    msg.body = (
+        f"Olá, {tecnico_nome or 'Técnico'}.\n\n"
+        f"Segue em anexo o comprovante de entrega de material "
+        f"referente à requisição #{requisicao.id}.\n\n"
+        "Documento gerado automaticamente pelo LogiStock."
+    )
 
-        if cc_cfg:
-            msg.cc = [cc_cfg] if isinstance(cc_cfg, str) else list(cc_cfg)
+    msg.html = (
+        f"<p>Olá, <b>{tecnico_nome or 'Técnico'}</b>.</p>"
+        f"<p>Segue em anexo o comprovante de entrega de material "
+        f"referente à requisição <b>#{requisicao.id}</b>.</p>"
+        "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
+    )
 
-        if attach_pdf:
-            pdf_bytes = _build_requisition_pdf(requisicao)
-            filename = f"comprovante_entrega_material_{requisicao.id}.pdf"
+    cc_cfg = current_app.config.get("MAIL_CC_DEFAULT")
 
-            msg.attach(
-                filename,
-                "application/pdf",
-                pdf_bytes,
-            )
+    if cc_cfg:
+        msg.cc = [cc_cfg] if isinstance(cc_cfg, str) else list(cc_cfg)
 
-        mail.send(msg)
+    if attach_pdf:
+        pdf_bytes = _build_requisition_pdf(requisicao)
+        filename = f"comprovante_entrega_material_{requisicao.id}.pdf"
 
-        current_app.logger.info(
-            "Email da requisição %s enviado para %s",
-            requisicao.id,
-            dest_email,
+        msg.attach(
+            filename,
+            "application/pdf",
+            pdf_bytes,
         )
 
-        return True
+    return msg
 
-    except Exception as e:
-        current_app.logger.exception(
-            "Falha ao enviar e-mail da requisição %s: %s",
-            requisicao.id,
-            e,
-        )
 
-        return False
+def send_requisition_email(requisicao, attach_pdf: bool = True) -> bool:
+    return _enfileirar("requisicao", requisicao, attach_pdf=attach_pdf)
 
 
 # ==========================================================
@@ -450,6 +484,51 @@ def _build_baixa_pdf(
     motivo: str = "",
     aprovacoes=None
 ) -> bytes:
+    if aprovacoes is not None:
+        itens = [
+            [item_baixa, item_baixa.item, quantidade]
+            for item_baixa, quantidade in aprovacoes
+        ]
+    else:
+        itens = [[item_baixa, item_baixa.item] for item_baixa in baixa.itens]
+
+    return documento_pdf(
+        f"baixa_{situacao.lower() or 'padrao'}",
+        baixa.id,
+        VERSAO_LAYOUT_PDF,
+        [
+            baixa,
+            baixa.tecnico,
+            baixa.cliente,
+            baixa.tipo_servico,
+            baixa.ordem_servico,
+            motivo,
+            aprovacoes is not None,
+            itens,
+        ],
+        lambda: _desenhar_baixa_pdf(baixa, situacao, motivo, aprovacoes),
+    )
+
+
+def _desenhar_baixa_pdf(
+    baixa,
+    situacao: str = "",
+    motivo: str = "",
+    aprovacoes=None
+) -> bytes:
+
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.platypus import (
+        SimpleDocTemplate,
+        Paragraph,
+        Spacer,
+        Table,
+        TableStyle,
+        Image,
+    )
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
 
     buf = BytesIO()
 
@@ -734,178 +813,202 @@ def _build_baixa_pdf(
 # ENVIO DE E-MAIL - BAIXA TÉCNICA APROVADA
 # ==========================================================
 
-def send_baixa_aprovada_email(baixa, aprovacoes=None, attach_pdf: bool = True) -> bool:
-    try:
-        tecnico = getattr(baixa, "tecnico", None)
-
-        dest_email = None
+def _mensagem_baixa_aprovada(baixa, aprovacoes=None, attach_pdf: bool = True):
+    tecnico = getattr(baixa, "tecnico", None)
 
-        if tecnico and getattr(tecnico, "email", None):
-            dest_email = tecnico.email
-
-        if not dest_email:
-            dest_email = current_app.config.get("MAIL_USERNAME")
+    dest_email = None
 
-        tecnico_nome = getattr(tecnico, "nome", "Técnico") if tecnico else "Técnico"
-        tipo_nome = getattr(baixa.tipo_servico, "nome", "") if hasattr(baixa, "tipo_servico") else ""
-        data_hora = (
-            baixa.data_hora.strftime("%d/%m/%Y %H:%M")
-            if getattr(baixa, "data_hora", None)
-            else ""
-        )
+    if tecnico and getattr(tecnico, "email", None):
+        dest_email = tecnico.email
 
-        assunto = f"[LogiStock] Baixa Técnica #{baixa.id} CONFIRMADA"
+    if not dest_email:
+        dest_email = current_app.config.get("MAIL_USERNAME")
 
-        msg = Message(
-            subject=assunto,
-            recipients=[dest_email],
-        )
+    tecnico_nome = getattr(tecnico, "nome", "Técnico") if tecnico else "Técnico"
+    tipo_nome = getattr(baixa.tipo_servico, "nome", "") if hasattr(baixa, "tipo_servico") else ""
+    data_hora = (
+        baixa.data_hora.strftime("%d/%m/%Y %H:%M")
+        if getattr(baixa, "data_hora", None)
+        else ""
+    )
 
-        msg.body = (
-            f"Olá, {tecnico_nome}.\n\n"
-            f"Sua baixa técnica #{baixa.id} foi CONFIRMADA.\n"
-            f"Tipo de Serviço: {tipo_nome}\n"
-            f"Data/Hora: {data_hora or '-'}\n"
-            f"Responsável: {baixa.responsavel or '-'}\n\n"
-            "Documento gerado automaticamente pelo LogiStock."
-        )
+    assunto = f"[LogiStock] Baixa Técnica #{baixa.id} CONFIRMADA"
 
-        msg.html = (
-            f"<p>Olá, <b>{tecnico_nome}</b>.</p>"
-            f"<p>Sua baixa técnica <b>#{baixa.id}</b> foi "
-            "<span style='color:#070'><b>CONFIRMADA</b></span>.</p>"
-            "<ul style='margin:0;padding-left:18px'>"
-            f"<li><b>Tipo de Serviço:</b> {tipo_nome}</li>"
-            f"<li><b>Data/Hora:</b> {data_hora or '-'}</li>"
-            f"<li><b>Responsável:</b> {baixa.responsavel or '-'}</li>"
-            "</ul>"
-            "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
-        )
+    msg = Message(
+        subject=assunto,
+        recipients=[dest_email],
+    )
 
-        cc_cfg = current_app.config.get("MAIL_CC_DEFAULT")
+    msg.body = (
+        f"Olá, {tecnico_nome}.\n\n"
+        f"Sua baixa técnica #{baixa.id} foi CONFIRMADA.\n"
+        f"Tipo de Serviço: {tipo_nome}\n"
+        f"Data/Hora: {data_hora or '-'}\n"
+        f"Responsável: {baixa.responsavel or '-'}\n\n"
+        "Documento gerado automaticamente pelo LogiStock."
+    )
 
-        if cc_cfg:
-            msg.cc = [cc_cfg] if isinstance(cc_cfg, str) else list(cc_cfg)
+    msg.html = (
+        f"<p>Olá, <b>{tecnico_nome}</b>.</p>"
+        f"<p>Sua baixa técnica <b>#{baixa.id}</b> foi "
+        "<span style='color:#070'><b>CONFIRMADA</b></span>.</p>"
+        "<ul style='margin:0;padding-left:18px'>"
+        f"<li><b>Tipo de Serviço:</b> {tipo_nome}</li>"
+        f"<li><b>Data/Hora:</b> {data_hora or '-'}</li>"
+        f"<li><b>Responsável:</b> {baixa.responsavel or '-'}</li>"
+        "</ul>"
+        "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
+    )
 
-        if attach_pdf:
-            pdf_bytes = _build_baixa_pdf(
-                baixa,
-                situacao="CONFIRMADA",
-                aprovacoes=aprovacoes,
-            )
+    cc_cfg = current_app.config.get("MAIL_CC_DEFAULT")
 
-            filename = f"comprovante_baixa_{baixa.id}_confirmada.pdf"
+    if cc_cfg:
+        msg.cc = [cc_cfg] if isinstance(cc_cfg, str) else list(cc_cfg)
 
-            msg.attach(
-                filename,
-                "application/pdf",
-                pdf_bytes,
-            )
+    if attach_pdf:
+        pdf_bytes = _build_baixa_pdf(
+            baixa,
+            situacao="CONFIRMADA",
+            aprovacoes=aprovacoes,
+        )
 
-        mail.send(msg)
+        filename = f"comprovante_baixa_{baixa.id}_confirmada.pdf"
 
-        current_app.logger.info(
-            "Email de aprovação da baixa %s enviado para %s",
-            baixa.id,
-            dest_email,
+        msg.attach(
+            filename,
+            "application/pdf",
+            pdf_bytes,
         )
 
-        return True
+    return msg
 
-    except Exception as e:
-        current_app.logger.exception(
-            "Falha ao enviar e-mail de aprovação da baixa %s: %s",
-            baixa.id,
-            e,
-        )
 
-        return False
+def send_baixa_aprovada_email(baixa, aprovacoes=None, attach_pdf: bool = True) -> bool:
+    if aprovacoes is not None:
+        aprovacoes = [
+            [item_baixa.id, quantidade]
+            for item_baixa, quantidade in aprovacoes
+        ]
+
+    return _enfileirar(
+        "baixa_aprovada",
+        baixa,
+        aprovacoes=aprovacoes,
+        attach_pdf=attach_pdf,
+    )
 
 
 # ==========================================================
 # ENVIO DE E-MAIL - BAIXA TÉCNICA RECUSADA
 # ==========================================================
 
-def send_baixa_recusa_email(baixa, motivo: str = "", attach_pdf: bool = True) -> bool:
-    try:
-        tecnico = getattr(baixa, "tecnico", None)
-
-        dest_email = None
-
-        if tecnico and getattr(tecnico, "email", None):
-            dest_email = tecnico.email
+def _mensagem_baixa_recusa(baixa, motivo: str = "", attach_pdf: bool = True):
+    tecnico = getattr(baixa, "tecnico", None)
 
-        if not dest_email:
-            dest_email = current_app.config.get("MAIL_USERNAME")
+    dest_email = None
 
-        tecnico_nome = getattr(tecnico, "nome", "Técnico") if tecnico else "Técnico"
+    if tecnico and getattr(tecnico, "email", None):
+        dest_email = tecnico.email
 
-        assunto = f"[LogiStock] Baixa Técnica #{baixa.id} RECUSADA"
+    if not dest_email:
+        dest_email = current_app.config.get("MAIL_USERNAME")
 
-        msg = Message(
-            subject=assunto,
-            recipients=[dest_email],
-        )
+    tecnico_nome = getattr(tecnico, "nome", "Técnico") if tecnico else "Técnico"
 
-        msg.body = (
-            f"Olá, {tecnico_nome}.\n\n"
-            f"Sua baixa técnica #{baixa.id} foi RECUSADA.\n"
-            f"Motivo: {motivo or '-'}\n\n"
-            "Documento gerado automaticamente pelo LogiStock."
-        )
+    assunto = f"[LogiStock] Baixa Técnica #{baixa.id} RECUSADA"
 
-        msg.html = (
-            f"<p>Olá, <b>{tecnico_nome}</b>.</p>"
-            f"<p>Sua baixa técnica <b>#{baixa.id}</b> foi "
-            "<span style='color:#a00'><b>RECUSADA</b></span>.</p>"
-            f"<p><b>Motivo:</b> {motivo or '-'}</p>"
-            "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
-        )
+    msg = Message(
+        subject=assunto,
+        recipients=[dest_email],
+    )
 
-        cc_cfg = current_app.config.get("MAIL_CC_DEFAULT")
+    msg.body = (
+        f"Olá, {tecnico_nome}.\n\n"
+        f"Sua baixa técnica #{baixa.id} foi RECUSADA.\n"
+        f"Motivo: {motivo or '-'}\n\n"
+        "Documento gerado automaticamente pelo LogiStock."
+    )
 
-        if cc_cfg:
-            msg.cc = [cc_cfg] if isinstance(cc_cfg, str) else list(cc_cfg)
+    msg.html = (
+        f"<p>Olá, <b>{tecnico_nome}</b>.</p>"
+        f"<p>Sua baixa técnica <b>#{baixa.id}</b> foi "
+        "<span style='color:#a00'><b>RECUSADA</b></span>.</p>"
+        f"<p><b>Motivo:</b> {motivo or '-'}</p>"
+        "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
+    )
 
-        if attach_pdf:
-            pdf_bytes = _build_baixa_pdf(
-                baixa,
-                situacao="RECUSADA",
-                motivo=motivo,
-            )
+    cc_cfg = current_app.config.get("MAIL_CC_DEFAULT")
 
-            filename = f"comprovante_baixa_{baixa.id}_recusada.pdf"
+    if cc_cfg:
+        msg.cc = [cc_cfg] if isinstance(cc_cfg, str) else list(cc_cfg)
 
-            msg.attach(
-                filename,
-                "application/pdf",
-                pdf_bytes,
-            )
+    if attach_pdf:
+        pdf_bytes = _build_baixa_pdf(
+            baixa,
+            situacao="RECUSADA",
+            motivo=motivo,
+        )
 
-        mail.send(msg)
+        filename = f"comprovante_baixa_{baixa.id}_recusada.pdf"
 
-        current_app.logger.info(
-            "Email de recusa da baixa %s enviado para %s",
-            baixa.id,
-            dest_email,
+        msg.attach(
+            filename,
+            "application/pdf",
+            pdf_bytes,
         )
 
-        return True
+    return msg
 
-    except Exception as e:
-        current_app.logger.exception(
-            "Falha ao enviar e-mail de recusa da baixa %s: %s",
-            baixa.id,
-            e,
-        )
 
-        return False
+def send_baixa_recusa_email(baixa, motivo: str = "", attach_pdf: bool = True) -> bool:
+    return _enfileirar(
+        "baixa_recusada",
+        baixa,
+        motivo=motivo,
+        attach_pdf=attach_pdf,
+    )
     
 # ==========================================================
 # ENVIO DE E-MAIL - MOVIMENTAÇÃO DE ESTOQUE
 # ==========================================================
 
 def _build_movimentacao_pdf(movimentacao) -> bytes:
+    tecnico = None
+
+    if movimentacao.destino_tipo == "tecnico":
+        tecnico = Tecnico.query.get(movimentacao.destino_id)
+    elif movimentacao.origem_tipo == "tecnico":
+        tecnico = Tecnico.query.get(movimentacao.origem_id)
+
+    return documento_pdf(
+        "movimentacao",
+        movimentacao.id,
+        VERSAO_LAYOUT_PDF,
+        [
+            # Envio do e-mail não muda o documento.
+            colunas_registro(movimentacao, "email_enviado", "data_envio_email", "termo_pdf"),
+            movimentacao.tipo_servico,
+            tecnico,
+            [[item, item.item] for item in movimentacao.itens],
+        ],
+        lambda: _desenhar_movimentacao_pdf(movimentacao),
+    )
+
+
+def _desenhar_movimentacao_pdf(movimentacao) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib import colors
+    from reportlab.platypus import (
+        SimpleDocTemplate,
+        Paragraph,
+        Spacer,
+        Table,
+        TableStyle,
+        Image,
+    )
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+
     buf = BytesIO()
 
     doc = SimpleDocTemplate(
@@ -1152,16 +1255,7 @@ def _build_movimentacao_pdf(movimentacao) -> bytes:
     if movimentacao.assinatura:
 
         try:
-            import base64
-
-            assinatura_data = movimentacao.assinatura
-
-            if "," in assinatura_data:
-                assinatura_data = assinatura_data.split(",", 1)[1]
-
-            assinatura_bytes = base64.b64decode(
-                assinatura_data
-            )
+            assinatura_bytes = ler_assinatura(movimentacao.assinatura)
 
             assinatura_img = Image(
                 BytesIO(assinatura_bytes),
@@ -1226,129 +1320,134 @@ def _build_movimentacao_pdf(movimentacao) -> bytes:
     return pdf_bytes
 
 
-def send_movimentacao_email(movimentacao, attach_pdf=False):
-    try:
+def _mensagem_movimentacao(movimentacao, attach_pdf=False):
 
-        tecnico = None
+    tecnico = None
 
-        if movimentacao.destino_tipo == "tecnico":
-            tecnico = Tecnico.query.get(
-                movimentacao.destino_id
-            )
+    if movimentacao.destino_tipo == "tecnico":
+        tecnico = Tecnico.query.get(
+            movimentacao.destino_id
+        )
 
-        elif movimentacao.origem_tipo == "tecnico":
-            tecnico = Tecnico.query.get(
-                movimentacao.origem_id
-            )
+    elif movimentacao.origem_tipo == "tecnico":
+        tecnico = Tecnico.query.get(
+            movimentacao.origem_id
+        )
 
-        if not tecnico:
-            return False
+    if not tecnico:
+        return None
 
-        if not tecnico.email:
-            return False
+    if not tecnico.email:
+        return None
 
-        assunto = (
-            f"[LogiStock] Comprovante de Movimentação "
-            f"#{movimentacao.id}"
-        )
+    assunto = (
+        f"[LogiStock] Comprovante de Movimentação "
+        f"#{movimentacao.id}"
+    )
 
-        msg = Message(
-            subject=assunto,
-            recipients=[tecnico.email]
-        )
+    msg = Message(
+        subject=assunto,
+        recipients=[tecnico.email]
+    )
+
+    msg.body = (
+        f"Olá, {tecnico.nome}.\n\n"
+        f"Sua movimentação #{movimentacao.id} foi registrada com sucesso.\n\n"
+        "Documento gerado automaticamente pelo LogiStock."
+    )
 
-        msg.body = (
-            f"Olá, {tecnico.nome}.\n\n"
-            f"Sua movimentação #{movimentacao.id} foi registrada com sucesso.\n\n"
-            "Documento gerado automaticamente pelo LogiStock."
+    msg.html = (
+        f"<p>Olá, <b>{tecnico.nome}</b>.</p>"
+        f"<p>Sua movimentação <b>#{movimentacao.id}</b> foi registrada com sucesso.</p>"
+        "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
+    )
+
+    if attach_pdf:
+        pdf_bytes = _build_movimentacao_pdf(
+            movimentacao
         )
 
-        msg.html = (
-            f"<p>Olá, <b>{tecnico.nome}</b>.</p>"
-            f"<p>Sua movimentação <b>#{movimentacao.id}</b> foi registrada com sucesso.</p>"
-            "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
+        msg.attach(
+            f"comprovante_movimentacao_{movimentacao.id}.pdf",
+            "application/pdf",
+            pdf_bytes
         )
 
-        if attach_pdf:
-            pdf_bytes = _build_movimentacao_pdf(
-                movimentacao
-            )
+    return msg
 
-            msg.attach(
-                f"comprovante_movimentacao_{movimentacao.id}.pdf",
-                "application/pdf",
-                pdf_bytes
-            )
 
-        mail.send(msg)
+def send_movimentacao_email(movimentacao, attach_pdf=False):
+    tecnico_id = (
+        movimentacao.destino_id
+        if movimentacao.destino_tipo == "tecnico"
+        else movimentacao.origem_id
+        if movimentacao.origem_tipo == "tecnico"
+        else None
+    )
 
-        return True
-
-    except Exception as e:
-        current_app.logger.exception(
-            "Erro ao enviar e-mail movimentação: %s",
-            e
-        )
+    tecnico = Tecnico.query.get(tecnico_id) if tecnico_id else None
 
+    # Sem e-mail do técnico não há destinatário: nem entra na fila.
+    if not tecnico or not tecnico.email:
         return False
+
+    return _enfileirar("movimentacao", movimentacao, attach_pdf=attach_pdf)
     
     # ==========================================================
 # ENVIO DE E-MAIL - TERMO FERRAMENTAS / EPIs
 # ==========================================================
 
-def send_termo_ferramenta_email(historico) -> bool:
-    try:
-        tecnico = historico.tecnico
+def _mensagem_termo_ferramenta(historico):
+    tecnico = historico.tecnico
 
-        if not tecnico or not tecnico.email:
-            return False
+    if not tecnico or not tecnico.email:
+        return None
 
-        if not historico.termo_pdf:
-            return False
+    caminho_pdf = historico.termo_pdf and os.path.join(
+        current_app.root_path,
+        "static",
+        historico.termo_pdf
+    )
 
-        caminho_pdf = os.path.join(
-            current_app.root_path,
-            "static",
-            historico.termo_pdf
-        )
+    # O termo é gerado logo depois do commit que enfileira o e-mail: o
+    # worker pode chegar antes. Erro (e não None) para a fila tentar de novo.
+    if not caminho_pdf or not os.path.exists(caminho_pdf):
+        raise RuntimeError(f"Termo #{historico.id} ainda não gerado.")
 
-        if not os.path.exists(caminho_pdf):
-            return False
+    assunto = f"[LogiStock] Termo de Ferramentas / EPIs #{historico.id}"
 
-        assunto = f"[LogiStock] Termo de Ferramentas / EPIs #{historico.id}"
+    msg = Message(
+        subject=assunto,
+        recipients=[tecnico.email]
+    )
 
-        msg = Message(
-            subject=assunto,
-            recipients=[tecnico.email]
-        )
+    msg.body = (
+        f"Olá, {tecnico.nome}.\n\n"
+        f"Segue em anexo o termo referente à movimentação de Ferramentas / EPIs #{historico.id}.\n\n"
+        "Documento gerado automaticamente pelo LogiStock."
+    )
 
-        msg.body = (
-            f"Olá, {tecnico.nome}.\n\n"
-            f"Segue em anexo o termo referente à movimentação de Ferramentas / EPIs #{historico.id}.\n\n"
-            "Documento gerado automaticamente pelo LogiStock."
-        )
+    msg.html = (
+        f"<p>Olá, <b>{tecnico.nome}</b>.</p>"
+        f"<p>Segue em anexo o termo referente à movimentação de "
+        f"Ferramentas / EPIs <b>#{historico.id}</b>.</p>"
+        "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
+    )
 
-        msg.html = (
-            f"<p>Olá, <b>{tecnico.nome}</b>.</p>"
-            f"<p>Segue em anexo o termo referente à movimentação de "
-            f"Ferramentas / EPIs <b>#{historico.id}</b>.</p>"
-            "<p><i>Documento gerado automaticamente pelo LogiStock.</i></p>"
+    with open(caminho_pdf, "rb") as f:
+        msg.attach(
+            f"termo_ferramenta_epi_{historico.id}.pdf",
+            "application/pdf",
+            f.read()
         )
 
-        with open(caminho_pdf, "rb") as f:
-            msg.attach(
-                f"termo_ferramenta_epi_{historico.id}.pdf",
-                "application/pdf",
-                f.read()
-            )
+    return msg
 
-        mail.send(msg)
 
-        return True
+def send_termo_ferramenta_email(historico) -> bool:
+    tecnico = historico.tecnico
 
-    except Exception as e:
-        current_app.logger.exception(
-            "Erro ao enviar termo de ferramentas por e-mail: %s",
-            e
-        )
+    if not tecnico or not tecnico.email:
         return False
+
+    return _enfileirar("termo_ferramenta", historico)
@@ -0,0 +1,451 @@
+# app/utils/razao_estoque.py
+#
+# Razão do estoque: lançamentos imutáveis (RazaoEstoque) gravados no
+# after_flush de toda sessão que altera a quantidade de Estoque ou
+# SaldoTecnico, mais pontos de controle (RazaoSnapshot) para responder
+# "quanto havia na data D" somando snapshot + lançamentos posteriores,
+# sem reprocessar o histórico inteiro.
+
+from datetime import datetime, timedelta
+
+from flask import has_request_context, request
+from flask_login import current_user
+from sqlalchemy import event, func, insert, literal, null, select, union_all
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import (
+    BaixaTecnica,
+    Estoque,
+    HistoricoEquipamento,
+    InventarioEstoque,
+    InventarioTecnico,
+    MovimentacaoEstoque,
+    NotaFiscalEntrada,
+    RazaoEstoque,
+    RazaoSnapshot,
+    RazaoSnapshotSaldo,
+    RequisicaoTecnico,
+    SaldoTecnico,
+    TransferenciaExterna,
+)
+
+
+SALDO_ESTOQUE = "estoque"
+SALDO_TECNICO = "tecnico"
+
+# Chave do saldo no razão e nos snapshots
+DIMENSOES = (
+    "saldo",
+    "item_id",
+    "tecnico_id",
+    "tipo_estoque",
+    "cliente_id",
+    "tipo_servico_id",
+    "ordem_servico_id",
+    "condicao_material",
+)
+
+# Documento de origem: o último documento conhecido gravado na mesma
+# transação vira o documento_tipo/documento_id dos lançamentos.
+DOCUMENTOS = {
+    MovimentacaoEstoque: "movimentacao",
+    BaixaTecnica: "baixa",
+    NotaFiscalEntrada: "nota_fiscal",
+    InventarioEstoque: "inventario_estoque",
+    InventarioTecnico: "inventario_tecnico",
+    RequisicaoTecnico: "requisicao",
+    HistoricoEquipamento: "ferramentas_epis",
+    TransferenciaExterna: "transferencia_externa",
+}
+
+# Lançamentos mais novos que isso ficam fora do snapshot: uma transação
+# ainda aberta pode ter reservado um id menor e gravar depois.
+MARGEM_SNAPSHOT = timedelta(minutes=5)
+
+ORIGEM_ABERTURA = "abertura"
+
+
+# ==========================================================
+# GRAVAÇÃO
+# ==========================================================
+
+def _chave(saldo, valor):
+    """Chave do lançamento; `valor(campo)` lê o campo do registro."""
+    estoque = saldo == SALDO_ESTOQUE
+
+    return {
+        "saldo": saldo,
+        "item_id": valor("item_id"),
+        "tecnico_id": None if estoque else valor("tecnico_id"),
+        "tipo_estoque": valor("tipo_estoque"),
+        "cliente_id": valor("cliente_id"),
+        "tipo_servico_id": valor("tipo_servico_id"),
+        "ordem_servico_id": None if estoque else valor("ordem_servico_id"),
+        "condicao_material": valor("condicao_material") if estoque else None,
+    }
+
+
+def _dimensoes(registro, anteriores=None):
+    anteriores = anteriores or {}
+    saldo = SALDO_ESTOQUE if isinstance(registro, Estoque) else SALDO_TECNICO
+
+    return _chave(
+        saldo,
+        lambda campo: anteriores[campo] if campo in anteriores else getattr(registro, campo, None)
+    )
+
+
+def _valores_anteriores(registro):
+    """Valores lidos do banco para os campos alterados desde o último flush."""
+    estado = db.inspect(registro)
+    anteriores = {}
+
+    for campo in DIMENSOES[1:] + ("quantidade",):
+        if campo not in estado.attrs:
+            continue
+
+        historico = estado.attrs[campo].history
+
+        if historico.has_changes() and historico.deleted:
+            anteriores[campo] = historico.deleted[0]
+
+    return anteriores
+
+
+def _lancamentos(registro, novo=False, excluido=False):
+    quantidade = int(registro.quantidade or 0)
+
+    if novo:
+        if quantidade:
+            yield _dimensoes(registro), quantidade, quantidade
+        return
+
+    anteriores = _valores_anteriores(registro)
+    quantidade_anterior = int(anteriores.get("quantidade", registro.quantidade) or 0)
+
+    if excluido:
+        if quantidade_anterior:
+            yield _dimensoes(registro, anteriores), -quantidade_anterior, 0
+        return
+
+    chave_anterior = _dimensoes(registro, anteriores)
+    chave_atual = _dimensoes(registro)
+
+    if chave_anterior != chave_atual:
+        # Mudou de item/técnico/cliente: sai de uma chave e entra na outra.
+        if quantidade_anterior:
+            yield chave_anterior, -quantidade_anterior, 0
+        if quantidade:
+            yield chave_atual, quantidade, quantidade
+        return
+
+    if quantidade != quantidade_anterior:
+        yield chave_atual, quantidade - quantidade_anterior, quantidade
+
+
+def _origem():
+    if not has_request_context():
+        return None, None
+
+    usuario_id = None
+
+    try:
+        if current_user and current_user.is_authenticated:
+            usuario_id = getattr(current_user, "id", None)
+    except Exception:
+        usuario_id = None
+
+    origem = f"{request.method} {request.path}"[:120]
+
+    return origem, usuario_id
+
+
+def _registrar_documentos(session):
+    # Documentos novos têm precedência sobre os apenas alterados.
+    for instancia in list(session.dirty) + list(session.new):
+        tipo = DOCUMENTOS.get(type(instancia))
+
+        if tipo and instancia.id:
+            session.info["razao_documento"] = (tipo, instancia.id)
+
+
+@event.listens_for(Session, "after_flush")
+def _gravar_razao_apos_flush(session, flush_context):
+    _registrar_documentos(session)
+
+    linhas = []
+    agora = datetime.utcnow()
+
+    grupos = (
+        (session.new, {"novo": True}),
+        (session.dirty, {}),
+        (session.deleted, {"excluido": True}),
+    )
+
+    for instancias, opcoes in grupos:
+        for registro in instancias:
+            if not isinstance(registro, (Estoque, SaldoTecnico)):
+                continue
+
+            for chave, delta, quantidade_apos in _lancamentos(registro, **opcoes):
+                linhas.append(dict(
+                    chave,
+                    data_hora=agora,
+                    saldo_id=registro.id,
+                    delta=delta,
+                    quantidade_apos=quantidade_apos,
+                ))
+
+    if not linhas:
+        return
+
+    documento_tipo, documento_id = session.info.get("razao_documento", (None, None))
+    origem, usuario_id = _origem()
+
+    for linha in linhas:
+        linha.update(
+            documento_tipo=documento_tipo,
+            documento_id=documento_id,
+            origem=origem,
+            usuario_id=usuario_id,
+        )
+
+    session.connection().execute(insert(RazaoEstoque.__table__), linhas)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _limpar_documento(session):
+    # Savepoint (begin_nested) não encerra o documento da transação.
+    if not session.in_nested_transaction():
+        session.info.pop("razao_documento", None)
+
+
+# ==========================================================
+# ABERTURA (SALDOS EXISTENTES ANTES DO RAZÃO)
+# ==========================================================
+
+def _select_abertura(modelo, agora):
+    estoque = modelo is Estoque
+
+    return select(
+        literal(agora).label("data_hora"),
+        literal(SALDO_ESTOQUE if estoque else SALDO_TECNICO).label("saldo"),
+        modelo.id.label("saldo_id"),
+        modelo.item_id,
+        (null() if estoque else modelo.tecnico_id).label("tecnico_id"),
+        modelo.tipo_estoque,
+        modelo.cliente_id,
+        modelo.tipo_servico_id,
+        (null() if estoque else modelo.ordem_servico_id).label("ordem_servico_id"),
+        (modelo.condicao_material if estoque else null()).label("condicao_material"),
+        modelo.quantidade.label("delta"),
+        modelo.quantidade.label("quantidade_apos"),
+        literal(ORIGEM_ABERTURA).label("origem"),
+    ).where(
+        modelo.quantidade.isnot(None),
+        modelo.quantidade != 0
+    )
+
+
+def razao_pendente(conexao):
+    """True quando há saldo gravado mas o razão ainda não tem lançamentos."""
+    if conexao.execute(select(RazaoEstoque.id).limit(1)).first():
+        return False
+
+    for modelo in (Estoque, SaldoTecnico):
+        if conexao.execute(
+            select(modelo.id).where(modelo.quantidade != 0).limit(1)
+        ).first():
+            return True
+
+    return False
+
+
+def abrir_razao(conexao):
+    """Lança os saldos atuais como abertura (uma vez, razão vazio)."""
+    agora = datetime.utcnow()
+    colunas = (
+        "data_hora", "saldo", "saldo_id", "item_id", "tecnico_id",
+        "tipo_estoque", "cliente_id", "tipo_servico_id", "ordem_servico_id",
+        "condicao_material", "delta", "quantidade_apos", "origem",
+    )
+
+    for modelo in (Estoque, SaldoTecnico):
+        conexao.execute(
+            insert(RazaoEstoque.__table__).from_select(
+                colunas,
+                _select_abertura(modelo, agora)
+            )
+        )
+
+
+# ==========================================================
+# SNAPSHOTS
+# ==========================================================
+
+def _colunas_dimensao(modelo):
+    return [getattr(modelo, campo) for campo in DIMENSOES]
+
+
+def ultimo_snapshot(conexao, ate=None):
+    query = select(RazaoSnapshot.__table__)
+
+    if ate is not None:
+        query = query.where(RazaoSnapshot.data_corte <= ate)
+
+    return conexao.execute(
+        query.order_by(RazaoSnapshot.ultimo_lancamento_id.desc()).limit(1)
+    ).mappings().first()
+
+
+def _select_saldos(snapshot, *condicoes, ate_id=None, ate_data=None):
+    """
+    Saldos por chave = linhas do snapshot + lançamentos com id maior que o
+    do snapshot (até `ate_id` / `ate_data`).
+    """
+    partes = []
+
+    if snapshot:
+        partes.append(
+            select(
+                *_colunas_dimensao(RazaoSnapshotSaldo),
+                RazaoSnapshotSaldo.quantidade.label("quantidade")
+            ).where(
+                RazaoSnapshotSaldo.snapshot_id == snapshot["id"],
+                *[condicao(RazaoSnapshotSaldo) for condicao in condicoes]
+            )
+        )
+
+    lancamentos = select(
+        *_colunas_dimensao(RazaoEstoque),
+        RazaoEstoque.delta.label("quantidade")
+    ).where(*[condicao(RazaoEstoque) for condicao in condicoes])
+
+    if snapshot:
+        lancamentos = lancamentos.where(
+            RazaoEstoque.id > snapshot["ultimo_lancamento_id"]
+        )
+
+    if ate_id is not None:
+        lancamentos = lancamentos.where(RazaoEstoque.id <= ate_id)
+
+    if ate_data is not None:
+        lancamentos = lancamentos.where(RazaoEstoque.data_hora <= ate_data)
+
+    partes.append(lancamentos)
+
+    uniao = union_all(*partes).subquery() if len(partes) > 1 else partes[0].subquery()
+    dimensoes = [uniao.c[campo] for campo in DIMENSOES]
+
+    return (
+        select(*dimensoes, func.sum(uniao.c.quantidade).label("quantidade"))
+        .group_by(*dimensoes)
+        .having(func.sum(uniao.c.quantidade) != 0)
+    )
+
+
+def criar_snapshot(conexao, agora=None):
+    """
+    Cria um ponto de controle com os lançamentos anteriores a
+    agora - MARGEM_SNAPSHOT, a partir do snapshot anterior.
+    Retorna o id do snapshot ou None se não houver lançamento novo.
+    """
+    agora = agora or datetime.utcnow()
+    anterior = ultimo_snapshot(conexao)
+    ultimo_anterior = anterior["ultimo_lancamento_id"] if anterior else 0
+
+    ultimo_id = conexao.execute(
+        select(func.max(RazaoEstoque.id)).where(
+            RazaoEstoque.id > ultimo_anterior,
+            RazaoEstoque.data_hora <= agora - MARGEM_SNAPSHOT
+        )
+    ).scalar()
+
+    if not ultimo_id:
+        return None
+
+    data_corte = conexao.execute(
+        select(func.max(RazaoEstoque.data_hora)).where(
+            RazaoEstoque.id > ultimo_anterior,
+            RazaoEstoque.id <= ultimo_id
+        )
+    ).scalar()
+
+    if anterior and anterior["data_corte"] > data_corte:
+        data_corte = anterior["data_corte"]
+
+    snapshot_id = conexao.execute(
+        insert(RazaoSnapshot.__table__).values(
+            ultimo_lancamento_id=ultimo_id,
+            data_corte=data_corte,
+            criado_em=agora,
+        )
+    ).inserted_primary_key[0]
+
+    saldos = _select_saldos(anterior, ate_id=ultimo_id).subquery()
+
+    conexao.execute(
+        insert(RazaoSnapshotSaldo.__table__).from_select(
+            ("snapshot_id",) + DIMENSOES + ("quantidade",),
+            select(
+                literal(snapshot_id),
+                *[saldos.c[campo] for campo in DIMENSOES],
+                saldos.c.quantidade
+            )
+        )
+    )
+
+    return snapshot_id
+
+
+# ==========================================================
+# CONSULTAS
+# ==========================================================
+
+def filtro(campo, valor):
+    """Condição aplicável tanto a RazaoEstoque quanto a RazaoSnapshotSaldo."""
+    return lambda modelo: getattr(modelo, campo) == valor
+
+
+def saldos_em(data_hora, *condicoes, conexao=None):
+    """
+    Saldos por chave na data/hora informada (inclusive), usando o último
+    snapshot anterior a ela mais os lançamentos seguintes.
+    Retorna (snapshot, linhas).
+    """
+    conexao = conexao or db.session.connection()
+    snapshot = ultimo_snapshot(conexao, ate=data_hora)
+
+    linhas = conexao.execute(
+        _select_saldos(snapshot, *condicoes, ate_data=data_hora)
+    ).mappings().all()
+
+    return snapshot, linhas
+
+
+def verificar_razao(conexao):
+    """
+    Compara o saldo atual de Estoque/SaldoTecnico com a soma do razão.
+    Retorna a lista de divergências (chave, saldo_atual, saldo_razao).
+    """
+    atuais = {}
+
+    for modelo, saldo in ((Estoque, SALDO_ESTOQUE), (SaldoTecnico, SALDO_TECNICO)):
+        for registro in conexao.execute(select(modelo.__table__)).mappings():
+            chave = tuple(_chave(saldo, registro.get).values())
+            atuais[chave] = atuais.get(chave, 0) + int(registro["quantidade"] or 0)
+
+    razao = {
+        tuple(linha[campo] for campo in DIMENSOES): int(linha["quantidade"])
+        for linha in conexao.execute(
+            _select_saldos(ultimo_snapshot(conexao))
+        ).mappings()
+    }
+
+    return [
+        (chave, atuais.get(chave, 0), razao.get(chave, 0))
+        for chave in sorted(set(atuais) | set(razao), key=repr)
+        if atuais.get(chave, 0) != razao.get(chave, 0)
+    ]
@@ -0,0 +1,219 @@
+# app/utils/resumo_estoque.py
+#
+# Manutenção da tabela estoque_resumo (EstoqueResumo).
+#
+# Toda sessão que grava Estoque pelo ORM recalcula, no after_flush (mesma
+# transação), as linhas de resumo dos itens alterados: DELETE + INSERT ...
+# SELECT agrupado sobre os poucos registros de Estoque desses itens.
+# UPDATE/DELETE em massa (query.update/delete) não passam pelo flush e
+# precisam chamar `atualizar_resumo_itens` explicitamente.
+
+from sqlalchemy import case, delete, event, func, insert, or_, select
+from sqlalchemy.orm import Session
+
+from app.extensions import db
+from app.models import Estoque, EstoqueResumo, Item
+
+
+TAMANHO_LOTE = 500
+
+CHAVE = ('item_id', 'tipo_estoque', 'cliente_id', 'tipo_servico_id')
+
+QUANTIDADES = ('disponivel', 'usado_bom', 'novo_defeito', 'usado_defeito', 'total')
+
+CAMPOS_MAXIMOS = ('valor_unitario', 'quantidade_minima', 'endereco')
+
+# Colunas do Estoque que mudam o resumo (versao muda em todo UPDATE e
+# não interessa aqui).
+CAMPOS_MONITORADOS = CHAVE + ('quantidade', 'condicao_material') + CAMPOS_MAXIMOS
+
+
+def _soma_quando(condicao):
+    return func.coalesce(
+        func.sum(case((condicao, Estoque.quantidade), else_=0)),
+        0
+    )
+
+
+def _select_resumo(*condicoes):
+    colunas_chave = [getattr(Estoque, campo) for campo in CHAVE]
+
+    return (
+        select(
+            *colunas_chave,
+            _soma_quando(
+                or_(
+                    Estoque.condicao_material.is_(None),
+                    Estoque.condicao_material == '',
+                    Estoque.condicao_material == 'DISPONIVEL'
+                )
+            ).label('disponivel'),
+            _soma_quando(Estoque.condicao_material == 'USADO_BOM').label('usado_bom'),
+            _soma_quando(Estoque.condicao_material == 'NOVO_DEF').label('novo_defeito'),
+            _soma_quando(Estoque.condicao_material == 'USADO_DEF').label('usado_defeito'),
+            func.coalesce(func.sum(Estoque.quantidade), 0).label('total'),
+            func.max(Estoque.valor_unitario).label('valor_unitario'),
+            func.max(Estoque.quantidade_minima).label('quantidade_minima'),
+            func.max(Estoque.endereco).label('endereco'),
+        )
+        .where(Estoque.item_id.isnot(None), *condicoes)
+        .group_by(*colunas_chave)
+    )
+
+
+def _inserir_resumo(conexao, *condicoes):
+    conexao.execute(
+        insert(EstoqueResumo.__table__).from_select(
+            CHAVE + QUANTIDADES + CAMPOS_MAXIMOS,
+            _select_resumo(*condicoes)
+        )
+    )
+
+
+def _bloquear_itens(conexao, item_ids):
+    """
+    No PostgreSQL duas transações recalculando o mesmo item poderiam
+    duplicar linhas (cada DELETE só enxerga o snapshot do próprio
+    comando). O FOR UPDATE na linha do item serializa o recálculo.
+    O SQLite já serializa as escritas.
+    """
+    if conexao.dialect.name != 'postgresql':
+        return
+
+    conexao.execute(
+        select(Item.id)
+        .where(Item.id.in_(item_ids))
+        .order_by(Item.id)
+        .with_for_update()
+    )
+
+
+def atualizar_resumo_itens(item_ids, conexao=None):
+    """
+    Recalcula as linhas de resumo dos itens informados a partir do
+    Estoque atual, na transação da conexão (padrão: a da db.session).
+    """
+    item_ids = sorted({int(item_id) for item_id in item_ids if item_id})
+
+    if not item_ids:
+        return
+
+    conexao = conexao or db.session.connection()
+
+    for inicio in range(0, len(item_ids), TAMANHO_LOTE):
+        lote = item_ids[inicio:inicio + TAMANHO_LOTE]
+
+        _bloquear_itens(conexao, lote)
+
+        conexao.execute(
+            delete(EstoqueResumo.__table__)
+            .where(EstoqueResumo.item_id.in_(lote))
+        )
+
+        _inserir_resumo(conexao, Estoque.item_id.in_(lote))
+
+
+def reconstruir_resumo(conexao):
+    conexao.execute(delete(EstoqueResumo.__table__))
+    _inserir_resumo(conexao)
+
+
+def resumo_pendente(conexao):
+    """True quando há estoque mas o resumo está vazio (tabela recém-criada)."""
+    tem_estoque = conexao.execute(
+        select(Estoque.id).where(Estoque.item_id.isnot(None)).limit(1)
+    ).first()
+
+    if not tem_estoque:
+        return False
+
+    return not conexao.execute(select(EstoqueResumo.id).limit(1)).first()
+
+
+def _normalizar(linha):
+    chave = tuple(linha[campo] for campo in CHAVE)
+
+    valores = tuple(int(linha[campo] or 0) for campo in QUANTIDADES) + (
+        round(float(linha['valor_unitario']), 6)
+        if linha['valor_unitario'] is not None else None,
+        linha['quantidade_minima'],
+        linha['endereco'],
+    )
+
+    return chave, valores
+
+
+def verificar_resumo(conexao):
+    """
+    Compara o resumo gravado com o recalculado a partir do Estoque.
+    Retorna a lista de divergências (chave, esperado, gravado).
+    """
+    esperado = {}
+
+    for linha in conexao.execute(_select_resumo()).mappings():
+        chave, valores = _normalizar(linha)
+        esperado[chave] = valores
+
+    gravado = {}
+    duplicadas = []
+
+    colunas = [
+        getattr(EstoqueResumo, campo)
+        for campo in CHAVE + QUANTIDADES + CAMPOS_MAXIMOS
+    ]
+
+    for linha in conexao.execute(select(*colunas)).mappings():
+        chave, valores = _normalizar(linha)
+
+        if chave in gravado:
+            duplicadas.append((chave, None, valores))
+
+        gravado[chave] = valores
+
+    divergencias = [
+        (chave, esperado.get(chave), gravado.get(chave))
+        for chave in sorted(set(esperado) | set(gravado), key=repr)
+        if esperado.get(chave) != gravado.get(chave)
+    ]
+
+    return duplicadas + divergencias
+
+
+def _valores_alterados(estoque):
+    """Valores (antigos e novos) de item_id de um Estoque que mudou o resumo."""
+    estado = db.inspect(estoque)
+    item_ids = set()
+    mudou = False
+
+    for campo in CAMPOS_MONITORADOS:
+        historico = estado.attrs[campo].history
+
+        if historico.has_changes():
+            mudou = True
+
+            if campo == 'item_id':
+                item_ids.update(historico.deleted or ())
+
+    if mudou:
+        item_ids.add(estoque.item_id)
+
+    return item_ids
+
+
+@event.listens_for(Session, 'after_flush')
+def _atualizar_resumo_apos_flush(session, flush_context):
+    item_ids = set()
+
+    for estoque in list(session.new) + list(session.deleted):
+        if isinstance(estoque, Estoque):
+            item_ids.add(estoque.item_id)
+            item_ids.update(_valores_alterados(estoque))
+
+    for estoque in session.dirty:
+        if isinstance(estoque, Estoque):
+            item_ids.update(_valores_alterados(estoque))
+
+    item_ids.discard(None)
+
+    if item_ids:
+        atualizar_resumo_itens(item_ids, session.connection())
@@ -0,0 +1,250 @@
+# app/utils/saldos.py
+#
+# Consumo FIFO de saldos (Estoque, SaldoTecnico, EquipamentoTecnico) em lote.
+#
+# Fluxo: o documento inteiro (movimentação, baixa, cancelamento de NF,
+# retorno de ferramentas) carrega todos os registros candidatos em UMA
+# consulta, com bloqueio de linha no PostgreSQL; a alocação FIFO é feita em
+# memória e as alterações saem no próximo flush, que o SQLAlchemy agrupa em
+# executemany por tabela.
+
+import random
+import time
+
+from flask import current_app, flash, redirect, request, session
+from sqlalchemy import or_
+from sqlalchemy.orm.exc import StaleDataError
+
+from app.extensions import db
+from app.models import EquipamentoTecnico, Estoque, SaldoTecnico
+
+
+TENTATIVAS_CONFLITO = 3
+
+
+def bloquear(query):
+    """
+    SELECT ... FOR UPDATE no PostgreSQL, para que duas requisições não
+    aloquem o mesmo saldo. O SQLite já serializa as escritas.
+    """
+    if db.engine.dialect.name == "postgresql":
+        return query.with_for_update()
+
+    return query
+
+
+def campos_iguais(**campos):
+    """
+    Predicado para `alocar_fifo`: o registro atende quando todos os campos
+    são iguais aos informados (None equivale a IS NULL).
+    """
+    def atende(registro):
+        return all(
+            getattr(registro, campo) == valor
+            for campo, valor in campos.items()
+        )
+
+    return atende
+
+
+def disponivel(registros, atende):
+    return sum(
+        int(registro.quantidade or 0)
+        for registro in registros
+        if int(registro.quantidade or 0) > 0 and atende(registro)
+    )
+
+
+def alocar_fifo(registros, quantidade, atende, parcial=False):
+    """
+    Distribui `quantidade` entre os registros que atendem ao predicado,
+    na ordem em que foram carregados. Não altera os registros.
+
+    Retorna (alocacoes, faltante), onde alocacoes é uma lista de
+    (registro, quantidade). Sem `parcial`, um pedido sem saldo suficiente
+    não recebe nenhuma alocação.
+    """
+    restante = int(quantidade or 0)
+    alocacoes = []
+
+    if not parcial and disponivel(registros, atende) < restante:
+        return [], restante
+
+    for registro in registros:
+        if restante <= 0:
+            break
+
+        atual = int(registro.quantidade or 0)
+
+        if atual <= 0 or not atende(registro):
+            continue
+
+        baixa = min(atual, restante)
+        alocacoes.append((registro, baixa))
+        restante -= baixa
+
+    return alocacoes, restante
+
+
+def debitar(alocacoes):
+    for registro, baixa in alocacoes:
+        registro.quantidade = int(registro.quantidade or 0) - baixa
+
+
+def consumir_fifo(registros, pedidos, parcial=False):
+    """
+    Consome vários pedidos sobre a mesma lista de registros carregada.
+    `pedidos` é uma lista de (chave, quantidade, atende); como cada
+    pedido debita antes do próximo, linhas que disputam o mesmo saldo
+    enxergam o que sobrou.
+
+    Retorna {chave: faltante} dos pedidos que não foram atendidos por
+    inteiro (sem `parcial`, esses pedidos não debitam nada).
+    """
+    faltas = {}
+
+    for chave, quantidade, atende in pedidos:
+        alocacoes, faltante = alocar_fifo(
+            registros,
+            quantidade,
+            atende,
+            parcial=parcial
+        )
+
+        debitar(alocacoes)
+
+        if faltante > 0:
+            faltas[chave] = faltante
+
+    return faltas
+
+
+# ==========================================================
+# CARGA DE CANDIDATOS (UMA CONSULTA POR DOCUMENTO)
+# ==========================================================
+
+def _item_ids(item_ids):
+    return sorted({
+        int(item_id)
+        for item_id in item_ids
+        if str(item_id or "").strip().isdigit()
+    })
+
+
+def carregar_estoques(item_ids, *condicoes):
+    item_ids = _item_ids(item_ids)
+
+    if not item_ids:
+        return []
+
+    query = Estoque.query.filter(
+        Estoque.item_id.in_(item_ids),
+        Estoque.quantidade > 0,
+        *condicoes
+    )
+
+    return bloquear(query.order_by(Estoque.id.asc())).all()
+
+
+def carregar_saldos_tecnico(item_ids, *condicoes):
+    item_ids = _item_ids(item_ids)
+
+    if not item_ids:
+        return []
+
+    query = SaldoTecnico.query.filter(
+        SaldoTecnico.item_id.in_(item_ids),
+        SaldoTecnico.quantidade > 0,
+        *condicoes
+    )
+
+    return bloquear(query.order_by(SaldoTecnico.id.asc())).all()
+
+
+def carregar_posse_tecnico(tecnico_id, item_ids):
+    item_ids = _item_ids(item_ids)
+
+    if not item_ids:
+        return []
+
+    query = EquipamentoTecnico.query.filter(
+        EquipamentoTecnico.tecnico_id == tecnico_id,
+        EquipamentoTecnico.item_id.in_(item_ids),
+        EquipamentoTecnico.status == "tecnico"
+    )
+
+    return bloquear(
+        query.order_by(
+            EquipamentoTecnico.data_hora.asc(),
+            EquipamentoTecnico.id.asc()
+        )
+    ).all()
+
+
+def condicao_estoque_empresa(usar_usado_bom=False):
+    """
+    Filtro de condição do estoque empresa: comum (sem condição) ou
+    USADO_BOM. Devolve (condição SQL, predicado) equivalentes.
+    """
+    if usar_usado_bom:
+        return (
+            Estoque.condicao_material == "USADO_BOM",
+            lambda estoque: estoque.condicao_material == "USADO_BOM",
+        )
+
+    return (
+        or_(
+            Estoque.condicao_material.is_(None),
+            Estoque.condicao_material == ""
+        ),
+        lambda estoque: not estoque.condicao_material,
+    )
+
+
+# ==========================================================
+# CONCORRÊNCIA
+# ==========================================================
+
+def repetir_em_conflito(gravar):
+    """
+    Estoque e SaldoTecnico têm version_id_col: se outra requisição gravou
+    o mesmo saldo entre a leitura e o flush, o UPDATE não casa a versão e
+    o SQLAlchemy levanta StaleDataError. `gravar` é o trecho da view que
+    lê os saldos, altera e faz o commit; só ele é repetido do zero (novo
+    SELECT, nova validação de saldo), até TENTATIVAS_CONFLITO vezes. O que
+    a view faz depois do commit (termo, PDF, mensagens) roda uma vez.
+
+    `gravar` devolve None quando gravou, ou a resposta que encerra a view
+    (validação recusada). Esgotadas as tentativas, devolve a resposta de
+    conflito para a view retornar.
+    """
+    for tentativa in range(1, TENTATIVAS_CONFLITO + 1):
+        flashes = list(session.get("_flashes", []))
+
+        try:
+            return gravar()
+
+        except StaleDataError as e:
+            db.session.rollback()
+
+            # Mensagens da tentativa descartada não vão para a tela.
+            session["_flashes"] = flashes
+
+            current_app.logger.warning(
+                "Conflito de saldo em %s (tentativa %s/%s): %s",
+                request.endpoint,
+                tentativa,
+                TENTATIVAS_CONFLITO,
+                e,
+            )
+
+            if tentativa < TENTATIVAS_CONFLITO:
+                time.sleep(random.uniform(0.02, 0.1) * tentativa)
+
+    flash(
+        "O saldo foi alterado por outra operação ao mesmo tempo. "
+        "Confira os valores e tente novamente.",
+        "warning"
+    )
+
+    return redirect(request.referrer or request.url)
@@ -0,0 +1,292 @@
+# app/utils/sqlite_perfil.py
+#
+# Perfil de conexão do SQLite (SQLITE_PERFIL).
+#
+# "producao" aplica em toda conexão nova do pool:
+#
+#   journal_mode=WAL        leitores não esperam o escritor (e vice-versa)
+#   synchronous=NORMAL      com WAL, uma queda de energia pode perder as
+#                           últimas transações, mas não corrompe o banco
+#   busy_timeout            espera pelo lock em vez de "database is locked"
+#   cache_size, mmap_size   mais páginas em memória (por conexão / mapeadas)
+#   temp_store=MEMORY       ORDER BY/GROUP BY grandes sem arquivo temporário
+#   journal_size_limit      o -wal volta a esse tamanho depois do checkpoint
+#
+# Uma thread por processo faz PRAGMA wal_checkpoint(PASSIVE) e PRAGMA
+# optimize a cada SQLITE_MANUTENCAO_MINUTOS. "padrao" deixa as conexões
+# como o SQLite abre (journal de rollback); serve de base no benchmark
+# (flask benchmark-sqlite).
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+
+from app.extensions import db
+
+
+PERFIS = {
+    "padrao": {},
+    "producao": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16384,
+        "mmap_size": 128 * 1024 * 1024,
+        "temp_store": "MEMORY",
+        "journal_size_limit": 64 * 1024 * 1024,
+    },
+}
+
+_manutencao_thread = None
+_manutencao_lock = threading.Lock()
+
+
+def pragmas_do_perfil(config):
+    """Pragmas do SQLITE_PERFIL, com os ajustes SQLITE_* do config."""
+    perfil = config.get("SQLITE_PERFIL") or "producao"
+
+    if perfil not in PERFIS:
+        raise ValueError(f"SQLITE_PERFIL inválido: {perfil}")
+
+    pragmas = dict(PERFIS[perfil])
+
+    if not pragmas:
+        return pragmas
+
+    if config.get("SQLITE_BUSY_TIMEOUT_MS") is not None:
+        pragmas["busy_timeout"] = config["SQLITE_BUSY_TIMEOUT_MS"]
+
+    if config.get("SQLITE_CACHE_MB") is not None:
+        # Negativo: tamanho em KiB, não em páginas.
+        pragmas["cache_size"] = -config["SQLITE_CACHE_MB"] * 1024
+
+    if config.get("SQLITE_MMAP_MB") is not None:
+        pragmas["mmap_size"] = config["SQLITE_MMAP_MB"] * 1024 * 1024
+
+    return pragmas
+
+
+def aplicar_pragmas(engine, pragmas):
+    """Executa os pragmas em cada conexão que o engine abrir."""
+    if not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _pragmas_na_conexao(conexao_dbapi, _registro):
+        cursor = conexao_dbapi.cursor()
+
+        try:
+            for nome, valor in pragmas.items():
+                try:
+                    cursor.execute(f"PRAGMA {nome} = {valor}")
+                except Exception:
+                    # journal_mode fica gravado no arquivo: se outra conexão
+                    # segura o banco na primeira troca para WAL, a próxima
+                    # conexão troca.
+                    if nome != "journal_mode":
+                        raise
+        finally:
+            cursor.close()
+
+
+def _sqlite_em_arquivo(engine):
+    url = engine.url
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def configurar_sqlite(app):
+    """Liga o perfil ao engine do app (chamar antes da primeira consulta)."""
+    if not _sqlite_em_arquivo(db.engine):
+        return None
+
+    pragmas = pragmas_do_perfil(app.config)
+    aplicar_pragmas(db.engine, pragmas)
+
+    # Conexões abertas antes do listener ficariam sem os pragmas.
+    db.engine.dispose()
+
+    app.extensions["sqlite_pragmas"] = pragmas
+
+    return pragmas
+
+
+# ==========================================================
+# MANUTENÇÃO
+# ==========================================================
+
+def manutencao_sqlite(modo="PASSIVE"):
+    """
+    Checkpoint do WAL e PRAGMA optimize. PASSIVE não espera ninguém;
+    TRUNCATE (CLI, fora do horário) espera os leitores e zera o -wal.
+    """
+    if modo not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"Modo de checkpoint inválido: {modo}")
+
+    with db.engine.connect() as conexao:
+        ocupado, paginas_wal, paginas_copiadas = conexao.execute(
+            text(f"PRAGMA wal_checkpoint({modo})")
+        ).fetchone()
+        conexao.execute(text("PRAGMA optimize"))
+
+    return {
+        "ocupado": bool(ocupado),
+        "paginas_wal": paginas_wal,
+        "paginas_copiadas": paginas_copiadas,
+    }
+
+
+def _loop_manutencao(app, intervalo):
+    while True:
+        time.sleep(intervalo)
+
+        with app.app_context():
+            try:
+                manutencao_sqlite()
+            except Exception:
+                app.logger.exception("Erro na manutenção do SQLite")
+            finally:
+                db.session.remove()
+
+
+def iniciar_manutencao_sqlite(app):
+    """
+    Inicia (uma vez por processo) a thread de checkpoint/optimize. Só com
+    o perfil ligado; SQLITE_MANUTENCAO_MINUTOS=0 desliga.
+    """
+    global _manutencao_thread
+
+    minutos = app.config.get("SQLITE_MANUTENCAO_MINUTOS", 30)
+
+    if not minutos or not app.extensions.get("sqlite_pragmas"):
+        return
+
+    if _manutencao_thread and _manutencao_thread.is_alive():
+        return
+
+    with _manutencao_lock:
+        if _manutencao_thread and _manutencao_thread.is_alive():
+            return
+
+        _manutencao_thread = threading.Thread(
+            target=_loop_manutencao,
+            args=(app, minutos * 60),
+            name="logistock-sqlite-manutencao",
+            daemon=True,
+        )
+        _manutencao_thread.start()
+
+
+# ==========================================================
+# BENCHMARK
+# ==========================================================
+
+def medir_concorrencia(pragmas, segundos=5, leitores=12, escritores=4, linhas=20000):
+    """
+    Banco temporário com uma tabela no formato das movimentações; threads
+    leitoras (saldo por item) e escritoras (uma inserção por transação,
+    como uma requisição) rodando juntas. Devolve operações por segundo,
+    erros de lock e latência das escritas.
+    """
+    pasta = tempfile.mkdtemp(prefix="benchmark_sqlite_")
+    engine = create_engine(
+        f"sqlite:///{os.path.join(pasta, 'benchmark.db')}",
+        pool_size=leitores + escritores,
+        max_overflow=0,
+    )
+    aplicar_pragmas(engine, pragmas)
+
+    try:
+        with engine.begin() as conexao:
+            conexao.execute(text(
+                "CREATE TABLE movimento (id INTEGER PRIMARY KEY, item_id INTEGER NOT NULL, "
+                "quantidade REAL NOT NULL, criado_em TEXT NOT NULL)"
+            ))
+            conexao.execute(text("CREATE INDEX ix_movimento_item ON movimento (item_id)"))
+            conexao.execute(
+                text("INSERT INTO movimento (item_id, quantidade, criado_em) "
+                     "VALUES (:item, :quantidade, datetime('now'))"),
+                [{"item": i % 500, "quantidade": i % 7 + 1} for i in range(linhas)],
+            )
+
+        inicio = threading.Barrier(leitores + escritores + 1)
+        parar = threading.Event()
+        resultados = {"leituras": 0, "escritas": 0, "erros": 0}
+        latencias = []
+        trava = threading.Lock()
+
+        def ler(numero):
+            feitas = erros = 0
+            inicio.wait()
+
+            while not parar.is_set():
+                try:
+                    with engine.connect() as conexao:
+                        conexao.execute(
+                            text("SELECT SUM(quantidade) FROM movimento WHERE item_id = :item"),
+                            {"item": (numero * 31 + feitas) % 500},
+                        ).scalar()
+                    feitas += 1
+                except Exception:
+                    erros += 1
+
+            with trava:
+                resultados["leituras"] += feitas
+                resultados["erros"] += erros
+
+        def escrever(numero):
+            feitas = erros = 0
+            minhas = []
+            inicio.wait()
+
+            while not parar.is_set():
+                comeco = time.perf_counter()
+
+                try:
+                    with engine.begin() as conexao:
+                        conexao.execute(
+                            text("INSERT INTO movimento (item_id, quantidade, criado_em) "
+                                 "VALUES (:item, 1, datetime('now'))"),
+                            {"item": (numero * 17 + feitas) % 500},
+                        )
+                    feitas += 1
+                    minhas.append(time.perf_counter() - comeco)
+                except Exception:
+                    erros += 1
+
+            with trava:
+                resultados["escritas"] += feitas
+                resultados["erros"] += erros
+                latencias.extend(minhas)
+
+        threads = [threading.Thread(target=ler, args=(i,)) for i in range(leitores)]
+        threads += [threading.Thread(target=escrever, args=(i,)) for i in range(escritores)]
+
+        for thread in threads:
+            thread.start()
+
+        inicio.wait()
+        time.sleep(segundos)
+        parar.set()
+
+        for thread in threads:
+            thread.join()
+
+        latencias.sort()
+
+        def percentil(p):
+            return latencias[min(len(latencias) - 1, int(len(latencias) * p))] * 1000 if latencias else 0.0
+
+        return {
+            "leituras_s": resultados["leituras"] / segundos,
+            "escritas_s": resultados["escritas"] / segundos,
+            "erros": resultados["erros"],
+            "escrita_p50_ms": percentil(0.50),
+            "escrita_p95_ms": percentil(0.95),
+        }
+    finally:
+        engine.dispose()
+        shutil.rmtree(pasta, ignore_errors=True)
@@ -1,12 +1,15 @@
+from sqlalchemy import func, or_, select
+
 from app import db
-from app.models import Estoque, SaldoTecnico
+from app.models import Estoque, Item, SaldoTecnico
+from app.utils.resumo_estoque import atualizar_resumo_itens
 
 
 def sincronizar_valor_empresa_item(item_id, valor_unitario):
     """Atualiza saldos abertos de origem empresa para o valor corrente do item."""
     valor = float(valor_unitario or 0)
 
-    Estoque.query.filter(
+    alterados = Estoque.query.filter(
         Estoque.item_id == item_id,
         Estoque.tipo_estoque == 'empresa'
     ).update(
@@ -21,3 +24,40 @@ def sincronizar_valor_empresa_item(item_id, valor_unitario):
         {SaldoTecnico.valor_unitario: valor},
         synchronize_session=False
     )
+
+    if alterados:
+        atualizar_resumo_itens([item_id])
+
+
+def sincronizar_valor_empresa_itens(item_ids, tamanho_lote=500):
+    """
+    Versão em conjunto de `sincronizar_valor_empresa_item`: copia Item.valor
+    para os saldos empresa dos itens informados, com um UPDATE por tabela
+    (por lote de ids) que só reescreve as linhas com valor diferente.
+    """
+    item_ids = sorted(set(item_ids))
+
+    for modelo in (Estoque, SaldoTecnico):
+        valor_item = (
+            select(Item.valor)
+            .where(Item.id == modelo.item_id)
+            .scalar_subquery()
+        )
+
+        for inicio in range(0, len(item_ids), tamanho_lote):
+            lote = item_ids[inicio:inicio + tamanho_lote]
+
+            alterados = modelo.query.filter(
+                modelo.item_id.in_(lote),
+                modelo.tipo_estoque == 'empresa',
+                or_(
+                    modelo.valor_unitario.is_(None),
+                    modelo.valor_unitario != valor_item
+                )
+            ).update(
+                {modelo.valor_unitario: func.coalesce(valor_item, 0)},
+                synchronize_session=False
+            )
+
+            if modelo is Estoque and alterados:
+                atualizar_resumo_itens(lote)
@@ -1,13 +1,12 @@
 import os
-from datetime import datetime
 
 from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 
 from app import create_app
 from app.extensions import db
-from app.utils.backup_drive import enviar_backup_google_drive
+from app.utils.backup_drive import enviar_arquivo_drive, enviar_backup_google_drive
+from app.utils.backups import caminho_backup, gerar_backup
 
 
 ARQUIVO_TOKEN = "token_drive.json"
@@ -59,7 +58,7 @@ def obter_ou_criar_pasta_drive(service):
     return pasta["id"]
 
 
-def enviar_com_token_usuario(caminho_banco):
+def enviar_com_token_usuario(caminho_backup_arquivo):
     creds = Credentials.from_authorized_user_file(
         ARQUIVO_TOKEN,
         ["https://www.googleapis.com/auth/drive.file"]
@@ -68,43 +67,27 @@ def enviar_com_token_usuario(caminho_banco):
     service = build("drive", "v3", credentials=creds)
     pasta_id = obter_ou_criar_pasta_drive(service)
 
-    nome_backup = (
-        "logistock_backup_"
-        f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-    )
-
     metadata = {
-        "name": nome_backup,
+        "name": os.path.basename(caminho_backup_arquivo),
         "parents": [pasta_id]
     }
 
-    media = MediaFileUpload(
-        caminho_banco,
-        mimetype="application/octet-stream",
-        resumable=True
-    )
-
-    arquivo = service.files().create(
-        body=metadata,
-        media_body=media,
-        fields="id, name"
-    ).execute()
+    return enviar_arquivo_drive(service, caminho_backup_arquivo, metadata)
 
-    return arquivo
 
-
-def enviar_backup(caminho_banco):
+def enviar_backup(caminho_backup_arquivo):
     if os.path.exists(ARQUIVO_TOKEN):
-        return enviar_com_token_usuario(caminho_banco)
+        return enviar_com_token_usuario(caminho_backup_arquivo)
 
     if (
         os.getenv("GOOGLE_DRIVE_CREDENTIALS_FILE")
         and os.getenv("GOOGLE_DRIVE_FOLDER_ID")
     ):
-        arquivo_id = enviar_backup_google_drive(caminho_banco)
+        nome = os.path.basename(caminho_backup_arquivo)
+        arquivo_id = enviar_backup_google_drive(caminho_backup_arquivo, nome)
         return {
             "id": arquivo_id,
-            "name": os.path.basename(caminho_banco)
+            "name": nome
         }
 
     raise RuntimeError(
@@ -121,8 +104,13 @@ if __name__ == "__main__":
         caminho_banco = banco_ativo()
         print(f"Banco ativo: {caminho_banco}")
 
+        # Cópia avulsa: sempre um backup completo (instantâneo online
+        # comprimido), nunca o arquivo do banco em uso.
+        print("Gerando backup completo...")
+        manifesto = gerar_backup("completo")
+
         print("Enviando backup para o Google Drive...")
-        arquivo = enviar_backup(caminho_banco)
+        arquivo = enviar_backup(caminho_backup(manifesto))
 
         print("Backup enviado com sucesso!")
         print(f"Arquivo: {arquivo.get('name', 'logistock_backup.db')}")
@@ -40,3 +40,74 @@ MAIL_DEFAULT_SENDER = (
     "LogiStock",
     os.getenv("MAIL_DEFAULT_SENDER", "claudineymoura@gmail.com")
 )
+
+# Fila de e-mails: "thread" consome a fila dentro de cada worker gunicorn;
+# "processo" exige rodar `flask processar-emails --loop` separadamente.
+EMAIL_FILA_WORKER = os.getenv("EMAIL_FILA_WORKER", "thread")
+
+# Streams SSE simultâneos por worker (cada um ocupa uma thread do gthread);
+# acima disso o navegador usa polling condicional com ETag.
+CONTADORES_SSE_MAX_STREAMS = int(os.getenv("CONTADORES_SSE_MAX_STREAMS", "8"))
+
+# Subida: com o banco na head das migrações o create_app pula a inspeção
+# de colunas/índices; "1" força a verificação completa em toda subida.
+VERIFICAR_ESQUEMA_SEMPRE = os.getenv("VERIFICAR_ESQUEMA_SEMPRE") == "1"
+
+# Telas de lista (opcoes_listagem dos modelos): "1" faz coluna ou relação
+# fora do perfil levantar erro em vez de carregar sob demanda. Ligado pela
+# `flask auditar-consultas-listagens`; em produção fica desligado.
+LISTAGENS_RAISELOAD = os.getenv("LISTAGENS_RAISELOAD") == "1"
+
+# "1" escreve no stderr o tempo de cada fase da subida (workers gunicorn).
+LOG_TEMPOS_INICIALIZACAO = os.getenv("LOG_TEMPOS_INICIALIZACAO") == "1"
+
+# Repositório de assinaturas (PNG endereçado por SHA-256). Vazio: pasta
+# "assinaturas" ao lado do banco SQLite (disco persistente no Render).
+ASSINATURAS_DIR = os.getenv("ASSINATURAS_DIR")
+
+# Cache dos PDFs gerados (comprovantes, termos, notas). Vazio: instance/
+# pdf_cache. Acima do limite saem os menos usados; "0" desliga o cache.
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR")
+PDF_CACHE_MAX_MB = int(os.getenv("PDF_CACHE_MAX_MB", "200"))
+
+# Comprovantes em lote (ZIP): processos que montam os PDFs em paralelo
+# (um pool por worker), lotes simultâneos por worker pela tela (o excedente
+# recebe 429) e teto de documentos por download (a CLI não tem teto).
+PDF_LOTE_PROCESSOS = int(os.getenv("PDF_LOTE_PROCESSOS", "4"))
+PDF_LOTE_SIMULTANEOS = int(os.getenv("PDF_LOTE_SIMULTANEOS", "1"))
+PDF_LOTE_MAX_DOCUMENTOS = int(os.getenv("PDF_LOTE_MAX_DOCUMENTOS", "1000"))
+
+# Fotos de campo: threads (por worker) que redimensionam os uploads e
+# geram miniatura e versão para PDF fora da requisição.
+FOTOS_THREADS = int(os.getenv("FOTOS_THREADS", "2"))
+
+# Backups do banco (flask gerar-backup). Vazio: pasta "backups" ao lado do
+# banco SQLite. Destino do envio: "drive" ou uma pasta (vazio: só local).
+BACKUP_DIR = os.getenv("BACKUP_DIR")
+BACKUP_DESTINO = os.getenv("BACKUP_DESTINO")
+
+# Instantâneo online do SQLite: páginas copiadas por passo e pausa entre os
+# passos (os workers gravam no intervalo).
+BACKUP_PAGINAS_POR_PASSO = int(os.getenv("BACKUP_PAGINAS_POR_PASSO", "1024"))
+BACKUP_PAUSA_PASSO_MS = int(os.getenv("BACKUP_PAUSA_PASSO_MS", "20"))
+
+# Incrementais (só as páginas alteradas) entre dois backups completos.
+BACKUP_INCREMENTAIS_POR_COMPLETO = int(os.getenv("BACKUP_INCREMENTAIS_POR_COMPLETO", "6"))
+
+# Retenção avô-pai-filho: tudo das últimas horas, depois o backup mais
+# recente de cada dia, semana e mês (quantidades abaixo).
+BACKUP_RETER_HORAS = int(os.getenv("BACKUP_RETER_HORAS", "48"))
+BACKUP_RETER_DIARIOS = int(os.getenv("BACKUP_RETER_DIARIOS", "7"))
+BACKUP_RETER_SEMANAIS = int(os.getenv("BACKUP_RETER_SEMANAIS", "4"))
+BACKUP_RETER_MENSAIS = int(os.getenv("BACKUP_RETER_MENSAIS", "12"))
+
+# Conexões SQLite: "producao" liga WAL, synchronous=NORMAL, busy_timeout,
+# cache, mmap e temporários em memória em toda conexão; "padrao" deixa como
+# o SQLite abre. Vazio nos ajustes abaixo: valores do perfil.
+SQLITE_PERFIL = os.getenv("SQLITE_PERFIL", "producao")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS")) if os.getenv("SQLITE_BUSY_TIMEOUT_MS") else None
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB")) if os.getenv("SQLITE_CACHE_MB") else None
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB")) if os.getenv("SQLITE_MMAP_MB") else None
+
+# Checkpoint do WAL e PRAGMA optimize (thread por worker); "0" desliga.
+SQLITE_MANUTENCAO_MINUTOS = int(os.getenv("SQLITE_MANUTENCAO_MINUTOS", "30"))
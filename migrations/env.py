@@ -90,9 +90,18 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # the item search index (FTS5 / pg_trgm) lives outside the models
+    # metadata: keep autogenerate from dropping it
+    def include_object(object, name, type_, reflected, compare_to):
+        from app.utils.busca_itens import TABELAS_INDICE
+
+        return not (type_ == 'table' and reflected and name in TABELAS_INDICE)
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
@@ -0,0 +1,84 @@
+"""add indices de busca de saldo e historico
+
+Revision ID: 04f7112dc764
+Revises: c6f4d2a91b7e
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '04f7112dc764'
+down_revision = 'c6f4d2a91b7e'
+branch_labels = None
+depends_on = None
+
+
+INDICES = [
+    (
+        'ix_estoque_busca_saldo',
+        'estoque',
+        ['item_id', 'tipo_servico_id', 'tipo_estoque', 'cliente_id', 'condicao_material'],
+    ),
+    (
+        'ix_saldo_tecnico_busca_saldo',
+        'saldo_tecnico',
+        ['tecnico_id', 'item_id', 'tipo_servico_id', 'tipo_estoque', 'cliente_id', 'ordem_servico_id'],
+    ),
+    (
+        'ix_movimentacoes_estoque_data_hora',
+        'movimentacoes_estoque',
+        ['data_hora', 'id'],
+    ),
+    (
+        'ix_movimentacoes_estoque_itens_movimentacao',
+        'movimentacoes_estoque_itens',
+        ['movimentacao_id'],
+    ),
+    (
+        'ix_baixas_tecnicas_data_hora',
+        'baixas_tecnicas',
+        ['data_hora'],
+    ),
+    (
+        'ix_baixas_tecnicas_status',
+        'baixas_tecnicas',
+        ['status'],
+    ),
+    (
+        'ix_notas_fiscais_entrada_data_hora',
+        'notas_fiscais_entrada',
+        ['data_hora'],
+    ),
+]
+
+
+def _indices_existentes(inspector, table_name):
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for index_name, table_name, columns in INDICES:
+        if not inspector.has_table(table_name):
+            continue
+
+        if index_name in _indices_existentes(inspector, table_name):
+            continue
+
+        op.create_index(index_name, table_name, columns)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for index_name, table_name, columns in reversed(INDICES):
+        if not inspector.has_table(table_name):
+            continue
+
+        if index_name not in _indices_existentes(inspector, table_name):
+            continue
+
+        op.drop_index(index_name, table_name=table_name)
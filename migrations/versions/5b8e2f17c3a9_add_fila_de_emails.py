@@ -0,0 +1,52 @@
+"""add fila persistente de e-mails
+
+Revision ID: 5b8e2f17c3a9
+Revises: 04f7112dc764
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '5b8e2f17c3a9'
+down_revision = '04f7112dc764'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if inspector.has_table('emails_fila'):
+        return
+
+    op.create_table('emails_fila',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=30), nullable=False),
+    sa.Column('referencia_id', sa.Integer(), nullable=False),
+    sa.Column('parametros', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('tentativas', sa.Integer(), nullable=False),
+    sa.Column('proxima_tentativa', sa.DateTime(), nullable=True),
+    sa.Column('ultimo_erro', sa.Text(), nullable=True),
+    sa.Column('lote', sa.String(length=36), nullable=True),
+    sa.Column('destinatario', sa.String(length=255), nullable=True),
+    sa.Column('criado_em', sa.DateTime(), nullable=True),
+    sa.Column('atualizado_em', sa.DateTime(), nullable=True),
+    sa.Column('enviado_em', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_emails_fila_status_proxima', 'emails_fila', ['status', 'proxima_tentativa'])
+    op.create_index('ix_emails_fila_referencia', 'emails_fila', ['tipo', 'referencia_id'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('emails_fila'):
+        return
+
+    op.drop_index('ix_emails_fila_referencia', table_name='emails_fila')
+    op.drop_index('ix_emails_fila_status_proxima', table_name='emails_fila')
+    op.drop_table('emails_fila')
@@ -0,0 +1,52 @@
+"""add coluna versao (concorrencia otimista) em estoque e saldo_tecnico
+
+Revision ID: 8c3d5e9a1f42
+Revises: 5b8e2f17c3a9
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '8c3d5e9a1f42'
+down_revision = '5b8e2f17c3a9'
+branch_labels = None
+depends_on = None
+
+
+TABELAS = ['estoque', 'saldo_tecnico']
+
+
+def _colunas(inspector, table_name):
+    return {column['name'] for column in inspector.get_columns(table_name)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for table_name in TABELAS:
+        if not inspector.has_table(table_name):
+            continue
+
+        if 'versao' in _colunas(inspector, table_name):
+            continue
+
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column('versao', sa.Integer(), nullable=False, server_default='0')
+            )
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for table_name in TABELAS:
+        if not inspector.has_table(table_name):
+            continue
+
+        if 'versao' not in _colunas(inspector, table_name):
+            continue
+
+        with op.batch_alter_table(table_name, schema=None) as batch_op:
+            batch_op.drop_column('versao')
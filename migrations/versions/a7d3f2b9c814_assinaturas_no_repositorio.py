@@ -0,0 +1,69 @@
+"""move assinaturas em base64 para o repositorio endereçado por SHA-256
+
+Revision ID: a7d3f2b9c814
+Revises: f1c6a8d25e47
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a7d3f2b9c814'
+down_revision = 'f1c6a8d25e47'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+
+def _alterar_tipos(tipo_novo, tipo_antigo):
+    # SQLite ignora o tamanho do VARCHAR: só o PostgreSQL precisa do ALTER.
+    bind = op.get_bind()
+
+    if bind.dialect.name != 'postgresql':
+        return
+
+    from app.utils.assinaturas import COLUNAS_ASSINATURA
+
+    inspector = sa.inspect(bind)
+
+    for tabela, coluna in COLUNAS_ASSINATURA:
+        if not inspector.has_table(tabela.name):
+            continue
+
+        if coluna not in {c['name'] for c in inspector.get_columns(tabela.name)}:
+            continue
+
+        op.alter_column(
+            tabela.name,
+            coluna,
+            type_=tipo_novo,
+            existing_type=tipo_antigo,
+            existing_nullable=True,
+        )
+
+
+def upgrade():
+    # Os PNGs vão para a pasta do repositório (ASSINATURAS_DIR); a coluna
+    # passa a guardar só o SHA-256. Valores inválidos ficam como estão.
+    from app.utils.assinaturas import migrar_assinaturas
+
+    convertidas, invalidas = migrar_assinaturas(op.get_bind())
+    logger.info(
+        'Assinaturas movidas para o repositório: %s (inválidas: %s)',
+        convertidas,
+        invalidas,
+    )
+
+    if not invalidas:
+        _alterar_tipos(sa.String(length=64), sa.Text())
+
+
+def downgrade():
+    from app.utils.assinaturas import restaurar_assinaturas
+
+    _alterar_tipos(sa.Text(), sa.String(length=64))
+    restaurar_assinaturas(op.get_bind())
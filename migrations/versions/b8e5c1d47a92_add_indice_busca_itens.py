@@ -0,0 +1,28 @@
+"""add indice de busca de itens (FTS5 / pg_trgm)
+
+Revision ID: b8e5c1d47a92
+Revises: a7d3f2b9c814
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+
+
+revision = 'b8e5c1d47a92'
+down_revision = 'a7d3f2b9c814'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite: tabela virtual FTS5; PostgreSQL: tsvector + trigram.
+    # criar_indice não faz nada se a tabela já existir.
+    from app.utils.busca_itens import criar_indice
+
+    criar_indice(op.get_bind())
+
+
+def downgrade():
+    from app.utils.busca_itens import remover_indice
+
+    remover_indice(op.get_bind())
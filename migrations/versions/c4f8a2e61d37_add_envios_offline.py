@@ -0,0 +1,45 @@
+"""add tabela envios_offline (idempotência da fila offline do celular)
+
+Revision ID: c4f8a2e61d37
+Revises: b8e5c1d47a92
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'c4f8a2e61d37'
+down_revision = 'b8e5c1d47a92'
+branch_labels = None
+depends_on = None
+
+
+TABELA = 'envios_offline'
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if inspector.has_table(TABELA):
+        return
+
+    op.create_table(
+        TABELA,
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('chave', sa.String(length=64), nullable=False),
+        sa.Column('tipo', sa.String(length=20), nullable=False),
+        sa.Column('registro_id', sa.Integer(), nullable=False),
+        sa.Column('tecnico_id', sa.Integer(), nullable=True),
+        sa.Column('criado_em', sa.DateTime(), nullable=True),
+        sa.Column('recebido_em', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('chave'),
+    )
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if inspector.has_table(TABELA):
+        op.drop_table(TABELA)
@@ -0,0 +1,47 @@
+"""add indice de itens por nota fiscal
+
+Revision ID: d2a7c4e19b63
+Revises: 8c3d5e9a1f42
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd2a7c4e19b63'
+down_revision = '8c3d5e9a1f42'
+branch_labels = None
+depends_on = None
+
+
+INDICE = 'ix_notas_fiscais_itens_nota'
+TABELA = 'notas_fiscais_itens'
+
+
+def _indices_existentes(inspector, table_name):
+    return {index['name'] for index in inspector.get_indexes(table_name)}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table(TABELA):
+        return
+
+    if INDICE in _indices_existentes(inspector, TABELA):
+        return
+
+    op.create_index(INDICE, TABELA, ['nota_fiscal_id', 'id'])
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table(TABELA):
+        return
+
+    if INDICE not in _indices_existentes(inspector, TABELA):
+        return
+
+    op.drop_index(INDICE, table_name=TABELA)
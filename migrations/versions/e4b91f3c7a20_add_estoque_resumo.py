@@ -0,0 +1,96 @@
+"""add tabela estoque_resumo (saldo consolidado)
+
+Revision ID: e4b91f3c7a20
+Revises: d2a7c4e19b63
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e4b91f3c7a20'
+down_revision = 'd2a7c4e19b63'
+branch_labels = None
+depends_on = None
+
+
+TABELA = 'estoque_resumo'
+
+
+PREENCHER_RESUMO = """
+INSERT INTO estoque_resumo (
+    item_id, tipo_estoque, cliente_id, tipo_servico_id,
+    disponivel, usado_bom, novo_defeito, usado_defeito, total,
+    valor_unitario, quantidade_minima, endereco
+)
+SELECT
+    item_id, tipo_estoque, cliente_id, tipo_servico_id,
+    COALESCE(SUM(CASE WHEN condicao_material IS NULL
+                        OR condicao_material = ''
+                        OR condicao_material = 'DISPONIVEL'
+                      THEN quantidade ELSE 0 END), 0),
+    COALESCE(SUM(CASE WHEN condicao_material = 'USADO_BOM' THEN quantidade ELSE 0 END), 0),
+    COALESCE(SUM(CASE WHEN condicao_material = 'NOVO_DEF' THEN quantidade ELSE 0 END), 0),
+    COALESCE(SUM(CASE WHEN condicao_material = 'USADO_DEF' THEN quantidade ELSE 0 END), 0),
+    COALESCE(SUM(quantidade), 0),
+    MAX(valor_unitario),
+    MAX(quantidade_minima),
+    MAX(endereco)
+FROM estoque
+WHERE item_id IS NOT NULL
+GROUP BY item_id, tipo_estoque, cliente_id, tipo_servico_id
+"""
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if inspector.has_table(TABELA):
+        return
+
+    op.create_table(
+        TABELA,
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=False),
+        sa.Column('tipo_estoque', sa.String(length=20), nullable=True),
+        sa.Column('cliente_id', sa.Integer(), nullable=True),
+        sa.Column('tipo_servico_id', sa.Integer(), nullable=True),
+        sa.Column('disponivel', sa.Integer(), nullable=False),
+        sa.Column('usado_bom', sa.Integer(), nullable=False),
+        sa.Column('novo_defeito', sa.Integer(), nullable=False),
+        sa.Column('usado_defeito', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=False),
+        sa.Column('valor_unitario', sa.Float(), nullable=True),
+        sa.Column('quantidade_minima', sa.Integer(), nullable=True),
+        sa.Column('endereco', sa.String(length=100), nullable=True),
+        sa.ForeignKeyConstraint(['item_id'], ['itens.id']),
+        sa.ForeignKeyConstraint(['cliente_id'], ['empresas.id']),
+        sa.ForeignKeyConstraint(['tipo_servico_id'], ['tipo_servico.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+
+    op.create_index(
+        'ix_estoque_resumo_chave',
+        TABELA,
+        ['item_id', 'tipo_estoque', 'cliente_id', 'tipo_servico_id'],
+    )
+    op.create_index(
+        'ix_estoque_resumo_tipo_cliente',
+        TABELA,
+        ['tipo_estoque', 'cliente_id'],
+    )
+
+    if inspector.has_table('estoque'):
+        op.execute(PREENCHER_RESUMO)
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table(TABELA):
+        return
+
+    op.drop_index('ix_estoque_resumo_tipo_cliente', table_name=TABELA)
+    op.drop_index('ix_estoque_resumo_chave', table_name=TABELA)
+    op.drop_table(TABELA)
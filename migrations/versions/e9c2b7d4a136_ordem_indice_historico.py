@@ -0,0 +1,46 @@
+"""indice do historico de movimentacoes em data_hora DESC NULLS LAST
+
+Revision ID: e9c2b7d4a136
+Revises: c4f8a2e61d37
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'e9c2b7d4a136'
+down_revision = 'c4f8a2e61d37'
+branch_labels = None
+depends_on = None
+
+
+INDICE = 'ix_movimentacoes_estoque_data_hora'
+TABELA = 'movimentacoes_estoque'
+
+
+def _recriar(colunas):
+    # SQLite já percorre o índice (data_hora, id) na ordem do histórico e
+    # não aceita NULLS LAST em índice: só o PostgreSQL muda.
+    bind = op.get_bind()
+
+    if bind.dialect.name != 'postgresql':
+        return
+
+    inspector = sa.inspect(bind)
+
+    if not inspector.has_table(TABELA):
+        return
+
+    if INDICE in {index['name'] for index in inspector.get_indexes(TABELA)}:
+        op.drop_index(INDICE, table_name=TABELA)
+
+    op.create_index(INDICE, TABELA, colunas)
+
+
+def upgrade():
+    _recriar([sa.text('data_hora DESC NULLS LAST'), sa.text('id DESC')])
+
+
+def downgrade():
+    _recriar(['data_hora', 'id'])
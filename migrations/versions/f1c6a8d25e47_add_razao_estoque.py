@@ -0,0 +1,131 @@
+"""add razao do estoque (lancamentos e snapshots)
+
+Revision ID: f1c6a8d25e47
+Revises: e4b91f3c7a20
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f1c6a8d25e47'
+down_revision = 'e4b91f3c7a20'
+branch_labels = None
+depends_on = None
+
+
+# Saldos existentes entram como lançamento de abertura.
+ABERTURA_ESTOQUE = """
+INSERT INTO razao_estoque (
+    data_hora, saldo, saldo_id, item_id, tecnico_id, tipo_estoque,
+    cliente_id, tipo_servico_id, ordem_servico_id, condicao_material,
+    delta, quantidade_apos, origem
+)
+SELECT
+    CURRENT_TIMESTAMP, 'estoque', id, item_id, NULL, tipo_estoque,
+    cliente_id, tipo_servico_id, NULL, condicao_material,
+    quantidade, quantidade, 'abertura'
+FROM estoque
+WHERE quantidade IS NOT NULL AND quantidade <> 0
+"""
+
+ABERTURA_SALDO_TECNICO = """
+INSERT INTO razao_estoque (
+    data_hora, saldo, saldo_id, item_id, tecnico_id, tipo_estoque,
+    cliente_id, tipo_servico_id, ordem_servico_id, condicao_material,
+    delta, quantidade_apos, origem
+)
+SELECT
+    CURRENT_TIMESTAMP, 'tecnico', id, item_id, tecnico_id, tipo_estoque,
+    cliente_id, tipo_servico_id, ordem_servico_id, NULL,
+    quantidade, quantidade, 'abertura'
+FROM saldo_tecnico
+WHERE quantidade IS NOT NULL AND quantidade <> 0
+"""
+
+
+def _colunas_chave():
+    return [
+        sa.Column('saldo', sa.String(length=10), nullable=False),
+        sa.Column('item_id', sa.Integer(), nullable=True),
+        sa.Column('tecnico_id', sa.Integer(), nullable=True),
+        sa.Column('tipo_estoque', sa.String(length=20), nullable=True),
+        sa.Column('cliente_id', sa.Integer(), nullable=True),
+        sa.Column('tipo_servico_id', sa.Integer(), nullable=True),
+        sa.Column('ordem_servico_id', sa.Integer(), nullable=True),
+        sa.Column('condicao_material', sa.String(length=30), nullable=True),
+    ]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if not inspector.has_table('razao_estoque'):
+        op.create_table(
+            'razao_estoque',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('data_hora', sa.DateTime(), nullable=False),
+            sa.Column('saldo_id', sa.Integer(), nullable=True),
+            *_colunas_chave(),
+            sa.Column('delta', sa.Integer(), nullable=False),
+            sa.Column('quantidade_apos', sa.Integer(), nullable=True),
+            sa.Column('documento_tipo', sa.String(length=30), nullable=True),
+            sa.Column('documento_id', sa.Integer(), nullable=True),
+            sa.Column('origem', sa.String(length=120), nullable=True),
+            sa.Column('usuario_id', sa.Integer(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index('ix_razao_estoque_data_hora', 'razao_estoque', ['data_hora'])
+        op.create_index(
+            'ix_razao_estoque_tecnico_item',
+            'razao_estoque',
+            ['tecnico_id', 'item_id', 'id'],
+        )
+        op.create_index('ix_razao_estoque_item', 'razao_estoque', ['item_id', 'id'])
+
+        if inspector.has_table('estoque'):
+            op.execute(ABERTURA_ESTOQUE)
+
+        if inspector.has_table('saldo_tecnico'):
+            op.execute(ABERTURA_SALDO_TECNICO)
+
+    if not inspector.has_table('razao_snapshots'):
+        op.create_table(
+            'razao_snapshots',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('ultimo_lancamento_id', sa.Integer(), nullable=False),
+            sa.Column('data_corte', sa.DateTime(), nullable=False),
+            sa.Column('criado_em', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(
+            'ix_razao_snapshots_ultimo_lancamento_id',
+            'razao_snapshots',
+            ['ultimo_lancamento_id'],
+        )
+        op.create_index('ix_razao_snapshots_data_corte', 'razao_snapshots', ['data_corte'])
+
+    if not inspector.has_table('razao_snapshot_saldos'):
+        op.create_table(
+            'razao_snapshot_saldos',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('snapshot_id', sa.Integer(), nullable=False),
+            *_colunas_chave(),
+            sa.Column('quantidade', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(['snapshot_id'], ['razao_snapshots.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+        op.create_index(
+            'ix_razao_snapshot_saldos_busca',
+            'razao_snapshot_saldos',
+            ['snapshot_id', 'tecnico_id', 'item_id'],
+        )
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for tabela in ('razao_snapshot_saldos', 'razao_snapshots', 'razao_estoque'):
+        if inspector.has_table(tabela):
+            op.drop_table(tabela)